@@ -463,6 +463,40 @@ def api_migrate_produtos():
             else:
                 results["errors"].append(f"Erro ao adicionar 'estoque': {str(e)}")
 
+        # Verificar e adicionar colunas de agregados materializados
+        for coluna in ('estoque_total', 'rating_count', 'rating_sum'):
+            try:
+                db.session.execute(text(f"ALTER TABLE produtos ADD COLUMN {coluna} INTEGER NOT NULL DEFAULT 0"))
+                db.session.commit()
+                results["migrations"].append(f"Coluna '{coluna}' adicionada com sucesso")
+            except Exception as e:
+                db.session.rollback()
+                if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                    results["migrations"].append(f"Coluna '{coluna}' já existe")
+                else:
+                    results["errors"].append(f"Erro ao adicionar '{coluna}': {str(e)}")
+
+        # Verificar e adicionar coluna do manifesto de rendições de imagem
+        try:
+            db.session.execute(text("ALTER TABLE produtos ADD COLUMN imagens_rendicoes TEXT"))
+            db.session.commit()
+            results["migrations"].append("Coluna 'imagens_rendicoes' adicionada com sucesso")
+        except Exception as e:
+            db.session.rollback()
+            if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                results["migrations"].append("Coluna 'imagens_rendicoes' já existe")
+            else:
+                results["errors"].append(f"Erro ao adicionar 'imagens_rendicoes': {str(e)}")
+
+        # Preencher agregados a partir de estoque e reviews
+        try:
+            from app.services.agregados_service import AgregadosService
+            corrigidos = AgregadosService.reconciliar()
+            results["migrations"].append(f"Agregados recalculados para {corrigidos} produto(s)")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao recalcular agregados: {str(e)}")
+
         # Atualizar estoque dos produtos existentes baseado na tabela de estoque
         try:
             db.session.execute(text("""
@@ -505,6 +539,219 @@ def api_migrate_produtos():
         }), 500
 
 
+@app.route('/api/migrate-rollups')
+def api_migrate_rollups():
+    """
+    Cria as tabelas de rollup de vendas e faz a carga completa.
+    Acesse: https://seu-site.vercel.app/api/migrate-rollups
+    """
+    from sqlalchemy import text
+    results = {
+        "status": "ok",
+        "migrations": [],
+        "errors": []
+    }
+
+    try:
+        db.create_all()
+        results["migrations"].append("Tabelas de rollup verificadas/criadas")
+
+        # Índice usado pela busca incremental (pedidos alterados após a marca d'água)
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_pedidos_data_atualizacao ON pedidos (data_atualizacao)"
+            ))
+            db.session.commit()
+            results["migrations"].append("Índice 'ix_pedidos_data_atualizacao' verificado/criado")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao criar índice: {str(e)}")
+
+        try:
+            from app.services.rollup_service import RollupVendasService
+            dias = RollupVendasService.reconstruir()
+            results["migrations"].append(f"Rollups reconstruídos para {dias} dia(s)")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao reconstruir rollups: {str(e)}")
+
+        results["message"] = "Migração de rollups concluída!"
+        return jsonify(results)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/migrate-resumo-fiscal')
+def api_migrate_resumo_fiscal():
+    """
+    Cria o resumo mensal de notas fiscais e faz a carga completa.
+    Acesse: https://seu-site.vercel.app/api/migrate-resumo-fiscal
+    """
+    from sqlalchemy import text
+    results = {
+        "status": "ok",
+        "migrations": [],
+        "errors": []
+    }
+
+    try:
+        db.create_all()
+        results["migrations"].append("Tabela 'resumo_fiscal_mensal' verificada/criada")
+
+        # Índice usado pelo recálculo mensal e pelas listagens por período
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_nota_fiscal_data_emissao ON nota_fiscal (data_emissao)"
+            ))
+            db.session.commit()
+            results["migrations"].append("Índice 'ix_nota_fiscal_data_emissao' verificado/criado")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao criar índice: {str(e)}")
+
+        try:
+            from app.services.resumo_fiscal_service import ResumoFiscalService
+            meses = ResumoFiscalService.reconstruir()
+            results["migrations"].append(f"Resumo fiscal reconstruído para {meses} mês(es)")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao reconstruir resumo fiscal: {str(e)}")
+
+        results["message"] = "Migração do resumo fiscal concluída!"
+        return jsonify(results)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/migrate-lotes-nfe')
+def api_migrate_lotes_nfe():
+    """
+    Cria a tabela de lotes de NF-e e a coluna nota_fiscal.lote_nfe_id.
+    Acesse: https://seu-site.vercel.app/api/migrate-lotes-nfe
+    """
+    from sqlalchemy import text
+    results = {
+        "status": "ok",
+        "migrations": [],
+        "errors": []
+    }
+
+    try:
+        db.create_all()
+        results["migrations"].append("Tabela 'lote_nfe' verificada/criada")
+
+        try:
+            db.session.execute(text("ALTER TABLE nota_fiscal ADD COLUMN lote_nfe_id INTEGER REFERENCES lote_nfe (id)"))
+            db.session.commit()
+            results["migrations"].append("Coluna 'lote_nfe_id' adicionada com sucesso")
+        except Exception as e:
+            db.session.rollback()
+            if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                results["migrations"].append("Coluna 'lote_nfe_id' já existe")
+            else:
+                results["errors"].append(f"Erro ao adicionar 'lote_nfe_id': {str(e)}")
+
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_nota_fiscal_lote_nfe_id ON nota_fiscal (lote_nfe_id)"
+            ))
+            db.session.commit()
+            results["migrations"].append("Índice 'ix_nota_fiscal_lote_nfe_id' verificado/criado")
+        except Exception as e:
+            db.session.rollback()
+            results["errors"].append(f"Erro ao criar índice: {str(e)}")
+
+        results["message"] = "Migração dos lotes de NF-e concluída!"
+        return jsonify(results)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/migrate-fila-emissao')
+def api_migrate_fila_emissao():
+    """
+    Cria a tabela da fila de emissão do PDV (fila_emissao_nfe).
+    Acesse: https://seu-site.vercel.app/api/migrate-fila-emissao
+    """
+    try:
+        db.create_all()
+        return jsonify({
+            "status": "ok",
+            "migrations": ["Tabela 'fila_emissao_nfe' verificada/criada"],
+            "message": "Migração da fila de emissão concluída!"
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
+@app.route('/api/migrate-contingencia')
+def api_migrate_contingencia():
+    """
+    Adiciona à nota_fiscal as colunas da emissão em contingência (tpEmis, dhCont, xJust).
+    Acesse: https://seu-site.vercel.app/api/migrate-contingencia
+    """
+    from sqlalchemy import text
+    results = {
+        "status": "ok",
+        "migrations": [],
+        "errors": []
+    }
+
+    colunas = [
+        ("tipo_emissao", "INTEGER DEFAULT 1"),
+        ("data_contingencia", "TIMESTAMP"),
+        ("justificativa_contingencia", "VARCHAR(256)"),
+    ]
+
+    try:
+        for nome, tipo in colunas:
+            try:
+                db.session.execute(text(f"ALTER TABLE nota_fiscal ADD COLUMN {nome} {tipo}"))
+                db.session.commit()
+                results["migrations"].append(f"Coluna '{nome}' adicionada com sucesso")
+            except Exception as e:
+                db.session.rollback()
+                if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                    results["migrations"].append(f"Coluna '{nome}' já existe")
+                else:
+                    results["errors"].append(f"Erro ao adicionar '{nome}': {str(e)}")
+
+        results["message"] = "Migração da contingência concluída!"
+        return jsonify(results)
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "error_type": type(e).__name__
+        }), 500
+
+
 # Exportar app para Vercel (WSGI compatível)
 # Vercel detecta automaticamente o objeto 'app' ou 'application'
 application = app
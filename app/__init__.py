@@ -61,6 +61,7 @@ def create_app():
     from .routes.erp import erp_bp
     from .routes.super_admin import super_admin_bp
     from .routes.fiscal import fiscal_bp
+    from .routes.imagens import imagens_bp
 
     app.register_blueprint(cliente_bp, url_prefix='/painel')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
@@ -73,6 +74,7 @@ def create_app():
     app.register_blueprint(erp_bp, url_prefix='/erp')
     app.register_blueprint(super_admin_bp, url_prefix='/super-admin')
     app.register_blueprint(fiscal_bp, url_prefix='/fiscal')
+    app.register_blueprint(imagens_bp)
 
     from .models.user import User
     from .models.configuracao import Configuracao
@@ -84,6 +86,22 @@ def create_app():
     # Registrar error handlers
     register_error_handlers(app)
 
+    # Manutenção de agregados materializados de produtos
+    from .services.agregados_service import AgregadosService
+    AgregadosService.registrar_eventos()
+
+    # Resumo mensal de notas fiscais
+    from .services.resumo_fiscal_service import ResumoFiscalService
+    ResumoFiscalService.registrar_eventos()
+
+    # Cache de certificados A1 carregados
+    from .services.certificado_service import CertificadoService
+    CertificadoService.registrar_eventos()
+
+    # Invalidação do cache da vitrine por versão de tabela
+    from .services.cache_service import CacheService
+    CacheService.registrar_eventos(app)
+
     # Criar tabelas automaticamente (para Vercel/serverless)
     with app.app_context():
         try:
@@ -93,6 +111,14 @@ def create_app():
         except Exception as e:
             app.logger.warning(f'Aviso ao verificar tabelas: {e}')
 
+        # Índice de busca textual de produtos
+        from .services.busca_service import BuscaService
+        BuscaService.instalar_indices()
+
+        # Aviso se a validação XSD da NF-e estiver desligada por falta dos schemas
+        from .services.validador_xsd_service import ValidadorXSDService
+        ValidadorXSDService.verificar_instalacao()
+
     return app
 
 
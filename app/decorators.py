@@ -1,5 +1,5 @@
 from flask_login import current_user
-from flask import abort
+from flask import abort, g, request, make_response, get_flashed_messages
 from functools import wraps
 
 
@@ -24,4 +24,100 @@ def super_admin_required(f):
         if current_user.tipo_usuario != 'super_admin':
             return abort(403)
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def cache_resposta(tabelas, timeout=None):
+    """
+    Cacheia a página HTML para visitantes anônimos
+
+    A chave inclui a query string normalizada e a versão das tabelas
+    informadas: qualquer commit nessas tabelas invalida a página.
+
+    Args:
+        tabelas: Tabelas de que a página depende
+        timeout: Segundos de validade (padrão: CACHE_CATALOGO_TIMEOUT)
+    """
+    from app import cache
+    from app.services.cache_service import CacheService
+
+    def decorator(f):
+        # Nome estável do endpoint para as estatísticas (ex: 'marketplace.loja')
+        nome = f"{f.__module__.rsplit('.', 1)[-1]}.{f.__name__}"
+        CacheService.endpoints.add(nome)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not CacheService.pode_cachear_resposta():
+                return f(*args, **kwargs)
+
+            chave = CacheService.chave_resposta(tabelas)
+            corpo = cache.get(chave)
+            if corpo is not None:
+                CacheService.registrar_acesso(nome, True)
+                resposta = make_response(CacheService.preencher_csrf(corpo))
+                resposta.headers['X-Cache'] = 'HIT'
+                return resposta
+
+            g.cache_resposta_renderizando = True
+            try:
+                resposta = make_response(f(*args, **kwargs))
+            finally:
+                g.cache_resposta_renderizando = False
+
+            CacheService.registrar_acesso(nome, False)
+            if resposta.direct_passthrough or resposta.mimetype != 'text/html':
+                return resposta
+
+            corpo = resposta.get_data(as_text=True)
+            cacheavel = (
+                resposta.status_code == 200
+                and not g.get('cache_resposta_ignorar')
+                and not get_flashed_messages()
+            )
+            if cacheavel:
+                cache.set(chave, corpo, timeout=CacheService.timeout_padrao(timeout))
+                resposta.headers['X-Cache'] = 'MISS'
+            resposta.set_data(CacheService.preencher_csrf(corpo))
+            return resposta
+        return decorated_function
+    return decorator
+
+
+def etag_por_versao(tabelas):
+    """
+    GET condicional para APIs JSON do painel
+
+    O ETag é derivado da versão das tabelas lidas pelo endpoint (trocada a
+    cada commit que as altera; para os rollups, lida do banco, já que só
+    o worker os escreve). Se o cliente já tem a versão atual
+    (If-None-Match), responde 304 sem executar a view nem as consultas.
+    Sem cache compartilhado, tabelas versionadas pelo cache não geram ETag
+    (o commit de outro processo não trocaria o token). Use depois dos
+    decoradores de autenticação.
+
+    Args:
+        tabelas: Tabelas lidas pelo endpoint
+    """
+    from app.services.cache_service import CacheService
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or not CacheService.versoes_confiaveis(tabelas):
+                return f(*args, **kwargs)
+
+            etag = CacheService.etag_resposta(tabelas)
+            if request.if_none_match.contains(etag):
+                resposta = make_response('', 304)
+            else:
+                resposta = make_response(f(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+
+            resposta.set_etag(etag)
+            # Dados internos: o navegador guarda, mas sempre revalida
+            resposta.headers['Cache-Control'] = 'private, no-cache'
+            return resposta
+        return decorated_function
+    return decorator
@@ -64,6 +64,12 @@ from .conteudo import (
 # Modelo legado (manter por compatibilidade)
 from .ordem_servico import OrdemServico as OrdemServicoLegacy
 
+# Numeração de documentos
+from .numeracao import SequenciaDocumento, BlocoNumeracao
+
+# Rollups de vendas (BI)
+from .rollup import VendaDiaria, PedidoDiario, EstadoRollup
+
 # Modelos Fiscais (NFe, Orçamentos, Configurações)
 from .fiscal import (
     ConfiguracaoEmpresa,
@@ -79,7 +85,11 @@ from .fiscal import (
     ContaBancaria,
     TransacaoBancaria,
     ConfiguracaoImposto,
-    InutilizacaoNFe
+    InutilizacaoNFe,
+    ResumoFiscalMensal,
+    StatusSefaz,
+    LoteNFe,
+    FilaEmissaoNFe
 )
 
 __all__ = [
@@ -130,6 +140,13 @@ __all__ = [
     'Contato',
     'Newsletter',
     'Banner',
+    # Numeração
+    'SequenciaDocumento',
+    'BlocoNumeracao',
+    # Rollups
+    'VendaDiaria',
+    'PedidoDiario',
+    'EstadoRollup',
     # Fiscal/NFe
     'ConfiguracaoEmpresa',
     'CertificadoDigital',
@@ -145,4 +162,8 @@ __all__ = [
     'TransacaoBancaria',
     'ConfiguracaoImposto',
     'InutilizacaoNFe',
+    'ResumoFiscalMensal',
+    'StatusSefaz',
+    'LoteNFe',
+    'FilaEmissaoNFe',
 ]
\ No newline at end of file
@@ -76,7 +76,8 @@ class Cliente(db.Model):
 
     def calcular_rfm(self):
         """Calcula score RFM (Recency, Frequency, Monetary)"""
-        # Implementação simplificada - pode ser refinada
+        # Implementação simplificada por limiares fixos; o score por quintis de
+        # todos os clientes é calculado em lote pelo RFMService (worker)
         recency_score = 5 if self.ultima_compra and (datetime.utcnow() - self.ultima_compra).days < 30 else 1
         frequency_score = min(5, self.quantidade_pedidos // 2)
         monetary_score = min(5, int(self.total_compras / 1000))
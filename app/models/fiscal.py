@@ -109,12 +109,12 @@ class ConfiguracaoEmpresa(db.Model):
         self.cnae_secundarios = json.dumps(lista)
 
     def proximo_numero_nfe(self):
-        self.ultimo_numero_nfe += 1
-        return self.ultimo_numero_nfe
+        from app.services.numeracao_service import NumeracaoService
+        return NumeracaoService.proximo_numero_fiscal(self, '55')[1]
 
     def proximo_numero_nfce(self):
-        self.ultimo_numero_nfce += 1
-        return self.ultimo_numero_nfce
+        from app.services.numeracao_service import NumeracaoService
+        return NumeracaoService.proximo_numero_fiscal(self, '65')[1]
 
     def __repr__(self):
         return f'<Empresa {self.razao_social}>'
@@ -331,20 +331,8 @@ class Orcamento(db.Model):
     @staticmethod
     def gerar_numero():
         """Gera número único do orçamento"""
-        ano = datetime.now().year
-        ultimo = Orcamento.query.filter(
-            Orcamento.numero_orcamento.like(f'ORC-{ano}-%')
-        ).order_by(Orcamento.id.desc()).first()
-
-        if ultimo:
-            try:
-                ultimo_num = int(ultimo.numero_orcamento.split('-')[-1])
-            except:
-                ultimo_num = 0
-        else:
-            ultimo_num = 0
-
-        return f'ORC-{ano}-{str(ultimo_num + 1).zfill(5)}'
+        from app.services.numeracao_service import NumeracaoService
+        return NumeracaoService.numero_orcamento()
 
     def __repr__(self):
         return f'<Orcamento {self.numero_orcamento}>'
@@ -450,7 +438,7 @@ class NotaFiscal(db.Model):
     indicador_presenca = db.Column(db.Integer, default=1)  # 0=Não se aplica, 1=Presencial, etc.
 
     # Datas
-    data_emissao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    data_emissao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     data_saida_entrada = db.Column(db.DateTime)
 
     # Valores Totais
@@ -504,13 +492,18 @@ class NotaFiscal(db.Model):
 
     # Status SEFAZ
     status = db.Column(db.String(30), default='rascunho')
-    # rascunho, validada, assinada, transmitida, autorizada, rejeitada, denegada, cancelada, inutilizada
+    # rascunho, validada, assinada, contingencia, transmitida, autorizada, rejeitada, denegada, cancelada, inutilizada
 
     codigo_status_sefaz = db.Column(db.String(3))
     motivo_status_sefaz = db.Column(db.String(500))
     data_autorizacao = db.Column(db.DateTime)
     protocolo_autorizacao = db.Column(db.String(20))
 
+    # Forma de emissão (tpEmis): 1=Normal, 6=SVC-AN, 7=SVC-RS, 9=Contingência off-line NFC-e
+    tipo_emissao = db.Column(db.Integer, default=1)
+    data_contingencia = db.Column(db.DateTime)  # dhCont: entrada em contingência
+    justificativa_contingencia = db.Column(db.String(256))  # xJust
+
     # Cancelamento
     cancelada = db.Column(db.Boolean, default=False)
     data_cancelamento = db.Column(db.DateTime)
@@ -520,14 +513,14 @@ class NotaFiscal(db.Model):
     # Carta de Correção
     tem_carta_correcao = db.Column(db.Boolean, default=False)
 
-    # XMLs
-    xml_nfe = db.Column(db.Text)  # XML da NFe assinada
-    xml_autorizacao = db.Column(db.Text)  # XML de retorno da SEFAZ
-    xml_cancelamento = db.Column(db.Text)
+    # XMLs (carregados só quando acessados: listagens não trazem o conteúdo)
+    xml_nfe = db.deferred(db.Column(db.Text), group='xml')  # XML da NFe assinada
+    xml_autorizacao = db.deferred(db.Column(db.Text), group='xml')  # XML de retorno da SEFAZ
+    xml_cancelamento = db.deferred(db.Column(db.Text), group='xml')
 
     # PDFs
     pdf_danfe_url = db.Column(db.String(500))
-    pdf_danfe_base64 = db.Column(db.Text)
+    pdf_danfe_base64 = db.deferred(db.Column(db.Text))
 
     # Ambiente
     ambiente = db.Column(db.Integer, default=2)  # 1=Produção, 2=Homologação
@@ -538,6 +531,9 @@ class NotaFiscal(db.Model):
     ordem_servico_id = db.Column(db.Integer, db.ForeignKey('ordens_servico.id'))
     nfe_referenciada = db.Column(db.String(44))  # Chave NFe referenciada
 
+    # Lote de envio assíncrono (LoteNFeService)
+    lote_nfe_id = db.Column(db.Integer, db.ForeignKey('lote_nfe.id'), index=True)
+
     # Usuário
     usuario_emissao_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
@@ -552,6 +548,18 @@ class NotaFiscal(db.Model):
     usuario_emissao = db.relationship('User', foreign_keys=[usuario_emissao_id])
     orcamento = db.relationship('Orcamento', foreign_keys=[orcamento_id], backref='notas_fiscais')
 
+    # Colunas usadas nas listagens (load_only)
+    COLUNAS_RESUMO = (
+        'id', 'modelo', 'serie', 'numero', 'chave_acesso', 'data_emissao',
+        'destinatario_razao_social', 'destinatario_cpf_cnpj', 'valor_total',
+        'valor_icms', 'status', 'cancelada', 'possui_xml'
+    )
+
+    @classmethod
+    def query_resumo(cls):
+        """Query que carrega apenas as colunas das listagens"""
+        return cls.query.options(db.load_only(*[getattr(cls, nome) for nome in cls.COLUNAS_RESUMO]))
+
     def get_duplicatas(self):
         if self.duplicatas:
             return json.loads(self.duplicatas)
@@ -604,6 +612,10 @@ class NotaFiscal(db.Model):
         return f'<NFe {self.numero} - {self.chave_acesso}>'
 
 
+# Indica se há XML sem carregar o conteúdo (usado nas listagens)
+NotaFiscal.possui_xml = db.column_property(NotaFiscal.__table__.c.xml_nfe.isnot(None))
+
+
 class ItemNotaFiscal(db.Model):
     """Item da Nota Fiscal"""
     __tablename__ = 'item_nota_fiscal'
@@ -969,3 +981,117 @@ class InutilizacaoNFe(db.Model):
 
     def __repr__(self):
         return f'<Inutilização {self.numero_inicial}-{self.numero_final}>'
+
+
+class ResumoFiscalMensal(db.Model):
+    """Totais mensais de notas por modelo, status e cancelamento (mantido pelo ResumoFiscalService)"""
+    __tablename__ = 'resumo_fiscal_mensal'
+    __table_args__ = (
+        db.Index('ix_resumo_fiscal_mensal_mes', 'mes', 'modelo', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Date, nullable=False)  # Primeiro dia do mês de emissão
+    modelo = db.Column(db.String(2))
+    status = db.Column(db.String(30))
+    cancelada = db.Column(db.Boolean, default=False)
+
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(db.Numeric(15, 2), default=0)
+    valor_icms = db.Column(db.Numeric(15, 2), default=0)
+
+    def __repr__(self):
+        return f'<ResumoFiscal {self.mes:%m/%Y} {self.modelo} {self.status}: {self.quantidade}>'
+
+
+class StatusSefaz(db.Model):
+    """Histórico de disponibilidade do serviço da SEFAZ (registrado pelo SefazMonitorService)"""
+    __tablename__ = 'status_sefaz'
+    __table_args__ = (
+        db.Index('ix_status_sefaz_uf_ambiente_data', 'uf', 'ambiente', 'data_consulta'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    uf = db.Column(db.String(2), nullable=False)
+    ambiente = db.Column(db.Integer, nullable=False)  # 1=Produção, 2=Homologação
+
+    online = db.Column(db.Boolean, default=False)
+    codigo = db.Column(db.String(3))  # cStat (107 = em operação)
+    mensagem = db.Column(db.String(500))
+    latencia_ms = db.Column(db.Integer)
+
+    data_consulta = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<StatusSefaz {self.uf}/{self.ambiente} {"online" if self.online else "offline"}>'
+
+
+class LoteNFe(db.Model):
+    """Lote de NF-e enviado de forma assíncrona (enviNFe com indSinc=0)"""
+    __tablename__ = 'lote_nfe'
+    __table_args__ = (
+        db.Index('ix_lote_nfe_status_proxima', 'status', 'proxima_consulta'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    numero_lote = db.Column(db.String(15), unique=True, nullable=False)  # idLote
+    empresa_id = db.Column(db.Integer, db.ForeignKey('configuracao_empresa.id'), nullable=False)
+    uf = db.Column(db.String(2), nullable=False)
+    ambiente = db.Column(db.Integer, nullable=False)
+    modelo = db.Column(db.String(2), default='55')
+
+    # montado, processando, processado, erro
+    status = db.Column(db.String(20), default='montado')
+    recibo = db.Column(db.String(15))  # nRec
+    codigo_status = db.Column(db.String(3))
+    motivo_status = db.Column(db.String(500))
+
+    quantidade = db.Column(db.Integer, default=0)
+    autorizadas = db.Column(db.Integer, default=0)
+    rejeitadas = db.Column(db.Integer, default=0)
+
+    # Consulta do recibo com backoff
+    tentativas_consulta = db.Column(db.Integer, default=0)
+    proxima_consulta = db.Column(db.DateTime)
+
+    data_envio = db.Column(db.DateTime)
+    data_processamento = db.Column(db.DateTime)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    notas = db.relationship('NotaFiscal', backref='lote_nfe', lazy='dynamic')
+    empresa = db.relationship('ConfiguracaoEmpresa')
+    usuario = db.relationship('User')
+
+    def __repr__(self):
+        return f'<LoteNFe {self.numero_lote} {self.status}>'
+
+
+class FilaEmissaoNFe(db.Model):
+    """Item da fila de emissão: nota aguardando assinatura e transmissão pelo worker"""
+    __tablename__ = 'fila_emissao_nfe'
+    __table_args__ = (
+        db.Index('ix_fila_emissao_nfe_status_proxima', 'status', 'proxima_tentativa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Uma entrada por nota: enfileirar de novo não duplica a emissão
+    nota_fiscal_id = db.Column(db.Integer, db.ForeignKey('nota_fiscal.id'), unique=True, nullable=False)
+
+    # pendente, processando, concluida, erro
+    status = db.Column(db.String(20), default='pendente', nullable=False)
+    tentativas = db.Column(db.Integer, default=0)
+    proxima_tentativa = db.Column(db.DateTime, default=datetime.utcnow)
+    ultimo_erro = db.Column(db.String(500))
+
+    # Reserva pelo worker (compare-and-set em status)
+    trabalhador = db.Column(db.String(100))
+    data_reserva = db.Column(db.DateTime)
+
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_conclusao = db.Column(db.DateTime)
+
+    nota = db.relationship('NotaFiscal', backref=db.backref('fila_emissao', uselist=False))
+
+    def __repr__(self):
+        return f'<FilaEmissaoNFe nota={self.nota_fiscal_id} {self.status}>'
@@ -98,6 +98,12 @@ class OrdemServico(db.Model):
     def __repr__(self):
         return f'<OrdemServico {self.numero_os} | Status: {self.status}>'
 
+    @staticmethod
+    def gerar_numero():
+        """Gera número único da ordem de serviço"""
+        from app.services.numeracao_service import NumeracaoService
+        return NumeracaoService.numero_os()
+
 
 class ProdutoOS(db.Model):
     """Produtos/materiais utilizados na ordem de serviço"""
@@ -0,0 +1,40 @@
+"""
+Modelos de Numeração de Documentos
+Contadores de séries (PED, ORC, OS, NFe/NFCe) e blocos alocados
+"""
+from app import db
+from datetime import datetime
+
+
+class SequenciaDocumento(db.Model):
+    """Contador de uma série de numeração (ex: 'PED-2025', 'NFE-55-1')"""
+    __tablename__ = 'sequencias_documento'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    ultimo_valor = db.Column(db.Integer, nullable=False, default=0)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SequenciaDocumento {self.chave} | Último: {self.ultimo_valor}>'
+
+
+class BlocoNumeracao(db.Model):
+    """
+    Faixa de números entregue a um processo
+
+    Permite rastrear lacunas na numeração fiscal: todo número de um bloco
+    que não virou NotaFiscal nem foi inutilizado precisa ser inutilizado.
+    """
+    __tablename__ = 'blocos_numeracao'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(50), nullable=False, index=True)
+    inicio = db.Column(db.Integer, nullable=False)
+    fim = db.Column(db.Integer, nullable=False)
+    processo = db.Column(db.String(100), nullable=True)  # host:pid que recebeu o bloco
+    data_alocacao = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<BlocoNumeracao {self.chave} {self.inicio}-{self.fim}>'
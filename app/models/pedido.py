@@ -12,7 +12,7 @@ class Pedido(db.Model):
 
     # Datas
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     data_aprovacao = db.Column(db.DateTime, nullable=True)
     data_envio = db.Column(db.DateTime, nullable=True)
     data_entrega = db.Column(db.DateTime, nullable=True)
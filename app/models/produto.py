@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+import json
 
 class Produto(db.Model):
     __tablename__ = 'produtos'
@@ -16,6 +17,7 @@ class Produto(db.Model):
     imagem_url = db.Column(db.String(255), nullable=True)
     imagem_filename = db.Column(db.String(255), nullable=True)  # Nome do arquivo local
     imagens_adicionais = db.Column(db.Text, nullable=True)  # JSON array de URLs
+    imagens_rendicoes = db.Column(db.Text, nullable=True)  # JSON {rendição: {'webp': url, 'jpeg': url}} (ImagemService)
     estoque = db.Column(db.Integer, default=0)  # Estoque direto (para compatibilidade)
 
     # Relacionamento com Categoria
@@ -37,15 +39,16 @@ class Produto(db.Model):
     visualizacoes = db.Column(db.Integer, default=0)
     vendas_total = db.Column(db.Integer, default=0)
 
+    # Agregados materializados (mantidos por AgregadosService a cada escrita
+    # em Estoque/MovimentacaoEstoque/Review)
+    estoque_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relacionamentos
     estoques = db.relationship('Estoque', backref='produto', lazy='dynamic', cascade='all, delete-orphan')
     reviews = db.relationship('Review', backref='produto', lazy='dynamic', cascade='all, delete-orphan')
 
-    @property
-    def estoque_total(self):
-        """Retorna quantidade total em estoque somando todas as localizações"""
-        return sum([e.quantidade for e in self.estoques]) if self.estoques else 0
-
     @property
     def preco_final(self):
         """Retorna preço promocional se existir, senão preço normal"""
@@ -60,11 +63,48 @@ class Produto(db.Model):
 
     @property
     def rating_medio(self):
-        """Calcula rating médio baseado em reviews"""
-        reviews_list = list(self.reviews)
-        if reviews_list:
-            return sum([r.rating for r in reviews_list]) / len(reviews_list)
+        """Calcula rating médio a partir dos agregados materializados"""
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
+    @property
+    def rendicoes(self):
+        """Rendições prontas da imagem ({} enquanto estão sendo geradas)"""
+        try:
+            return json.loads(self.imagens_rendicoes) if self.imagens_rendicoes else {}
+        except (TypeError, ValueError):
+            return {}
+
+    def imagem_rendicao(self, nome, formato='jpeg'):
+        """
+        URL de uma rendição (thumb, card, zoom). Enquanto as rendições não
+        ficam prontas, usa o redimensionamento sob demanda (/img).
+        """
+        rendicao = self.rendicoes.get(nome, {})
+        if rendicao.get(formato):
+            return rendicao[formato]
+        if self.imagem_filename:
+            from flask import url_for
+            from app.services.imagem_service import ImagemService
+            from app.services.imagem_cache_service import ImagemCacheService
+
+            lado = ImagemService.rendicoes_configuradas().get(nome)
+            if lado in ImagemCacheService.dimensoes_permitidas():
+                return url_for('imagens.redimensionar', filename=self.imagem_filename, w=lado, fmt=formato)
+            return f'/static/produtos/{self.imagem_filename}'
+        return self.imagem_url
+
+    def imagem_srcset(self, larguras=(300, 450, 600), formato='jpeg'):
+        """srcset com larguras servidas pelo redimensionamento sob demanda"""
+        if not self.imagem_filename:
+            return ''
+        from flask import url_for
+
+        return ', '.join(
+            f"{url_for('imagens.redimensionar', filename=self.imagem_filename, w=largura, fmt=formato)} {largura}w"
+            for largura in larguras
+        )
+
     def __repr__(self):
         return f'<Produto {self.nome}>'
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Modelos de Rollup de Vendas (BI)
+Agregados diários de pedidos mantidos pelo RollupVendasService
+"""
+from app import db
+from datetime import datetime
+
+
+class VendaDiaria(db.Model):
+    """Itens vendidos por dia x produto x categoria x status do pedido"""
+    __tablename__ = 'rollup_vendas_diarias'
+    __table_args__ = (
+        db.Index('ix_rollup_vendas_dia_produto', 'dia', 'produto_id'),
+        db.Index('ix_rollup_vendas_dia_categoria', 'dia', 'categoria_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    produto_id = db.Column(db.Integer, nullable=True)
+    categoria_id = db.Column(db.Integer, nullable=True)  # Categoria do produto no momento do rollup
+    status = db.Column(db.String(50), nullable=True)
+
+    itens = db.Column(db.Integer, nullable=False, default=0)  # Linhas de ItemPedido
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor = db.Column(db.Float, nullable=False, default=0.0)  # Soma de quantidade x preço unitário
+
+    def __repr__(self):
+        return f'<VendaDiaria {self.dia} produto={self.produto_id} {self.status}>'
+
+
+class PedidoDiario(db.Model):
+    """Pedidos por dia x status (quantidade e valor total com frete/desconto)"""
+    __tablename__ = 'rollup_pedidos_diarios'
+    __table_args__ = (
+        db.Index('ix_rollup_pedidos_dia_status', 'dia', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(50), nullable=True)
+
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<PedidoDiario {self.dia} {self.status}: {self.pedidos}>'
+
+
+class EstadoRollup(db.Model):
+    """Marca d'água (high-water mark) da atualização incremental de um rollup"""
+    __tablename__ = 'rollup_estado'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(50), unique=True, nullable=False)
+    marca = db.Column(db.DateTime, nullable=True)  # Pedidos alterados até aqui já estão no rollup
+    data_execucao = db.Column(db.DateTime, default=datetime.utcnow)
+    dias_recalculados = db.Column(db.Integer, default=0)  # Última execução
+
+    def __repr__(self):
+        return f'<EstadoRollup {self.nome} até {self.marca}>'
@@ -3,6 +3,7 @@ from flask_login import login_required
 from app.decorators import admin_required
 from app.models.produto import Produto
 from app.models.categoria import Categoria
+from app.services.imagem_service import ImagemService
 from app import db
 from app.routes.admin import admin_bp
 
@@ -32,8 +33,16 @@ def novo_produto():
             estoque=estoque,
             categoria_id=categoria_id if categoria_id else None
         )
+        imagem = request.files.get("imagem")
+        if imagem and imagem.filename:
+            erro = ImagemService.anexar(produto, imagem)
+            if erro:
+                flash(erro, "danger")
+                return render_template("admin/produtos/novo.html", categorias=categorias)
         db.session.add(produto)
         db.session.commit()
+        if produto.imagem_filename and not produto.imagens_rendicoes:
+            ImagemService.agendar(produto.id)
         flash("Produto criado com sucesso!", "success")
         return redirect(url_for("admin.listar_produtos"))
     return render_template("admin/produtos/novo.html", categorias=categorias)
@@ -51,7 +60,16 @@ def editar_produto(id):
         produto.estoque = int(request.form.get("estoque", 0))
         categoria_id = request.form.get("categoria_id")
         produto.categoria_id = categoria_id if categoria_id else None
+        imagem = request.files.get("imagem")
+        if imagem and imagem.filename:
+            erro = ImagemService.anexar(produto, imagem)
+            if erro:
+                db.session.rollback()
+                flash(erro, "danger")
+                return render_template("admin/produtos/editar.html", produto=produto, categorias=categorias)
         db.session.commit()
+        if produto.imagem_filename and not produto.imagens_rendicoes:
+            ImagemService.agendar(produto.id)
         flash("Produto atualizado com sucesso!", "success")
         return redirect(url_for("admin.listar_produtos"))
     return render_template("admin/produtos/editar.html", produto=produto, categorias=categorias)
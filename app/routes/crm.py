@@ -7,8 +7,9 @@ from flask_login import login_required, current_user
 from app.models.crm import Cliente, Lead, Oportunidade, Interacao, Atividade, Proposta
 from app.models.user import User
 from app import db
-from app.decorators import admin_required
+from app.decorators import admin_required, etag_por_versao
 from app.utils import paginate_query
+from app.services.kpi_service import KPIService
 from sqlalchemy import or_, func
 from datetime import datetime, timedelta
 
@@ -22,15 +23,12 @@ crm_bp = Blueprint('crm', __name__)
 @admin_required
 def dashboard():
     """Dashboard CRM com métricas principais"""
-    # Contadores
-    total_clientes = Cliente.query.filter_by(ativo=True).count()
-    total_leads = Lead.query.filter(Lead.status.notin_(['ganho', 'perdido', 'descartado'])).count()
-    total_oportunidades = Oportunidade.query.filter_by(status='aberta').count()
-
-    # Valor total do pipeline
-    pipeline_valor = db.session.query(
-        func.sum(Oportunidade.valor_ponderado)
-    ).filter_by(status='aberta').scalar() or 0
+    # Contadores (snapshot compartilhado com os demais dashboards)
+    kpis = KPIService.snapshot()
+    total_clientes = kpis['total_clientes']
+    total_leads = kpis['leads_em_aberto']
+    total_oportunidades = kpis['oportunidades_abertas']
+    pipeline_valor = kpis['valor_pipeline']
 
     # Leads por status
     leads_por_status = db.session.query(
@@ -233,7 +231,7 @@ def listar_clientes():
         )
 
     query = query.order_by(Cliente.data_cadastro.desc())
-    pagination = paginate_query(query, page, 20)
+    pagination = paginate_query(query, page, 20, modo='cursor', estimar_total=True)
 
     return render_template(
         'crm/clientes/listar.html',
@@ -410,6 +408,7 @@ def concluir_atividade(atividade_id):
 @crm_bp.route('/api/leads-status')
 @login_required
 @admin_required
+@etag_por_versao(['leads'])
 def api_leads_status():
     """API: Leads por status"""
     dados = db.session.query(
@@ -422,6 +421,7 @@ def api_leads_status():
 @crm_bp.route('/api/pipeline-valor')
 @login_required
 @admin_required
+@etag_por_versao(['oportunidades'])
 def api_pipeline_valor():
     """API: Valor do pipeline por estágio"""
     dados = db.session.query(
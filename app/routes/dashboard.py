@@ -2,16 +2,17 @@
 Blueprint Dashboard BI - Business Intelligence
 Dashboards, KPIs e Análises com Chart.js
 """
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, request, abort
 from flask_login import login_required, current_user
-from app.decorators import admin_required
+from app.decorators import admin_required, etag_por_versao
 from app.models import (
-    Pedido, ItemPedido, Produto, Estoque, Cliente, Lead,
-    Oportunidade, ContaPagar, ContaReceber, User, Categoria
+    Produto, Estoque, Oportunidade, ContaPagar, ContaReceber, User
 )
 from app import db
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from app.services.rollup_service import RollupVendasService
+from app.services.kpi_service import KPIService
+from sqlalchemy import func
+from datetime import datetime, date, timedelta
 import json
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
@@ -22,120 +23,97 @@ dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 @admin_required
 def index():
     """Dashboard principal com visão geral"""
-    # KPIs básicos
-    total_vendas = db.session.query(func.sum(Pedido.total)).scalar() or 0
-    total_pedidos = Pedido.query.count()
-    total_produtos = Produto.query.filter_by(ativo=True).count()
-    total_clientes = Cliente.query.filter_by(ativo=True).count()
-
-    # Ticket médio
-    ticket_medio = total_vendas / total_pedidos if total_pedidos > 0 else 0
-
-    # Pedidos por status
-    pedidos_pendentes = Pedido.query.filter_by(status='pendente').count()
-    pedidos_enviados = Pedido.query.filter_by(status='enviado').count()
-
-    # Estoque baixo
-    produtos_estoque_baixo = db.session.query(Produto).join(Estoque).filter(
-        Estoque.quantidade <= Estoque.quantidade_minima
-    ).count()
-
-    # Leads ativos
-    leads_ativos = Lead.query.filter(Lead.status.in_(['novo', 'contatado', 'qualificado'])).count()
-
-    # Oportunidades abertas
-    oportunidades_abertas = Oportunidade.query.filter_by(status='aberta').count()
-    valor_pipeline = db.session.query(func.sum(Oportunidade.valor_ponderado)).filter_by(status='aberta').scalar() or 0
+    kpis = KPIService.snapshot()
 
     context = {
-        'total_vendas': total_vendas,
-        'total_pedidos': total_pedidos,
-        'total_produtos': total_produtos,
-        'total_clientes': total_clientes,
-        'ticket_medio': ticket_medio,
-        'pedidos_pendentes': pedidos_pendentes,
-        'pedidos_enviados': pedidos_enviados,
-        'produtos_estoque_baixo': produtos_estoque_baixo,
-        'leads_ativos': leads_ativos,
-        'oportunidades_abertas': oportunidades_abertas,
-        'valor_pipeline': valor_pipeline
+        'total_vendas': kpis['total_vendas'],
+        'total_pedidos': kpis['total_pedidos'],
+        'total_produtos': kpis['total_produtos'],
+        'total_clientes': kpis['total_clientes'],
+        'ticket_medio': kpis['ticket_medio'],
+        'pedidos_pendentes': kpis['pedidos_pendentes'],
+        'pedidos_enviados': kpis['pedidos_enviados'],
+        'produtos_estoque_baixo': kpis['produtos_estoque_baixo'],
+        'leads_ativos': kpis['leads_ativos'],
+        'oportunidades_abertas': kpis['oportunidades_abertas'],
+        'valor_pipeline': kpis['valor_pipeline']
     }
 
     return render_template('dashboard/index.html', **context)
 
 
+def _periodo(padrao_dias=None):
+    """
+    Lê o período dos parâmetros inicio/fim (AAAA-MM-DD) e status (lista
+    separada por vírgula). Sem inicio, usa os últimos ``padrao_dias``.
+    """
+    try:
+        inicio = date.fromisoformat(request.args['inicio']) if request.args.get('inicio') else None
+        fim = date.fromisoformat(request.args['fim']) if request.args.get('fim') else None
+    except ValueError:
+        abort(400, 'Datas devem estar no formato AAAA-MM-DD')
+
+    if inicio is None and padrao_dias:
+        inicio = (fim or date.today()) - timedelta(days=padrao_dias)
+    status = [s for s in request.args.get('status', '').split(',') if s] or None
+    return inicio, fim, status
+
+
 @dashboard_bp.route('/api/vendas-mes')
 @login_required
 @admin_required
+@etag_por_versao(['rollup_pedidos_diarios'])
 def api_vendas_mes():
-    """API: Vendas por mês (últimos 12 meses)"""
-    hoje = datetime.now()
-    doze_meses_atras = hoje - timedelta(days=365)
-
-    # Query vendas por mês
-    vendas = db.session.query(
-        extract('year', Pedido.data_criacao).label('ano'),
-        extract('month', Pedido.data_criacao).label('mes'),
-        func.sum(Pedido.total).label('total'),
-        func.count(Pedido.id).label('quantidade')
-    ).filter(
-        Pedido.data_criacao >= doze_meses_atras
-    ).group_by('ano', 'mes').order_by('ano', 'mes').all()
-
-    # Formatar dados para Chart.js
-    labels = []
-    valores = []
-    quantidades = []
+    """API: Vendas por mês (padrão: últimos 12 meses) ou por dia (agrupamento=dia)"""
+    inicio, fim, status = _periodo(padrao_dias=365)
+    agrupamento = request.args.get('agrupamento', 'mes')
 
     meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
 
-    for venda in vendas:
-        mes_nome = meses[int(venda.mes) - 1]
-        ano = int(venda.ano)
-        labels.append(f"{mes_nome}/{ano}")
-        valores.append(float(venda.total))
-        quantidades.append(int(venda.quantidade))
+    # Agrupar os rollups diários no período
+    periodos = {}
+    for dia, quantidade, total in RollupVendasService.pedidos_por_dia(inicio, fim, status):
+        if agrupamento == 'dia':
+            chave, label = dia, dia.strftime('%d/%m/%Y')
+        else:
+            chave, label = (dia.year, dia.month), f"{meses[dia.month - 1]}/{dia.year}"
+        atual = periodos.setdefault(chave, [label, 0.0, 0])
+        atual[1] += total
+        atual[2] += quantidade
 
+    # Formatar dados para Chart.js
+    ordenados = [periodos[chave] for chave in sorted(periodos)]
     return jsonify({
-        'labels': labels,
-        'valores': valores,
-        'quantidades': quantidades
+        'labels': [p[0] for p in ordenados],
+        'valores': [p[1] for p in ordenados],
+        'quantidades': [p[2] for p in ordenados]
     })
 
 
 @dashboard_bp.route('/api/produtos-mais-vendidos')
 @login_required
 @admin_required
+@etag_por_versao(['rollup_vendas_diarias', 'produtos'])
 def api_produtos_mais_vendidos():
-    """API: Top 10 produtos mais vendidos"""
-    produtos = db.session.query(
-        Produto.nome,
-        func.sum(ItemPedido.quantidade).label('total_vendido'),
-        func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario).label('valor_total')
-    ).join(ItemPedido).group_by(Produto.id, Produto.nome).order_by(
-        func.sum(ItemPedido.quantidade).desc()
-    ).limit(10).all()
-
-    labels = [p.nome for p in produtos]
-    quantidades = [int(p.total_vendido) for p in produtos]
-    valores = [float(p.valor_total) for p in produtos]
+    """API: Top 10 produtos mais vendidos (filtros: inicio, fim, status)"""
+    inicio, fim, status = _periodo()
+    produtos = RollupVendasService.produtos_mais_vendidos(inicio, fim, status, limite=10)
 
     return jsonify({
-        'labels': labels,
-        'quantidades': quantidades,
-        'valores': valores
+        'labels': [nome for nome, _, _ in produtos],
+        'quantidades': [quantidade for _, quantidade, _ in produtos],
+        'valores': [valor for _, _, valor in produtos]
     })
 
 
 @dashboard_bp.route('/api/pedidos-status')
 @login_required
 @admin_required
+@etag_por_versao(['rollup_pedidos_diarios'])
 def api_pedidos_status():
-    """API: Distribuição de pedidos por status"""
-    pedidos = db.session.query(
-        Pedido.status,
-        func.count(Pedido.id).label('quantidade')
-    ).group_by(Pedido.status).all()
+    """API: Distribuição de pedidos por status (filtros: inicio, fim)"""
+    inicio, fim, _ = _periodo()
+    pedidos = RollupVendasService.pedidos_por_status(inicio, fim)
 
     # Mapeamento de status para português
     status_map = {
@@ -148,8 +126,8 @@ def api_pedidos_status():
         'cancelado': 'Cancelado'
     }
 
-    labels = [status_map.get(p.status, p.status) for p in pedidos]
-    valores = [int(p.quantidade) for p in pedidos]
+    labels = [status_map.get(status, status) for status, _, _ in pedidos]
+    valores = [quantidade for _, quantidade, _ in pedidos]
 
     return jsonify({
         'labels': labels,
@@ -160,6 +138,7 @@ def api_pedidos_status():
 @dashboard_bp.route('/api/estoque-critico')
 @login_required
 @admin_required
+@etag_por_versao(['produtos', 'estoque'])
 def api_estoque_critico():
     """API: Produtos com estoque crítico"""
     produtos = db.session.query(
@@ -184,32 +163,23 @@ def api_estoque_critico():
 @dashboard_bp.route('/api/vendas-por-categoria')
 @login_required
 @admin_required
+@etag_por_versao(['rollup_vendas_diarias', 'categorias'])
 def api_vendas_por_categoria():
-    """API: Vendas por categoria de produto"""
-    vendas = db.session.query(
-        Categoria.nome,
-        func.count(ItemPedido.id).label('quantidade'),
-        func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario).label('valor_total')
-    ).join(Produto, Produto.categoria_id == Categoria.id).join(
-        ItemPedido, ItemPedido.produto_id == Produto.id
-    ).group_by(Categoria.id, Categoria.nome).order_by(
-        func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario).desc()
-    ).all()
-
-    labels = [v.nome for v in vendas]
-    quantidades = [int(v.quantidade) for v in vendas]
-    valores = [float(v.valor_total) for v in vendas]
+    """API: Vendas por categoria de produto (filtros: inicio, fim, status)"""
+    inicio, fim, status = _periodo()
+    vendas = RollupVendasService.vendas_por_categoria(inicio, fim, status)
 
     return jsonify({
-        'labels': labels,
-        'quantidades': quantidades,
-        'valores': valores
+        'labels': [nome for nome, _, _ in vendas],
+        'quantidades': [itens for _, itens, _ in vendas],
+        'valores': [valor for _, _, valor in vendas]
     })
 
 
 @dashboard_bp.route('/api/pipeline-crm')
 @login_required
 @admin_required
+@etag_por_versao(['oportunidades'])
 def api_pipeline_crm():
     """API: Pipeline de vendas CRM"""
     pipeline = db.session.query(
@@ -241,6 +211,7 @@ def api_pipeline_crm():
 @dashboard_bp.route('/api/financeiro-resumo')
 @login_required
 @admin_required
+@etag_por_versao(['contas_pagar', 'contas_receber'])
 def api_financeiro_resumo():
     """API: Resumo financeiro (contas a pagar/receber)"""
     hoje = datetime.now().date()
@@ -9,6 +9,7 @@ from app.models.produto import Produto
 from app import db
 from app.decorators import admin_required
 from app.utils import paginate_query
+from app.services.kpi_service import KPIService
 from sqlalchemy import or_, func
 from datetime import datetime, timedelta
 import uuid
@@ -24,43 +25,15 @@ erp_bp = Blueprint('erp', __name__)
 def dashboard():
     """Dashboard ERP com métricas financeiras"""
     hoje = datetime.now().date()
-    inicio_mes = hoje.replace(day=1)
-
-    # Fornecedores ativos
-    total_fornecedores = Fornecedor.query.filter_by(ativo=True).count()
-
-    # Compras pendentes
-    compras_pendentes = Compra.query.filter(
-        Compra.status.in_(['pendente', 'aprovado', 'em_transito'])
-    ).count()
-
-    # Contas a pagar - vencidas e a vencer
-    contas_pagar_vencidas = ContaPagar.query.filter(
-        ContaPagar.status != 'pago',
-        ContaPagar.data_vencimento < hoje
-    ).count()
 
-    contas_pagar_mes = db.session.query(
-        func.sum(ContaPagar.valor_original - ContaPagar.valor_pago)
-    ).filter(
-        ContaPagar.status != 'pago',
-        ContaPagar.data_vencimento >= inicio_mes,
-        ContaPagar.data_vencimento <= hoje.replace(day=28)
-    ).scalar() or 0
-
-    # Contas a receber - vencidas e a vencer
-    contas_receber_vencidas = ContaReceber.query.filter(
-        ContaReceber.status != 'recebido',
-        ContaReceber.data_vencimento < hoje
-    ).count()
-
-    contas_receber_mes = db.session.query(
-        func.sum(ContaReceber.valor_original - ContaReceber.valor_recebido)
-    ).filter(
-        ContaReceber.status != 'recebido',
-        ContaReceber.data_vencimento >= inicio_mes,
-        ContaReceber.data_vencimento <= hoje.replace(day=28)
-    ).scalar() or 0
+    # Contadores e totais do mês (snapshot compartilhado com os demais dashboards)
+    kpis = KPIService.snapshot()
+    total_fornecedores = kpis['total_fornecedores']
+    compras_pendentes = kpis['compras_pendentes']
+    contas_pagar_vencidas = kpis['contas_pagar_vencidas']
+    contas_pagar_mes = kpis['contas_pagar_mes']
+    contas_receber_vencidas = kpis['contas_receber_vencidas']
+    contas_receber_mes = kpis['contas_receber_mes']
 
     # Próximos vencimentos (contas a pagar)
     proximos_vencimentos = ContaPagar.query.filter(
@@ -425,7 +398,7 @@ def listar_contas_receber():
         )
 
     query = query.order_by(ContaReceber.data_vencimento.asc())
-    pagination = paginate_query(query, page, 20)
+    pagination = paginate_query(query, page, 20, modo='cursor', estimar_total=True)
 
     return render_template(
         'erp/financeiro/contas_receber.html',
@@ -14,10 +14,16 @@ from app.models import (
     ConfiguracaoEmpresa, CertificadoDigital, Contabilista,
     NotaFiscal, ItemNotaFiscal, CartaCorrecao, EnvioEmailNFe,
     ContaBancaria, TransacaoBancaria, ConfiguracaoImposto, InutilizacaoNFe,
-    Orcamento, ItemOrcamento
+    Orcamento, ItemOrcamento, LoteNFe
 )
 from app.services.nfe_service import NFeService
 from app.services.certificado_service import CertificadoService
+from app.services.numeracao_service import NumeracaoService
+from app.services.resumo_fiscal_service import ResumoFiscalService
+from app.services.sefaz_monitor_service import SefazMonitorService
+from app.services.lote_nfe_service import LoteNFeService
+from app.services.fila_emissao_service import FilaEmissaoService
+from app.services.contingencia_service import ContingenciaService
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import json
@@ -209,36 +215,20 @@ def index():
     empresa = ConfiguracaoEmpresa.query.first()
     certificado = CertificadoDigital.query.filter_by(ativo=True, padrao=True).first()
 
-    # Estatísticas do mês
-    inicio_mes = date.today().replace(day=1)
-    fim_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-
-    # Notas do mês
-    notas_mes = NotaFiscal.query.filter(
-        NotaFiscal.data_emissao >= inicio_mes,
-        NotaFiscal.data_emissao <= fim_mes
-    ).all()
-
-    total_notas = len(notas_mes)
-    notas_autorizadas = len([n for n in notas_mes if n.status == 'autorizada'])
-    notas_canceladas = len([n for n in notas_mes if n.cancelada])
-    valor_total_mes = sum(float(n.valor_total or 0) for n in notas_mes if n.status == 'autorizada')
+    # Estatísticas do mês (resumo mensal mantido a cada alteração de nota)
+    resumo = ResumoFiscalService.resumo_mes()
+    total_notas = resumo['total_notas']
+    notas_autorizadas = resumo['notas_autorizadas']
+    notas_canceladas = resumo['notas_canceladas']
+    valor_total_mes = resumo['valor_total_mes']
 
     # Últimas 10 notas
-    ultimas_notas = NotaFiscal.query.order_by(NotaFiscal.data_emissao.desc()).limit(10).all()
+    ultimas_notas = NotaFiscal.query_resumo().order_by(NotaFiscal.data_emissao.desc()).limit(10).all()
 
-    # Status SEFAZ
+    # Status SEFAZ (último registrado pelo monitor do worker)
     status_sefaz = None
     if empresa and certificado:
-        try:
-            cert_service = CertificadoService(certificado)
-            if certificado.tipo == 'A1' and certificado.arquivo_pfx:
-                cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)
-            nfe_service = NFeService(empresa, cert_service)
-            status_sefaz = nfe_service.consultar_status_servico()
-        except Exception as e:
-            logger.error(f"Erro ao consultar status SEFAZ: {e}")
-            status_sefaz = {'online': False, 'mensagem': str(e)}
+        status_sefaz = SefazMonitorService.ultimo_status(empresa.uf, empresa.ambiente_nfe)
 
     # Alertas
     alertas = []
@@ -823,7 +813,7 @@ def pdv_buscar_cliente():
 @login_required
 @admin_required
 def pdv_emitir_nfe():
-    """Emite NFe/NFCe a partir do PDV"""
+    """Grava a NFe/NFCe do PDV e a enfileira para emissão pelo worker"""
     try:
         dados = request.get_json()
 
@@ -836,6 +826,16 @@ def pdv_emitir_nfe():
         if certificado.esta_vencido:
             return jsonify({'sucesso': False, 'erro': 'Certificado digital vencido'})
 
+        # SEFAZ fora do ar: emitir em contingência ou, se desativada, não reservar numeração
+        disponivel, status = SefazMonitorService.disponivel(empresa.uf, empresa.ambiente_nfe)
+        if not disponivel and not current_app.config.get('CONTINGENCIA_AUTOMATICA', True):
+            return jsonify({
+                'sucesso': False,
+                'erro': f"SEFAZ indisponível: {status['mensagem'] or 'sem resposta'}",
+                'codigo': status['codigo'],
+                'sefaz_offline': True
+            })
+
         # Determinar modelo (55=NFe, 65=NFCe)
         modelo = dados.get('modelo', '65')  # Padrão NFCe para PDV
 
@@ -951,63 +951,38 @@ def pdv_emitir_nfe():
         # Recalcular totais de impostos
         nota.calcular_totais()
 
-        db.session.commit()
+        # Forma de emissão pela disponibilidade da SEFAZ (normal, SVC ou off-line)
+        ContingenciaService.aplicar(nota, empresa.uf, empresa.ambiente_nfe)
+        if nota.tipo_emissao == ContingenciaService.OFFLINE_NFCE:
+            # NFC-e off-line: assinada aqui para impressão imediata; o worker transmite quando a SEFAZ voltar
+            ContingenciaService.emitir_offline(nota, FilaEmissaoService.servico_nfe(empresa))
 
-        # Carregar certificado
-        cert_service = CertificadoService(certificado)
-        if certificado.tipo == 'A1':
-            cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)
-        else:
-            cert_service.carregar_certificado_a3(
-                certificado.slot_token,
-                certificado.pin_token,
-                certificado.biblioteca_token
-            )
-
-        # Gerar XML
-        nfe_service = NFeService(empresa, cert_service)
-        xml = nfe_service.gerar_xml_nfe(nota)
-
-        # Assinar
-        xml_assinado = nfe_service.assinar_nfe(xml)
-        nota.xml_nfe = xml_assinado
-        nota.status = 'assinada'
+        # Nota e item da fila na mesma transação; assinatura e transmissão ficam com o worker
+        FilaEmissaoService.enfileirar(nota)
         db.session.commit()
 
-        # Transmitir para SEFAZ
-        resultado = nfe_service.transmitir_nfe(xml_assinado)
-
-        if resultado['sucesso']:
-            nota.status = 'autorizada'
-            nota.protocolo_autorizacao = resultado.get('protocolo')
-            nota.data_autorizacao = datetime.now()
-            nota.codigo_status_sefaz = resultado.get('codigo')
-            nota.motivo_status_sefaz = resultado.get('mensagem')
-            nota.xml_autorizacao = resultado.get('xml_retorno')
-            db.session.commit()
-
-            logger.info(f"NFe {nota.chave_acesso} autorizada - Protocolo: {nota.protocolo_autorizacao}")
-
+        if nota.status == 'contingencia':
+            logger.info(f"Nota {nota.id} ({modelo}/{serie}/{numero}) emitida em contingência off-line")
             return jsonify({
                 'sucesso': True,
+                'contingencia': True,
                 'nota_id': nota.id,
+                'status': nota.status,
                 'chave_acesso': nota.chave_acesso,
-                'protocolo': nota.protocolo_autorizacao,
-                'mensagem': 'Nota fiscal autorizada com sucesso!'
-            })
-        else:
-            nota.status = 'rejeitada'
-            nota.codigo_status_sefaz = resultado.get('codigo')
-            nota.motivo_status_sefaz = resultado.get('mensagem')
-            db.session.commit()
+                'tipo_emissao': nota.tipo_emissao,
+                'url_danfe': url_for('fiscal.nota_danfe', id=nota.id),
+                'url_situacao': url_for('fiscal.pdv_situacao_emissao', id=nota.id)
+            }), 201
 
-            logger.warning(f"NFe rejeitada: {resultado.get('mensagem')}")
+        logger.info(f"Nota {nota.id} ({modelo}/{serie}/{numero}) enfileirada para emissão")
 
-            return jsonify({
-                'sucesso': False,
-                'erro': resultado.get('mensagem', 'Erro na transmissão'),
-                'codigo': resultado.get('codigo')
-            })
+        return jsonify({
+            'sucesso': True,
+            'pendente': True,
+            'nota_id': nota.id,
+            'status': nota.status,
+            'url_situacao': url_for('fiscal.pdv_situacao_emissao', id=nota.id)
+        }), 202
 
     except Exception as e:
         db.session.rollback()
@@ -1015,6 +990,17 @@ def pdv_emitir_nfe():
         return jsonify({'sucesso': False, 'erro': str(e)})
 
 
+@fiscal_bp.route('/pdv/emissao/<int:id>')
+@login_required
+@admin_required
+def pdv_situacao_emissao(id):
+    """Situação da emissão enfileirada pelo PDV (consultada periodicamente pelo terminal)"""
+    nota = db.session.get(NotaFiscal, id)
+    if nota is None:
+        return jsonify({'sucesso': False, 'erro': 'Nota não encontrada'}), 404
+    return jsonify(FilaEmissaoService.situacao(nota))
+
+
 # ===================================================================
 # NOTAS FISCAIS - LISTAGEM E GESTÃO
 # ===================================================================
@@ -1030,7 +1016,7 @@ def notas():
     data_inicio = request.args.get('data_inicio', '')
     data_fim = request.args.get('data_fim', '')
 
-    query = NotaFiscal.query
+    query = NotaFiscal.query_resumo()
 
     if status:
         query = query.filter(NotaFiscal.status == status)
@@ -1263,8 +1249,16 @@ def inutilizacao():
     inutilizacoes = query.offset((page - 1) * per_page).limit(per_page).all()
     empresa = ConfiguracaoEmpresa.query.first()
 
+    # Lacunas na numeração alocada que ainda precisam ser inutilizadas
+    lacunas = []
+    if empresa:
+        for modelo, serie in (('55', empresa.serie_nfe or 1), ('65', empresa.serie_nfce or 1)):
+            for lacuna in NumeracaoService.lacunas_fiscais(modelo, serie):
+                lacunas.append(dict(lacuna, modelo=modelo, serie=serie))
+
     return render_template('fiscal/inutilizacao/lista.html',
         inutilizacoes=inutilizacoes,
+        lacunas=lacunas,
         empresa=empresa,
         ano_atual=datetime.now().year,
         pagina=page,
@@ -1452,6 +1446,66 @@ def impostos_salvar():
     return redirect(url_for('fiscal.impostos'))
 
 
+# ===================================================================
+# EMISSÃO EM LOTE (ASSÍNCRONA)
+# ===================================================================
+
+@fiscal_bp.route('/lotes/emitir', methods=['POST'])
+@login_required
+@admin_required
+def lotes_emitir():
+    """Envia NF-e em lotes assíncronos; o worker consulta os recibos"""
+    dados = request.get_json() or {}
+    nota_ids = [int(nota_id) for nota_id in dados.get('nota_ids', [])]
+    if not nota_ids:
+        return jsonify({'sucesso': False, 'erro': 'Informe as notas (nota_ids)'})
+
+    empresa = ConfiguracaoEmpresa.query.first()
+    if not empresa:
+        return jsonify({'sucesso': False, 'erro': 'Empresa não configurada'})
+
+    cert_service = CertificadoService.carregar_padrao(empresa)
+    if not cert_service:
+        return jsonify({'sucesso': False, 'erro': 'Nenhum certificado A1 válido configurado'})
+
+    disponivel, status = SefazMonitorService.disponivel(empresa.uf, empresa.ambiente_nfe)
+    if not disponivel:
+        return jsonify({
+            'sucesso': False,
+            'erro': f"SEFAZ indisponível: {status['mensagem'] or 'sem resposta'}",
+            'sefaz_offline': True
+        })
+
+    notas = NotaFiscal.query.filter(
+        NotaFiscal.id.in_(nota_ids),
+        NotaFiscal.lote_nfe_id.is_(None)
+    ).order_by(NotaFiscal.numero).all()
+    ignoradas = set(nota_ids) - {nota.id for nota in notas}
+
+    try:
+        lotes, erros = LoteNFeService.emitir(notas, empresa, cert_service, usuario_id=current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro na emissão em lote: {e}")
+        return jsonify({'sucesso': False, 'erro': str(e)})
+
+    erros.extend({'nota_id': nota_id, 'erro': 'Nota não encontrada ou já enviada em lote'} for nota_id in sorted(ignoradas))
+    return jsonify({
+        'sucesso': any(lote.status == 'processando' for lote in lotes),
+        'lotes': [LoteNFeService.progresso(lote) for lote in lotes],
+        'erros': erros
+    })
+
+
+@fiscal_bp.route('/lotes/<int:id>')
+@login_required
+@admin_required
+def lote_progresso(id):
+    """Progresso do processamento de um lote"""
+    lote = LoteNFe.query.get_or_404(id)
+    return jsonify(LoteNFeService.progresso(lote))
+
+
 # ===================================================================
 # STATUS SEFAZ
 # ===================================================================
@@ -1472,15 +1526,50 @@ def status_sefaz():
         if certificado.tipo == 'A1':
             cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)
 
-        nfe_service = NFeService(empresa, cert_service)
-        resultado = nfe_service.consultar_status_servico()
+        status = SefazMonitorService.verificar(empresa, cert_service)
+        db.session.commit()
 
-        return jsonify(resultado)
+        return jsonify({
+            'sucesso': status.online,
+            'codigo': status.codigo,
+            'mensagem': status.mensagem,
+            'online': status.online,
+            'latencia_ms': status.latencia_ms
+        })
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'online': False, 'mensagem': str(e)})
 
 
+@fiscal_bp.route('/status-sefaz/historico')
+@login_required
+@admin_required
+def status_sefaz_historico():
+    """Histórico de disponibilidade e latência da SEFAZ (monitor do worker)"""
+    empresa = ConfiguracaoEmpresa.query.first()
+    if not empresa:
+        return jsonify({'ultimo': None, 'historico': []})
+
+    horas = min(request.args.get('horas', 24, type=int), 24 * 7)
+    historico = SefazMonitorService.historico(empresa.uf, empresa.ambiente_nfe, horas)
+    ultimo = SefazMonitorService.ultimo_status(empresa.uf, empresa.ambiente_nfe)
+    if ultimo:
+        ultimo['data_consulta'] = ultimo['data_consulta'].isoformat()
+
+    return jsonify({
+        'uf': empresa.uf,
+        'ambiente': empresa.ambiente_nfe,
+        'ultimo': ultimo,
+        'historico': [{
+            'data_consulta': status.data_consulta.isoformat(),
+            'online': status.online,
+            'codigo': status.codigo,
+            'latencia_ms': status.latencia_ms
+        } for status in historico]
+    })
+
+
 # ===================================================================
 # RELATÓRIOS FISCAIS
 # ===================================================================
@@ -1528,25 +1617,22 @@ def relatorio_notas_periodo():
     """Relatório de notas por período"""
     data_inicio = request.args.get('data_inicio', date.today().replace(day=1).isoformat())
     data_fim = request.args.get('data_fim', date.today().isoformat())
+    inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+    fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
 
-    notas = NotaFiscal.query.filter(
-        NotaFiscal.data_emissao >= datetime.strptime(data_inicio, '%Y-%m-%d'),
-        NotaFiscal.data_emissao <= datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
-    ).order_by(NotaFiscal.data_emissao.asc()).all()
+    # Totais agregados no banco (meses inteiros vêm do resumo mensal)
+    grupos = ResumoFiscalService.agrupar_periodo(inicio, fim)
+    totais = ResumoFiscalService.totalizar(grupos)
 
-    total_notas = len(notas)
-    total_autorizadas = len([n for n in notas if n.status == 'autorizada' and not n.cancelada])
-    total_canceladas = len([n for n in notas if n.cancelada])
-    valor_total = sum(float(n.valor_total or 0) for n in notas if n.status == 'autorizada' and not n.cancelada)
-    total_icms = sum(float(n.valor_icms or 0) for n in notas if n.status == 'autorizada' and not n.cancelada)
+    notas = NotaFiscal.query_resumo().filter(
+        NotaFiscal.data_emissao >= inicio,
+        NotaFiscal.data_emissao < fim + timedelta(days=1)
+    ).order_by(NotaFiscal.data_emissao.asc()).all()
 
     return render_template('fiscal/relatorios/notas_periodo.html',
         notas=notas,
         data_inicio=data_inicio,
         data_fim=data_fim,
-        total_notas=total_notas,
-        total_autorizadas=total_autorizadas,
-        total_canceladas=total_canceladas,
-        valor_total=valor_total,
-        total_icms=total_icms
+        grupos=grupos,
+        **totais
     )
@@ -0,0 +1,42 @@
+from flask import Blueprint, request, abort, send_file, current_app
+from app.services.imagem_cache_service import ImagemCacheService
+
+imagens_bp = Blueprint('imagens', __name__)
+
+
+@imagens_bp.route('/img/<path:filename>')
+def redimensionar(filename):
+    """
+    Imagem de produto redimensionada sob demanda
+
+    Parâmetros: w (largura), h (altura) e fmt (webp, jpeg, png ou auto).
+    Sem fmt (ou auto) o formato é escolhido pelo header Accept.
+    """
+    largura = request.args.get('w', type=int)
+    altura = request.args.get('h', type=int)
+    formato = request.args.get('fmt', 'auto').lower()
+
+    automatico = formato == 'auto'
+    if automatico:
+        formato = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    elif formato == 'jpg':
+        formato = 'jpeg'
+
+    erro = ImagemCacheService.validar(largura, altura, formato)
+    if erro:
+        abort(400, erro)
+
+    caminho, mimetype = ImagemCacheService.obter(filename, largura, altura, formato)
+    if not caminho:
+        abort(404)
+
+    resposta = send_file(
+        caminho,
+        mimetype=mimetype,
+        conditional=True,
+        max_age=current_app.config.get('IMAGEM_CACHE_MAX_AGE', 31536000)
+    )
+    resposta.cache_control.public = True
+    if automatico:
+        resposta.vary.add('Accept')
+    return resposta
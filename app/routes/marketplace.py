@@ -2,15 +2,20 @@ from flask import Blueprint, render_template, redirect, url_for, request, sessio
 from flask_login import login_required, current_user
 from app.models.produto import Produto
 from app.models.pedido import Pedido, ItemPedido
-from app.models.categoria import Categoria
 from app.models.estoque import Review
 from app import db, cache, limiter
 from app.utils import paginate_query
-from sqlalchemy import or_
+from app.services.busca_service import BuscaService
+from app.services.carrinho_service import CarrinhoService
+from app.services.numeracao_service import NumeracaoService
+from app.services.cache_service import CacheService
+from app.services.facetas_service import FacetasService
+from app.decorators import cache_resposta
 
 marketplace_bp = Blueprint('marketplace', __name__)
 
 @marketplace_bp.route('/')
+@cache_resposta(CacheService.TABELAS_CATALOGO)
 def loja():
     """Loja com busca, filtros e paginação"""
     try:
@@ -19,22 +24,22 @@ def loja():
         categoria_id = request.args.get('categoria', type=int)
         min_preco = request.args.get('min_preco', type=float)
         max_preco = request.args.get('max_preco', type=float)
-        ordenar = request.args.get('ordenar', 'nome')  # nome, preco_asc, preco_desc, mais_vendidos
+        ordenar = request.args.get('ordenar', 'relevancia' if search else 'nome')  # relevancia, nome, preco_asc, preco_desc, mais_vendidos
         page = request.args.get('page', 1, type=int)
         per_page = 12
 
         # Query base - apenas produtos ativos
         query = Produto.query.filter_by(ativo=True)
 
-        # Busca por nome ou descrição
+        # Busca textual (índice full-text com ranking por relevância)
+        ordem_relevancia = None
         if search:
-            query = query.filter(
-                or_(
-                    Produto.nome.ilike(f'%{search}%'),
-                    Produto.descricao.ilike(f'%{search}%'),
-                    Produto.descricao_curta.ilike(f'%{search}%')
-                )
-            )
+            query, ordem_relevancia = BuscaService.aplicar_busca(query, search)
+
+        # Contagens do filtro lateral (busca aplicada, antes de categoria/preço)
+        facetas = FacetasService.calcular(
+            query, categoria_id=categoria_id, min_preco=min_preco, max_preco=max_preco, termo=search
+        )
 
         # Filtro por categoria
         if categoria_id:
@@ -47,7 +52,9 @@ def loja():
             query = query.filter(Produto.preco <= max_preco)
 
         # Ordenação
-        if ordenar == 'preco_asc':
+        if ordenar == 'relevancia' and ordem_relevancia is not None:
+            query = query.order_by(ordem_relevancia, Produto.id.asc())
+        elif ordenar == 'preco_asc':
             query = query.order_by(Produto.preco.asc())
         elif ordenar == 'preco_desc':
             query = query.order_by(Produto.preco.desc())
@@ -61,9 +68,6 @@ def loja():
         # Paginação
         pagination = paginate_query(query, page, per_page)
 
-        # Carregar categorias para filtro
-        categorias = Categoria.query.all()
-
         # Log da busca
         if search:
             current_app.logger.info(f"Busca realizada: '{search}' - {pagination['total']} resultados")
@@ -72,7 +76,8 @@ def loja():
             'loja.html',
             produtos=pagination['items'],
             pagination=pagination,
-            categorias=categorias,
+            categorias=facetas['categorias'],
+            faixas_preco=facetas['faixas'],
             search=search,
             categoria_id=categoria_id,
             min_preco=min_preco,
@@ -82,12 +87,14 @@ def loja():
     except Exception as e:
         current_app.logger.error(f"Erro na loja: {str(e)}")
         db.session.rollback()
+        CacheService.nao_cachear()
         # Retornar página vazia em caso de erro
         return render_template(
             'loja.html',
             produtos=[],
             pagination={'items': [], 'total': 0, 'pages': 0, 'current_page': 1, 'has_prev': False, 'has_next': False, 'prev_page': None, 'next_page': None, 'per_page': 12},
             categorias=[],
+            faixas_preco=[],
             search='',
             categoria_id=None,
             min_preco=None,
@@ -96,39 +103,31 @@ def loja():
         )
 
 @marketplace_bp.route('/produto/<int:produto_id>')
+@cache_resposta(CacheService.TABELAS_CATALOGO)
 def produto_detalhado(produto_id):
     produto = Produto.query.get_or_404(produto_id)
-    return render_template('produto.html', produto=produto)
+    reviews = produto.reviews.filter_by(aprovado=True).order_by(Review.data_criacao.desc()).limit(10).all()
+    relacionados = []
+    if produto.categoria_id:
+        relacionados = Produto.query.filter(
+            Produto.categoria_id == produto.categoria_id,
+            Produto.id != produto.id,
+            Produto.ativo == True
+        ).limit(4).all()
+    return render_template('produto.html', produto=produto, reviews=reviews, relacionados=relacionados)
 
 @marketplace_bp.route('/carrinho')
 def carrinho():
     carrinho_session = session.get('carrinho', {})
-    itens = []
-    total = 0
-    produtos_remover = []
-
-    for pid, item in carrinho_session.items():
-        produto = Produto.query.get(int(pid))
-        if produto:
-            subtotal = produto.preco * item['quantidade']
-            total += subtotal
-            itens.append({
-                'produto': produto,
-                'quantidade': item['quantidade'],
-                'subtotal': subtotal,
-                'produto_id': produto.id
-            })
-        else:
-            # Produto nao existe mais, marcar para remover
-            produtos_remover.append(pid)
+    cotacao = CarrinhoService.precificar(carrinho_session)
 
     # Limpar produtos que nao existem mais
-    if produtos_remover:
-        for pid in produtos_remover:
+    if cotacao['removidos']:
+        for pid in cotacao['removidos']:
             carrinho_session.pop(pid, None)
         session['carrinho'] = carrinho_session
 
-    return render_template('carrinho.html', itens=itens, total=total)
+    return render_template('carrinho.html', itens=cotacao['itens'], total=cotacao['total'])
 
 @marketplace_bp.route('/adicionar_carrinho/<int:produto_id>', methods=['POST'])
 def adicionar_carrinho(produto_id):
@@ -153,54 +152,46 @@ def remover_item_carrinho(produto_id):
 @marketplace_bp.route('/finalizar_pedido', methods=['POST'])
 @login_required
 def finalizar_pedido():
-    from datetime import datetime
-    import random
-
     carrinho_session = session.get('carrinho', {})
     if not carrinho_session:
         flash('Seu carrinho está vazio.', 'warning')
         return redirect(url_for('marketplace.loja'))
 
-    # Gerar numero do pedido
-    ano = datetime.now().year
-    ultimo_pedido = Pedido.query.order_by(Pedido.id.desc()).first()
-    proximo_numero = (ultimo_pedido.id + 1) if ultimo_pedido else 1
-    numero_pedido = f"PED-{ano}-{proximo_numero:05d}"
+    cotacao = CarrinhoService.precificar(carrinho_session)
+    if cotacao['removidos']:
+        flash(f'Produto nao encontrado no sistema.', 'danger')
+        return redirect(url_for('marketplace.carrinho'))
+
+    # Reserva atômica de todas as linhas (nunca vende além do estoque)
+    reserva = CarrinhoService.reservar_estoque(cotacao['itens'])
+    if not reserva['sucesso']:
+        db.session.rollback()
+        for falha in reserva['falhas']:
+            flash(f"Estoque insuficiente para o produto {falha['nome']} "
+                  f"(disponível: {falha['disponivel']}).", 'danger')
+        return redirect(url_for('marketplace.carrinho'))
 
     pedido = Pedido(
         usuario_id=current_user.id,
-        numero_pedido=numero_pedido,
+        numero_pedido=NumeracaoService.numero_pedido(),
         status='pendente',
         status_pagamento='pendente'
     )
     db.session.add(pedido)
     db.session.flush()
 
-    subtotal = 0
-    for pid, item in carrinho_session.items():
-        produto = Produto.query.get(int(pid))
-        if not produto:
-            flash(f'Produto nao encontrado no sistema.', 'danger')
-            db.session.rollback()
-            return redirect(url_for('marketplace.carrinho'))
-
-        if produto.estoque < item['quantidade']:
-            flash(f'Estoque insuficiente para o produto {produto.nome}.', 'danger')
-            db.session.rollback()
-            return redirect(url_for('marketplace.carrinho'))
-
-        produto.estoque -= item['quantidade']
-
+    subtotal = cotacao['total']
+    for item in cotacao['itens']:
+        produto = item['produto']
         item_pedido = ItemPedido(
             pedido_id=pedido.id,
             produto_id=produto.id,
             produto_nome=produto.nome,
             produto_codigo=produto.codigo if hasattr(produto, 'codigo') else None,
             quantidade=item['quantidade'],
-            preco_unitario=produto.preco
+            preco_unitario=item['preco_unitario']
         )
         db.session.add(item_pedido)
-        subtotal += produto.preco * item['quantidade']
 
     # Atualizar totais do pedido
     pedido.subtotal = subtotal
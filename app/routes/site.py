@@ -1,17 +1,22 @@
-from flask import Blueprint, render_template, Response, request, url_for
-from datetime import datetime
+from flask import Blueprint, render_template, Response, request, url_for, abort, current_app, stream_with_context
+from werkzeug.http import http_date
+from datetime import timezone
+from app.decorators import cache_resposta
 
 site_bp = Blueprint('site', __name__)
 
 @site_bp.route('/')
+@cache_resposta(['configuracoes'])
 def homepage():
     return render_template('index.html')
 
 @site_bp.route('/sobre')
+@cache_resposta(['configuracoes'])
 def sobre_nos():
     return render_template('sobre.html')
 
 @site_bp.route('/contato', methods=['GET', 'POST'])
+@cache_resposta(['configuracoes'])
 def contato():
     return render_template('contato.html')
 
@@ -86,81 +91,94 @@ Crawl-delay: 1
 @site_bp.route('/sitemap.xml')
 def sitemap():
     """
-    Gera um sitemap.xml dinâmico com todas as páginas do site.
+    Sitemap index: aponta para o arquivo de páginas e para os arquivos de
+    produtos (até 50 mil URLs cada).
     """
-    from app.models.produto import Produto
-    from app.models.categoria import Categoria
-    from app import db
+    from app.services.sitemap_service import SitemapService
 
     base_url = request.url_root.rstrip('/')
-    today = datetime.now().strftime('%Y-%m-%d')
-
-    # Páginas estáticas principais
-    static_pages = [
-        {'loc': '/', 'priority': '1.0', 'changefreq': 'daily'},
-        {'loc': '/loja', 'priority': '0.9', 'changefreq': 'daily'},
-        {'loc': '/sobre', 'priority': '0.7', 'changefreq': 'monthly'},
-        {'loc': '/contato', 'priority': '0.8', 'changefreq': 'monthly'},
-    ]
-
-    xml_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
-        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"
-        xmlns:xhtml="http://www.w3.org/1999/xhtml">
-'''
-
-    # Adicionar páginas estáticas
-    for page in static_pages:
-        xml_content += f'''    <url>
-        <loc>{base_url}{page['loc']}</loc>
-        <lastmod>{today}</lastmod>
-        <changefreq>{page['changefreq']}</changefreq>
-        <priority>{page['priority']}</priority>
-    </url>
-'''
-
-    # Adicionar categorias
-    try:
-        categorias = Categoria.query.filter_by(ativo=True).all()
-        for categoria in categorias:
-            xml_content += f'''    <url>
-        <loc>{base_url}/loja?categoria={categoria.id}</loc>
-        <lastmod>{today}</lastmod>
-        <changefreq>weekly</changefreq>
-        <priority>0.8</priority>
-    </url>
-'''
-    except Exception:
-        pass
-
-    # Adicionar produtos
-    try:
-        produtos = Produto.query.filter_by(ativo=True).all()
-        for produto in produtos:
-            lastmod = produto.data_atualizacao.strftime('%Y-%m-%d') if hasattr(produto, 'data_atualizacao') and produto.data_atualizacao else today
-
-            xml_content += f'''    <url>
-        <loc>{base_url}/loja/produto/{produto.id}</loc>
-        <lastmod>{lastmod}</lastmod>
-        <changefreq>weekly</changefreq>
-        <priority>0.8</priority>
-'''
-            # Adicionar imagem do produto se existir
-            if produto.imagem_url:
-                xml_content += f'''        <image:image>
-            <image:loc>{produto.imagem_url}</image:loc>
-            <image:title>{produto.nome}</image:title>
-            <image:caption>{produto.descricao_curta or produto.nome}</image:caption>
-        </image:image>
-'''
-            xml_content += '''    </url>
-'''
-    except Exception:
-        pass
-
-    xml_content += '''</urlset>'''
-
-    return Response(xml_content, mimetype='application/xml')
+    arquivos = SitemapService.arquivos_produtos()
+    ultima = max((a['ultima_alteracao'] for a in arquivos.values() if a['ultima_alteracao']), default=None)
+    etag = SitemapService.etag(
+        'indice', base_url, SitemapService.urls_por_arquivo(),
+        sorted((n, a['total'], a['ultima_alteracao']) for n, a in arquivos.items())
+    )
+    return _responder_sitemap(etag, ultima, SitemapService.gerar_indice(base_url, arquivos))
+
+
+@site_bp.route('/sitemap-paginas.xml')
+def sitemap_paginas():
+    """Sitemap das páginas institucionais e categorias"""
+    from app.services.sitemap_service import SitemapService
+    from app.services.cache_service import CacheService
+
+    base_url = request.url_root.rstrip('/')
+    etag = SitemapService.etag('paginas', base_url, CacheService.versoes('categorias')['categorias'])
+    return _responder_sitemap(etag, None, SitemapService.gerar_paginas(base_url))
+
+
+@site_bp.route('/sitemap-produtos-<int:numero>.xml')
+def sitemap_produtos(numero):
+    """Sitemap de uma faixa de produtos"""
+    from app.services.sitemap_service import SitemapService
+
+    arquivo = SitemapService.arquivos_produtos().get(numero)
+    if not arquivo:
+        abort(404)
+
+    base_url = request.url_root.rstrip('/')
+    etag = SitemapService.etag(
+        'produtos', base_url, numero, SitemapService.urls_por_arquivo(),
+        arquivo['total'], arquivo['ultima_alteracao']
+    )
+    return _responder_sitemap(etag, arquivo['ultima_alteracao'], SitemapService.gerar_produtos(base_url, numero))
+
+
+def _responder_sitemap(etag, ultima_alteracao, gerador):
+    """
+    Responde um arquivo de sitemap com validação condicional
+
+    304 quando o ETag (ou Last-Modified) do crawler ainda vale; corpo do
+    cache quando outro acesso já gerou esta versão; caso contrário gera em
+    streaming e guarda o corpo para os próximos acessos.
+    """
+    from app import cache
+
+    cabecalhos = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f"public, max-age={current_app.config.get('SITEMAP_MAX_AGE', 3600)}"
+    }
+    if ultima_alteracao:
+        ultima_alteracao = ultima_alteracao.replace(microsecond=0, tzinfo=timezone.utc)
+        cabecalhos['Last-Modified'] = http_date(ultima_alteracao)
+
+    if request.if_none_match:
+        nao_modificado = request.if_none_match.contains(etag)
+    else:
+        nao_modificado = bool(
+            ultima_alteracao and request.if_modified_since
+            and request.if_modified_since >= ultima_alteracao
+        )
+    if nao_modificado:
+        return Response(status=304, headers=cabecalhos)
+
+    chave = f'sitemap:{etag}'
+    corpo = cache.get(chave)
+    if corpo is not None:
+        return Response(corpo, mimetype='application/xml', headers=cabecalhos)
+
+    timeout = current_app.config.get('SITEMAP_CACHE_TIMEOUT', 3600)
+
+    def transmitir():
+        partes = [] if timeout > 0 else None
+        for parte in gerador:
+            if partes is not None:
+                partes.append(parte)
+            yield parte
+        if partes is not None:
+            cache.set(chave, ''.join(partes), timeout=timeout)
+
+    return Response(stream_with_context(transmitir()), mimetype='application/xml', headers=cabecalhos)
 
 
 @site_bp.route('/manifest.json')
@@ -11,6 +11,7 @@ from app.models.categoria import Categoria
 from app.models.configuracao import Configuracao
 from app import db
 from app.decorators import super_admin_required
+from app.services.contagem_service import ContagemService
 from datetime import datetime
 import os
 
@@ -20,6 +21,28 @@ super_admin_bp = Blueprint('super_admin', __name__)
 # =============================================
 # DASHBOARD SUPER ADMIN
 # =============================================
+def _estatisticas_usuarios():
+    """Totais de usuarios por tipo e status a partir de um unico GROUP BY"""
+    por_tipo_status = ContagemService.agrupado(User, User.tipo_usuario, User.ativo)
+
+    def contar(tipo=None, ativo=None):
+        return sum(
+            n for (t, a), n in por_tipo_status.items()
+            if (tipo is None or t == tipo) and (ativo is None or a == ativo)
+        )
+
+    return {
+        'total': contar(),
+        'ativos': contar(ativo=True),
+        'inativos': contar(ativo=False),
+        'por_tipo': {
+            'super_admin': contar(tipo='super_admin'),
+            'admin': contar(tipo='admin'),
+            'cliente': contar(tipo='cliente')
+        }
+    }
+
+
 @super_admin_bp.route('/')
 @super_admin_bp.route('/dashboard')
 @login_required
@@ -39,19 +62,14 @@ def dashboard():
     ultimos_usuarios = []
 
     try:
-        # Estatisticas de usuarios
-        total_usuarios = User.query.count()
-        total_admins = User.query.filter_by(tipo_usuario='admin').count()
-        total_clientes = User.query.filter_by(tipo_usuario='cliente').count()
-        total_super_admins = User.query.filter_by(tipo_usuario='super_admin').count()
-
-        try:
-            usuarios_ativos = User.query.filter_by(ativo=True).count()
-            usuarios_inativos = User.query.filter_by(ativo=False).count()
-        except Exception as e:
-            current_app.logger.warning(f'Erro ao contar usuarios ativos/inativos: {e}')
-            usuarios_ativos = total_usuarios
-            usuarios_inativos = 0
+        # Estatisticas de usuarios (um unico GROUP BY por tipo e status)
+        stats = _estatisticas_usuarios()
+        total_usuarios = stats['total']
+        total_admins = stats['por_tipo']['admin']
+        total_clientes = stats['por_tipo']['cliente']
+        total_super_admins = stats['por_tipo']['super_admin']
+        usuarios_ativos = stats['ativos']
+        usuarios_inativos = stats['inativos']
 
         # Ultimos usuarios
         try:
@@ -64,25 +82,18 @@ def dashboard():
                 ultimos_usuarios = []
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'Erro ao carregar estatisticas de usuarios: {e}')
 
-    # Estatisticas de produtos
-    try:
-        total_produtos = Produto.query.count()
-    except Exception as e:
-        current_app.logger.warning(f'Erro ao contar produtos: {e}')
-
-    # Estatisticas de pedidos
-    try:
-        total_pedidos = Pedido.query.count()
-    except Exception as e:
-        current_app.logger.warning(f'Erro ao contar pedidos: {e}')
-
-    # Estatisticas de categorias
+    # Estatisticas de produtos, pedidos e categorias (estimadas em tabelas grandes)
     try:
-        total_categorias = Categoria.query.count()
+        totais = ContagemService.totais(Produto, Pedido, Categoria)
+        total_produtos = totais['produtos']
+        total_pedidos = totais['pedidos']
+        total_categorias = totais['categorias']
     except Exception as e:
-        current_app.logger.warning(f'Erro ao contar categorias: {e}')
+        db.session.rollback()
+        current_app.logger.warning(f'Erro ao contar produtos/pedidos/categorias: {e}')
 
     return render_template('super_admin/dashboard.html',
         total_usuarios=total_usuarios,
@@ -487,14 +498,17 @@ def logs_sistema():
 @super_admin_required
 def api_usuarios_stats():
     """Retorna estatisticas de usuarios em JSON"""
-    stats = {
-        'total': User.query.count(),
-        'ativos': User.query.filter_by(ativo=True).count(),
-        'inativos': User.query.filter_by(ativo=False).count(),
-        'por_tipo': {
-            'super_admin': User.query.filter_by(tipo_usuario='super_admin').count(),
-            'admin': User.query.filter_by(tipo_usuario='admin').count(),
-            'cliente': User.query.filter_by(tipo_usuario='cliente').count()
-        }
-    }
+    stats = _estatisticas_usuarios()
     return jsonify(stats)
+
+
+@super_admin_bp.route('/api/cache/stats', methods=['GET', 'DELETE'])
+@login_required
+@super_admin_required
+def api_cache_stats():
+    """Taxa de acerto do cache da vitrine (DELETE zera os contadores)"""
+    from app.services.cache_service import CacheService
+
+    if request.method == 'DELETE':
+        CacheService.zerar_estatisticas()
+    return jsonify(CacheService.estatisticas())
@@ -10,6 +10,25 @@ from .pdf_service import PDFService
 from .email_service import EmailService
 from .banco_service import BancoService
 from .excel_service import ExcelService
+from .busca_service import BuscaService
+from .agregados_service import AgregadosService
+from .carrinho_service import CarrinhoService
+from .numeracao_service import NumeracaoService
+from .cache_service import CacheService
+from .imagem_service import ImagemService
+from .imagem_cache_service import ImagemCacheService
+from .rollup_service import RollupVendasService
+from .kpi_service import KPIService
+from .rfm_service import RFMService
+from .contagem_service import ContagemService
+from .resumo_fiscal_service import ResumoFiscalService
+from .sefaz_monitor_service import SefazMonitorService
+from .sefaz_transporte_service import SefazTransporteService
+from .lote_nfe_service import LoteNFeService
+from .fila_emissao_service import FilaEmissaoService
+from .assinatura_service import AssinaturaService
+from .validador_xsd_service import ValidadorXSDService
+from .contingencia_service import ContingenciaService
 
 __all__ = [
     'NFeService',
@@ -17,5 +36,24 @@ __all__ = [
     'PDFService',
     'EmailService',
     'BancoService',
-    'ExcelService'
+    'ExcelService',
+    'BuscaService',
+    'AgregadosService',
+    'CarrinhoService',
+    'NumeracaoService',
+    'CacheService',
+    'ImagemService',
+    'ImagemCacheService',
+    'RollupVendasService',
+    'KPIService',
+    'RFMService',
+    'ContagemService',
+    'ResumoFiscalService',
+    'SefazMonitorService',
+    'SefazTransporteService',
+    'LoteNFeService',
+    'FilaEmissaoService',
+    'AssinaturaService',
+    'ValidadorXSDService',
+    'ContingenciaService'
 ]
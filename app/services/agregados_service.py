@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Agregados Materializados
+Mantém estoque_total, rating_count e rating_sum de Produto atualizados
+"""
+
+import logging
+from sqlalchemy import event, select, func, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class AgregadosService:
+    """
+    Serviço de manutenção dos agregados denormalizados de Produto
+
+    Escritas via ORM em Estoque, MovimentacaoEstoque e Review disparam,
+    no mesmo flush, um UPDATE com subconsultas correlacionadas apenas para
+    os produtos afetados. Alterações feitas fora do ORM (UPDATE em massa,
+    SQL direto) são corrigidas pela reconciliação periódica do worker.
+    """
+
+    CHAVE_SESSAO = 'agregados_produtos'
+    ATRIBUTOS_ESTOQUE = ['estoque_total']
+    ATRIBUTOS_REVIEW = ['rating_count', 'rating_sum']
+
+    # ==================== EVENTOS ====================
+
+    @classmethod
+    def registrar_eventos(cls):
+        """Registra os listeners de sessão (idempotente)"""
+        from app.models.estoque import Estoque, MovimentacaoEstoque, Review
+
+        if not event.contains(Session, 'after_flush', cls._coletar_alteracoes):
+            event.listen(Session, 'after_flush', cls._coletar_alteracoes)
+            event.listen(Session, 'after_flush_postexec', cls._atualizar_agregados)
+
+            # Carregar o valor anterior das FKs ao alterá-las, para que o
+            # produto de origem também seja recalculado
+            for atributo in (Estoque.produto_id, Review.produto_id, MovimentacaoEstoque.estoque_id):
+                event.listen(atributo, 'set', cls._manter_historico, active_history=True)
+
+    @classmethod
+    def _coletar_alteracoes(cls, session, flush_context):
+        """Coleta produtos/estoques afetados pelo flush atual"""
+        from app.models.estoque import Estoque, MovimentacaoEstoque, Review
+
+        pendentes = None
+
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Estoque):
+                chave, ids = 'estoque', cls._valores_coluna(obj, 'produto_id')
+            elif isinstance(obj, Review):
+                chave, ids = 'review', cls._valores_coluna(obj, 'produto_id')
+            elif isinstance(obj, MovimentacaoEstoque):
+                chave, ids = 'movimentacao', cls._valores_coluna(obj, 'estoque_id')
+            else:
+                continue
+
+            if pendentes is None:
+                pendentes = session.info.setdefault(
+                    cls.CHAVE_SESSAO,
+                    {'estoque': set(), 'review': set(), 'movimentacao': set()}
+                )
+            pendentes[chave].update(ids)
+
+    @classmethod
+    def _atualizar_agregados(cls, session, flush_context):
+        """Recalcula os agregados dos produtos afetados (mesma transação)"""
+        pendentes = session.info.pop(cls.CHAVE_SESSAO, None)
+        if not pendentes:
+            return
+
+        from app.models.produto import Produto
+        from app.models.estoque import Estoque
+
+        ids_estoque = set(pendentes['estoque'])
+        if pendentes['movimentacao']:
+            ids_estoque.update(
+                session.connection().execute(
+                    select(Estoque.produto_id).where(Estoque.id.in_(pendentes['movimentacao']))
+                ).scalars()
+            )
+
+        if ids_estoque:
+            session.connection().execute(
+                cls._update_agregados(ids_estoque, estoque=True, reviews=False)
+            )
+        if pendentes['review']:
+            session.connection().execute(
+                cls._update_agregados(pendentes['review'], estoque=False, reviews=True)
+            )
+
+        # Expirar valores em memória para que a próxima leitura venha do banco
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, Produto):
+                atributos = []
+                if obj.id in ids_estoque:
+                    atributos += cls.ATRIBUTOS_ESTOQUE
+                if obj.id in pendentes['review']:
+                    atributos += cls.ATRIBUTOS_REVIEW
+                if atributos:
+                    session.expire(obj, atributos)
+
+    @staticmethod
+    def _manter_historico(target, value, oldvalue, initiator):
+        """Listener vazio; existe apenas para ativar o histórico completo da FK"""
+
+    @staticmethod
+    def _valores_coluna(obj, coluna):
+        """Valor atual e anterior de uma FK (cobre troca de produto/estoque)"""
+        historico = get_history(obj, coluna)
+        valores = set(historico.added or ()) | set(historico.unchanged or ()) | set(historico.deleted or ())
+        if not valores:
+            valores = {getattr(obj, coluna)}
+        return {valor for valor in valores if valor is not None}
+
+    # ==================== CÁLCULO ====================
+
+    @staticmethod
+    def _subconsultas():
+        """Subconsultas correlacionadas com os valores reais de cada produto"""
+        from app.models.produto import Produto
+        from app.models.estoque import Estoque, Review
+
+        estoque_total = (
+            select(func.coalesce(func.sum(Estoque.quantidade), 0))
+            .where(Estoque.produto_id == Produto.id)
+            .scalar_subquery()
+        )
+        rating_count = (
+            select(func.count(Review.id))
+            .where(Review.produto_id == Produto.id)
+            .scalar_subquery()
+        )
+        rating_sum = (
+            select(func.coalesce(func.sum(Review.rating), 0))
+            .where(Review.produto_id == Produto.id)
+            .scalar_subquery()
+        )
+        return estoque_total, rating_count, rating_sum
+
+    @classmethod
+    def _update_agregados(cls, produto_ids, estoque=True, reviews=True):
+        """Monta UPDATE dos agregados para os produtos informados"""
+        from app.models.produto import Produto
+
+        estoque_total, rating_count, rating_sum = cls._subconsultas()
+        tabela = Produto.__table__
+
+        valores = {}
+        if estoque:
+            valores['estoque_total'] = estoque_total
+        if reviews:
+            valores['rating_count'] = rating_count
+            valores['rating_sum'] = rating_sum
+        # Agregados não contam como alteração do cadastro do produto
+        valores['data_atualizacao'] = tabela.c.data_atualizacao
+
+        return (
+            tabela.update()
+            .where(tabela.c.id.in_(sorted(produto_ids)))
+            .values(**valores)
+        )
+
+    @classmethod
+    def recalcular(cls, produto_ids):
+        """
+        Recalcula os agregados de produtos específicos
+
+        Args:
+            produto_ids: Iterável de IDs de produto
+
+        Returns:
+            int: Quantidade de produtos atualizados
+        """
+        produto_ids = set(produto_ids)
+        if not produto_ids:
+            return 0
+
+        resultado = db.session.execute(cls._update_agregados(produto_ids))
+        db.session.commit()
+        return resultado.rowcount
+
+    @classmethod
+    def reconciliar(cls):
+        """
+        Corrige divergências entre os agregados materializados e as tabelas
+        de origem (executado periodicamente pelo worker)
+
+        Returns:
+            int: Quantidade de produtos corrigidos
+        """
+        from app.models.produto import Produto
+
+        estoque_total, rating_count, rating_sum = cls._subconsultas()
+        tabela = Produto.__table__
+
+        resultado = db.session.execute(
+            tabela.update()
+            .where(or_(
+                tabela.c.estoque_total.is_(None),
+                tabela.c.rating_count.is_(None),
+                tabela.c.rating_sum.is_(None),
+                tabela.c.estoque_total != estoque_total,
+                tabela.c.rating_count != rating_count,
+                tabela.c.rating_sum != rating_sum
+            ))
+            .values(
+                estoque_total=estoque_total,
+                rating_count=rating_count,
+                rating_sum=rating_sum,
+                data_atualizacao=tabela.c.data_atualizacao
+            )
+        )
+        db.session.commit()
+
+        if resultado.rowcount:
+            logger.warning(f"Agregados reconciliados para {resultado.rowcount} produto(s)")
+        return resultado.rowcount
+
+    # ==================== CARREGAMENTO EM LOTE ====================
+
+    @staticmethod
+    def carregar(produto_ids):
+        """
+        Carrega os agregados de vários produtos em uma única consulta
+
+        Args:
+            produto_ids: Iterável de IDs de produto
+
+        Returns:
+            dict: {produto_id: {'estoque_total', 'rating_count', 'rating_medio'}}
+        """
+        from app.models.produto import Produto
+
+        produto_ids = set(produto_ids)
+        if not produto_ids:
+            return {}
+
+        linhas = db.session.execute(
+            select(Produto.id, Produto.estoque_total, Produto.rating_count, Produto.rating_sum)
+            .where(Produto.id.in_(produto_ids))
+        ).all()
+
+        return {
+            produto_id: {
+                'estoque_total': estoque or 0,
+                'rating_count': quantidade or 0,
+                'rating_medio': (soma / quantidade) if quantidade else 0
+            }
+            for produto_id, estoque, quantidade, soma in linhas
+        }
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Assinatura XML
+Assinatura XMLDSig (certificado A1) com assinador reaproveitado e assinatura
+de lotes em paralelo por processos
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from cryptography.hazmat.primitives import serialization
+from flask import current_app, has_app_context
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Assinador do processo filho do pool (criado pelo inicializador)
+_assinador_processo = None
+
+
+def criar_signer():
+    """
+    XMLSigner no padrão da NF-e (enveloped, RSA-SHA1, SHA1, C14N 2001)
+
+    O signxml recusa SHA1 por padrão; o leiaute 4.00 da NF-e ainda o exige.
+    A assinatura usa o namespace padrão: a SEFAZ recusa prefixos como ds:
+    (rejeição 404). A canonicalização é feita sobre uma cópia de cada elemento: o
+    libxml2 2.12 (lxml 5.3) emite xmlns="" nos descendentes ao canonicalizar
+    um elemento dentro do documento, o que invalidaria o SignedInfo.
+    """
+    from signxml import XMLSigner, methods, namespaces
+
+    class AssinadorNFe(XMLSigner):
+        def check_deprecated_methods(self):
+            pass
+
+        def _c14n(self, nodes, algorithm, inclusive_ns_prefixes=None):
+            if not isinstance(nodes, list):
+                nodes = [nodes]
+            nodes = [etree.fromstring(etree.tostring(node)) for node in nodes]
+            return super()._c14n(nodes, algorithm, inclusive_ns_prefixes=inclusive_ns_prefixes)
+
+    signer = AssinadorNFe(
+        method=methods.enveloped,
+        signature_algorithm='rsa-sha1',
+        digest_algorithm='sha1',
+        c14n_algorithm='http://www.w3.org/TR/2001/REC-xml-c14n-20010315'
+    )
+    signer.namespaces = {None: namespaces.ds}
+    return signer
+
+
+def _contexto_processos():
+    """
+    Início dos processos do pool sem fork do processo atual: o processo web
+    tem threads (ex: pool de imagens) e um fork com threads ativas pode
+    travar o filho
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    contexto = multiprocessing.get_context('forkserver')
+    # O servidor (sem threads) importa o serviço uma vez; os filhos nascem dele já com os módulos
+    contexto.set_forkserver_preload([__name__])
+    return contexto
+
+
+def _iniciar_processo(key_pem, cert_pem):
+    """Inicializador do pool: carrega a chave e o assinador uma vez por processo"""
+    global _assinador_processo
+    # A chave já foi validada no processo pai; a validação RSA é a parte cara do carregamento
+    chave = serialization.load_pem_private_key(key_pem, password=None, unsafe_skip_rsa_key_validation=True)
+    _assinador_processo = AssinaturaService(chave, cert_pem)
+
+
+def _assinar_no_processo(documento):
+    """
+    Assina um documento no processo filho
+
+    Returns:
+        tuple: (xml assinado, None) ou (None, mensagem de erro)
+    """
+    xml_string, reference_uri = documento
+    try:
+        return _assinador_processo.assinar(xml_string, reference_uri), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+class AssinaturaService:
+    """
+    Assinatura enveloped (RSA-SHA1, SHA1, C14N 2001) como exigida pela SEFAZ
+
+    A chave privada é carregada e o XMLSigner configurado uma única vez por
+    instância; cada assinatura apenas faz o parse do documento. A geração
+    da assinatura RSA domina o custo e prende o GIL, então lotes grandes
+    (a partir de ASSINATURA_LOTE_MINIMO documentos) são divididos entre até
+    ASSINATURA_PROCESSOS processos, cada um com seu próprio assinador. O
+    resultado mantém a ordem dos documentos e traz o erro de cada um.
+    """
+
+    def __init__(self, chave, cert_pem):
+        """
+        Args:
+            chave: Chave privada (objeto do cryptography ou PEM sem senha)
+            cert_pem: Certificado em PEM
+        """
+        if not chave or not cert_pem:
+            raise Exception("Certificado não carregado")
+
+        if isinstance(chave, (str, bytes)):
+            chave = chave.encode() if isinstance(chave, str) else chave
+            self._key_pem = chave
+            chave = serialization.load_pem_private_key(chave, password=None)
+        else:
+            self._key_pem = None
+        self._chave = chave
+        self._cert_pem = cert_pem.encode() if isinstance(cert_pem, str) else cert_pem
+        self._certificados = [self._cert_pem.decode()]
+
+        self._signer = criar_signer()
+
+    @staticmethod
+    def _config(nome, padrao):
+        if has_app_context():
+            return current_app.config.get(nome, padrao)
+        return padrao
+
+    def _chave_pem(self):
+        """PEM da chave para os processos filhos (nunca gravado em disco)"""
+        if self._key_pem is None:
+            self._key_pem = self._chave.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            )
+        return self._key_pem
+
+    # ==================== ASSINATURA ====================
+
+    def assinar(self, xml_string, reference_uri=''):
+        """
+        Assina um documento XML
+
+        Args:
+            xml_string: String do XML a ser assinado
+            reference_uri: URI de referência para assinatura (ex: "#NFe...")
+
+        Returns:
+            str: XML assinado
+        """
+        root = etree.fromstring(xml_string.encode('utf-8'))
+        signed_root = self._signer.sign(
+            root,
+            key=self._chave,
+            cert=self._certificados,
+            reference_uri=reference_uri
+        )
+        return etree.tostring(signed_root, encoding='unicode', pretty_print=False)
+
+    def _assinar_em_serie(self, documentos):
+        resultados = []
+        for xml_string, reference_uri in documentos:
+            try:
+                resultados.append((self.assinar(xml_string, reference_uri), None))
+            except Exception as e:
+                resultados.append((None, str(e) or type(e).__name__))
+        return resultados
+
+    def assinar_lote(self, documentos, processos=None):
+        """
+        Assina vários documentos, em paralelo quando compensa
+
+        Args:
+            documentos: Lista de tuplas (xml, reference_uri)
+            processos: Máximo de processos (padrão: ASSINATURA_PROCESSOS;
+                0 = número de CPUs; 1 = em série no processo atual)
+
+        Returns:
+            list: Um dict {'indice', 'sucesso', 'xml', 'erro'} por documento, na ordem recebida
+        """
+        documentos = list(documentos)
+        if processos is None:
+            processos = self._config('ASSINATURA_PROCESSOS', 0)
+        processos = min(processos or os.cpu_count() or 1, len(documentos))
+
+        if processos <= 1 or len(documentos) < self._config('ASSINATURA_LOTE_MINIMO', 100):
+            resultados = self._assinar_em_serie(documentos)
+        else:
+            try:
+                with ProcessPoolExecutor(max_workers=processos, mp_context=_contexto_processos(),
+                                         initializer=_iniciar_processo,
+                                         initargs=(self._chave_pem(), self._cert_pem)) as executor:
+                    blocos = max(1, len(documentos) // (processos * 4))
+                    resultados = list(executor.map(_assinar_no_processo, documentos, chunksize=blocos))
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning(f"Pool de assinatura indisponível ({e}); assinando em série")
+                resultados = self._assinar_em_serie(documentos)
+
+        return [
+            {'indice': indice, 'sucesso': erro is None, 'xml': xml, 'erro': erro}
+            for indice, (xml, erro) in enumerate(resultados)
+        ]
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Busca Textual
+Índice full-text de produtos (PostgreSQL tsvector/GIN e SQLite FTS5)
+"""
+
+import re
+import logging
+from sqlalchemy import text, func, select, table, column, literal_column, or_
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class BuscaService:
+    """Serviço de busca textual de produtos com ranking por relevância"""
+
+    # Configuração de text search do PostgreSQL (stemming português + unaccent)
+    CONFIG_PG = 'pt_unaccent'
+    CONFIG_PG_FALLBACK = 'portuguese'
+
+    # Índice e tabela virtual
+    INDICE_PG = 'ix_produtos_busca_fts'
+    TABELA_FTS = 'produtos_fts'
+
+    # Pesos por campo (nome > descrição curta > descrição)
+    PESOS_FTS5 = (10.0, 5.0, 1.0)
+
+    # Modo de busca detectado por banco: 'postgres', 'fts5' ou 'like'
+    _modos = {}
+    _configs_pg = {}
+
+    # ==================== INSTALAÇÃO ====================
+
+    @classmethod
+    def instalar_indices(cls):
+        """
+        Cria (de forma idempotente) as estruturas de busca do banco atual
+
+        PostgreSQL: configuração pt_unaccent e índice GIN de expressão,
+        mantido automaticamente pelo próprio banco.
+        SQLite: tabela virtual FTS5 com triggers de insert/update/delete.
+
+        Returns:
+            str: Modo de busca ativo ('postgres', 'fts5' ou 'like')
+        """
+        dialeto = db.engine.dialect.name
+
+        try:
+            if dialeto == 'postgresql':
+                modo = cls._instalar_postgres()
+            elif dialeto == 'sqlite':
+                modo = cls._instalar_sqlite()
+            else:
+                modo = 'like'
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Índice de busca indisponível, usando ILIKE: {str(e)}")
+            modo = 'like'
+
+        cls._modos[cls._chave_banco()] = modo
+        logger.info(f"Busca de produtos em modo '{modo}'")
+        return modo
+
+    @classmethod
+    def _instalar_postgres(cls):
+        """Cria configuração de busca e índice GIN no PostgreSQL"""
+        config = cls.CONFIG_PG
+
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+                existe = conn.execute(
+                    text("SELECT 1 FROM pg_ts_config WHERE cfgname = :nome"),
+                    {'nome': cls.CONFIG_PG}
+                ).scalar()
+                if not existe:
+                    conn.execute(text(
+                        f"CREATE TEXT SEARCH CONFIGURATION {cls.CONFIG_PG} "
+                        f"(COPY = portuguese)"
+                    ))
+                    conn.execute(text(
+                        f"ALTER TEXT SEARCH CONFIGURATION {cls.CONFIG_PG} "
+                        f"ALTER MAPPING FOR hword, hword_part, word "
+                        f"WITH unaccent, portuguese_stem"
+                    ))
+        except Exception as e:
+            # Sem permissão para criar a extensão: stemming sem remoção de acentos
+            logger.warning(f"unaccent indisponível, busca sem remoção de acentos: {str(e)}")
+            config = cls.CONFIG_PG_FALLBACK
+
+        cls._configs_pg[cls._chave_banco()] = config
+
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {cls.INDICE_PG} ON produtos "
+                f"USING GIN (({cls._vetor_pg_sql(config)}))"
+            ))
+
+        return 'postgres'
+
+    @classmethod
+    def _instalar_sqlite(cls):
+        """Cria tabela FTS5 de conteúdo externo e triggers de manutenção"""
+        with db.engine.begin() as conn:
+            existe = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                {'nome': cls.TABELA_FTS}
+            ).scalar()
+
+            if not existe:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {cls.TABELA_FTS} USING fts5("
+                    f"nome, descricao_curta, descricao, "
+                    f"content='produtos', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                ))
+
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {cls.TABELA_FTS}_ai AFTER INSERT ON produtos BEGIN "
+                f"INSERT INTO {cls.TABELA_FTS}(rowid, nome, descricao_curta, descricao) "
+                f"VALUES (new.id, new.nome, new.descricao_curta, new.descricao); "
+                f"END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {cls.TABELA_FTS}_ad AFTER DELETE ON produtos BEGIN "
+                f"INSERT INTO {cls.TABELA_FTS}({cls.TABELA_FTS}, rowid, nome, descricao_curta, descricao) "
+                f"VALUES ('delete', old.id, old.nome, old.descricao_curta, old.descricao); "
+                f"END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {cls.TABELA_FTS}_au "
+                f"AFTER UPDATE OF nome, descricao_curta, descricao ON produtos BEGIN "
+                f"INSERT INTO {cls.TABELA_FTS}({cls.TABELA_FTS}, rowid, nome, descricao_curta, descricao) "
+                f"VALUES ('delete', old.id, old.nome, old.descricao_curta, old.descricao); "
+                f"INSERT INTO {cls.TABELA_FTS}(rowid, nome, descricao_curta, descricao) "
+                f"VALUES (new.id, new.nome, new.descricao_curta, new.descricao); "
+                f"END"
+            ))
+
+            if not existe:
+                # Indexar produtos já cadastrados
+                conn.execute(text(
+                    f"INSERT INTO {cls.TABELA_FTS}({cls.TABELA_FTS}) VALUES ('rebuild')"
+                ))
+
+        return 'fts5'
+
+    @classmethod
+    def reconstruir_indice(cls):
+        """Reconstrói o índice FTS5 a partir da tabela de produtos (apenas SQLite)"""
+        if cls.modo() != 'fts5':
+            return False
+
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"INSERT INTO {cls.TABELA_FTS}({cls.TABELA_FTS}) VALUES ('rebuild')"
+            ))
+        return True
+
+    # ==================== CONSULTA ====================
+
+    @classmethod
+    def modo(cls):
+        """Retorna o modo de busca ativo para o banco atual"""
+        chave = cls._chave_banco()
+        if chave not in cls._modos:
+            cls._modos[chave] = cls._detectar_modo()
+        return cls._modos[chave]
+
+    @classmethod
+    def aplicar_busca(cls, query, termo):
+        """
+        Aplica o filtro de busca textual a uma query de Produto
+
+        Args:
+            query: Query de Produto (pode já conter outros filtros)
+            termo: Texto digitado pelo usuário
+
+        Returns:
+            tuple: (query filtrada, expressão de ordenação por relevância ou None)
+        """
+        from app.models.produto import Produto
+
+        tokens = cls._tokenizar(termo)
+        if not tokens:
+            return query, None
+
+        modo = cls.modo()
+
+        if modo == 'postgres':
+            config = cls._configs_pg.get(cls._chave_banco(), cls.CONFIG_PG)
+            vetor = literal_column(cls._vetor_pg_sql(config))
+            consulta = func.to_tsquery(
+                literal_column(f"'{config}'"),
+                ' & '.join(f"{token}:*" for token in tokens)
+            )
+            query = query.filter(vetor.op('@@')(consulta))
+            return query, func.ts_rank_cd(vetor, consulta).desc()
+
+        if modo == 'fts5':
+            fts = table(cls.TABELA_FTS, column('rowid'))
+            coluna_fts = literal_column(cls.TABELA_FTS)
+            expressao = ' '.join(f'"{token}"*' for token in tokens)
+            pesos = ', '.join(str(peso) for peso in cls.PESOS_FTS5)
+
+            resultados = (
+                select(
+                    fts.c.rowid.label('produto_id'),
+                    literal_column(f"bm25({cls.TABELA_FTS}, {pesos})").label('rank')
+                )
+                .where(coluna_fts.op('MATCH')(expressao))
+                .subquery('busca_fts')
+            )
+            query = query.join(resultados, resultados.c.produto_id == Produto.id)
+            # bm25 retorna valores menores para documentos mais relevantes
+            return query, resultados.c.rank.asc()
+
+        padrao = f'%{termo.strip()}%'
+        query = query.filter(
+            or_(
+                Produto.nome.ilike(padrao),
+                Produto.descricao.ilike(padrao),
+                Produto.descricao_curta.ilike(padrao)
+            )
+        )
+        return query, None
+
+    # ==================== AUXILIARES ====================
+
+    @classmethod
+    def _vetor_pg_sql(cls, config):
+        """Expressão tsvector ponderada (deve ser idêntica no índice e na consulta)"""
+        return (
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(produtos.nome, '')), 'A') || "
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(produtos.descricao_curta, '')), 'B') || "
+            f"setweight(to_tsvector('{config}'::regconfig, coalesce(produtos.descricao, '')), 'C')"
+        )
+
+    @staticmethod
+    def _tokenizar(termo):
+        """Extrai palavras do termo, descartando operadores e pontuação"""
+        if not termo:
+            return []
+        return re.findall(r'\w+', termo.lower())[:10]
+
+    @classmethod
+    def _detectar_modo(cls):
+        """Detecta estruturas de busca já instaladas (sem executar DDL)"""
+        dialeto = db.engine.dialect.name
+
+        try:
+            if dialeto == 'postgresql':
+                config = db.session.execute(
+                    text("SELECT cfgname FROM pg_ts_config WHERE cfgname = :nome"),
+                    {'nome': cls.CONFIG_PG}
+                ).scalar()
+                cls._configs_pg[cls._chave_banco()] = config or cls.CONFIG_PG_FALLBACK
+                return 'postgres'
+
+            if dialeto == 'sqlite':
+                existe = db.session.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                    {'nome': cls.TABELA_FTS}
+                ).scalar()
+                return 'fts5' if existe else 'like'
+        except Exception as e:
+            logger.warning(f"Erro ao detectar índice de busca: {str(e)}")
+
+        return 'like'
+
+    @staticmethod
+    def _chave_banco():
+        """Identifica o banco atual (permite múltiplas apps no mesmo processo)"""
+        return str(db.engine.url)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Cache
+Versões por tabela, cache de respostas da vitrine e estatísticas de acerto
+"""
+
+import hashlib
+import logging
+import uuid
+from datetime import date
+from flask import current_app, g, request, session
+from flask_login import current_user
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+
+from app import cache, db
+
+logger = logging.getLogger(__name__)
+
+
+class CacheService:
+    """
+    Serviço de cache invalidado por versão de tabela
+
+    Cada tabela tem um token de versão guardado no cache. Todo commit que
+    escreve na tabela (flush do ORM ou INSERT/UPDATE/DELETE em massa pela sessão)
+    troca o token; as chaves de cache incluem os tokens das tabelas de que
+    dependem, então entradas antigas deixam de ser encontradas e expiram
+    sozinhas pelo timeout.
+    """
+
+    CHAVE_SESSAO = 'cache_tabelas_alteradas'
+    PREFIXO_VERSAO = 'versao_tabela:'
+    PREFIXO_RESPOSTA = 'resposta:'
+    PREFIXO_DADOS = 'dados:'
+    PREFIXO_ESTATISTICA = 'estatistica_cache:'
+    PLACEHOLDER_CSRF = '__CSRF_TOKEN_CACHE__'
+
+    # Tabelas que alteram o conteúdo das páginas da vitrine
+    TABELAS_CATALOGO = ('produtos', 'categorias', 'estoque', 'reviews')
+
+    # Backends vistos por todos os processos (CACHE_TYPE); nos demais os
+    # tokens de versão só mudam no processo que fez o commit
+    BACKENDS_COMPARTILHADOS = ('redis', 'rediscluster', 'redissentinel', 'memcached', 'saslmemcached')
+
+    # Tabelas escritas só pelo worker (rollups): a versão vem do próprio
+    # banco (maior id e quantidade de linhas), já que o commit acontece
+    # fora dos processos web. O recálculo de um dia apaga e reinsere as
+    # linhas, então qualquer alteração muda o maior id ou a contagem.
+    TABELAS_VERSAO_BANCO = ('rollup_pedidos_diarios', 'rollup_vendas_diarias')
+
+    _aviso_cache_local = False
+
+    # Endpoints cacheados, para as estatísticas (preenchido pelo decorator cache_resposta)
+    endpoints = set()
+
+    # ==================== EVENTOS ====================
+
+    @classmethod
+    def registrar_eventos(cls, app):
+        """Registra os listeners de sessão e o context processor (idempotente)"""
+        if not event.contains(Session, 'after_flush', cls._coletar_flush):
+            event.listen(Session, 'after_flush', cls._coletar_flush)
+            event.listen(Session, 'do_orm_execute', cls._coletar_execucao)
+            event.listen(Session, 'after_commit', cls._publicar_versoes)
+
+        app.context_processor(cls._contexto_csrf)
+
+    @classmethod
+    def _marcar(cls, session, tabelas):
+        session.info.setdefault(cls.CHAVE_SESSAO, set()).update(tabelas)
+
+    @classmethod
+    def _coletar_flush(cls, session, flush_context):
+        """Coleta as tabelas escritas pelo flush atual"""
+        tabelas = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            tabela = getattr(obj, '__tablename__', None)
+            if tabela:
+                tabelas.add(tabela)
+        if tabelas:
+            cls._marcar(session, tabelas)
+
+    @classmethod
+    def _coletar_execucao(cls, orm_execute_state):
+        """Coleta tabelas de INSERT/UPDATE/DELETE executados direto pela sessão"""
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        tabela = getattr(orm_execute_state.statement, 'table', None)
+        nome = getattr(tabela, 'name', None)
+        if nome:
+            cls._marcar(orm_execute_state.session, {nome})
+
+    @classmethod
+    def _publicar_versoes(cls, session):
+        """Troca o token de versão das tabelas alteradas após o commit"""
+        tabelas = session.info.pop(cls.CHAVE_SESSAO, None)
+        if not tabelas:
+            return
+        try:
+            cls.invalidar(*tabelas)
+        except Exception as e:
+            # Sem contexto de aplicação ou cache indisponível: as entradas
+            # expiram pelo timeout
+            logger.warning(f"Não foi possível invalidar o cache de {sorted(tabelas)}: {e}")
+
+    # ==================== VERSÕES ====================
+
+    @classmethod
+    def invalidar(cls, *tabelas):
+        """Gera novos tokens de versão para as tabelas informadas"""
+        if tabelas:
+            cache.set_many({f'{cls.PREFIXO_VERSAO}{t}': uuid.uuid4().hex for t in tabelas}, timeout=0)
+
+    @staticmethod
+    def _versao_banco(tabela):
+        """Token de versão lido do banco: maior id e quantidade de linhas"""
+        t = db.metadata.tables[tabela]
+        maior, linhas = db.session.execute(select(func.max(t.c.id), func.count()).select_from(t)).one()
+        return f'{maior or 0}-{linhas}'
+
+    @classmethod
+    def versoes(cls, *tabelas):
+        """
+        Tokens de versão atuais das tabelas
+
+        Returns:
+            dict: {tabela: token}
+        """
+        ordem = tabelas
+        banco = {t: cls._versao_banco(t) for t in tabelas if t in cls.TABELAS_VERSAO_BANCO}
+        tabelas = [t for t in tabelas if t not in banco]
+        chaves = [f'{cls.PREFIXO_VERSAO}{t}' for t in tabelas]
+        valores = dict(zip(tabelas, cache.get_many(*chaves))) if chaves else {}
+
+        for tabela, valor in valores.items():
+            if valor is None:
+                chave = f'{cls.PREFIXO_VERSAO}{tabela}'
+                cache.add(chave, uuid.uuid4().hex, timeout=0)
+                valores[tabela] = cache.get(chave) or 'sem-versao'
+        valores.update(banco)
+        return {t: valores[t] for t in ordem}
+
+    @classmethod
+    def assinatura(cls, tabelas):
+        """Resumo curto dos tokens de versão (parte das chaves de cache)"""
+        versoes = cls.versoes(*sorted(tabelas))
+        texto = '|'.join(f'{t}={v}' for t, v in versoes.items())
+        return hashlib.sha1(texto.encode()).hexdigest()[:16]
+
+    # ==================== DADOS ====================
+
+    @classmethod
+    def obter_dados(cls, nome, tabelas, funcao, timeout=None):
+        """
+        Retorna o resultado de ``funcao()`` guardado no cache enquanto as
+        tabelas não mudarem. O resultado precisa ser serializável (não use
+        instâncias do ORM).
+        """
+        chave = f'{cls.PREFIXO_DADOS}{nome}:{cls.assinatura(tabelas)}'
+        valor = cache.get(chave)
+        if valor is None:
+            valor = funcao()
+            cache.set(chave, valor, timeout=cls.timeout_padrao(timeout))
+        return valor
+
+    # ==================== RESPOSTAS ====================
+
+    @staticmethod
+    def timeout_padrao(timeout=None):
+        """Validade das entradas do catálogo (CACHE_CATALOGO_TIMEOUT)"""
+        if timeout is not None:
+            return timeout
+        return current_app.config.get('CACHE_CATALOGO_TIMEOUT', 300)
+
+    @classmethod
+    def cache_compartilhado(cls):
+        """Se o backend de cache é o mesmo para web, worker e demais instâncias"""
+        tipo = str(current_app.config.get('CACHE_TYPE') or '').rsplit('.', 1)[-1].lower()
+        if tipo.endswith('cache'):
+            tipo = tipo[:-len('cache')]
+        return tipo in cls.BACKENDS_COMPARTILHADOS
+
+    @classmethod
+    def pode_cachear_resposta(cls):
+        """
+        Apenas GET de visitantes anônimos, sem carrinho e sem mensagens
+        flash pendentes recebem a página compartilhada
+
+        Com cache local ao processo (SimpleCache), commits do worker e das
+        outras instâncias não invalidariam as páginas: o cache da vitrine
+        fica desligado.
+        """
+        if not current_app.config.get('CACHE_CATALOGO_ATIVO', True):
+            return False
+        if not cls.cache_compartilhado():
+            if not cls._aviso_cache_local:
+                cls._aviso_cache_local = True
+                logger.warning(
+                    f"Cache da vitrine desativado: CACHE_TYPE={current_app.config.get('CACHE_TYPE')} "
+                    "não é compartilhado entre processos (use RedisCache)"
+                )
+            return False
+        if request.method != 'GET' or current_user.is_authenticated:
+            return False
+        return not session.get('carrinho') and not session.get('_flashes')
+
+    @staticmethod
+    def nao_cachear():
+        """Marca a resposta atual como não cacheável (ex: página de erro)"""
+        g.cache_resposta_ignorar = True
+
+    @staticmethod
+    def _identificar_requisicao():
+        """Endpoint, argumentos da rota, query string normalizada e host"""
+        argumentos = []
+        for nome in sorted(request.args):
+            valores = sorted(v.strip() for v in request.args.getlist(nome) if v.strip())
+            if valores:
+                argumentos.append((nome, valores))
+
+        return f'{request.endpoint}|{sorted((request.view_args or {}).items())}|{argumentos}|{request.host}'
+
+    @classmethod
+    def chave_resposta(cls, tabelas):
+        """
+        Monta a chave da resposta a partir do endpoint, argumentos da rota,
+        query string normalizada e versão das tabelas
+
+        Args:
+            tabelas: Tabelas de que a página depende
+        """
+        resumo = hashlib.sha1(cls._identificar_requisicao().encode()).hexdigest()
+        return f'{cls.PREFIXO_RESPOSTA}{request.endpoint}:{resumo}:{cls.assinatura(tabelas)}'
+
+    @classmethod
+    def versoes_confiaveis(cls, tabelas):
+        """
+        Se os tokens das tabelas mudam para todos os processos: versão lida
+        do banco ou cache compartilhado
+        """
+        return cls.cache_compartilhado() or all(t in cls.TABELAS_VERSAO_BANCO for t in tabelas)
+
+    @classmethod
+    def etag_resposta(cls, tabelas):
+        """
+        ETag de uma resposta que só depende das tabelas informadas (e da
+        data, para períodos relativos como "últimos 30 dias")
+
+        Args:
+            tabelas: Tabelas lidas pelo endpoint
+        """
+        base = f'{cls._identificar_requisicao()}|{date.today().isoformat()}|{cls.assinatura(tabelas)}'
+        return hashlib.sha1(base.encode()).hexdigest()
+
+    @classmethod
+    def _contexto_csrf(cls):
+        """Durante a renderização cacheável o token CSRF vira um marcador"""
+        if g.get('cache_resposta_renderizando'):
+            return {'csrf_token': lambda: cls.PLACEHOLDER_CSRF}
+        return {}
+
+    @classmethod
+    def preencher_csrf(cls, corpo):
+        """Substitui o marcador pelo token CSRF do visitante atual"""
+        if cls.PLACEHOLDER_CSRF not in corpo:
+            return corpo
+        from flask_wtf.csrf import generate_csrf
+        return corpo.replace(cls.PLACEHOLDER_CSRF, generate_csrf())
+
+    # ==================== ESTATÍSTICAS ====================
+
+    @classmethod
+    def registrar_acesso(cls, endpoint, acerto):
+        """Incrementa o contador de acertos/faltas do endpoint"""
+        chave = f"{cls.PREFIXO_ESTATISTICA}{endpoint}:{'hits' if acerto else 'misses'}"
+        try:
+            if cache.cache.inc(chave) is None:
+                cache.set(chave, 1, timeout=0)
+        except Exception as e:
+            logger.debug(f"Falha ao registrar estatística de cache: {e}")
+
+    @classmethod
+    def estatisticas(cls):
+        """
+        Taxa de acerto por endpoint cacheado
+
+        Returns:
+            dict: {'endpoints': {endpoint: {'hits', 'misses', 'taxa_acerto'}}, 'hits', 'misses', 'taxa_acerto'}
+        """
+        endpoints = sorted(cls.endpoints)
+        chaves = []
+        for endpoint in endpoints:
+            chaves += [f'{cls.PREFIXO_ESTATISTICA}{endpoint}:hits', f'{cls.PREFIXO_ESTATISTICA}{endpoint}:misses']
+        valores = cache.get_many(*chaves) if chaves else []
+
+        resultado = {}
+        total_hits = total_misses = 0
+        for i, endpoint in enumerate(endpoints):
+            hits = int(valores[2 * i] or 0)
+            misses = int(valores[2 * i + 1] or 0)
+            total_hits += hits
+            total_misses += misses
+            resultado[endpoint] = {
+                'hits': hits,
+                'misses': misses,
+                'taxa_acerto': round(hits / (hits + misses), 4) if hits + misses else None
+            }
+
+        total = total_hits + total_misses
+        return {
+            'endpoints': resultado,
+            'hits': total_hits,
+            'misses': total_misses,
+            'taxa_acerto': round(total_hits / total, 4) if total else None
+        }
+
+    @classmethod
+    def zerar_estatisticas(cls):
+        """Zera os contadores de acerto/falta"""
+        chaves = []
+        for endpoint in cls.endpoints:
+            chaves += [f'{cls.PREFIXO_ESTATISTICA}{endpoint}:hits', f'{cls.PREFIXO_ESTATISTICA}{endpoint}:misses']
+        if chaves:
+            cache.delete_many(*chaves)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Carrinho
+Precificação do carrinho e reserva atômica de estoque no checkout
+"""
+
+import logging
+from sqlalchemy import case, select
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class CarrinhoService:
+    """Serviço de precificação e reserva de estoque do carrinho"""
+
+    @staticmethod
+    def precificar(carrinho):
+        """
+        Precifica o carrinho carregando todos os produtos em uma única consulta
+
+        Args:
+            carrinho: Dicionário da sessão {produto_id (str): {'quantidade': int}}
+
+        Returns:
+            dict: {
+                'itens': [{'produto', 'produto_id', 'quantidade', 'preco_unitario', 'subtotal'}],
+                'total': soma dos subtotais,
+                'removidos': IDs (str) de produtos que não existem mais
+            }
+        """
+        from app.models.produto import Produto
+
+        quantidades = {}
+        removidos = []
+        for pid, item in (carrinho or {}).items():
+            try:
+                quantidades[int(pid)] = int(item.get('quantidade', 0))
+            except (TypeError, ValueError, AttributeError):
+                removidos.append(pid)
+
+        produtos = {}
+        if quantidades:
+            produtos = {
+                produto.id: produto
+                for produto in Produto.query.filter(Produto.id.in_(quantidades.keys())).all()
+            }
+
+        itens = []
+        total = 0
+        for produto_id, quantidade in quantidades.items():
+            produto = produtos.get(produto_id)
+            if produto is None:
+                removidos.append(str(produto_id))
+                continue
+
+            subtotal = produto.preco * quantidade
+            total += subtotal
+            itens.append({
+                'produto': produto,
+                'produto_id': produto.id,
+                'quantidade': quantidade,
+                'preco_unitario': produto.preco,
+                'subtotal': subtotal
+            })
+
+        return {'itens': itens, 'total': total, 'removidos': removidos}
+
+    @classmethod
+    def reservar_estoque(cls, itens):
+        """
+        Reserva o estoque de todas as linhas do carrinho de forma atômica
+
+        Emite um único UPDATE condicional
+        (``SET estoque = estoque - qtd WHERE id IN (...) AND estoque >= qtd``).
+        O bloqueio de linha do UPDATE impede que checkouts concorrentes vendam
+        a mesma unidade. Se qualquer linha falhar, nada é reservado: o chamador
+        deve fazer rollback da transação.
+
+        Args:
+            itens: Lista de itens de ``precificar`` (ou dicts com produto_id/quantidade)
+
+        Returns:
+            dict: {
+                'sucesso': bool,
+                'falhas': [{'produto_id', 'nome', 'solicitado', 'disponivel'}]
+            }
+        """
+        from app.models.produto import Produto
+
+        quantidades = {}
+        for item in itens:
+            quantidades[item['produto_id']] = quantidades.get(item['produto_id'], 0) + item['quantidade']
+
+        if not quantidades:
+            return {'sucesso': True, 'falhas': []}
+
+        invalidas = [pid for pid, qtd in quantidades.items() if qtd < 1]
+        if invalidas:
+            return {'sucesso': False, 'falhas': cls._descrever_falhas(invalidas, quantidades)}
+
+        tabela = Produto.__table__
+        quantidade_linha = case(quantidades, value=tabela.c.id)
+        condicao = (tabela.c.id.in_(sorted(quantidades))) & (tabela.c.estoque >= quantidade_linha)
+
+        if db.engine.dialect.update_returning:
+            reservados = set(db.session.execute(
+                tabela.update()
+                .where(condicao)
+                .values(estoque=tabela.c.estoque - quantidade_linha)
+                .returning(tabela.c.id)
+            ).scalars())
+        else:
+            # Bancos sem RETURNING: uma instrução condicional por linha
+            reservados = set()
+            for produto_id, quantidade in sorted(quantidades.items()):
+                resultado = db.session.execute(
+                    tabela.update()
+                    .where(tabela.c.id == produto_id, tabela.c.estoque >= quantidade)
+                    .values(estoque=tabela.c.estoque - quantidade)
+                )
+                if resultado.rowcount:
+                    reservados.add(produto_id)
+
+        # Produtos em memória passam a refletir o estoque do banco
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, Produto) and obj.id in quantidades:
+                db.session.expire(obj, ['estoque', 'data_atualizacao'])
+
+        falhas = [pid for pid in quantidades if pid not in reservados]
+        if falhas:
+            logger.info(f"Reserva de estoque recusada para os produtos {falhas}")
+            return {'sucesso': False, 'falhas': cls._descrever_falhas(falhas, quantidades)}
+
+        return {'sucesso': True, 'falhas': []}
+
+    @staticmethod
+    def _descrever_falhas(produto_ids, quantidades):
+        """Detalha as linhas recusadas com o estoque disponível no momento"""
+        from app.models.produto import Produto
+
+        linhas = db.session.execute(
+            select(Produto.id, Produto.nome, Produto.estoque).where(Produto.id.in_(produto_ids))
+        ).all()
+        encontrados = {produto_id: (nome, estoque) for produto_id, nome, estoque in linhas}
+
+        falhas = []
+        for produto_id in produto_ids:
+            nome, estoque = encontrados.get(produto_id, (None, 0))
+            falhas.append({
+                'produto_id': produto_id,
+                'nome': nome,
+                'solicitado': quantidades[produto_id],
+                'disponivel': max(estoque or 0, 0)
+            })
+        return falhas
@@ -6,20 +6,38 @@ Suporta certificados A1 (arquivo .pfx) e A3 (token USB/SmartCard)
 
 import os
 import base64
+import hashlib
 import tempfile
+import threading
+from collections import OrderedDict
 from datetime import datetime, date
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.serialization import pkcs12
 from lxml import etree
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class CertificadoService:
-    """Serviço para manipulação de certificados digitais A1 e A3"""
+    """
+    Serviço para manipulação de certificados digitais A1 e A3
+
+    Certificados A1 já cadastrados (com id) ficam em um cache do processo
+    após o primeiro carregamento: chave privada, certificado e PEMs, apenas
+    em memória, indexados pelo id e pelo SHA-256 do .pfx + senha. Alterar
+    ou excluir um CertificadoDigital (inclusive trocar o padrão em massa)
+    remove as entradas do cache.
+    """
+
+    CACHE_MAXIMO = 16
+
+    _cache = OrderedDict()
+    _trava = threading.Lock()
 
     def __init__(self, certificado=None):
         """
@@ -33,6 +51,74 @@ class CertificadoService:
         self._certificate = None
         self._cert_pem = None
         self._key_pem = None
+        self._assinador = None
+
+    # ==================== CACHE ====================
+
+    @classmethod
+    def registrar_eventos(cls):
+        """Registra a invalidação do cache em alterações de CertificadoDigital (idempotente)"""
+        from app.models.fiscal import CertificadoDigital
+
+        if not event.contains(CertificadoDigital, 'after_update', cls._invalidar_objeto):
+            event.listen(CertificadoDigital, 'after_update', cls._invalidar_objeto)
+            event.listen(CertificadoDigital, 'after_delete', cls._invalidar_objeto)
+            event.listen(Session, 'do_orm_execute', cls._invalidar_execucao)
+
+    @classmethod
+    def _invalidar_objeto(cls, mapper, connection, target):
+        cls.invalidar_cache(target.id)
+
+    @classmethod
+    def _invalidar_execucao(cls, orm_execute_state):
+        """UPDATE/DELETE em massa (ex: desmarcar o padrão) não identifica os ids"""
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        tabela = getattr(orm_execute_state.statement, 'table', None)
+        if getattr(tabela, 'name', None) == 'certificado_digital':
+            cls.invalidar_cache()
+
+    @classmethod
+    def invalidar_cache(cls, certificado_id=None):
+        """Remove do cache um certificado (ou todos)"""
+        with cls._trava:
+            if certificado_id is None:
+                cls._cache.clear()
+                return
+            for chave in [chave for chave in cls._cache if chave[0] == certificado_id]:
+                del cls._cache[chave]
+
+    @classmethod
+    def carregar_padrao(cls, empresa=None):
+        """
+        Carrega o certificado A1 padrão da empresa (ou o padrão geral, como nas telas fiscais)
+
+        Returns:
+            CertificadoService|None: None se não houver certificado A1 válido
+        """
+        from app.models.fiscal import CertificadoDigital
+
+        ativos = CertificadoDigital.query.filter_by(ativo=True, padrao=True)
+        certificado = (empresa and ativos.filter_by(empresa_id=empresa.id).first()) or ativos.first()
+        if not certificado or certificado.esta_vencido:
+            return None
+        if certificado.tipo != 'A1' or not certificado.arquivo_pfx:
+            return None
+
+        cert_service = cls(certificado)
+        if not cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)['sucesso']:
+            return None
+        return cert_service
+
+    def _chave_cache(self, pfx_data, senha):
+        """(id, sha256 do pfx + senha), ou None para certificados não cadastrados"""
+        certificado_id = getattr(self.certificado, 'id', None)
+        if certificado_id is None or not pfx_data:
+            return None
+        resumo = hashlib.sha256(pfx_data)
+        resumo.update(b'\0')
+        resumo.update(senha or b'')
+        return certificado_id, resumo.hexdigest()
 
     def carregar_certificado_a1(self, pfx_data, senha):
         """
@@ -45,11 +131,33 @@ class CertificadoService:
         Returns:
             dict: Informações do certificado
         """
+        self._assinador = None
+        senha = senha.encode() if isinstance(senha, str) else senha
+        chave = self._chave_cache(pfx_data, senha)
+        if chave:
+            with self._trava:
+                carregado = self._cache.get(chave)
+                if carregado:
+                    self._cache.move_to_end(chave)
+            if carregado:
+                self._private_key, self._certificate, self._cert_pem, self._key_pem, info = carregado
+                return dict(info)
+
+        info = self._ler_pfx(pfx_data, senha)
+        if chave and info['sucesso']:
+            with self._trava:
+                self._cache[chave] = (self._private_key, self._certificate, self._cert_pem, self._key_pem, info)
+                while len(self._cache) > self.CACHE_MAXIMO:
+                    self._cache.popitem(last=False)
+        return info
+
+    def _ler_pfx(self, pfx_data, senha):
+        """Decodifica o PKCS12 e deriva os PEMs"""
         try:
             # Decodifica o certificado PKCS12
             private_key, certificate, additional_certs = pkcs12.load_key_and_certificates(
                 pfx_data,
-                senha.encode() if isinstance(senha, str) else senha,
+                senha,
                 default_backend()
             )
 
@@ -266,6 +374,21 @@ class CertificadoService:
                 return attribute.value
         return "Desconhecido"
 
+    def assinador(self):
+        """
+        Assinador A1 deste certificado, criado uma vez por instância
+
+        Returns:
+            AssinaturaService: Assinador com a chave já carregada
+        """
+        if self._assinador is None:
+            from app.services.assinatura_service import AssinaturaService
+
+            if not (self._key_pem and self._cert_pem):
+                raise Exception("Certificado não carregado")
+            self._assinador = AssinaturaService(self._private_key or self._key_pem, self._cert_pem)
+        return self._assinador
+
     def assinar_xml(self, xml_string, reference_uri=''):
         """
         Assina um documento XML com o certificado carregado
@@ -278,32 +401,7 @@ class CertificadoService:
             str: XML assinado
         """
         try:
-            from signxml import XMLSigner, methods
-
-            # Parse do XML
-            root = etree.fromstring(xml_string.encode('utf-8'))
-
-            # Configura o assinador
-            signer = XMLSigner(
-                method=methods.enveloped,
-                signature_algorithm='rsa-sha1',
-                digest_algorithm='sha1',
-                c14n_algorithm='http://www.w3.org/TR/2001/REC-xml-c14n-20010315'
-            )
-
-            # Para A1, usa chave e certificado carregados
-            if self._key_pem and self._cert_pem:
-                signed_root = signer.sign(
-                    root,
-                    key=self._key_pem,
-                    cert=self._cert_pem,
-                    reference_uri=reference_uri
-                )
-            else:
-                raise Exception("Certificado não carregado")
-
-            return etree.tostring(signed_root, encoding='unicode', pretty_print=False)
-
+            return self.assinador().assinar(xml_string, reference_uri)
         except ImportError:
             logger.error("Biblioteca signxml não instalada")
             raise Exception("Biblioteca signxml não instalada. Execute: pip install signxml")
@@ -311,6 +409,23 @@ class CertificadoService:
             logger.error(f"Erro ao assinar XML: {str(e)}")
             raise
 
+    def assinar_lote(self, documentos, processos=None):
+        """
+        Assina vários documentos com o certificado A1 carregado
+
+        Args:
+            documentos: Lista de tuplas (xml, reference_uri)
+            processos: Ver AssinaturaService.assinar_lote
+
+        Returns:
+            list: Um dict {'indice', 'sucesso', 'xml', 'erro'} por documento, na ordem recebida
+        """
+        try:
+            return self.assinador().assinar_lote(documentos, processos)
+        except ImportError:
+            logger.error("Biblioteca signxml não instalada")
+            raise Exception("Biblioteca signxml não instalada. Execute: pip install signxml")
+
     def assinar_xml_a3(self, xml_string, reference_uri=''):
         """
         Assina XML usando certificado A3 (token USB)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Contagens
+Totais de tabelas exatos ou estimados e contagens agrupadas em cache
+"""
+
+import json
+import logging
+from flask import current_app
+from sqlalchemy import select, func, text, bindparam, Table
+
+from app import db
+from app.services.cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+
+class ContagemService:
+    """
+    Contagens para telas administrativas
+
+    No PostgreSQL o total de uma tabela vem das estatísticas do
+    planejador (pg_class.reltuples, atualizadas pelo autovacuum/ANALYZE);
+    tabelas abaixo de CONTAGEM_LIMITE_EXATO linhas ou nunca analisadas são
+    contadas com COUNT(*). Nos demais bancos o COUNT(*) exato fica no
+    cache até a próxima escrita na tabela (versões do CacheService).
+    Contagens agrupadas usam um único GROUP BY, também em cache.
+    """
+
+    # ==================== TOTAIS ====================
+
+    @staticmethod
+    def _nome_tabela(tabela):
+        if isinstance(tabela, str):
+            return tabela
+        return getattr(tabela, '__tablename__', None) or tabela.name
+
+    @staticmethod
+    def limite_exato():
+        return current_app.config.get('CONTAGEM_LIMITE_EXATO', 100000)
+
+    @staticmethod
+    def _contar_exato(tabela):
+        """COUNT(*) exato em cache até a próxima escrita na tabela"""
+        def contar():
+            return db.session.execute(
+                select(func.count()).select_from(db.metadata.tables[tabela])
+            ).scalar() or 0
+
+        return CacheService.obter_dados(
+            f'contagem:{tabela}', [tabela], contar,
+            timeout=current_app.config.get('CONTAGEM_CACHE_TIMEOUT', 300)
+        )
+
+    @staticmethod
+    def _estatisticas_postgres(tabelas):
+        """
+        Returns:
+            dict: {tabela: linhas estimadas} (-1 se nunca analisada)
+        """
+        linhas = db.session.execute(
+            text(
+                "SELECT c.relname, c.reltuples FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE c.relkind IN ('r', 'p') AND c.relname IN :tabelas "
+                "AND n.nspname = ANY (current_schemas(false))"
+            ).bindparams(bindparam('tabelas', expanding=True)),
+            {'tabelas': list(tabelas)}
+        ).all()
+        return {nome: int(reltuples) for nome, reltuples in linhas}
+
+    @classmethod
+    def totais(cls, *tabelas, detalhado=False):
+        """
+        Total de linhas de cada tabela (modelos ou nomes)
+
+        Args:
+            detalhado: Retorna também se cada total é estimado
+
+        Returns:
+            dict: {tabela: total} ou {tabela: {'total': int, 'estimado': bool}}
+        """
+        nomes = [cls._nome_tabela(tabela) for tabela in tabelas]
+        estimativas = {}
+        if db.engine.dialect.name == 'postgresql':
+            try:
+                estimativas = cls._estatisticas_postgres(nomes)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Não foi possível ler as estatísticas de {nomes}: {e}")
+
+        limite = cls.limite_exato()
+        resultado = {}
+        for nome in nomes:
+            estimativa = estimativas.get(nome, -1)
+            if estimativa >= limite:
+                resultado[nome] = {'total': estimativa, 'estimado': True}
+            else:
+                resultado[nome] = {'total': cls._contar_exato(nome), 'estimado': False}
+
+        if detalhado:
+            return resultado
+        return {nome: dados['total'] for nome, dados in resultado.items()}
+
+    @classmethod
+    def total(cls, tabela):
+        """Total de linhas de uma tabela (modelo ou nome)"""
+        return cls.totais(tabela)[cls._nome_tabela(tabela)]
+
+    # ==================== AGRUPADOS ====================
+
+    @classmethod
+    def agrupado(cls, modelo, *colunas):
+        """
+        Contagem por combinação de valores das colunas em um único GROUP BY
+
+        Ex: ``agrupado(User, User.tipo_usuario, User.ativo)`` →
+        ``{('admin', True): 3, ('cliente', True): 120, ...}``
+
+        Returns:
+            dict: {tupla de valores: quantidade}
+        """
+        tabela = cls._nome_tabela(modelo)
+        nomes = [coluna.key for coluna in colunas]
+
+        def contar():
+            linhas = db.session.execute(
+                select(*colunas, func.count()).select_from(modelo).group_by(*colunas)
+            ).all()
+            # Lista de pares: o cache precisa de valores serializáveis
+            return [[list(linha[:-1]), linha[-1]] for linha in linhas]
+
+        linhas = CacheService.obter_dados(
+            f'contagem_agrupada:{tabela}:{",".join(nomes)}', [tabela], contar,
+            timeout=current_app.config.get('CONTAGEM_CACHE_TIMEOUT', 300)
+        )
+        return {tuple(valores): quantidade for valores, quantidade in linhas}
+
+    # ==================== QUERIES ====================
+
+    @classmethod
+    def contar_query(cls, query, estimar=False):
+        """
+        Total de linhas de uma query do ORM
+
+        Query sem filtros sobre uma única tabela usa ``total``; com
+        ``estimar``, as demais usam a estimativa do planejador quando o
+        banco oferece. Caso contrário, COUNT exato.
+
+        Returns:
+            tuple: (total, estimado)
+        """
+        statement = query.statement
+        froms = statement.get_final_froms()
+        if (
+            query.whereclause is None
+            and len(froms) == 1
+            and isinstance(froms[0], Table)
+            and not statement._group_by_clauses
+            and not statement._distinct
+            and statement._limit_clause is None
+            and statement._offset_clause is None
+        ):
+            dados = cls.totais(froms[0].name, detalhado=True)[froms[0].name]
+            return dados['total'], dados['estimado']
+
+        if estimar:
+            estimativa = cls.estimar_query(query)
+            if estimativa is not None:
+                return estimativa, True
+        return query.count(), False
+
+    @staticmethod
+    def estimar_query(query):
+        """
+        Estima o número de linhas de uma query pelo planejador do banco
+
+        Usa EXPLAIN no PostgreSQL. Retorna None quando o banco não oferece
+        estimativa (o chamador deve então usar COUNT exato).
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return None
+
+        try:
+            compilado = query.statement.compile(dialect=db.engine.dialect)
+            # SAVEPOINT: um EXPLAIN com erro não deixa a transação da requisição abortada
+            with db.session.begin_nested():
+                plano = db.session.connection().exec_driver_sql(
+                    'EXPLAIN (FORMAT JSON) ' + compilado.string,
+                    compilado.params
+                ).scalar()
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            return int(plano[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            current_app.logger.warning(f"Não foi possível estimar total: {str(e)}")
+            return None
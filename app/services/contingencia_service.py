@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Contingência
+Emissão em contingência (NFC-e off-line e SVC) guiada pela disponibilidade da SEFAZ
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func
+
+from app import db
+from .sefaz_monitor_service import SefazMonitorService
+from .validador_xsd_service import ValidadorXSDService
+
+logger = logging.getLogger(__name__)
+
+
+class ContingenciaService:
+    """
+    Forma de emissão (tpEmis) de acordo com a disponibilidade da SEFAZ
+
+    A SEFAZ é considerada indisponível quando o último status recente do
+    monitor (SefazMonitorService) é offline ou sua latência passa de
+    CONTINGENCIA_LATENCIA_MAXIMA_MS. As falhas transitórias das próprias
+    transmissões (108, 109, 999) também são registradas no histórico do
+    monitor, de modo que o PDV entra em contingência sem esperar a próxima
+    consulta de status; a primeira consulta com 107 encerra a contingência.
+
+    Com a SEFAZ indisponível:
+
+    - NFC-e (modelo 65): contingência off-line (tpEmis 9). A nota é gerada,
+      assinada e validada no próprio PDV, fica com status 'contingencia' e
+      pode ser impressa na hora; a transmissão fica na fila de emissão e o
+      worker envia essas notas em bloco quando a SEFAZ volta.
+    - NF-e (modelo 55): SEFAZ Virtual de Contingência da UF (tpEmis 6 para
+      SVC-AN, 7 para SVC-RS). A nota segue pela fila normal, transmitida ao
+      SVC.
+
+    A forma de emissão faz parte da chave de acesso: uma nota já numerada
+    em contingência nunca é regerada em emissão normal (nem o inverso).
+    """
+
+    NORMAL = 1
+    SVC_AN = 6
+    SVC_RS = 7
+    OFFLINE_NFCE = 9
+
+    # UFs atendidas pelo SVC-RS; as demais usam o SVC-AN
+    UFS_SVC_RS = {'AM', 'BA', 'CE', 'GO', 'MA', 'MS', 'MT', 'PA', 'PE', 'PI', 'PR'}
+
+    # ==================== DISPONIBILIDADE ====================
+
+    @staticmethod
+    def _inicio_indisponibilidade(uf, ambiente):
+        """Primeiro registro offline desde o último online (dhCont, em UTC)"""
+        from app.models.fiscal import StatusSefaz
+
+        filtro = (StatusSefaz.uf == uf, StatusSefaz.ambiente == ambiente)
+        ultimo_online = db.session.execute(
+            select(func.max(StatusSefaz.data_consulta)).where(*filtro, StatusSefaz.online.is_(True))
+        ).scalar()
+        consulta = select(func.min(StatusSefaz.data_consulta)).where(*filtro)
+        if ultimo_online is not None:
+            consulta = consulta.where(StatusSefaz.data_consulta > ultimo_online)
+        return db.session.execute(consulta).scalar()
+
+    @classmethod
+    def avaliar(cls, uf, ambiente):
+        """
+        Verifica, sem acessar a SEFAZ, se a emissão deve ser feita em contingência
+
+        Returns:
+            dict: ativa, motivo e inicio (UTC, entrada em contingência)
+        """
+        resultado = {'ativa': False, 'motivo': None, 'inicio': None}
+        if not current_app.config.get('CONTINGENCIA_AUTOMATICA', True):
+            return resultado
+
+        disponivel, status = SefazMonitorService.disponivel(uf, ambiente)
+        if not disponivel:
+            resultado['motivo'] = f"SEFAZ indisponível ({status['codigo'] or 'sem código'}): {status['mensagem'] or 'sem resposta'}"
+        elif status and not status['desatualizado'] and status['latencia_ms'] is not None and \
+                status['latencia_ms'] > current_app.config.get('CONTINGENCIA_LATENCIA_MAXIMA_MS', 5000):
+            resultado['motivo'] = f"SEFAZ com tempo de resposta elevado ({status['latencia_ms']}ms)"
+        else:
+            return resultado
+
+        resultado['ativa'] = True
+        resultado['inicio'] = cls._inicio_indisponibilidade(uf, ambiente) or status['data_consulta']
+        return resultado
+
+    @classmethod
+    def disponivel(cls, uf, ambiente):
+        """Se a SEFAZ pode receber as notas emitidas em contingência off-line"""
+        return not cls.avaliar(uf, ambiente)['ativa']
+
+    @staticmethod
+    def registrar_falha(uf, ambiente, resultado):
+        """
+        Registra uma falha transitória de transmissão no histórico do monitor (sem commit)
+
+        Args:
+            resultado: Retorno de transmitir_nfe com código 108, 109 ou 999
+        """
+        return SefazMonitorService.registrar(uf, ambiente, {
+            'online': False,
+            'codigo': resultado.get('codigo'),
+            'mensagem': resultado.get('mensagem'),
+        })
+
+    # ==================== EMISSÃO ====================
+
+    @classmethod
+    def tipo_contingencia(cls, uf, modelo):
+        """tpEmis de contingência: off-line para NFC-e, SVC da UF para NF-e"""
+        if str(modelo) == '65':
+            return cls.OFFLINE_NFCE
+        return cls.SVC_RS if uf in cls.UFS_SVC_RS else cls.SVC_AN
+
+    @classmethod
+    def aplicar(cls, nota, uf, ambiente):
+        """
+        Define a forma de emissão da nota ainda não numerada (sem commit)
+
+        Returns:
+            dict: Resultado de ``avaliar``; com contingência ativa, a nota
+            recebe tipo_emissao, data_contingencia e justificativa_contingencia
+        """
+        avaliacao = cls.avaliar(uf, ambiente)
+        if not avaliacao['ativa']:
+            nota.tipo_emissao = cls.NORMAL
+            return avaliacao
+
+        # dhCont em horário local, como dhEmi; nunca posterior à emissão
+        inicio = avaliacao['inicio'] + (datetime.now() - datetime.utcnow())
+        nota.tipo_emissao = cls.tipo_contingencia(uf, nota.modelo)
+        nota.data_contingencia = min(inicio, nota.data_emissao).replace(microsecond=0)
+        nota.justificativa_contingencia = current_app.config.get(
+            'CONTINGENCIA_JUSTIFICATIVA', 'SEFAZ indisponivel ou com tempo de resposta elevado'
+        )[:256]
+        logger.warning(f"Nota {nota.modelo}/{nota.serie}/{nota.numero} em contingência "
+                       f"(tpEmis {nota.tipo_emissao}): {avaliacao['motivo']}")
+        return avaliacao
+
+    @staticmethod
+    def emitir_offline(nota, nfe_service):
+        """
+        Gera, assina e valida a NFC-e em contingência off-line, pronta para impressão (sem commit)
+
+        A transmissão fica com a fila de emissão; o XML assinado gravado aqui
+        é o que será enviado (a chave impressa não muda).
+
+        Returns:
+            NotaFiscal: Nota com status 'contingencia'
+        """
+        xml = nfe_service.assinar_nfe(nfe_service.gerar_xml_nfe(nota))
+        rejeicao = ValidadorXSDService.rejeicao(xml)
+        if rejeicao:
+            raise Exception(rejeicao['mensagem'])
+
+        nota.xml_nfe = xml
+        nota.status = 'contingencia'
+        return nota
+
+    # ==================== TRANSMISSÃO ====================
+
+    @staticmethod
+    def transmitir_pendentes(limite=None):
+        """
+        Transmite em bloco as NFC-e emitidas off-line das UFs com a SEFAZ disponível (worker)
+
+        Returns:
+            int: Notas processadas
+        """
+        from app.services.fila_emissao_service import FilaEmissaoService
+
+        limite = limite or current_app.config.get('CONTINGENCIA_LIMITE_TRANSMISSAO', 200)
+        return FilaEmissaoService.processar_pendentes(limite=limite, contingencia=True)
+
+    @classmethod
+    def verificar_prazo(cls):
+        """
+        Alerta no log as NFC-e off-line ainda não transmitidas após
+        CONTINGENCIA_PRAZO_HORAS (worker)
+
+        Returns:
+            int: Notas fora do prazo
+        """
+        prazo = current_app.config.get('CONTINGENCIA_PRAZO_HORAS', 24)
+        atrasadas = cls.pendentes(horas=prazo)
+        if atrasadas:
+            logger.error(f"{atrasadas} NFC-e emitida(s) em contingência off-line há mais de {prazo}h "
+                         "sem autorização da SEFAZ")
+        return atrasadas
+
+    @staticmethod
+    def pendentes(horas=None):
+        """
+        NFC-e emitidas em contingência ainda não transmitidas com sucesso
+
+        Args:
+            horas: Apenas as emitidas há mais de N horas (prazo de transmissão)
+
+        Returns:
+            int
+        """
+        from app.models.fiscal import NotaFiscal
+
+        consulta = select(func.count()).select_from(NotaFiscal).where(
+            NotaFiscal.tipo_emissao == ContingenciaService.OFFLINE_NFCE,
+            NotaFiscal.status.in_(('contingencia', 'transmitida'))
+        )
+        if horas:
+            consulta = consulta.where(NotaFiscal.data_emissao < datetime.now() - timedelta(hours=horas))
+        return db.session.execute(consulta).scalar()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Facetas da Loja
+Contagem de resultados por categoria e faixa de preço em uma única consulta
+"""
+
+from flask import current_app
+from sqlalchemy import select, func, case, and_, true
+
+from app import db
+from app.services.cache_service import CacheService
+
+
+class FacetasService:
+    """
+    Serviço de facetas do filtro lateral da loja
+
+    Cada faceta ignora o próprio filtro e respeita os demais (padrão de
+    navegação facetada): a contagem por categoria considera a busca e a
+    faixa de preço; a contagem por faixa considera a busca e a categoria.
+    As duas saem de um único GROUP BY (categoria, faixa) sobre os produtos
+    da busca, com a soma dos que estão dentro da faixa de preço pedida.
+    """
+
+    TABELAS = ['produtos', 'categorias']
+
+    @staticmethod
+    def limites_faixas():
+        """Limites das faixas de preço (config LOJA_FAIXAS_PRECO)"""
+        valor = current_app.config.get('LOJA_FAIXAS_PRECO', '50,100,250,500,1000')
+        limites = []
+        for parte in str(valor).split(','):
+            try:
+                limites.append(float(parte))
+            except ValueError:
+                continue
+        return sorted(set(limite for limite in limites if limite > 0))
+
+    @classmethod
+    def faixas(cls):
+        """
+        Faixas de preço configuradas
+
+        Returns:
+            list: [{'indice', 'min', 'max', 'max_filtro', 'rotulo'}] (max None
+            na última). A faixa inclui o mínimo e exclui o máximo; max_filtro
+            é o valor usado no filtro max_preco (inclusivo) do link.
+        """
+        limites = cls.limites_faixas()
+        faixas = []
+        anterior = None
+        for indice, limite in enumerate(limites + [None]):
+            if anterior is None:
+                rotulo = f'Até R$ {limite:.0f}'
+            elif limite is None:
+                rotulo = f'Acima de R$ {anterior:.0f}'
+            else:
+                rotulo = f'R$ {anterior:.0f} a R$ {limite:.0f}'
+            faixas.append({
+                'indice': indice,
+                'min': anterior,
+                'max': limite,
+                'max_filtro': round(limite - 0.01, 2) if limite is not None else None,
+                'rotulo': rotulo
+            })
+            anterior = limite
+        return faixas
+
+    @staticmethod
+    def categorias():
+        """Categorias do filtro (id, nome), cacheadas até a próxima alteração"""
+        from app.models.categoria import Categoria
+
+        return CacheService.obter_dados(
+            'categorias_filtro', ['categorias'],
+            lambda: [{'id': c.id, 'nome': c.nome} for c in Categoria.query.order_by(Categoria.nome).all()]
+        )
+
+    @classmethod
+    def _agrupar(cls, query_base, min_preco, max_preco):
+        """
+        Executa o GROUP BY (categoria, faixa)
+
+        Returns:
+            list: [(categoria_id, faixa, total, dentro_preco)]
+        """
+        from app.models.produto import Produto
+
+        limites = cls.limites_faixas()
+        if limites:
+            faixa = case(
+                *[(Produto.preco < limite, indice) for indice, limite in enumerate(limites)],
+                else_=len(limites)
+            )
+        else:
+            faixa = db.literal(0)
+
+        condicoes = []
+        if min_preco is not None:
+            condicoes.append(Produto.preco >= min_preco)
+        if max_preco is not None:
+            condicoes.append(Produto.preco <= max_preco)
+        dentro_preco = case((and_(true(), *condicoes), 1), else_=0)
+
+        linhas = query_base.with_entities(
+            Produto.categoria_id.label('categoria_id'),
+            faixa.label('faixa'),
+            dentro_preco.label('dentro_preco')
+        ).order_by(None).subquery()
+
+        return [
+            (categoria_id, faixa_indice, total, int(dentro or 0))
+            for categoria_id, faixa_indice, total, dentro in db.session.execute(
+                select(
+                    linhas.c.categoria_id,
+                    linhas.c.faixa,
+                    func.count(),
+                    func.sum(linhas.c.dentro_preco)
+                ).group_by(linhas.c.categoria_id, linhas.c.faixa)
+            ).all()
+        ]
+
+    @classmethod
+    def calcular(cls, query_base, categoria_id=None, min_preco=None, max_preco=None, termo=None):
+        """
+        Calcula as facetas da listagem atual
+
+        Args:
+            query_base: Query de produtos com a busca aplicada e sem os
+                filtros de categoria/preço
+            categoria_id: Categoria selecionada
+            min_preco / max_preco: Faixa de preço selecionada
+            termo: Termo de busca; sem termo o agrupamento vem do cache
+
+        Returns:
+            dict: {
+                'categorias': [{'id', 'nome', 'total'}],
+                'faixas': [{'indice', 'min', 'max', 'rotulo', 'total', 'selecionada'}],
+                'sem_categoria': produtos sem categoria na faixa de preço
+            }
+        """
+        if termo:
+            grupos = cls._agrupar(query_base, min_preco, max_preco)
+        else:
+            grupos = CacheService.obter_dados(
+                f'facetas_loja:{min_preco}:{max_preco}:{cls.limites_faixas()}', cls.TABELAS,
+                lambda: cls._agrupar(query_base, min_preco, max_preco)
+            )
+
+        por_categoria = {}
+        por_faixa = {}
+        for grupo_categoria, faixa, total, dentro_preco in grupos:
+            por_categoria[grupo_categoria] = por_categoria.get(grupo_categoria, 0) + dentro_preco
+            if not categoria_id or grupo_categoria == categoria_id:
+                por_faixa[faixa] = por_faixa.get(faixa, 0) + total
+
+        categorias = [
+            {'id': categoria['id'], 'nome': categoria['nome'], 'total': por_categoria.get(categoria['id'], 0)}
+            for categoria in cls.categorias()
+        ]
+
+        faixas = []
+        for faixa in cls.faixas():
+            faixa['total'] = por_faixa.get(faixa['indice'], 0)
+            faixa['selecionada'] = (
+                (min_preco is not None or max_preco is not None)
+                and min_preco == faixa['min'] and max_preco == faixa['max_filtro']
+            )
+            faixas.append(faixa)
+
+        return {
+            'categorias': categorias,
+            'faixas': faixas,
+            'sem_categoria': por_categoria.get(None, 0)
+        }
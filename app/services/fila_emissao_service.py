@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Fila de Emissão
+Emissão de NF-e/NFC-e do PDV em background (worker), com repetição idempotente
+"""
+
+import os
+import socket
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, and_, or_
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class FilaEmissaoService:
+    """
+    Fila durável de emissão
+
+    O PDV grava a nota em rascunho e a enfileira na mesma transação; o
+    worker reserva o item com um UPDATE condicional (compare-and-set no
+    status, de modo que dois workers nunca processam a mesma nota), gera,
+    assina e transmite. Reservas mais antigas que FILA_NFE_RESERVA_SEGUNDOS
+    (worker que caiu no meio da emissão) voltam a ficar disponíveis.
+
+    A emissão é idempotente pela chave de acesso: o XML assinado é gravado
+    antes do envio e reaproveitado nas novas tentativas (a chave não muda),
+    e uma nota que já foi transmitida é consultada na SEFAZ pela chave antes
+    de ser reenviada, pois a falha pode ter ocorrido depois de a SEFAZ
+    receber a nota.
+
+    NFC-e emitidas em contingência off-line (ContingenciaService) chegam à
+    fila já assinadas e ficam fora da emissão normal: são transmitidas em
+    bloco, com ``contingencia=True``, apenas para UFs com a SEFAZ disponível,
+    sem gastar tentativas enquanto ela está fora do ar.
+    """
+
+    STATUS_FINAIS = ('autorizada', 'denegada', 'rejeitada', 'cancelada')
+    CODIGOS_AUTORIZADA = {'100', '150'}
+    CODIGOS_DENEGADA = {'110', '205', '301', '302', '303'}
+    CODIGO_NAO_CONSTA = '217'
+    CODIGO_DUPLICIDADE = '204'
+    # Serviço paralisado ou falha de comunicação: tentar de novo mais tarde
+    CODIGOS_TRANSITORIOS = {'108', '109', '999'}
+
+    # ==================== ENFILEIRAMENTO ====================
+
+    @staticmethod
+    def enfileirar(nota):
+        """
+        Enfileira a nota para emissão pelo worker (sem commit)
+
+        Idempotente: a nota tem no máximo um item na fila; um item que
+        esgotou as tentativas volta a ficar pendente.
+
+        Returns:
+            FilaEmissaoNFe: Item da fila
+        """
+        from app.models.fiscal import FilaEmissaoNFe
+
+        item = FilaEmissaoNFe.query.filter_by(nota_fiscal_id=nota.id).first()
+        if item is None:
+            item = FilaEmissaoNFe(nota_fiscal_id=nota.id, status='pendente', tentativas=0,
+                                  proxima_tentativa=datetime.utcnow())
+            db.session.add(item)
+        elif item.status == 'erro':
+            item.status = 'pendente'
+            item.tentativas = 0
+            item.proxima_tentativa = datetime.utcnow()
+        return item
+
+    # ==================== RESERVA ====================
+
+    @staticmethod
+    def trabalhador():
+        """Identificação do processo que reserva os itens"""
+        return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+    @staticmethod
+    def _disponiveis(agora):
+        """Condição dos itens que podem ser reservados agora"""
+        from app.models.fiscal import FilaEmissaoNFe
+
+        expirada = agora - timedelta(seconds=current_app.config.get('FILA_NFE_RESERVA_SEGUNDOS', 300))
+        return or_(
+            and_(FilaEmissaoNFe.status == 'pendente', FilaEmissaoNFe.proxima_tentativa <= agora),
+            and_(FilaEmissaoNFe.status == 'processando', FilaEmissaoNFe.data_reserva < expirada)
+        )
+
+    @classmethod
+    def reservar(cls, item_id, trabalhador=None):
+        """
+        Reserva o item para este processo (commit)
+
+        Returns:
+            bool: False se outro worker reservou antes
+        """
+        from app.models.fiscal import FilaEmissaoNFe
+
+        agora = datetime.utcnow()
+        resultado = db.session.execute(
+            update(FilaEmissaoNFe)
+            .where(FilaEmissaoNFe.id == item_id, cls._disponiveis(agora))
+            .values(
+                status='processando',
+                trabalhador=trabalhador or cls.trabalhador(),
+                data_reserva=agora,
+                tentativas=FilaEmissaoNFe.tentativas + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return resultado.rowcount == 1
+
+    # ==================== EMISSÃO ====================
+
+    @classmethod
+    def _aplicar_retorno(cls, nota, resultado):
+        """
+        Atualiza a nota com o retorno de autorização ou consulta
+
+        Returns:
+            bool: True se a nota chegou a um status final
+        """
+        codigo = resultado.get('codigo')
+        nota.codigo_status_sefaz = codigo
+        nota.motivo_status_sefaz = (resultado.get('mensagem') or '')[:500]
+
+        if codigo in cls.CODIGOS_AUTORIZADA:
+            nota.status = 'autorizada'
+            nota.protocolo_autorizacao = resultado.get('protocolo')
+            nota.data_autorizacao = datetime.now()
+            nota.xml_autorizacao = resultado.get('xml_retorno')
+            return True
+        if codigo in cls.CODIGOS_DENEGADA:
+            nota.status = 'denegada'
+            nota.protocolo_autorizacao = resultado.get('protocolo')
+            nota.xml_autorizacao = resultado.get('xml_retorno')
+            return True
+        return False
+
+    @classmethod
+    def _preparar_envio(cls, nota, nfe_service):
+        """
+        Retoma a emissão até o envio: consulta a nota já transmitida, assina se
+        preciso e grava a transmissão antes do envio (commit)
+
+        Returns:
+            bool|None: Como em ``emitir`` quando não há o que enviar; None com
+            a nota pronta para transmitir
+        """
+        if nota.status in cls.STATUS_FINAIS:
+            return True
+
+        if nota.status == 'transmitida':
+            # A tentativa anterior pode ter chegado à SEFAZ: consultar antes de reenviar
+            consulta = nfe_service.consultar_nfe(nota.chave_acesso)
+            if cls._aplicar_retorno(nota, consulta):
+                db.session.commit()
+                logger.info(f"NFe {nota.chave_acesso} recuperada pela consulta: {nota.status}")
+                return True
+            if consulta.get('codigo') != cls.CODIGO_NAO_CONSTA:
+                db.session.commit()
+                return False
+
+        if nota.status not in ('assinada', 'contingencia', 'transmitida') or not nota.xml_nfe:
+            nota.xml_nfe = nfe_service.assinar_nfe(nfe_service.gerar_xml_nfe(nota))
+            nota.status = 'assinada'
+
+        # Gravar a transmissão antes do envio: a próxima tentativa consulta pela chave
+        nota.status = 'transmitida'
+        db.session.commit()
+        return None
+
+    @classmethod
+    def _concluir_envio(cls, nota, nfe_service, resultado):
+        """
+        Aplica o retorno da transmissão (commit)
+
+        Returns:
+            bool: Como em ``emitir``
+        """
+        from app.services.contingencia_service import ContingenciaService
+
+        if resultado.get('codigo') == cls.CODIGO_DUPLICIDADE:
+            # Já recebida numa tentativa anterior: buscar o protocolo pela chave
+            resultado = nfe_service.consultar_nfe(nota.chave_acesso)
+
+        if cls._aplicar_retorno(nota, resultado):
+            db.session.commit()
+            logger.info(f"NFe {nota.chave_acesso} {nota.status} - Protocolo: {nota.protocolo_autorizacao}")
+            return True
+        if resultado.get('codigo') in cls.CODIGOS_TRANSITORIOS:
+            if nota.tipo_emissao in (None, ContingenciaService.NORMAL, ContingenciaService.OFFLINE_NFCE):
+                # Autorizador da UF fora do ar: o PDV passa a emitir em contingência
+                ContingenciaService.registrar_falha(nfe_service.uf, nfe_service.ambiente, resultado)
+            db.session.commit()
+            return False
+
+        nota.status = 'rejeitada'
+        db.session.commit()
+        logger.warning(f"NFe {nota.chave_acesso} rejeitada: {nota.codigo_status_sefaz} - {nota.motivo_status_sefaz}")
+        return True
+
+    @classmethod
+    def emitir(cls, nota, nfe_service):
+        """
+        Gera, assina e transmite a nota, retomando de onde a última tentativa parou
+
+        Returns:
+            bool: True se a nota chegou a um status final; False para tentar de novo
+        """
+        situacao = cls._preparar_envio(nota, nfe_service)
+        if situacao is not None:
+            return situacao
+        return cls._concluir_envio(nota, nfe_service, nfe_service.transmitir_nfe(nota.xml_nfe))
+
+    @staticmethod
+    def _agendar(item, concluida, erro):
+        """
+        Encerra a tentativa do item e agenda a próxima, se houver (commit)
+
+        NFC-e emitidas off-line já foram entregues ao consumidor e precisam
+        ser transmitidas: não têm limite de tentativas (o backoff continua).
+        """
+        from app.services.contingencia_service import ContingenciaService
+
+        agora = datetime.utcnow()
+        offline = item.nota is not None and item.nota.tipo_emissao == ContingenciaService.OFFLINE_NFCE
+        item.trabalhador = None
+        item.data_reserva = None
+        item.ultimo_erro = (erro or '')[:500] or None
+        if concluida:
+            item.status = 'concluida'
+            item.data_conclusao = agora
+        elif not offline and item.tentativas >= current_app.config.get('FILA_NFE_TENTATIVAS', 8):
+            item.status = 'erro'
+            logger.error(f"Nota {item.nota_fiscal_id}: tentativas de emissão esgotadas ({erro})")
+        else:
+            inicial = current_app.config.get('FILA_NFE_BACKOFF_SEGUNDOS', 5)
+            espera = min(inicial * 2 ** (item.tentativas - 1), 300)
+            item.status = 'pendente'
+            item.proxima_tentativa = agora + timedelta(seconds=espera)
+        db.session.commit()
+        return item
+
+    @classmethod
+    def processar(cls, item, nfe_service, erro=None):
+        """
+        Executa uma tentativa de emissão do item reservado e agenda a próxima, se houver (commit)
+
+        Args:
+            erro: Falha anterior à emissão (ex: certificado); a tentativa é apenas contada
+        """
+        concluida = False
+        if erro is None:
+            try:
+                concluida = cls.emitir(item.nota, nfe_service)
+                erro = None if concluida else item.nota.motivo_status_sefaz
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao emitir nota {item.nota_fiscal_id} da fila: {e}")
+                erro = str(e)
+        return cls._agendar(item, concluida, erro)
+
+    @classmethod
+    def processar_em_bloco(cls, itens, nfe_service):
+        """
+        Uma tentativa de emissão de vários itens reservados, com as transmissões em paralelo (commit)
+
+        Preparação e retorno de cada nota acontecem nesta thread (banco);
+        apenas as chamadas à SEFAZ vão para até SEFAZ_POOL_CONEXOES threads,
+        que reaproveitam as conexões da sessão do certificado. Cada NFC-e
+        segue em sua própria autorização síncrona.
+
+        Returns:
+            list: Itens processados
+        """
+        envios = []
+        for item in itens:
+            try:
+                situacao = cls._preparar_envio(item.nota, nfe_service)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao emitir nota {item.nota_fiscal_id} da fila: {e}")
+                cls._agendar(item, False, str(e))
+                continue
+            if situacao is None:
+                envios.append(item)
+            else:
+                cls._agendar(item, situacao, None if situacao else item.nota.motivo_status_sefaz)
+
+        app = current_app._get_current_object()
+
+        def transmitir(xml_nfe):
+            with app.app_context():
+                return nfe_service.transmitir_nfe(xml_nfe)
+
+        if envios:
+            with ThreadPoolExecutor(max_workers=current_app.config.get('SEFAZ_POOL_CONEXOES', 4)) as executor:
+                resultados = list(executor.map(transmitir, [item.nota.xml_nfe for item in envios]))
+            for item, resultado in zip(envios, resultados):
+                try:
+                    concluida = cls._concluir_envio(item.nota, nfe_service, resultado)
+                    erro = None if concluida else item.nota.motivo_status_sefaz
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro ao emitir nota {item.nota_fiscal_id} da fila: {e}")
+                    concluida, erro = False, str(e)
+                cls._agendar(item, concluida, erro)
+        return itens
+
+    @staticmethod
+    def servico_nfe(empresa):
+        """NFeService com o certificado padrão carregado (A1 ou A3), como no PDV"""
+        from app.models.fiscal import CertificadoDigital
+        from app.services.nfe_service import NFeService
+        from app.services.certificado_service import CertificadoService
+
+        ativos = CertificadoDigital.query.filter_by(ativo=True, padrao=True)
+        certificado = ativos.filter_by(empresa_id=empresa.id).first() or ativos.first()
+        if not certificado or certificado.esta_vencido:
+            raise Exception("Nenhum certificado digital válido configurado")
+
+        cert_service = CertificadoService(certificado)
+        if certificado.tipo == 'A1':
+            resultado = cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)
+        else:
+            resultado = cert_service.carregar_certificado_a3(
+                certificado.slot_token,
+                certificado.pin_token,
+                certificado.biblioteca_token
+            )
+        if not resultado.get('sucesso'):
+            raise Exception(resultado.get('erro') or 'Falha ao carregar o certificado digital')
+        return NFeService(empresa, cert_service)
+
+    @classmethod
+    def processar_pendentes(cls, limite=20, contingencia=False):
+        """
+        Reserva e emite os itens disponíveis da fila (worker)
+
+        Args:
+            contingencia: False para a emissão normal; True para transmitir as
+                NFC-e emitidas em contingência off-line, somente das UFs com a
+                SEFAZ disponível (parando a UF na primeira falha transitória)
+
+        Returns:
+            int: Itens processados por este processo
+        """
+        from app.models.fiscal import FilaEmissaoNFe, NotaFiscal, ConfiguracaoEmpresa
+        from app.services.contingencia_service import ContingenciaService
+
+        offline = NotaFiscal.tipo_emissao == ContingenciaService.OFFLINE_NFCE
+        filtro = offline if contingencia else or_(NotaFiscal.tipo_emissao.is_(None), ~offline)
+        ids = db.session.execute(
+            select(FilaEmissaoNFe.id)
+            .join(NotaFiscal, NotaFiscal.id == FilaEmissaoNFe.nota_fiscal_id)
+            .where(cls._disponiveis(datetime.utcnow()), filtro)
+            .order_by(FilaEmissaoNFe.data_criacao if contingencia else FilaEmissaoNFe.proxima_tentativa)
+            .limit(limite)
+        ).scalars().all()
+
+        trabalhador = cls.trabalhador()
+        servicos = {}
+        disponiveis = {}
+        # Contingência: itens reservados por empresa, transmitidos em blocos paralelos
+        blocos = {}
+        tamanho_bloco = current_app.config.get('SEFAZ_POOL_CONEXOES', 4) * 5
+        processados = 0
+
+        def transmitir_bloco(empresa_id, destino):
+            itens = blocos.pop(empresa_id, [])
+            if not itens:
+                return 0
+            cls.processar_em_bloco(itens, servicos[empresa_id])
+            if any(item.nota.codigo_status_sefaz in cls.CODIGOS_TRANSITORIOS for item in itens):
+                # SEFAZ caiu de novo: as demais notas da UF esperam a próxima verificação
+                disponiveis[destino] = False
+            return len(itens)
+
+        destinos = {}
+        for item_id in ids:
+            nota = db.session.execute(
+                select(NotaFiscal).join(FilaEmissaoNFe).where(FilaEmissaoNFe.id == item_id)
+            ).scalar()
+            empresa = (ConfiguracaoEmpresa.query.filter_by(cnpj=nota.emitente_cnpj).first()
+                       or ConfiguracaoEmpresa.query.first())
+            if empresa is None:
+                # Sem empresa emitente: a tentativa conta e o item volta a 'pendente'
+                if cls.reservar(item_id, trabalhador):
+                    erro = f"Empresa emitente {nota.emitente_cnpj} não cadastrada"
+                    logger.error(f"Fila de emissão: {erro}")
+                    cls.processar(db.session.get(FilaEmissaoNFe, item_id), None, erro=erro)
+                continue
+            destino = (empresa.uf, empresa.ambiente_nfe or 2)
+            if contingencia:
+                if destino not in disponiveis:
+                    disponiveis[destino] = ContingenciaService.disponivel(*destino)
+                if not disponiveis[destino]:
+                    continue
+
+            if not cls.reservar(item_id, trabalhador):
+                continue
+            item = db.session.get(FilaEmissaoNFe, item_id)
+            try:
+                if empresa.id not in servicos:
+                    servicos[empresa.id] = cls.servico_nfe(empresa)
+            except Exception as e:
+                # Sem certificado: a tentativa conta e o item é reagendado
+                logger.error(f"Fila de emissão: {e}")
+                cls.processar(item, None, erro=str(e))
+                continue
+
+            if contingencia:
+                destinos[empresa.id] = destino
+                blocos.setdefault(empresa.id, []).append(item)
+                if len(blocos[empresa.id]) >= tamanho_bloco:
+                    processados += transmitir_bloco(empresa.id, destino)
+                continue
+
+            cls.processar(item, servicos[empresa.id])
+            processados += 1
+
+        for empresa_id in list(blocos):
+            processados += transmitir_bloco(empresa_id, destinos[empresa_id])
+
+        return processados
+
+    # ==================== SITUAÇÃO ====================
+
+    @classmethod
+    def situacao(cls, nota):
+        """
+        Situação da emissão para o PDV acompanhar (consulta leve, sem SEFAZ)
+
+        Returns:
+            dict: status da nota e da fila; ``concluida`` indica que não há
+            mais o que aguardar
+        """
+        item = nota.fila_emissao
+        return {
+            'nota_id': nota.id,
+            'status': nota.status,
+            'chave_acesso': nota.chave_acesso,
+            'protocolo': nota.protocolo_autorizacao,
+            'codigo': nota.codigo_status_sefaz,
+            'mensagem': nota.motivo_status_sefaz,
+            'tipo_emissao': nota.tipo_emissao or 1,
+            'contingencia': (nota.tipo_emissao or 1) != 1,
+            'fila': item.status if item else None,
+            'tentativas': item.tentativas if item else 0,
+            'erro': item.ultimo_erro if item else None,
+            'concluida': nota.status in cls.STATUS_FINAIS or (item is not None and item.status == 'erro'),
+        }
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Imagens Sob Demanda
+Redimensionamento por URL com cache em disco limitado por tamanho (LRU)
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from PIL import Image
+from flask import current_app
+from werkzeug.security import safe_join
+
+from app.services.imagem_service import ImagemService
+
+logger = logging.getLogger(__name__)
+
+
+class ImagemCacheService:
+    """
+    Redimensiona imagens de produtos na primeira requisição e guarda o
+    resultado em disco
+
+    A chave do cache inclui o mtime do original, então substituir o arquivo
+    gera novas variantes. O uso do disco é limitado por
+    IMAGEM_CACHE_MAX_MB: cada acerto atualiza o mtime da variante e, ao
+    passar do limite, as menos usadas recentemente são apagadas até 90%.
+    """
+
+    FORMATOS = {
+        'webp': ('WEBP', 'image/webp', 'webp'),
+        'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+        'png': ('PNG', 'image/png', 'png'),
+    }
+
+    _trava = threading.Lock()
+    _bytes_em_uso = None
+
+    # ==================== PARÂMETROS ====================
+
+    @staticmethod
+    def dimensoes_permitidas():
+        """Larguras/alturas aceitas (IMAGEM_DIMENSOES_PERMITIDAS)"""
+        valor = current_app.config.get('IMAGEM_DIMENSOES_PERMITIDAS', '150,300,450,600,900,1200,1600')
+        return {int(parte) for parte in str(valor).split(',') if parte.strip().isdigit()}
+
+    @classmethod
+    def validar(cls, largura, altura, formato):
+        """
+        Valida os parâmetros da URL
+
+        Só dimensões da lista são aceitas: sem isso qualquer cliente poderia
+        encher o cache pedindo tamanhos arbitrários.
+
+        Returns:
+            str|None: Mensagem de erro
+        """
+        permitidas = cls.dimensoes_permitidas()
+        if largura is None and altura is None:
+            return 'Informe w e/ou h'
+        for valor in (largura, altura):
+            if valor is not None and valor not in permitidas:
+                return f'Dimensão não permitida. Permitidas: {sorted(permitidas)}'
+        if formato not in cls.FORMATOS:
+            return f'Formato não suportado. Suportados: {sorted(cls.FORMATOS)}'
+        return None
+
+    @staticmethod
+    def diretorio_cache():
+        diretorio = current_app.config.get('IMAGEM_CACHE_DIR') or os.path.join(current_app.instance_path, 'img_cache')
+        os.makedirs(diretorio, exist_ok=True)
+        return diretorio
+
+    @staticmethod
+    def caminho_original(filename):
+        """Caminho do original em static/produtos (None se inválido/ausente)"""
+        caminho = safe_join(os.path.join(current_app.root_path, 'static', ImagemService.PASTA), filename)
+        if caminho and os.path.isfile(caminho):
+            return caminho
+        return None
+
+    # ==================== VARIANTES ====================
+
+    @classmethod
+    def obter(cls, filename, largura=None, altura=None, formato='jpeg'):
+        """
+        Retorna a variante redimensionada, gerando-a se necessário
+
+        Returns:
+            tuple: (caminho, mimetype) ou (None, None) se o original não existe
+        """
+        original = cls.caminho_original(filename)
+        if not original:
+            return None, None
+
+        formato_pil, mimetype, extensao = cls.FORMATOS[formato]
+        chave = hashlib.sha1(
+            f'{filename}|{os.stat(original).st_mtime_ns}|{largura}|{altura}|{formato}'.encode()
+        ).hexdigest()
+        diretorio = os.path.join(cls.diretorio_cache(), chave[:2])
+        caminho = os.path.join(diretorio, f'{chave}.{extensao}')
+
+        try:
+            # Acerto: marca como usado recentemente
+            os.utime(caminho)
+            return caminho, mimetype
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(diretorio, exist_ok=True)
+        with Image.open(original) as imagem:
+            limite = (largura or imagem.width, altura or imagem.height)
+            imagem.draft('RGB', limite)
+            if formato == 'png':
+                imagem = imagem.convert('RGBA')
+            else:
+                imagem = ImagemService.para_rgb(imagem)
+            # thumbnail mantém a proporção e nunca amplia
+            imagem.thumbnail(limite, Image.Resampling.LANCZOS)
+
+            opcoes = {}
+            if formato == 'jpeg':
+                opcoes = {'quality': current_app.config.get('IMAGEM_QUALIDADE_JPEG', 82),
+                          'optimize': True, 'progressive': True}
+            elif formato == 'webp':
+                opcoes = {'quality': current_app.config.get('IMAGEM_QUALIDADE_WEBP', 80), 'method': 4}
+            else:
+                opcoes = {'optimize': True}
+
+            ImagemService.gravar_atomico(caminho, lambda destino: imagem.save(destino, formato_pil, **opcoes))
+
+        cls._registrar_escrita(caminho)
+        return caminho, mimetype
+
+    # ==================== LRU ====================
+
+    @classmethod
+    def _registrar_escrita(cls, caminho):
+        """Soma a nova variante ao uso do disco e libera espaço se preciso"""
+        tamanho = os.path.getsize(caminho)
+        limite = current_app.config.get('IMAGEM_CACHE_MAX_MB', 512) * 1024 * 1024
+        with cls._trava:
+            if cls._bytes_em_uso is None:
+                cls._bytes_em_uso = cls._medir_uso()
+            else:
+                cls._bytes_em_uso += tamanho
+            if cls._bytes_em_uso <= limite:
+                return
+            cls._bytes_em_uso = cls._liberar_espaco(int(limite * 0.9), preservar=caminho)
+
+    @classmethod
+    def _arquivos(cls):
+        for raiz, _, arquivos in os.walk(cls.diretorio_cache()):
+            for nome in arquivos:
+                if nome.endswith('.tmp'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    estado = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield caminho, estado.st_size, estado.st_mtime
+
+    @classmethod
+    def _medir_uso(cls):
+        return sum(tamanho for _, tamanho, _ in cls._arquivos())
+
+    @classmethod
+    def _liberar_espaco(cls, alvo, preservar=None):
+        """
+        Apaga as variantes usadas há mais tempo até o uso ficar abaixo do alvo
+        (a variante ``preservar`` acabou de ser gerada e será enviada)
+
+        Returns:
+            int: Bytes em uso após a limpeza
+        """
+        arquivos = sorted(cls._arquivos(), key=lambda item: item[2])
+        em_uso = sum(tamanho for _, tamanho, _ in arquivos)
+        removidos = 0
+        for caminho, tamanho, _ in arquivos:
+            if em_uso <= alvo:
+                break
+            if caminho == preservar:
+                continue
+            try:
+                os.remove(caminho)
+                em_uso -= tamanho
+                removidos += 1
+            except FileNotFoundError:
+                continue
+        logger.info(f"Cache de imagens: {removidos} variante(s) removida(s), {em_uso // 1024} KB em uso")
+        return em_uso
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Imagens
+Armazenamento do original por hash e geração das rendições em background
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class ImagemService:
+    """
+    Pipeline de imagens de produtos
+
+    O upload grava apenas o original (nome = hash do conteúdo, então o
+    mesmo arquivo enviado duas vezes é guardado uma vez) e devolve a
+    resposta. As rendições configuradas (ex: thumb, card, zoom em WebP e
+    JPEG) são geradas por um pool de threads; o Pillow libera o GIL ao
+    decodificar, redimensionar e codificar, então as rendições rodam em
+    paralelo. Quando ficam prontas, o manifesto é gravado em
+    Produto.imagens_rendicoes. Imagens que ficarem sem rendição (processo
+    reiniciado no meio) são reprocessadas pelo worker.
+    """
+
+    PASTA = 'produtos'
+    SUBPASTA_RENDICOES = 'rendicoes'
+    FORMATOS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+    EXTENSOES = {'webp': 'webp', 'jpeg': 'jpg'}
+
+    _executor = None
+    _trava = threading.Lock()
+
+    # ==================== CONFIGURAÇÃO ====================
+
+    @staticmethod
+    def rendicoes_configuradas():
+        """
+        Rendições configuradas em IMAGEM_RENDICOES ('nome:lado_maximo,...')
+
+        Returns:
+            dict: {nome: lado_maximo} em ordem decrescente de tamanho
+        """
+        valor = current_app.config.get('IMAGEM_RENDICOES', 'thumb:300,card:600,zoom:1600')
+        rendicoes = {}
+        for parte in str(valor).split(','):
+            nome, _, lado = parte.strip().partition(':')
+            try:
+                if nome and int(lado) > 0:
+                    rendicoes[nome] = int(lado)
+            except ValueError:
+                continue
+        return dict(sorted(rendicoes.items(), key=lambda item: -item[1]))
+
+    @classmethod
+    def _diretorio(cls, *partes):
+        caminho = os.path.join(current_app.root_path, 'static', cls.PASTA, *partes)
+        os.makedirs(caminho, exist_ok=True)
+        return caminho
+
+    @classmethod
+    def executor(cls):
+        """Pool de threads compartilhado pelo processo"""
+        with cls._trava:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('IMAGEM_WORKERS', 2),
+                    thread_name_prefix='imagens'
+                )
+            return cls._executor
+
+    # ==================== ORIGINAL ====================
+
+    @classmethod
+    def salvar_original(cls, file):
+        """
+        Valida e grava o arquivo enviado sem reprocessá-lo
+
+        Args:
+            file: Arquivo de upload (werkzeug.datastructures.FileStorage)
+
+        Returns:
+            tuple: (dict {'filename', 'hash', 'url', 'path'} ou None, mensagem de erro)
+        """
+        from app.utils import validate_image
+
+        valido, erro = validate_image(file)
+        if not valido:
+            return None, erro
+
+        conteudo = file.stream.read()
+        digest = hashlib.sha256(conteudo).hexdigest()
+        extensao = file.filename.rsplit('.', 1)[1].lower()
+        if extensao == 'jpeg':
+            extensao = 'jpg'
+        filename = f'{digest[:32]}.{extensao}'
+        caminho = os.path.join(cls._diretorio(), filename)
+
+        # Conteúdo idêntico já armazenado: reaproveita o arquivo
+        if not os.path.exists(caminho):
+            cls.gravar_atomico(caminho, lambda destino: destino.write(conteudo))
+
+        return {
+            'filename': filename,
+            'hash': digest,
+            'url': f'/static/{cls.PASTA}/{filename}',
+            'path': caminho
+        }, None
+
+    @classmethod
+    def anexar(cls, produto, file):
+        """
+        Define a imagem de um produto (as rendições ficam pendentes até
+        ``agendar`` ser chamado após o commit)
+
+        Returns:
+            str|None: Mensagem de erro
+        """
+        resultado, erro = cls.salvar_original(file)
+        if erro:
+            return erro
+
+        if produto.imagem_filename != resultado['filename']:
+            produto.imagem_filename = resultado['filename']
+            produto.imagem_url = resultado['url']
+            produto.imagens_rendicoes = cls._manifesto_existente(resultado['filename'])
+        return None
+
+    # ==================== RENDIÇÕES ====================
+
+    @classmethod
+    def _nome_rendicao(cls, filename, nome, formato):
+        base = filename.rsplit('.', 1)[0]
+        return f'{base}_{nome}.{cls.EXTENSOES[formato]}'
+
+    @classmethod
+    def _manifesto_existente(cls, filename):
+        """Manifesto (JSON) se todas as rendições deste original já existem"""
+        diretorio = cls._diretorio(cls.SUBPASTA_RENDICOES)
+        manifesto = {}
+        for nome in cls.rendicoes_configuradas():
+            manifesto[nome] = {}
+            for formato in cls.FORMATOS:
+                arquivo = cls._nome_rendicao(filename, nome, formato)
+                if not os.path.exists(os.path.join(diretorio, arquivo)):
+                    return None
+                manifesto[nome][formato] = f'/static/{cls.PASTA}/{cls.SUBPASTA_RENDICOES}/{arquivo}'
+        return json.dumps(manifesto)
+
+    @classmethod
+    def gerar_rendicoes(cls, filename):
+        """
+        Gera as rendições de um original (pula as que já existem)
+
+        Returns:
+            str: Manifesto JSON {nome: {'webp': url, 'jpeg': url}}
+        """
+        existente = cls._manifesto_existente(filename)
+        if existente:
+            return existente
+
+        rendicoes = cls.rendicoes_configuradas()
+        if not rendicoes:
+            return json.dumps({})
+        diretorio = cls._diretorio(cls.SUBPASTA_RENDICOES)
+        qualidade = {
+            'webp': current_app.config.get('IMAGEM_QUALIDADE_WEBP', 80),
+            'jpeg': current_app.config.get('IMAGEM_QUALIDADE_JPEG', 82)
+        }
+
+        with Image.open(os.path.join(cls._diretorio(), filename)) as original:
+            # JPEG: decodifica já reduzido quando a maior rendição permite
+            maior = max(rendicoes.values())
+            original.draft('RGB', (maior, maior))
+            imagem = cls.para_rgb(original)
+
+        manifesto = {}
+        # Da maior para a menor: cada rendição parte da anterior
+        for nome, lado in rendicoes.items():
+            imagem = imagem.copy()
+            imagem.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            manifesto[nome] = {}
+            for formato, formato_pil in cls.FORMATOS.items():
+                arquivo = cls._nome_rendicao(filename, nome, formato)
+                opcoes = {'quality': qualidade[formato]}
+                if formato == 'jpeg':
+                    opcoes.update(optimize=True, progressive=True)
+                else:
+                    opcoes.update(method=4)
+                cls.gravar_atomico(
+                    os.path.join(diretorio, arquivo),
+                    lambda destino, img=imagem, f=formato_pil, o=opcoes: img.save(destino, f, **o)
+                )
+                manifesto[nome][formato] = f'/static/{cls.PASTA}/{cls.SUBPASTA_RENDICOES}/{arquivo}'
+
+        return json.dumps(manifesto)
+
+    @staticmethod
+    def para_rgb(imagem):
+        """Converte para RGB com fundo branco nas transparências"""
+        if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+            imagem = imagem.convert('RGBA')
+            fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+            fundo.paste(imagem, mask=imagem.split()[-1])
+            return fundo
+        return imagem.convert('RGB')
+
+    @staticmethod
+    def gravar_atomico(caminho, escrever):
+        """Grava em arquivo temporário e renomeia (leitores nunca veem arquivo parcial)"""
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+        try:
+            with os.fdopen(descritor, 'wb') as destino:
+                escrever(destino)
+            os.replace(temporario, caminho)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    # ==================== PROCESSAMENTO ====================
+
+    @classmethod
+    def agendar(cls, produto_id):
+        """Envia a geração das rendições do produto para o pool (após o commit)"""
+        app = current_app._get_current_object()
+        return cls.executor().submit(cls._processar_em_background, app, produto_id)
+
+    @classmethod
+    def _processar_em_background(cls, app, produto_id):
+        with app.app_context():
+            try:
+                cls.processar_produto(produto_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao gerar rendições do produto {produto_id}: {e}")
+            finally:
+                db.session.remove()
+
+    @classmethod
+    def processar_produto(cls, produto_id):
+        """
+        Gera e registra as rendições da imagem atual do produto
+
+        Returns:
+            bool: True se o manifesto foi gravado
+        """
+        from app.models.produto import Produto
+
+        filename = db.session.execute(
+            select(Produto.imagem_filename).where(Produto.id == produto_id)
+        ).scalar()
+        if not filename:
+            return False
+
+        if os.path.exists(os.path.join(cls._diretorio(), filename)):
+            manifesto = cls.gerar_rendicoes(filename)
+        else:
+            # Original ausente (ex: imagem externa): não tentar de novo
+            logger.warning(f"Original {filename} do produto {produto_id} não encontrado")
+            manifesto = json.dumps({})
+
+        # Só grava se a imagem não foi trocada enquanto processava
+        tabela = Produto.__table__
+        resultado = db.session.execute(
+            tabela.update()
+            .where(tabela.c.id == produto_id, tabela.c.imagem_filename == filename)
+            .values(imagens_rendicoes=manifesto, data_atualizacao=tabela.c.data_atualizacao)
+        )
+        db.session.commit()
+        return bool(resultado.rowcount)
+
+    @classmethod
+    def processar_pendentes(cls, limite=100):
+        """
+        Gera as rendições de produtos com imagem e sem manifesto (worker)
+
+        Returns:
+            int: Quantidade de produtos processados
+        """
+        from app.models.produto import Produto
+
+        produto_ids = db.session.execute(
+            select(Produto.id)
+            .where(Produto.imagem_filename.isnot(None), Produto.imagens_rendicoes.is_(None))
+            .order_by(Produto.id)
+            .limit(limite)
+        ).scalars().all()
+        db.session.commit()
+
+        futuros = [cls.agendar(produto_id) for produto_id in produto_ids]
+        for futuro in futuros:
+            futuro.result()
+        return len(produto_ids)
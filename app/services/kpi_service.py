@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de KPIs
+Snapshot dos indicadores dos dashboards (BI, CRM e ERP) em uma consulta
+"""
+
+from datetime import date
+from flask import current_app
+from sqlalchemy import select, func, case, true
+
+from app import db
+from app.services.cache_service import CacheService
+
+
+class KPIService:
+    """
+    Snapshot dos indicadores principais
+
+    Cada tabela é lida uma única vez por uma subconsulta de agregação
+    condicional (SUM(CASE ...)) que devolve uma linha; as subconsultas são
+    unidas por CROSS JOIN, então todos os indicadores vêm em uma ida ao
+    banco. O resultado fica no cache por KPI_CACHE_TIMEOUT segundos e é
+    descartado antes disso quando alguma das tabelas é alterada (versões
+    do CacheService).
+    """
+
+    TABELAS = (
+        'pedidos', 'produtos', 'estoque', 'clientes', 'leads', 'oportunidades',
+        'fornecedores', 'compras', 'contas_pagar', 'contas_receber'
+    )
+
+    STATUS_LEAD_ATIVO = ('novo', 'contatado', 'qualificado')
+    STATUS_LEAD_ENCERRADO = ('ganho', 'perdido', 'descartado')
+    STATUS_COMPRA_PENDENTE = ('pendente', 'aprovado', 'em_transito')
+    MONETARIOS = ('total_vendas', 'valor_pipeline', 'contas_pagar_mes', 'contas_receber_mes')
+
+    @staticmethod
+    def _contar(condicao):
+        return func.coalesce(func.sum(case((condicao, 1), else_=0)), 0)
+
+    @staticmethod
+    def _somar(expressao, condicao=None):
+        if condicao is not None:
+            expressao = case((condicao, expressao), else_=0)
+        return func.coalesce(func.sum(expressao), 0)
+
+    @classmethod
+    def _consulta(cls, hoje):
+        from app.models.pedido import Pedido
+        from app.models.produto import Produto
+        from app.models.estoque import Estoque
+        from app.models.crm import Cliente, Lead, Oportunidade
+        from app.models.erp import Fornecedor, Compra, ContaPagar, ContaReceber
+
+        inicio_mes = hoje.replace(day=1)
+        fim_mes = hoje.replace(day=28)
+
+        pedidos = select(
+            cls._somar(Pedido.total).label('total_vendas'),
+            func.count(Pedido.id).label('total_pedidos'),
+            cls._contar(Pedido.status == 'pendente').label('pedidos_pendentes'),
+            cls._contar(Pedido.status == 'enviado').label('pedidos_enviados'),
+        ).subquery('kpi_pedidos')
+
+        produtos = select(
+            cls._contar(Produto.ativo == True).label('total_produtos'),
+        ).subquery('kpi_produtos')
+
+        estoque = select(
+            cls._contar(Estoque.quantidade <= Estoque.quantidade_minima).label('produtos_estoque_baixo'),
+        ).select_from(Estoque).join(Produto, Produto.id == Estoque.produto_id).subquery('kpi_estoque')
+
+        clientes = select(
+            cls._contar(Cliente.ativo == True).label('total_clientes'),
+        ).subquery('kpi_clientes')
+
+        leads = select(
+            cls._contar(Lead.status.in_(cls.STATUS_LEAD_ATIVO)).label('leads_ativos'),
+            cls._contar(Lead.status.notin_(cls.STATUS_LEAD_ENCERRADO)).label('leads_em_aberto'),
+        ).subquery('kpi_leads')
+
+        aberta = Oportunidade.status == 'aberta'
+        oportunidades = select(
+            cls._contar(aberta).label('oportunidades_abertas'),
+            cls._somar(Oportunidade.valor_ponderado, aberta).label('valor_pipeline'),
+        ).subquery('kpi_oportunidades')
+
+        fornecedores = select(
+            cls._contar(Fornecedor.ativo == True).label('total_fornecedores'),
+        ).subquery('kpi_fornecedores')
+
+        compras = select(
+            cls._contar(Compra.status.in_(cls.STATUS_COMPRA_PENDENTE)).label('compras_pendentes'),
+        ).subquery('kpi_compras')
+
+        pagar_aberta = ContaPagar.status != 'pago'
+        contas_pagar = select(
+            cls._contar(pagar_aberta & (ContaPagar.data_vencimento < hoje)).label('contas_pagar_vencidas'),
+            cls._somar(
+                ContaPagar.valor_original - ContaPagar.valor_pago,
+                pagar_aberta & ContaPagar.data_vencimento.between(inicio_mes, fim_mes)
+            ).label('contas_pagar_mes'),
+        ).subquery('kpi_contas_pagar')
+
+        receber_aberta = ContaReceber.status != 'recebido'
+        contas_receber = select(
+            cls._contar(receber_aberta & (ContaReceber.data_vencimento < hoje)).label('contas_receber_vencidas'),
+            cls._somar(
+                ContaReceber.valor_original - ContaReceber.valor_recebido,
+                receber_aberta & ContaReceber.data_vencimento.between(inicio_mes, fim_mes)
+            ).label('contas_receber_mes'),
+        ).subquery('kpi_contas_receber')
+
+        partes = [
+            pedidos, produtos, estoque, clientes, leads, oportunidades,
+            fornecedores, compras, contas_pagar, contas_receber
+        ]
+        consulta = select(*[coluna for parte in partes for coluna in parte.c]).select_from(partes[0])
+        for parte in partes[1:]:
+            consulta = consulta.join(parte, true())
+        return consulta
+
+    @classmethod
+    def calcular(cls, hoje=None):
+        """
+        Calcula o snapshot direto no banco (sem cache)
+
+        Returns:
+            dict: {indicador: valor}
+        """
+        hoje = hoje or date.today()
+        linha = db.session.execute(cls._consulta(hoje)).mappings().one()
+
+        kpis = {
+            nome: float(valor or 0) if nome in cls.MONETARIOS else int(valor or 0)
+            for nome, valor in linha.items()
+        }
+
+        kpis['ticket_medio'] = kpis['total_vendas'] / kpis['total_pedidos'] if kpis['total_pedidos'] > 0 else 0
+        return kpis
+
+    @classmethod
+    def snapshot(cls):
+        """
+        Snapshot compartilhado pelos dashboards (cacheado)
+
+        Returns:
+            dict: {indicador: valor}
+        """
+        hoje = date.today()
+        timeout = current_app.config.get('KPI_CACHE_TIMEOUT', 60)
+        if timeout <= 0:
+            return cls.calcular(hoje)
+        # A data entra no nome: vencidas/a vencer mudam na virada do dia
+        return CacheService.obter_dados(
+            f'kpis:{hoje.isoformat()}', cls.TABELAS, lambda: cls.calcular(hoje), timeout=timeout
+        )
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Lotes de NF-e
+Emissão em lote assíncrona (enviNFe com indSinc=0) e consulta de recibos
+"""
+
+import time
+import random
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func
+
+from app import db
+from .validador_xsd_service import ValidadorXSDService
+
+logger = logging.getLogger(__name__)
+
+
+class LoteNFeService:
+    """
+    Emissão de NF-e (modelo 55) em lotes
+
+    As notas são assinadas (se ainda não estiverem), agrupadas em lotes de
+    até LOTE_NFE_TAMANHO notas e 500 KB e enviadas com indSinc=0. A SEFAZ
+    devolve um recibo (nRec); a consulta do recibo (retConsReciNFe) é
+    repetida com backoff exponencial, a partir do tMed informado, até o
+    lote ser processado. Cada protNFe é associado à nota pela chave de
+    acesso. Lotes em processamento são consultados pelo worker; ``aguardar``
+    faz o mesmo de forma síncrona (scripts e testes com o stub).
+
+    Sem recibo (falha de comunicação no envio, que pode ter chegado à
+    SEFAZ) ou após LOTE_NFE_CONSULTA_TENTATIVAS consultas sem resultado, o
+    lote passa a ser conferido nota a nota pela chave (consSitNFe): as
+    notas que não constam na SEFAZ voltam a ficar disponíveis para envio e
+    nenhuma nota é dada como rejeitada sem retorno da SEFAZ.
+
+    NFC-e (modelo 65) exige envio síncrono e não é aceita aqui.
+    """
+
+    BYTES_MAXIMO = 500 * 1024
+    STATUS_PREPARAVEIS = ('rascunho', 'validada', 'assinada')
+    CODIGOS_AUTORIZADA = {'100', '150'}
+    CODIGOS_DENEGADA = {'110', '205', '301', '302', '303'}
+    CODIGO_EM_PROCESSAMENTO = '105'
+    CODIGO_DUPLICIDADE = '204'
+    CODIGO_NAO_CONSTA = '217'
+    # Retornos da consulta do recibo que falam da consulta, não das notas:
+    # serviço paralisado (108, 109), consumo indevido (656) e falha de comunicação
+    CODIGOS_CONSULTA_TRANSITORIOS = {'108', '109', '656', '999'}
+
+    # ==================== MONTAGEM ====================
+
+    @staticmethod
+    def _numero_lote():
+        """idLote de 15 dígitos (data/hora + aleatório)"""
+        return f"{datetime.utcnow():%y%m%d%H%M%S}{random.randint(0, 999):03d}"
+
+    @classmethod
+    def agrupar(cls, notas):
+        """
+        Divide as notas assinadas em grupos dentro dos limites do enviNFe
+
+        Returns:
+            list: Listas de NotaFiscal
+        """
+        tamanho = current_app.config.get('LOTE_NFE_TAMANHO', 50)
+        grupos, grupo, bytes_grupo = [], [], 0
+        for nota in notas:
+            bytes_nota = len(nota.xml_nfe.encode('utf-8'))
+            if grupo and (len(grupo) >= tamanho or bytes_grupo + bytes_nota > cls.BYTES_MAXIMO):
+                grupos.append(grupo)
+                grupo, bytes_grupo = [], 0
+            grupo.append(nota)
+            bytes_grupo += bytes_nota
+        if grupo:
+            grupos.append(grupo)
+        return grupos
+
+    @classmethod
+    def preparar(cls, notas, nfe_service):
+        """
+        Gera e assina o XML das notas que ainda não têm e valida cada uma no XSD
+
+        Uma nota fora do schema fica fora do lote (com código 225 e os
+        erros da validação), em vez de levar a SEFAZ a recusar o lote inteiro.
+
+        Returns:
+            tuple: (notas assinadas, [{'nota_id', 'erro'}])
+        """
+        notas = list(notas)
+        prontas, erros = [], []
+        a_assinar, xmls = [], []
+        for nota in notas:
+            if nota.modelo != '55':
+                erros.append({'nota_id': nota.id, 'erro': 'Emissão em lote disponível apenas para NF-e (modelo 55)'})
+                continue
+            if nota.status not in cls.STATUS_PREPARAVEIS:
+                erros.append({'nota_id': nota.id, 'erro': f'Nota com status {nota.status}'})
+                continue
+            if nota.status == 'assinada' and nota.xml_nfe:
+                prontas.append(nota)
+                continue
+            try:
+                xmls.append(nfe_service.gerar_xml_nfe(nota))
+                a_assinar.append(nota)
+            except Exception as e:
+                logger.error(f"Erro ao preparar NF-e {nota.id} para lote: {e}")
+                erros.append({'nota_id': nota.id, 'erro': str(e)})
+
+        # Assinatura do lote de uma vez (em paralelo com certificado A1)
+        if xmls:
+            for nota, resultado in zip(a_assinar, nfe_service.assinar_lote_nfe(xmls)):
+                if resultado['sucesso']:
+                    nota.xml_nfe = resultado['xml']
+                    nota.status = 'assinada'
+                    prontas.append(nota)
+                else:
+                    logger.error(f"Erro ao assinar NF-e {nota.id} para lote: {resultado['erro']}")
+                    erros.append({'nota_id': nota.id, 'erro': resultado['erro']})
+            prontas.sort(key=notas.index)
+
+        validas = []
+        for nota in prontas:
+            validacao = ValidadorXSDService.validar(nota.xml_nfe)
+            if validacao['valido']:
+                validas.append(nota)
+                continue
+            nota.codigo_status_sefaz = validacao['codigo']
+            nota.motivo_status_sefaz = validacao['mensagem'][:500]
+            erros.append({'nota_id': nota.id, 'erro': validacao['mensagem'], 'erros': validacao['erros']})
+        db.session.commit()
+        return validas, erros
+
+    # ==================== ENVIO ====================
+
+    @classmethod
+    def emitir(cls, notas, empresa, cert_service, usuario_id=None):
+        """
+        Assina, agrupa e envia as notas em lotes assíncronos
+
+        Args:
+            notas: NotaFiscal (modelo 55) em rascunho, validada ou assinada
+            empresa: ConfiguracaoEmpresa emitente
+            cert_service: CertificadoService com o certificado carregado
+
+        Returns:
+            tuple: ([LoteNFe], [{'nota_id', 'erro'}])
+        """
+        from app.models.fiscal import LoteNFe
+        from app.services.nfe_service import NFeService
+
+        nfe_service = NFeService(empresa, cert_service)
+        prontas, erros = cls.preparar(notas, nfe_service)
+
+        lotes = []
+        for grupo in cls.agrupar(prontas):
+            lote = LoteNFe(
+                numero_lote=cls._numero_lote(),
+                empresa_id=empresa.id,
+                uf=nfe_service.uf,
+                ambiente=nfe_service.ambiente,
+                quantidade=len(grupo),
+                usuario_id=usuario_id
+            )
+            db.session.add(lote)
+            db.session.flush()
+            for nota in grupo:
+                nota.lote_nfe_id = lote.id
+                nota.status = 'transmitida'
+            # Gravar a associação antes do envio: se o processo cair, o lote fica rastreável
+            db.session.commit()
+
+            cls.enviar(lote, grupo, nfe_service)
+            lotes.append(lote)
+
+        return lotes, erros
+
+    @classmethod
+    def enviar(cls, lote, notas, nfe_service):
+        """Envia o lote e agenda a primeira consulta do recibo (commit)"""
+        resultado = nfe_service.enviar_lote(lote.numero_lote, [nota.xml_nfe for nota in notas])
+
+        agora = datetime.utcnow()
+        lote.data_envio = agora
+        lote.codigo_status = resultado.get('codigo')
+        lote.motivo_status = (resultado.get('mensagem') or '')[:500]
+
+        if resultado['sucesso']:
+            lote.status = 'processando'
+            lote.recibo = resultado['recibo']
+            espera = max(resultado.get('tempo_medio') or 0, current_app.config.get('LOTE_NFE_CONSULTA_INICIAL', 3))
+            lote.proxima_consulta = agora + timedelta(seconds=espera)
+        elif resultado.get('falha_comunicacao'):
+            # Sem resposta (ex: timeout de leitura): o lote pode ter chegado à
+            # SEFAZ. As notas continuam transmitidas e são conferidas pela chave
+            lote.status = 'processando'
+            lote.recibo = None
+            lote.proxima_consulta = agora + timedelta(seconds=current_app.config.get('LOTE_NFE_CONSULTA_INICIAL', 3))
+            logger.warning(f"Lote {lote.numero_lote} sem resposta da SEFAZ ({lote.motivo_status}): "
+                           "notas serão conferidas pela chave")
+        else:
+            # Lote recusado na recepção: as notas voltam a ficar disponíveis para novo envio
+            lote.status = 'erro'
+            for nota in notas:
+                nota.status = 'assinada'
+                nota.lote_nfe_id = None
+                nota.codigo_status_sefaz = lote.codigo_status
+                nota.motivo_status_sefaz = lote.motivo_status
+            logger.warning(f"Lote {lote.numero_lote} recusado: {lote.codigo_status} - {lote.motivo_status}")
+
+        db.session.commit()
+        return lote
+
+    # ==================== CONSULTA DO RECIBO ====================
+
+    @staticmethod
+    def _protocolo_consulta(nota, consulta):
+        """Retorno da consulta pela chave no formato dos protNFe do recibo"""
+        return {
+            'chave': nota.chave_acesso,
+            'codigo': consulta.get('codigo'),
+            'mensagem': consulta.get('mensagem'),
+            'protocolo': consulta.get('protocolo'),
+            'xml': consulta.get('xml_retorno'),
+        }
+
+    @classmethod
+    def _aplicar_protocolo(cls, nota, protocolo, nfe_service):
+        """
+        Atualiza a nota com o protNFe (sem commit)
+
+        Returns:
+            bool: False se a nota continua sem situação definida (fica 'transmitida')
+        """
+        if protocolo['codigo'] == cls.CODIGO_DUPLICIDADE:
+            # Já recebida antes (ex: reenvio após timeout): vale a situação pela chave
+            protocolo = cls._protocolo_consulta(nota, nfe_service.consultar_nfe(nota.chave_acesso))
+            if protocolo['codigo'] not in cls.CODIGOS_AUTORIZADA | cls.CODIGOS_DENEGADA:
+                return False
+
+        nota.codigo_status_sefaz = protocolo['codigo']
+        nota.motivo_status_sefaz = (protocolo['mensagem'] or '')[:500]
+        if protocolo['codigo'] in cls.CODIGOS_AUTORIZADA:
+            nota.status = 'autorizada'
+            nota.protocolo_autorizacao = protocolo['protocolo']
+            nota.data_autorizacao = datetime.now()
+            nota.xml_autorizacao = protocolo['xml']
+        elif protocolo['codigo'] in cls.CODIGOS_DENEGADA:
+            nota.status = 'denegada'
+            nota.protocolo_autorizacao = protocolo['protocolo']
+            nota.xml_autorizacao = protocolo['xml']
+        else:
+            nota.status = 'rejeitada'
+        return True
+
+    @staticmethod
+    def _reagendar(lote, agora):
+        """Próxima consulta com backoff exponencial (sem commit)"""
+        inicial = current_app.config.get('LOTE_NFE_CONSULTA_INICIAL', 3)
+        maxima = current_app.config.get('LOTE_NFE_CONSULTA_MAXIMA', 300)
+        lote.proxima_consulta = agora + timedelta(seconds=min(inicial * 2 ** lote.tentativas_consulta, maxima))
+
+    @classmethod
+    def _conferir_pela_chave(cls, lote, motivo):
+        """Passa o lote para a conferência nota a nota (sem commit)"""
+        logger.warning(f"Lote {lote.numero_lote}: {motivo}; notas serão conferidas pela chave")
+        lote.recibo = None
+        lote.tentativas_consulta = 0
+        lote.proxima_consulta = datetime.utcnow()
+
+    @staticmethod
+    def _finalizar(lote, agora):
+        """Fecha o lote e conta autorizadas e rejeitadas (commit)"""
+        from app.models.fiscal import NotaFiscal
+
+        lote.data_processamento = agora
+        lote.proxima_consulta = None
+        db.session.flush()
+        lote.autorizadas, lote.rejeitadas = db.session.execute(
+            select(
+                func.count().filter(NotaFiscal.status == 'autorizada'),
+                func.count().filter(NotaFiscal.status.in_(('rejeitada', 'denegada')))
+            ).where(NotaFiscal.lote_nfe_id == lote.id)
+        ).one()
+        db.session.commit()
+
+        logger.info(
+            f"Lote {lote.numero_lote} {lote.status}: {lote.autorizadas} autorizada(s), "
+            f"{lote.rejeitadas} rejeitada(s) de {lote.quantidade}"
+        )
+        return lote
+
+    @classmethod
+    def consultar(cls, lote, nfe_service):
+        """
+        Consulta o recibo do lote uma vez (commit)
+
+        Em processamento (105) ou com retorno transitório (108, 109, 656,
+        999), reagenda com backoff exponencial limitado a
+        LOTE_NFE_CONSULTA_MAXIMA segundos, até LOTE_NFE_CONSULTA_TENTATIVAS
+        consultas; depois disso, sem recibo ou com qualquer outro retorno sem
+        os protNFe (ex: 106 lote não localizado, 225 schema do lote), o lote
+        é conferido pela chave. Uma nota só fica rejeitada pelo próprio protNFe.
+
+        Returns:
+            LoteNFe: Lote atualizado
+        """
+        from app.models.fiscal import NotaFiscal
+
+        if not lote.recibo:
+            return cls.conferir(lote, nfe_service)
+
+        resultado = nfe_service.consultar_recibo(lote.recibo)
+        agora = datetime.utcnow()
+        lote.tentativas_consulta = (lote.tentativas_consulta or 0) + 1
+        lote.codigo_status = resultado['codigo']
+        lote.motivo_status = (resultado['mensagem'] or '')[:500]
+
+        codigo = resultado['codigo']
+        if codigo == cls.CODIGO_EM_PROCESSAMENTO or codigo in cls.CODIGOS_CONSULTA_TRANSITORIOS:
+            if lote.tentativas_consulta >= current_app.config.get('LOTE_NFE_CONSULTA_TENTATIVAS', 20):
+                cls._conferir_pela_chave(lote, f"recibo {lote.recibo} sem resultado após "
+                                               f"{lote.tentativas_consulta} consulta(s)")
+            else:
+                cls._reagendar(lote, agora)
+            db.session.commit()
+            return lote
+
+        if not resultado['processado']:
+            cls._conferir_pela_chave(lote, f"consulta do recibo {lote.recibo} sem os protocolos "
+                                           f"({lote.codigo_status} - {lote.motivo_status})")
+            db.session.commit()
+            return lote
+
+        notas = {nota.chave_acesso: nota for nota in lote.notas.filter(NotaFiscal.status == 'transmitida')}
+        for protocolo in resultado['protocolos']:
+            nota = notas.pop(protocolo['chave'], None)
+            if nota is None:
+                logger.warning(f"Lote {lote.numero_lote}: protNFe de chave desconhecida {protocolo['chave']}")
+                continue
+            if not cls._aplicar_protocolo(nota, protocolo, nfe_service):
+                notas[nota.chave_acesso] = nota
+        if notas:
+            cls._conferir_pela_chave(lote, f"{len(notas)} nota(s) sem situação definida no retorno")
+            db.session.commit()
+            return lote
+
+        lote.status = 'processado'
+        return cls._finalizar(lote, agora)
+
+    @classmethod
+    def conferir(cls, lote, nfe_service):
+        """
+        Confere pela chave (consSitNFe) as notas do lote ainda transmitidas (commit)
+
+        Notas que não constam na SEFAZ voltam a 'assinada', fora do lote;
+        autorizadas e denegadas recebem o protocolo. As demais continuam
+        transmitidas e o lote é conferido de novo com backoff, até
+        LOTE_NFE_CONSULTA_TENTATIVAS vezes; esgotadas, o lote fica com
+        'erro' e as notas seguem transmitidas (consulta manual pela chave).
+
+        Returns:
+            LoteNFe: Lote atualizado
+        """
+        from app.models.fiscal import NotaFiscal
+
+        agora = datetime.utcnow()
+        lote.tentativas_consulta = (lote.tentativas_consulta or 0) + 1
+        pendentes = 0
+        for nota in lote.notas.filter(NotaFiscal.status == 'transmitida').all():
+            consulta = nfe_service.consultar_nfe(nota.chave_acesso)
+            codigo = consulta.get('codigo')
+            if codigo == cls.CODIGO_NAO_CONSTA:
+                # Não chegou à SEFAZ: pode ser enviada de novo
+                nota.status = 'assinada'
+                nota.lote_nfe_id = None
+                nota.codigo_status_sefaz = lote.codigo_status
+                nota.motivo_status_sefaz = lote.motivo_status
+            elif codigo in cls.CODIGOS_AUTORIZADA | cls.CODIGOS_DENEGADA:
+                cls._aplicar_protocolo(nota, cls._protocolo_consulta(nota, consulta), nfe_service)
+            else:
+                pendentes += 1
+
+        if not pendentes:
+            lote.status = 'processado'
+            return cls._finalizar(lote, agora)
+
+        if lote.tentativas_consulta >= current_app.config.get('LOTE_NFE_CONSULTA_TENTATIVAS', 20):
+            lote.status = 'erro'
+            logger.error(f"Lote {lote.numero_lote}: {pendentes} nota(s) transmitida(s) sem situação "
+                         f"após {lote.tentativas_consulta} conferência(s) pela chave")
+            return cls._finalizar(lote, agora)
+
+        cls._reagendar(lote, agora)
+        db.session.commit()
+        return lote
+
+    @classmethod
+    def aguardar(cls, lote, nfe_service, timeout=120):
+        """
+        Consulta o recibo até o lote sair de processamento (uso síncrono)
+
+        Returns:
+            LoteNFe: Lote atualizado (ainda 'processando' se o tempo acabar)
+        """
+        limite = time.monotonic() + timeout
+        while lote.status == 'processando' and time.monotonic() < limite:
+            espera = (lote.proxima_consulta - datetime.utcnow()).total_seconds()
+            if espera > 0:
+                time.sleep(min(espera, max(limite - time.monotonic(), 0)))
+            cls.consultar(lote, nfe_service)
+        return lote
+
+    @classmethod
+    def processar_pendentes(cls, limite=50):
+        """
+        Consulta os lotes cuja próxima consulta já venceu (worker)
+
+        Returns:
+            int: Lotes consultados
+        """
+        from app.models.fiscal import LoteNFe
+        from app.services.nfe_service import NFeService
+        from app.services.certificado_service import CertificadoService
+
+        lotes = LoteNFe.query.filter(
+            LoteNFe.status == 'processando',
+            LoteNFe.proxima_consulta <= datetime.utcnow()
+        ).order_by(LoteNFe.proxima_consulta).limit(limite).all()
+
+        servicos = {}
+        for lote in lotes:
+            if lote.empresa_id not in servicos:
+                cert_service = CertificadoService.carregar_padrao(lote.empresa)
+                servicos[lote.empresa_id] = NFeService(lote.empresa, cert_service) if cert_service else None
+            nfe_service = servicos[lote.empresa_id]
+            if nfe_service is None:
+                logger.warning(f"Lote {lote.numero_lote}: nenhum certificado A1 válido para consultar o recibo")
+                continue
+            cls.consultar(lote, nfe_service)
+
+        return len(lotes)
+
+    # ==================== PROGRESSO ====================
+
+    @staticmethod
+    def progresso(lote):
+        """
+        Situação do lote e contagem das notas por status
+
+        Returns:
+            dict
+        """
+        from app.models.fiscal import NotaFiscal
+
+        por_status = dict(db.session.execute(
+            select(NotaFiscal.status, func.count())
+            .where(NotaFiscal.lote_nfe_id == lote.id)
+            .group_by(NotaFiscal.status)
+        ).all())
+        pendentes = por_status.get('transmitida', 0)
+
+        return {
+            'lote_id': lote.id,
+            'numero_lote': lote.numero_lote,
+            'status': lote.status,
+            'recibo': lote.recibo,
+            'codigo': lote.codigo_status,
+            'mensagem': lote.motivo_status,
+            'quantidade': lote.quantidade,
+            'processadas': (lote.quantidade or 0) - pendentes,
+            'por_status': por_status,
+            'tentativas_consulta': lote.tentativas_consulta,
+            'proxima_consulta': lote.proxima_consulta.isoformat() if lote.proxima_consulta else None,
+            'data_envio': lote.data_envio.isoformat() if lote.data_envio else None,
+            'data_processamento': lote.data_processamento.isoformat() if lote.data_processamento else None,
+        }
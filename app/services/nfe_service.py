@@ -4,16 +4,18 @@ Serviço de Nota Fiscal Eletrônica (NFe)
 Integração completa com SEFAZ - Layout 4.00
 """
 
-import os
+import re
 import random
 import hashlib
 from datetime import datetime
 from decimal import Decimal
 from lxml import etree
-import requests
 import logging
 
 from .certificado_service import CertificadoService
+from .sefaz_transporte_service import SefazTransporteService
+from .nfe_xml_service import NFeXMLService
+from .validador_xsd_service import ValidadorXSDService
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +68,40 @@ class NFeService:
                 'status': 'https://nfe.svrs.rs.gov.br/ws/NfeStatusServico/NfeStatusServico4.asmx',
             }
         },
+        # SEFAZ Virtual de Contingência (tpEmis 6 e 7): apenas autorização, recibo,
+        # consulta, status e eventos; a inutilização segue no autorizador da UF
+        'SVC-AN': {
+            'homologacao': {
+                'autorizacao': 'https://hom.svc.fazenda.gov.br/NFeAutorizacao4/NFeAutorizacao4.asmx',
+                'retorno': 'https://hom.svc.fazenda.gov.br/NFeRetAutorizacao4/NFeRetAutorizacao4.asmx',
+                'consulta': 'https://hom.svc.fazenda.gov.br/NFeConsultaProtocolo4/NFeConsultaProtocolo4.asmx',
+                'evento': 'https://hom.svc.fazenda.gov.br/NFeRecepcaoEvento4/NFeRecepcaoEvento4.asmx',
+                'status': 'https://hom.svc.fazenda.gov.br/NFeStatusServico4/NFeStatusServico4.asmx',
+            },
+            'producao': {
+                'autorizacao': 'https://www.svc.fazenda.gov.br/NFeAutorizacao4/NFeAutorizacao4.asmx',
+                'retorno': 'https://www.svc.fazenda.gov.br/NFeRetAutorizacao4/NFeRetAutorizacao4.asmx',
+                'consulta': 'https://www.svc.fazenda.gov.br/NFeConsultaProtocolo4/NFeConsultaProtocolo4.asmx',
+                'evento': 'https://www.svc.fazenda.gov.br/NFeRecepcaoEvento4/NFeRecepcaoEvento4.asmx',
+                'status': 'https://www.svc.fazenda.gov.br/NFeStatusServico4/NFeStatusServico4.asmx',
+            }
+        },
+        'SVC-RS': {
+            'homologacao': {
+                'autorizacao': 'https://nfe-homologacao.svrs.rs.gov.br/ws/NfeAutorizacao/NFeAutorizacao4.asmx',
+                'retorno': 'https://nfe-homologacao.svrs.rs.gov.br/ws/NfeRetAutorizacao/NFeRetAutorizacao4.asmx',
+                'consulta': 'https://nfe-homologacao.svrs.rs.gov.br/ws/NfeConsulta/NfeConsulta4.asmx',
+                'evento': 'https://nfe-homologacao.svrs.rs.gov.br/ws/recepcaoevento/recepcaoevento4.asmx',
+                'status': 'https://nfe-homologacao.svrs.rs.gov.br/ws/NfeStatusServico/NfeStatusServico4.asmx',
+            },
+            'producao': {
+                'autorizacao': 'https://nfe.svrs.rs.gov.br/ws/NfeAutorizacao/NFeAutorizacao4.asmx',
+                'retorno': 'https://nfe.svrs.rs.gov.br/ws/NfeRetAutorizacao/NFeRetAutorizacao4.asmx',
+                'consulta': 'https://nfe.svrs.rs.gov.br/ws/NfeConsulta/NfeConsulta4.asmx',
+                'evento': 'https://nfe.svrs.rs.gov.br/ws/recepcaoevento/recepcaoevento4.asmx',
+                'status': 'https://nfe.svrs.rs.gov.br/ws/NfeStatusServico/NfeStatusServico4.asmx',
+            }
+        },
         'SP': {
             'homologacao': {
                 'autorizacao': 'https://homologacao.nfe.fazenda.sp.gov.br/ws/nfeautorizacao4.asmx',
@@ -96,6 +132,9 @@ class NFeService:
         'SP': '35', 'TO': '17'
     }
 
+    # Web services por forma de emissão (tpEmis) em contingência SVC
+    WS_CONTINGENCIA = {6: 'SVC-AN', 7: 'SVC-RS'}
+
     def __init__(self, empresa, certificado_service=None):
         """
         Inicializa o serviço de NFe
@@ -108,19 +147,19 @@ class NFeService:
         self.certificado_service = certificado_service
         self.uf = empresa.uf if empresa else 'RS'
         self.ambiente = empresa.ambiente_nfe if empresa else 2
+        self._transporte = None
+        self._xml_service = None
 
-    def gerar_xml_nfe(self, nota_fiscal):
+    def _chave_nota(self, nota_fiscal, codigo_numerico=None):
         """
-        Gera o XML completo da NFe (Layout 4.00)
-
-        Args:
-            nota_fiscal: Objeto NotaFiscal com todos os dados
+        Código numérico (cNF) e chave de acesso da nota
 
         Returns:
-            str: XML da NFe pronto para assinatura
+            tuple: (codigo_numerico, chave_acesso)
         """
         # Gera código numérico aleatório (8 dígitos)
-        codigo_numerico = str(random.randint(10000000, 99999999))
+        if codigo_numerico is None:
+            codigo_numerico = str(random.randint(10000000, 99999999))
 
         # Gera chave de acesso
         ano_mes = nota_fiscal.data_emissao.strftime('%y%m')
@@ -133,9 +172,48 @@ class NFeService:
             nota_fiscal.modelo,
             nota_fiscal.serie,
             nota_fiscal.numero,
-            1,  # Tipo emissão normal
+            nota_fiscal.tipo_emissao or 1,  # 1=Normal; 6/7=SVC; 9=Off-line NFC-e
             codigo_numerico
         )
+        return codigo_numerico, chave_acesso
+
+    def gerar_xml_nfe(self, nota_fiscal, codigo_numerico=None, itens=None):
+        """
+        Gera o XML completo da NFe (Layout 4.00)
+
+        Args:
+            nota_fiscal: Objeto NotaFiscal com todos os dados
+            codigo_numerico: cNF fixo (padrão: aleatório)
+            itens: Itens já carregados (padrão: nota_fiscal.itens)
+
+        Returns:
+            str: XML da NFe pronto para assinatura
+        """
+        codigo_numerico, chave_acesso = self._chave_nota(nota_fiscal, codigo_numerico)
+
+        if self._xml_service is None:
+            self._xml_service = NFeXMLService(self.empresa, self.uf, self.ambiente, self.CODIGO_UF.get(self.uf, '43'))
+        xml = self._xml_service.gerar(
+            nota_fiscal, chave_acesso, codigo_numerico,
+            self._mapear_forma_pagamento(nota_fiscal.forma_pagamento), itens
+        )
+
+        # Atualiza a nota com a chave gerada
+        nota_fiscal.chave_acesso = chave_acesso
+        return xml
+
+    def gerar_xml_nfe_referencia(self, nota_fiscal, codigo_numerico=None, itens=None):
+        """
+        Gera o XML da NFe montando a árvore lxml elemento a elemento
+
+        Implementação original, mantida como referência: gerar_xml_nfe deve
+        produzir exatamente os mesmos bytes (scripts/benchmark_xml_nfe.py).
+
+        Returns:
+            str: XML da NFe pronto para assinatura
+        """
+        codigo_numerico, chave_acesso = self._chave_nota(nota_fiscal, codigo_numerico)
+        cnpj_limpo = self.empresa.cnpj.replace('.', '').replace('/', '').replace('-', '')
 
         # Namespace
         NSMAP = {None: self.NS_NFE}
@@ -163,7 +241,7 @@ class NFeService:
         self._add_element(ide, 'idDest', '1')  # 1=Operação interna, 2=Interestadual, 3=Exterior
         self._add_element(ide, 'cMunFG', self.empresa.codigo_municipio)
         self._add_element(ide, 'tpImp', '1')  # 1=Retrato, 2=Paisagem
-        self._add_element(ide, 'tpEmis', '1')  # 1=Normal
+        self._add_element(ide, 'tpEmis', str(nota_fiscal.tipo_emissao or 1))
         self._add_element(ide, 'cDV', chave_acesso[-1])
         self._add_element(ide, 'tpAmb', str(self.ambiente))
         self._add_element(ide, 'finNFe', str(nota_fiscal.finalidade))
@@ -172,6 +250,11 @@ class NFeService:
         self._add_element(ide, 'procEmi', '0')  # 0=Aplicativo do contribuinte
         self._add_element(ide, 'verProc', 'TermanOS 1.0')
 
+        # Contingência: entrada (dhCont) e justificativa (xJust)
+        if (nota_fiscal.tipo_emissao or 1) != 1:
+            self._add_element(ide, 'dhCont', nota_fiscal.data_contingencia.strftime('%Y-%m-%dT%H:%M:%S-03:00'))
+            self._add_element(ide, 'xJust', nota_fiscal.justificativa_contingencia[:256])
+
         # emit - Emitente
         emit = etree.SubElement(inf_nfe, 'emit')
         self._add_element(emit, 'CNPJ', cnpj_limpo)
@@ -222,7 +305,7 @@ class NFeService:
             self._add_element(dest, 'email', nota_fiscal.destinatario_email[:60])
 
         # det - Detalhamento dos produtos/serviços
-        for item in nota_fiscal.itens:
+        for item in (nota_fiscal.itens if itens is None else itens):
             det = etree.SubElement(inf_nfe, 'det', nItem=str(item.numero_item))
 
             prod = etree.SubElement(det, 'prod')
@@ -477,15 +560,51 @@ class NFeService:
         if not self.certificado_service:
             raise Exception("Certificado digital não configurado")
 
-        # Extrai o ID para referência na assinatura
+        return self.certificado_service.assinar_xml(xml_nfe, self._referencia_nfe(xml_nfe))
+
+    @staticmethod
+    def _referencia_nfe(xml_nfe):
+        """URI de referência da assinatura (Id do infNFe)"""
         root = etree.fromstring(xml_nfe.encode('utf-8'))
         inf_nfe = root.find('.//{http://www.portalfiscal.inf.br/nfe}infNFe')
         if inf_nfe is not None:
-            reference_uri = f"#{inf_nfe.get('Id')}"
-        else:
-            reference_uri = ''
+            return f"#{inf_nfe.get('Id')}"
+        return ''
+
+    def assinar_lote_nfe(self, xmls_nfe):
+        """
+        Assina vários XMLs de NFe; com certificado A1, em paralelo (AssinaturaService)
+
+        Args:
+            xmls_nfe: Lista de strings de XML da NFe
+
+        Returns:
+            list: Um dict {'indice', 'sucesso', 'xml', 'erro'} por XML, na ordem recebida
+        """
+        if not self.certificado_service:
+            raise Exception("Certificado digital não configurado")
 
-        return self.certificado_service.assinar_xml(xml_nfe, reference_uri)
+        documentos = []
+        resultados = [None] * len(xmls_nfe)
+        for indice, xml_nfe in enumerate(xmls_nfe):
+            try:
+                documentos.append((indice, xml_nfe, self._referencia_nfe(xml_nfe)))
+            except Exception as e:
+                resultados[indice] = {'indice': indice, 'sucesso': False, 'xml': None, 'erro': str(e)}
+
+        if self.certificado_service.obter_chave_pem():
+            assinados = self.certificado_service.assinar_lote([(xml, uri) for _, xml, uri in documentos])
+            for (indice, _, _), resultado in zip(documentos, assinados):
+                resultados[indice] = dict(resultado, indice=indice)
+        else:
+            # A3: a chave não sai do token, assinatura em série
+            for indice, xml_nfe, reference_uri in documentos:
+                try:
+                    xml = self.certificado_service.assinar_xml(xml_nfe, reference_uri)
+                    resultados[indice] = {'indice': indice, 'sucesso': True, 'xml': xml, 'erro': None}
+                except Exception as e:
+                    resultados[indice] = {'indice': indice, 'sucesso': False, 'xml': None, 'erro': str(e)}
+        return resultados
 
     def transmitir_nfe(self, xml_assinado):
         """
@@ -498,42 +617,23 @@ class NFeService:
             dict: Resposta da SEFAZ
         """
         try:
-            # Monta envelope SOAP
-            ambiente = 'producao' if self.ambiente == 1 else 'homologacao'
-            url = self._get_ws_url('autorizacao')
+            # Falha de schema detectada localmente, sem ida à SEFAZ
+            rejeicao = ValidadorXSDService.rejeicao(xml_assinado)
+            if rejeicao:
+                return rejeicao
 
+            # Monta envelope SOAP
             envelope = self._criar_envelope_soap('NfeAutorizacao', xml_assinado)
 
-            # Obtém certificado PEM
-            cert_pem = self.certificado_service.obter_certificado_pem()
-            key_pem = self.certificado_service.obter_chave_pem()
-
-            # Salva certificados temporariamente
-            import tempfile
-            cert_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
-            cert_file.write(cert_pem)
-            cert_file.write(key_pem)
-            cert_file.close()
-
-            # Headers SOAP
-            headers = {
-                'Content-Type': 'application/soap+xml; charset=utf-8',
-                'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeAutorizacao4/nfeAutorizacaoLote'
-            }
-
-            # Faz requisição
-            response = requests.post(
-                url,
-                data=envelope.encode('utf-8'),
-                headers=headers,
-                cert=cert_file.name,
-                verify=True,
-                timeout=60
+            tipo_emissao = re.search(r'<tpEmis>(\d)</tpEmis>', xml_assinado)
+            response = self._enviar_soap(
+                'autorizacao',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeAutorizacao4/nfeAutorizacaoLote',
+                envelope,
+                timeout=60,
+                tipo_emissao=int(tipo_emissao.group(1)) if tipo_emissao else 1
             )
 
-            # Remove arquivo temporário
-            os.unlink(cert_file.name)
-
             # Parse da resposta
             return self._parse_resposta_sefaz(response.text)
 
@@ -545,6 +645,128 @@ class NFeService:
                 'mensagem': str(e)
             }
 
+    def enviar_lote(self, numero_lote, xmls_assinados):
+        """
+        Envia um lote de NFe para processamento assíncrono (enviNFe, indSinc=0)
+
+        Args:
+            numero_lote: idLote (até 15 dígitos)
+            xmls_assinados: Lista de XMLs de NFe assinados (até 50)
+
+        Returns:
+            dict: sucesso (cStat 103 = lote recebido), codigo, mensagem,
+            recibo (nRec) e tempo_medio (tMed, segundos); falha_comunicacao
+            quando não houve resposta válida (o lote pode ter sido recebido)
+        """
+        try:
+            nfes = ''.join(
+                re.sub(r'^\s*<\?xml[^>]*\?>\s*', '', xml) for xml in xmls_assinados
+            )
+            xml_lote = (
+                f'<enviNFe xmlns="{self.NS_NFE}" versao="{self.VERSAO_NFE}">'
+                f'<idLote>{numero_lote}</idLote><indSinc>0</indSinc>{nfes}</enviNFe>'
+            )
+            rejeicao = ValidadorXSDService.rejeicao(xml_lote)
+            if rejeicao:
+                return rejeicao
+
+            envelope = self._criar_envelope_soap('NFeAutorizacao', xml_lote)
+
+            response = self._enviar_soap(
+                'autorizacao',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeAutorizacao4/nfeAutorizacaoLote',
+                envelope,
+                timeout=60
+            )
+
+            root = etree.fromstring(response.content)
+            ret = root.find(f'.//{{{self.NS_NFE}}}retEnviNFe')
+            if ret is None:
+                return {'sucesso': False, 'codigo': '999', 'mensagem': 'Resposta inválida da SEFAZ',
+                        'falha_comunicacao': True}
+
+            c_stat = ret.findtext(f'{{{self.NS_NFE}}}cStat')
+            return {
+                'sucesso': c_stat == '103',
+                'codigo': c_stat,
+                'mensagem': ret.findtext(f'{{{self.NS_NFE}}}xMotivo'),
+                'recibo': ret.findtext(f'.//{{{self.NS_NFE}}}nRec'),
+                'tempo_medio': int(ret.findtext(f'.//{{{self.NS_NFE}}}tMed') or 1)
+            }
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote {numero_lote}: {str(e)}")
+            return {
+                'sucesso': False,
+                'codigo': '999',
+                'mensagem': str(e),
+                'falha_comunicacao': True
+            }
+
+    def consultar_recibo(self, recibo):
+        """
+        Consulta o processamento de um lote (consReciNFe)
+
+        Args:
+            recibo: Número do recibo (nRec) retornado no envio
+
+        Returns:
+            dict: codigo (104 = processado, 105 = em processamento), mensagem,
+            processado e protocolos [{chave, codigo, mensagem, protocolo,
+            data_autorizacao, xml}] com um protNFe por nota
+        """
+        try:
+            NSMAP = {None: self.NS_NFE}
+            cons_reci = etree.Element('consReciNFe', versao=self.VERSAO_NFE, nsmap=NSMAP)
+            self._add_element(cons_reci, 'tpAmb', str(self.ambiente))
+            self._add_element(cons_reci, 'nRec', recibo)
+
+            xml_consulta = etree.tostring(cons_reci, encoding='unicode')
+            envelope = self._criar_envelope_soap('NFeRetAutorizacao', xml_consulta)
+
+            response = self._enviar_soap(
+                'retorno',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeRetAutorizacao4/nfeRetAutorizacaoLote',
+                envelope,
+                timeout=30
+            )
+
+            root = etree.fromstring(response.content)
+            ret = root.find(f'.//{{{self.NS_NFE}}}retConsReciNFe')
+            if ret is None:
+                return {'processado': False, 'codigo': '999', 'mensagem': 'Resposta inválida da SEFAZ', 'protocolos': []}
+
+            protocolos = []
+            for prot in ret.findall(f'{{{self.NS_NFE}}}protNFe'):
+                inf_prot = prot.find(f'{{{self.NS_NFE}}}infProt')
+                if inf_prot is None:
+                    continue
+                protocolos.append({
+                    'chave': inf_prot.findtext(f'{{{self.NS_NFE}}}chNFe'),
+                    'codigo': inf_prot.findtext(f'{{{self.NS_NFE}}}cStat'),
+                    'mensagem': inf_prot.findtext(f'{{{self.NS_NFE}}}xMotivo'),
+                    'protocolo': inf_prot.findtext(f'{{{self.NS_NFE}}}nProt'),
+                    'data_autorizacao': inf_prot.findtext(f'{{{self.NS_NFE}}}dhRecbto'),
+                    'xml': etree.tostring(prot, encoding='unicode')
+                })
+
+            c_stat = ret.findtext(f'{{{self.NS_NFE}}}cStat')
+            return {
+                'processado': c_stat == '104',
+                'codigo': c_stat,
+                'mensagem': ret.findtext(f'{{{self.NS_NFE}}}xMotivo'),
+                'protocolos': protocolos
+            }
+
+        except Exception as e:
+            logger.error(f"Erro ao consultar recibo {recibo}: {str(e)}")
+            return {
+                'processado': False,
+                'codigo': '999',
+                'mensagem': str(e),
+                'protocolos': []
+            }
+
     def consultar_nfe(self, chave_acesso):
         """
         Consulta situação de uma NFe na SEFAZ
@@ -556,8 +778,6 @@ class NFeService:
             dict: Situação da NFe
         """
         try:
-            url = self._get_ws_url('consulta')
-
             # Monta XML de consulta
             NSMAP = {None: self.NS_NFE}
             cons_sit = etree.Element('consSitNFe', versao=self.VERSAO_NFE, nsmap=NSMAP)
@@ -568,32 +788,15 @@ class NFeService:
             xml_consulta = etree.tostring(cons_sit, encoding='unicode')
             envelope = self._criar_envelope_soap('NfeConsulta', xml_consulta)
 
-            # Obtém certificado
-            cert_pem = self.certificado_service.obter_certificado_pem()
-            key_pem = self.certificado_service.obter_chave_pem()
-
-            import tempfile
-            cert_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
-            cert_file.write(cert_pem)
-            cert_file.write(key_pem)
-            cert_file.close()
-
-            headers = {
-                'Content-Type': 'application/soap+xml; charset=utf-8',
-                'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeConsultaProtocolo4/nfeConsultaNF'
-            }
-
-            response = requests.post(
-                url,
-                data=envelope.encode('utf-8'),
-                headers=headers,
-                cert=cert_file.name,
-                verify=True,
-                timeout=30
+            # tpEmis é a 35ª posição da chave: notas do SVC são consultadas no SVC
+            response = self._enviar_soap(
+                'consulta',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeConsultaProtocolo4/nfeConsultaNF',
+                envelope,
+                timeout=30,
+                tipo_emissao=int(chave_acesso[34]) if len(chave_acesso) == 44 else 1
             )
 
-            os.unlink(cert_file.name)
-
             return self._parse_resposta_consulta(response.text)
 
         except Exception as e:
@@ -688,8 +891,6 @@ class NFeService:
             dict: Resultado da inutilização
         """
         try:
-            url = self._get_ws_url('inutilizacao')
-
             # Monta ID da inutilização
             cnpj = self.empresa.cnpj.replace('.', '').replace('/', '').replace('-', '')
             id_inut = f"ID{self.CODIGO_UF[self.uf]}{'55'}{str(ano).zfill(2)}{cnpj}{str(serie).zfill(3)}{str(numero_inicial).zfill(9)}{str(numero_final).zfill(9)}"
@@ -714,33 +915,19 @@ class NFeService:
             # Assina
             xml_assinado = self.certificado_service.assinar_xml(xml_inut, f'#{id_inut}')
 
-            envelope = self._criar_envelope_soap('NfeInutilizacao', xml_assinado)
-
-            cert_pem = self.certificado_service.obter_certificado_pem()
-            key_pem = self.certificado_service.obter_chave_pem()
+            rejeicao = ValidadorXSDService.rejeicao(xml_assinado)
+            if rejeicao:
+                return rejeicao
 
-            import tempfile
-            cert_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
-            cert_file.write(cert_pem)
-            cert_file.write(key_pem)
-            cert_file.close()
-
-            headers = {
-                'Content-Type': 'application/soap+xml; charset=utf-8',
-                'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeInutilizacao4/nfeInutilizacaoNF'
-            }
+            envelope = self._criar_envelope_soap('NfeInutilizacao', xml_assinado)
 
-            response = requests.post(
-                url,
-                data=envelope.encode('utf-8'),
-                headers=headers,
-                cert=cert_file.name,
-                verify=True,
+            response = self._enviar_soap(
+                'inutilizacao',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeInutilizacao4/nfeInutilizacaoNF',
+                envelope,
                 timeout=30
             )
 
-            os.unlink(cert_file.name)
-
             return self._parse_resposta_inutilizacao(response.text)
 
         except Exception as e:
@@ -759,8 +946,6 @@ class NFeService:
             dict: Status do serviço
         """
         try:
-            url = self._get_ws_url('status')
-
             NSMAP = {None: self.NS_NFE}
             cons_stat = etree.Element('consStatServ', versao=self.VERSAO_NFE, nsmap=NSMAP)
             self._add_element(cons_stat, 'tpAmb', str(self.ambiente))
@@ -770,31 +955,13 @@ class NFeService:
             xml_status = etree.tostring(cons_stat, encoding='unicode')
             envelope = self._criar_envelope_soap('NfeStatusServico', xml_status)
 
-            cert_pem = self.certificado_service.obter_certificado_pem()
-            key_pem = self.certificado_service.obter_chave_pem()
-
-            import tempfile
-            cert_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
-            cert_file.write(cert_pem)
-            cert_file.write(key_pem)
-            cert_file.close()
-
-            headers = {
-                'Content-Type': 'application/soap+xml; charset=utf-8',
-                'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeStatusServico4/nfeStatusServicoNF'
-            }
-
-            response = requests.post(
-                url,
-                data=envelope.encode('utf-8'),
-                headers=headers,
-                cert=cert_file.name,
-                verify=True,
+            response = self._enviar_soap(
+                'status',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeStatusServico4/nfeStatusServicoNF',
+                envelope,
                 timeout=30
             )
 
-            os.unlink(cert_file.name)
-
             root = etree.fromstring(response.text.encode('utf-8'))
             ret = root.find('.//{http://www.portalfiscal.inf.br/nfe}retConsStatServ')
 
@@ -828,19 +995,15 @@ class NFeService:
     def _enviar_evento(self, chave_acesso, tipo_evento, sequencia, descricao, protocolo=None):
         """Envia evento para SEFAZ (cancelamento, CC-e, etc)"""
         try:
-            url = self._get_ws_url('evento')
-
             cnpj = self.empresa.cnpj.replace('.', '').replace('/', '').replace('-', '')
             dh_evento = datetime.now().strftime('%Y-%m-%dT%H:%M:%S-03:00')
 
             # ID do evento
             id_evento = f"ID{tipo_evento}{chave_acesso}{str(sequencia).zfill(2)}"
 
+            # A assinatura fica dentro de <evento>: assina o evento e depois monta o envEvento
             NSMAP = {None: self.NS_NFE}
-            evento = etree.Element('envEvento', versao='1.00', nsmap=NSMAP)
-            self._add_element(evento, 'idLote', str(random.randint(1, 999999999999999)))
-
-            event = etree.SubElement(evento, 'evento', versao='1.00')
+            event = etree.Element('evento', versao='1.00', nsmap=NSMAP)
             inf_evento = etree.SubElement(event, 'infEvento', Id=id_evento)
 
             self._add_element(inf_evento, 'cOrgao', self.CODIGO_UF[self.uf])
@@ -869,49 +1032,43 @@ class NFeService:
                     'quantidade, valor da operacao ou da prestacao; II - a correcao de dados cadastrais que '
                     'implique mudanca do remetente ou do destinatario; III - a data de emissao ou de saida.')
 
-            xml_evento = etree.tostring(evento, encoding='unicode')
+            xml_evento = etree.tostring(event, encoding='unicode')
 
             # Assina
-            xml_assinado = self.certificado_service.assinar_xml(xml_evento, f'#{id_evento}')
-
-            envelope = self._criar_envelope_soap('RecepcaoEvento', xml_assinado)
-
-            cert_pem = self.certificado_service.obter_certificado_pem()
-            key_pem = self.certificado_service.obter_chave_pem()
+            evento_assinado = self.certificado_service.assinar_xml(xml_evento, f'#{id_evento}')
+            xml_assinado = (
+                f'<envEvento xmlns="{self.NS_NFE}" versao="1.00">'
+                f'<idLote>{random.randint(1, 999999999999999)}</idLote>{evento_assinado}</envEvento>'
+            )
 
-            import tempfile
-            cert_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
-            cert_file.write(cert_pem)
-            cert_file.write(key_pem)
-            cert_file.close()
+            rejeicao = ValidadorXSDService.rejeicao(xml_assinado)
+            if rejeicao:
+                return rejeicao
 
-            headers = {
-                'Content-Type': 'application/soap+xml; charset=utf-8',
-                'SOAPAction': 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeRecepcaoEvento4/nfeRecepcaoEvento'
-            }
+            envelope = self._criar_envelope_soap('RecepcaoEvento', xml_assinado)
 
-            response = requests.post(
-                url,
-                data=envelope.encode('utf-8'),
-                headers=headers,
-                cert=cert_file.name,
-                verify=True,
+            response = self._enviar_soap(
+                'evento',
+                'http://www.portalfiscal.inf.br/nfe/wsdl/NFeRecepcaoEvento4/nfeRecepcaoEvento',
+                envelope,
                 timeout=30
             )
 
-            os.unlink(cert_file.name)
-
             return self._parse_resposta_evento(response.text)
 
         except Exception as e:
             logger.error(f"Erro ao enviar evento: {str(e)}")
             raise
 
-    def _get_ws_url(self, servico):
-        """Obtém URL do WebService para o serviço especificado"""
+    def _get_ws_url(self, servico, tipo_emissao=1):
+        """Obtém URL do WebService para o serviço especificado (SVC para tpEmis 6 e 7)"""
         ambiente = 'producao' if self.ambiente == 1 else 'homologacao'
         uf = self.uf
 
+        svc = self.WS_CONTINGENCIA.get(tipo_emissao)
+        if svc and servico in self.WS_URLS[svc][ambiente]:
+            return self.WS_URLS[svc][ambiente][servico]
+
         # Determina qual SEFAZ usar
         if uf in self.WS_URLS:
             return self.WS_URLS[uf][ambiente][servico]
@@ -919,6 +1076,13 @@ class NFeService:
             # Usa SEFAZ Virtual RS para estados não listados
             return self.WS_URLS['SVRS'][ambiente][servico]
 
+    def _enviar_soap(self, servico, soap_action, envelope, timeout=30, tipo_emissao=1):
+        """Envia o envelope ao web service pela sessão HTTPS reaproveitada do certificado"""
+        if self._transporte is None:
+            self._transporte = SefazTransporteService(self.certificado_service)
+        url = self._get_ws_url(servico, tipo_emissao)
+        return self._transporte.enviar(servico, url, envelope, soap_action, timeout)
+
     def _criar_envelope_soap(self, metodo, xml_dados):
         """Cria envelope SOAP para envio"""
         envelope = f'''<?xml version="1.0" encoding="UTF-8"?>
@@ -990,13 +1154,21 @@ class NFeService:
                 c_stat = ret.findtext('{http://www.portalfiscal.inf.br/nfe}cStat')
                 x_motivo = ret.findtext('{http://www.portalfiscal.inf.br/nfe}xMotivo')
 
+                # Protocolo de autorização (permite recuperar uma nota já autorizada)
+                inf_prot = ret.find('.//{http://www.portalfiscal.inf.br/nfe}protNFe/{http://www.portalfiscal.inf.br/nfe}infProt')
+                protocolo = inf_prot.findtext('{http://www.portalfiscal.inf.br/nfe}nProt') if inf_prot is not None else None
+                dh_recbto = inf_prot.findtext('{http://www.portalfiscal.inf.br/nfe}dhRecbto') if inf_prot is not None else None
+
                 return {
                     'sucesso': c_stat in ['100', '150'],
                     'codigo': c_stat,
                     'mensagem': x_motivo,
                     'autorizada': c_stat == '100',
                     'cancelada': c_stat == '101',
-                    'denegada': c_stat in ['110', '205', '301', '302']
+                    'denegada': c_stat in ['110', '205', '301', '302'],
+                    'protocolo': protocolo,
+                    'data_autorizacao': dh_recbto,
+                    'xml_retorno': xml_resposta
                 }
 
             return {
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Geração do XML da NFe
+Serialização direta do layout 4.00 com fragmentos do emitente em cache
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+# Caracteres recusados pelo lxml (mesma mensagem de erro de element.text)
+_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_ESCAPAR = re.compile('[&<>\r]')
+_ESCAPAR_ATRIBUTO = re.compile('[&<>"\r\n\t]')
+_ENTIDADES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#9;'}
+
+
+def _substituir(correspondencia):
+    return _ENTIDADES[correspondencia.group()]
+
+
+def _texto(valor):
+    """Texto de elemento como o lxml serializa (None vira vazio, como em _add_element)"""
+    texto = '' if valor is None else str(valor)
+    if _INVALIDOS.search(texto):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+    if _ESCAPAR.search(texto):
+        texto = _ESCAPAR.sub(_substituir, texto)
+    return texto
+
+
+def _atributo(valor):
+    texto = str(valor)
+    if _INVALIDOS.search(texto):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+    return _ESCAPAR_ATRIBUTO.sub(_substituir, texto)
+
+
+def _el(tag, valor):
+    texto = _texto(valor)
+    return f'<{tag}>{texto}</{tag}>'
+
+
+def _dec(valor, casas):
+    """Mesmo resultado de NFeService._format_decimal (arredondamento via float)"""
+    return f"{float(0 if valor is None else valor):.{casas}f}"
+
+
+def _dec2(valor):
+    return '%.2f' % float(0 if valor is None else valor)
+
+
+def _dec4(valor):
+    return '%.4f' % float(0 if valor is None else valor)
+
+
+def _dec10(valor):
+    return '%.10f' % float(0 if valor is None else valor)
+
+
+def _so_digitos(documento):
+    return documento.replace('.', '').replace('/', '').replace('-', '')
+
+
+class NFeXMLService:
+    """
+    Geração do XML da NFe (layout 4.00) sem montar a árvore lxml
+
+    Produz exatamente os mesmos bytes de NFeService.gerar_xml_nfe_referencia
+    (implementação com etree.SubElement), inclusive escapes e a recusa de
+    caracteres de controle. Os blocos que dependem só da empresa (emit,
+    infRespTec e as constantes do ide) ficam em cache por processo; a chave
+    do cache é o próprio conteúdo dos campos usados, então uma alteração no
+    cadastro da empresa gera um fragmento novo sem invalidação explícita.
+    Os itens (det) são emitidos num laço único, com as funções de
+    formatação ligadas a variáveis locais.
+
+    A verificação byte a byte e o benchmark ficam em scripts/benchmark_xml_nfe.py.
+    """
+
+    CACHE_MAXIMO = 32
+
+    _fragmentos = OrderedDict()
+    _trava = threading.Lock()
+
+    def __init__(self, empresa, uf, ambiente, codigo_uf):
+        """
+        Args:
+            empresa: ConfiguracaoEmpresa emitente
+            uf, ambiente, codigo_uf: Como em NFeService
+        """
+        self.empresa = empresa
+        self.uf = uf
+        self.ambiente = ambiente
+        self.codigo_uf = codigo_uf
+
+    # ==================== FRAGMENTOS DA EMPRESA ====================
+
+    def _campos_empresa(self):
+        empresa = self.empresa
+        return (
+            self.uf, self.ambiente, self.codigo_uf,
+            empresa.cnpj, empresa.razao_social, empresa.nome_fantasia, empresa.logradouro, empresa.numero,
+            empresa.complemento, empresa.bairro, empresa.codigo_municipio, empresa.cidade, empresa.uf,
+            empresa.cep, empresa.codigo_pais, empresa.pais, empresa.telefone, empresa.inscricao_estadual,
+            empresa.regime_tributario, empresa.resp_tecnico_cnpj, empresa.resp_tecnico_contato,
+            empresa.resp_tecnico_email, empresa.resp_tecnico_telefone
+        )
+
+    def _montar_fragmentos(self):
+        """emit, infRespTec e partes fixas do ide da empresa"""
+        empresa = self.empresa
+
+        emit = ['<emit>', _el('CNPJ', _so_digitos(empresa.cnpj)), _el('xNome', empresa.razao_social[:60])]
+        if empresa.nome_fantasia:
+            emit.append(_el('xFant', empresa.nome_fantasia[:60]))
+        emit.append('<enderEmit>')
+        emit.append(_el('xLgr', empresa.logradouro[:60]))
+        emit.append(_el('nro', empresa.numero[:60]))
+        if empresa.complemento:
+            emit.append(_el('xCpl', empresa.complemento[:60]))
+        emit.append(_el('xBairro', empresa.bairro[:60]))
+        emit.append(_el('cMun', empresa.codigo_municipio))
+        emit.append(_el('xMun', empresa.cidade[:60]))
+        emit.append(_el('UF', empresa.uf))
+        emit.append(_el('CEP', empresa.cep.replace('-', '')))
+        emit.append(_el('cPais', empresa.codigo_pais or '1058'))
+        emit.append(_el('xPais', empresa.pais or 'Brasil'))
+        if empresa.telefone:
+            emit.append(_el('fone', ''.join(filter(str.isdigit, empresa.telefone))))
+        emit.append('</enderEmit>')
+        emit.append(_el('IE', empresa.inscricao_estadual.replace('.', '').replace('-', '')))
+        emit.append(_el('CRT', str(empresa.regime_tributario)))
+        emit.append('</emit>')
+
+        resp_tec = ''
+        if empresa.resp_tecnico_cnpj:
+            telefone = empresa.resp_tecnico_telefone
+            resp_tec = ''.join((
+                '<infRespTec>',
+                _el('CNPJ', _so_digitos(empresa.resp_tecnico_cnpj)),
+                _el('xContato', empresa.resp_tecnico_contato[:60]),
+                _el('email', empresa.resp_tecnico_email[:60]),
+                _el('fone', ''.join(filter(str.isdigit, telefone)) if telefone else ''),
+                '</infRespTec>'
+            ))
+
+        return {
+            'emit': ''.join(emit),
+            'resp_tec': resp_tec,
+            'cuf': _el('cUF', self.codigo_uf),
+            'cmun_fg': _el('cMunFG', empresa.codigo_municipio),
+            'tp_amb': _el('tpAmb', str(self.ambiente)),
+        }
+
+    def fragmentos(self):
+        """Fragmentos da empresa (montados na primeira nota e reaproveitados)"""
+        chave = self._campos_empresa()
+        with self._trava:
+            fragmentos = self._fragmentos.get(chave)
+            if fragmentos is not None:
+                self._fragmentos.move_to_end(chave)
+                return fragmentos
+
+        fragmentos = self._montar_fragmentos()
+        with self._trava:
+            self._fragmentos[chave] = fragmentos
+            while len(self._fragmentos) > self.CACHE_MAXIMO:
+                self._fragmentos.popitem(last=False)
+        return fragmentos
+
+    @classmethod
+    def limpar_cache(cls):
+        with cls._trava:
+            cls._fragmentos.clear()
+
+    # ==================== ITENS ====================
+
+    def _icms(self, item, partes):
+        cst = item.cst_icms or '102'
+        origem = _el('orig', item.origem or '0')
+
+        if self.empresa.regime_tributario == 1:
+            if cst in ['101']:
+                partes += ('<ICMS><ICMSSN101>', origem, _el('CSOSN', cst),
+                           '<pCredSN>', _dec2(item.aliquota_icms or 0), '</pCredSN>',
+                           '<vCredICMSSN>', _dec2(item.valor_icms or 0), '</vCredICMSSN></ICMSSN101></ICMS>')
+            elif cst in ['102', '103', '300', '400']:
+                partes += ('<ICMS><ICMSSN102>', origem, _el('CSOSN', cst), '</ICMSSN102></ICMS>')
+            elif cst == '500':
+                partes += ('<ICMS><ICMSSN500>', origem, _el('CSOSN', cst), '</ICMSSN500></ICMS>')
+            else:
+                partes += ('<ICMS><ICMSSN102>', origem, '<CSOSN>102</CSOSN></ICMSSN102></ICMS>')
+        else:
+            if cst == '00':
+                partes += ('<ICMS><ICMS00>', origem, _el('CST', cst),
+                           _el('modBC', str(item.modalidade_bc_icms or 3)),
+                           '<vBC>', _dec2(item.valor_bc_icms), '</vBC>',
+                           '<pICMS>', _dec2(item.aliquota_icms), '</pICMS>',
+                           '<vICMS>', _dec2(item.valor_icms), '</vICMS></ICMS00></ICMS>')
+            elif cst in ['40', '41', '50']:
+                partes += ('<ICMS><ICMS40>', origem, _el('CST', cst), '</ICMS40></ICMS>')
+            elif cst == '60':
+                partes += ('<ICMS><ICMS60>', origem, _el('CST', cst), '</ICMS60></ICMS>')
+            else:
+                partes += ('<ICMS><ICMS00>', origem, '<CST>00</CST><modBC>3</modBC>',
+                           '<vBC>', _dec2(item.valor_bc_icms or 0), '</vBC>',
+                           '<pICMS>', _dec2(item.aliquota_icms or 0), '</pICMS>',
+                           '<vICMS>', _dec2(item.valor_icms or 0), '</vICMS></ICMS00></ICMS>')
+
+    @staticmethod
+    def _ipi(item, partes):
+        cst = item.cst_ipi or '99'
+        partes.append('<IPI><cEnq>999</cEnq>')
+        if cst in ['00', '49', '50', '99']:
+            if item.valor_ipi and item.valor_ipi > 0:
+                partes += ('<IPITrib>', _el('CST', cst),
+                           '<vBC>', _dec2(item.valor_bc_ipi), '</vBC>',
+                           '<pIPI>', _dec2(item.aliquota_ipi), '</pIPI>',
+                           '<vIPI>', _dec2(item.valor_ipi), '</vIPI></IPITrib>')
+            else:
+                partes.append('<IPINT><CST>53</CST></IPINT>')
+        else:
+            partes += ('<IPINT>', _el('CST', cst), '</IPINT>')
+        partes.append('</IPI>')
+
+    @staticmethod
+    def _pis_cofins(grupo, cst, base, aliquota, valor, partes):
+        if cst in ['01', '02']:
+            partes += (f'<{grupo}><{grupo}Aliq>', _el('CST', cst),
+                       '<vBC>', _dec2(base), '</vBC>',
+                       f'<p{grupo}>', _dec2(aliquota), f'</p{grupo}>',
+                       f'<v{grupo}>', _dec2(valor), f'</v{grupo}></{grupo}Aliq></{grupo}>')
+        else:
+            partes += (f'<{grupo}><{grupo}NT>', _el('CST', cst), f'</{grupo}NT></{grupo}>')
+
+    def _itens(self, itens, partes):
+        """Grupos det de todos os itens"""
+        el, dec2, dec4, dec10 = _el, _dec2, _dec4, _dec10
+        icms, ipi, pis_cofins = self._icms, self._ipi, self._pis_cofins
+        append = partes.append
+
+        for item in itens:
+            unidade = item.unidade[:6]
+            partes += (
+                '<det nItem="', _atributo(str(item.numero_item)), '"><prod>',
+                el('cProd', item.codigo[:60]),
+                el('cEAN', item.ean or 'SEM GTIN'),
+                el('xProd', item.descricao[:120]),
+                el('NCM', item.ncm),
+            )
+            if item.cest:
+                append(el('CEST', item.cest))
+            partes += (
+                el('CFOP', item.cfop),
+                el('uCom', unidade),
+                '<qCom>', dec4(item.quantidade), '</qCom>',
+                '<vUnCom>', dec10(item.valor_unitario), '</vUnCom>',
+                '<vProd>', dec2(item.valor_total), '</vProd>',
+                el('cEANTrib', item.ean_tributavel or 'SEM GTIN'),
+                el('uTrib', item.unidade_tributavel or unidade),
+                '<qTrib>', dec4(item.quantidade_tributavel or item.quantidade), '</qTrib>',
+                '<vUnTrib>', dec10(item.valor_unitario_tributavel or item.valor_unitario), '</vUnTrib>',
+                '<indTot>1</indTot>',
+            )
+            if item.valor_desconto and item.valor_desconto > 0:
+                partes += ('<vDesc>', dec2(item.valor_desconto), '</vDesc>')
+            append('</prod><imposto>')
+
+            if item.valor_aproximado_tributos and item.valor_aproximado_tributos > 0:
+                partes += ('<vTotTrib>', dec2(item.valor_aproximado_tributos), '</vTotTrib>')
+            icms(item, partes)
+            if item.cst_ipi:
+                ipi(item, partes)
+            pis_cofins('PIS', item.cst_pis or '07', item.valor_bc_pis, item.aliquota_pis, item.valor_pis, partes)
+            pis_cofins('COFINS', item.cst_cofins or '07', item.valor_bc_cofins, item.aliquota_cofins,
+                       item.valor_cofins, partes)
+            append('</imposto>')
+
+            if item.informacoes_adicionais:
+                append(el('infAdProd', item.informacoes_adicionais[:500]))
+            append('</det>')
+
+    # ==================== NOTA ====================
+
+    def gerar(self, nota_fiscal, chave_acesso, codigo_numerico, forma_pagamento, itens=None):
+        """
+        XML da NFe pronto para assinatura
+
+        Args:
+            nota_fiscal: NotaFiscal
+            chave_acesso: Chave de 44 dígitos já calculada
+            codigo_numerico: cNF usado na chave
+            forma_pagamento: tPag já mapeado
+            itens: Itens já carregados (padrão: nota_fiscal.itens)
+
+        Returns:
+            str: Mesmo conteúdo de etree.tostring(..., encoding='unicode')
+        """
+        nota = nota_fiscal
+        tipo_emissao = nota.tipo_emissao or 1
+        fragmentos = self.fragmentos()
+        el, dec2 = _el, _dec2
+
+        partes = [
+            f'<NFe xmlns="{NS_NFE}"><infNFe versao="4.00" Id="', _atributo(f'NFe{chave_acesso}'), '"><ide>',
+            fragmentos['cuf'],
+            el('cNF', codigo_numerico),
+            el('natOp', nota.natureza_operacao[:60]),
+            el('mod', nota.modelo),
+            el('serie', str(nota.serie)),
+            el('nNF', str(nota.numero)),
+            el('dhEmi', nota.data_emissao.strftime('%Y-%m-%dT%H:%M:%S-03:00')),
+        ]
+        if nota.data_saida_entrada:
+            partes.append(el('dhSaiEnt', nota.data_saida_entrada.strftime('%Y-%m-%dT%H:%M:%S-03:00')))
+        partes += (
+            el('tpNF', str(nota.tipo_operacao)),
+            '<idDest>1</idDest>',
+            fragmentos['cmun_fg'],
+            '<tpImp>1</tpImp>',
+            el('tpEmis', str(tipo_emissao)),
+            el('cDV', chave_acesso[-1]),
+            fragmentos['tp_amb'],
+            el('finNFe', str(nota.finalidade)),
+            el('indFinal', str(nota.indicador_consumidor_final)),
+            el('indPres', str(nota.indicador_presenca)),
+            '<procEmi>0</procEmi><verProc>TermanOS 1.0</verProc>',
+        )
+        if tipo_emissao != 1:
+            # Contingência: entrada (dhCont) e justificativa (xJust)
+            partes.append(el('dhCont', nota.data_contingencia.strftime('%Y-%m-%dT%H:%M:%S-03:00')))
+            partes.append(el('xJust', nota.justificativa_contingencia[:256]))
+        partes += ('</ide>', fragmentos['emit'], '<dest>')
+
+        # dest - Destinatário
+        cpf_cnpj_dest = _so_digitos(nota.destinatario_cpf_cnpj) if nota.destinatario_cpf_cnpj else ''
+        if len(cpf_cnpj_dest) == 11:
+            partes.append(el('CPF', cpf_cnpj_dest))
+        elif len(cpf_cnpj_dest) == 14:
+            partes.append(el('CNPJ', cpf_cnpj_dest))
+        partes.append(el('xNome', nota.destinatario_razao_social[:60] if nota.destinatario_razao_social else 'CONSUMIDOR'))
+        partes.append(el('indIEDest', str(nota.indicador_ie_destinatario)))
+        if nota.destinatario_ie and nota.indicador_ie_destinatario == 1:
+            partes.append(el('IE', nota.destinatario_ie.replace('.', '').replace('-', '')))
+        if nota.destinatario_email:
+            partes.append(el('email', nota.destinatario_email[:60]))
+        partes.append('</dest>')
+
+        self._itens(nota.itens if itens is None else itens, partes)
+
+        # total - Totais
+        partes += (
+            '<total><ICMSTot>',
+            '<vBC>', dec2(nota.valor_bc_icms), '</vBC>',
+            '<vICMS>', dec2(nota.valor_icms), '</vICMS>',
+            '<vICMSDeson>0.00</vICMSDeson><vFCPUFDest>0.00</vFCPUFDest>'
+            '<vICMSUFDest>0.00</vICMSUFDest><vICMSUFRemet>0.00</vICMSUFRemet>',
+            '<vFCP>', dec2(nota.valor_fcp), '</vFCP>',
+            '<vBCST>', dec2(nota.valor_bc_icms_st), '</vBCST>',
+            '<vST>', dec2(nota.valor_icms_st), '</vST>',
+            '<vFCPST>0.00</vFCPST><vFCPSTRet>0.00</vFCPSTRet>',
+            '<vProd>', dec2(nota.valor_produtos), '</vProd>',
+            '<vFrete>', dec2(nota.valor_frete), '</vFrete>',
+            '<vSeg>', dec2(nota.valor_seguro), '</vSeg>',
+            '<vDesc>', dec2(nota.valor_desconto), '</vDesc>',
+            '<vII>', dec2(nota.valor_ii), '</vII>',
+            '<vIPI>', dec2(nota.valor_ipi), '</vIPI>',
+            '<vIPIDevol>0.00</vIPIDevol>',
+            '<vPIS>', dec2(nota.valor_pis), '</vPIS>',
+            '<vCOFINS>', dec2(nota.valor_cofins), '</vCOFINS>',
+            '<vOutro>', dec2(nota.valor_outras_despesas), '</vOutro>',
+            '<vNF>', dec2(nota.valor_total), '</vNF>',
+            '<vTotTrib>', dec2(nota.valor_aproximado_tributos), '</vTotTrib>',
+            '</ICMSTot></total>',
+        )
+
+        # transp - Transporte
+        partes += ('<transp>', el('modFrete', str(nota.modalidade_frete)))
+        if nota.transportadora_cnpj:
+            cnpj_transp = _so_digitos(nota.transportadora_cnpj)
+            partes.append('<transporta>')
+            partes.append(el('CNPJ' if len(cnpj_transp) == 14 else 'CPF', cnpj_transp))
+            if nota.transportadora_razao_social:
+                partes.append(el('xNome', nota.transportadora_razao_social[:60]))
+            partes.append('</transporta>')
+        if nota.veiculo_placa:
+            partes += ('<veicTransp>', el('placa', nota.veiculo_placa), el('UF', nota.veiculo_uf or self.uf),
+                       '</veicTransp>')
+        if nota.quantidade_volumes and nota.quantidade_volumes > 0:
+            partes += ('<vol>', el('qVol', str(nota.quantidade_volumes)))
+            if nota.especie_volumes:
+                partes.append(el('esp', nota.especie_volumes[:60]))
+            if nota.peso_liquido:
+                partes.append(el('pesoL', _dec(nota.peso_liquido, 3)))
+            if nota.peso_bruto:
+                partes.append(el('pesoB', _dec(nota.peso_bruto, 3)))
+            partes.append('</vol>')
+        partes.append('</transp>')
+
+        # pag - Pagamento
+        partes += (
+            '<pag><detPag>', el('tPag', forma_pagamento),
+            '<vPag>', dec2(nota.valor_pagamento or nota.valor_total), '</vPag></detPag></pag>',
+        )
+
+        # infAdic - Informações Adicionais
+        if nota.informacoes_complementares or nota.informacoes_fisco:
+            partes.append('<infAdic>')
+            if nota.informacoes_fisco:
+                partes.append(el('infAdFisco', nota.informacoes_fisco[:2000]))
+            if nota.informacoes_complementares:
+                partes.append(el('infCpl', nota.informacoes_complementares[:5000]))
+            partes.append('</infAdic>')
+
+        partes.append(fragmentos['resp_tec'])
+        partes.append('</infNFe></NFe>')
+        return ''.join(partes)
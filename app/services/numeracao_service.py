@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Numeração de Documentos
+Alocação concorrente de números para pedidos, orçamentos, OS e NFe/NFCe
+"""
+
+import os
+import atexit
+import socket
+import logging
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func, and_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class NumeracaoService:
+    """
+    Alocador central de numeração
+
+    Cada série tem um contador em ``sequencias_documento``. O incremento é
+    feito com um único UPDATE (bloqueio de linha) em transação própria,
+    independente da transação de negócio: um rollback do pedido não devolve
+    o número, como em uma sequence do banco.
+
+    Cada processo reserva blocos de números e os entrega da memória, sem
+    consultar o banco a cada documento. Toda faixa entregue é registrada em
+    ``blocos_numeracao`` para que lacunas na numeração fiscal possam ser
+    encontradas e inutilizadas.
+    """
+
+    # Blocos em memória por série: {(url_banco, chave): [proximo, fim]}
+    _blocos = {}
+    _lock = threading.Lock()
+    _atexit_registrado = False
+
+    # ==================== SÉRIES ====================
+
+    @classmethod
+    def numero_pedido(cls):
+        """Gera número de pedido (PED-2025-00001)"""
+        from app.models.pedido import Pedido
+        return cls._numero_anual('PED', Pedido.numero_pedido)
+
+    @classmethod
+    def numero_orcamento(cls):
+        """Gera número de orçamento (ORC-2025-00001)"""
+        from app.models.fiscal import Orcamento
+        return cls._numero_anual('ORC', Orcamento.numero_orcamento)
+
+    @classmethod
+    def numero_os(cls):
+        """Gera número de ordem de serviço (OS-2025-00001)"""
+        from app.models.manufatura import OrdemServico
+        return cls._numero_anual('OS', OrdemServico.numero_os)
+
+    @classmethod
+    def proximo_numero_fiscal(cls, empresa, modelo):
+        """
+        Aloca o próximo número de NFe (55) ou NFCe (65) da série da empresa
+
+        Respeita o último número configurado na empresa (permite iniciar a
+        numeração a partir de um valor vindo de outro sistema) e mantém o
+        campo da configuração espelhando o último número alocado.
+
+        Args:
+            empresa: ConfiguracaoEmpresa
+            modelo: '55' ou '65'
+
+        Returns:
+            tuple: (serie, numero)
+        """
+        modelo = str(modelo)
+        if modelo == '65':
+            serie, campo = empresa.serie_nfce or 1, 'ultimo_numero_nfce'
+        else:
+            serie, campo = empresa.serie_nfe or 1, 'ultimo_numero_nfe'
+
+        numero = cls.proximo(
+            cls.chave_fiscal(modelo, serie),
+            tamanho_bloco=current_app.config.get('NUMERACAO_TAMANHO_BLOCO_FISCAL', 1),
+            semente=lambda: cls._semente_fiscal(modelo, serie),
+            minimo=getattr(empresa, campo) or 0
+        )
+
+        if numero > (getattr(empresa, campo) or 0):
+            setattr(empresa, campo, numero)
+
+        return serie, numero
+
+    @staticmethod
+    def chave_fiscal(modelo, serie):
+        return f'NFE-{modelo}-{serie}'
+
+    # ==================== ALOCAÇÃO ====================
+
+    @classmethod
+    def proximo(cls, chave, tamanho_bloco=None, semente=None, minimo=0):
+        """
+        Retorna o próximo número de uma série
+
+        Args:
+            chave: Identificador da série
+            tamanho_bloco: Quantidade de números reservados por ida ao banco
+            semente: Callable que retorna o último número já existente
+                     (usado apenas na criação da série)
+            minimo: Último número mínimo aceito para a série
+
+        Returns:
+            int: Número alocado
+        """
+        if tamanho_bloco is None:
+            tamanho_bloco = current_app.config.get('NUMERACAO_TAMANHO_BLOCO', 20)
+        tamanho_bloco = max(int(tamanho_bloco), 1)
+
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite admite um único escritor: alocar em transação separada
+            # bloquearia enquanto a requisição tiver escritas pendentes. A
+            # alocação ocorre na transação corrente, sem blocos em memória.
+            with cls._lock:
+                return cls._alocar_bloco(chave, 1, semente, minimo, db.session.connection())[0]
+
+        chave_cache = (str(db.engine.url), chave)
+
+        with cls._lock:
+            bloco = cls._blocos.get(chave_cache)
+            if bloco and bloco[0] <= bloco[1] and bloco[0] > minimo:
+                numero = bloco[0]
+                bloco[0] += 1
+                return numero
+
+            inicio, fim = cls._alocar_bloco(chave, tamanho_bloco, semente, minimo)
+            cls._blocos[chave_cache] = [inicio + 1, fim]
+            cls._registrar_devolucao()
+            return inicio
+
+    @classmethod
+    def _alocar_bloco(cls, chave, quantidade, semente, minimo, conexao=None):
+        """Incrementa o contador no banco (em transação própria, se não informada)"""
+        from app.models.numeracao import SequenciaDocumento, BlocoNumeracao
+
+        tabela = SequenciaDocumento.__table__
+        base = func.max(tabela.c.ultimo_valor, minimo) if db.engine.dialect.name == 'sqlite' \
+            else func.greatest(tabela.c.ultimo_valor, minimo)
+
+        def transacao():
+            return nullcontext(conexao) if conexao is not None else db.engine.begin()
+
+        for _ in range(3):
+            with transacao() as conn:
+                atualizar = (
+                    tabela.update()
+                    .where(tabela.c.chave == chave)
+                    .values(ultimo_valor=base + quantidade, data_atualizacao=datetime.utcnow())
+                )
+                if db.engine.dialect.update_returning:
+                    fim = conn.execute(atualizar.returning(tabela.c.ultimo_valor)).scalar()
+                else:
+                    resultado = conn.execute(atualizar)
+                    fim = conn.execute(
+                        select(tabela.c.ultimo_valor).where(tabela.c.chave == chave)
+                    ).scalar() if resultado.rowcount else None
+
+                if fim is not None:
+                    inicio = fim - quantidade + 1
+                    conn.execute(BlocoNumeracao.__table__.insert().values(
+                        chave=chave, inicio=inicio, fim=fim,
+                        processo=cls._processo(), data_alocacao=datetime.utcnow()
+                    ))
+                    return inicio, fim
+
+            # Série ainda não existe: criar a partir dos dados já cadastrados
+            inicial = max(int(semente() or 0) if semente else 0, minimo or 0)
+            try:
+                with transacao() as conn:
+                    conn.execute(tabela.insert().values(
+                        chave=chave, ultimo_valor=inicial,
+                        data_criacao=datetime.utcnow(), data_atualizacao=datetime.utcnow()
+                    ))
+                logger.info(f"Série de numeração '{chave}' criada a partir de {inicial}")
+            except IntegrityError:
+                # Outro processo criou a série ao mesmo tempo
+                pass
+
+        raise RuntimeError(f"Não foi possível alocar numeração para a série '{chave}'")
+
+    @classmethod
+    def devolver_blocos(cls):
+        """
+        Devolve ao contador a parte não usada dos blocos deste processo
+
+        Só é possível quando nenhum outro processo alocou números depois do
+        bloco (o contador ainda aponta para o fim dele). Chamado no
+        encerramento do processo.
+        """
+        from app.models.numeracao import SequenciaDocumento, BlocoNumeracao
+
+        with cls._lock:
+            blocos = [
+                (chave, proximo, fim)
+                for (url, chave), (proximo, fim) in cls._blocos.items()
+                if url == str(db.engine.url) and proximo <= fim
+            ]
+            for url_chave in [k for k in cls._blocos if k[0] == str(db.engine.url)]:
+                del cls._blocos[url_chave]
+
+        sequencias = SequenciaDocumento.__table__
+        registros = BlocoNumeracao.__table__
+
+        for chave, proximo, fim in blocos:
+            try:
+                with db.engine.begin() as conn:
+                    devolvido = conn.execute(
+                        sequencias.update()
+                        .where(sequencias.c.chave == chave, sequencias.c.ultimo_valor == fim)
+                        .values(ultimo_valor=proximo - 1)
+                    ).rowcount
+                    if devolvido:
+                        conn.execute(
+                            registros.update()
+                            .where(registros.c.chave == chave, registros.c.fim == fim)
+                            .values(fim=proximo - 1)
+                        )
+                        conn.execute(
+                            registros.delete()
+                            .where(registros.c.chave == chave, registros.c.inicio > registros.c.fim)
+                        )
+            except Exception as e:
+                logger.warning(f"Não foi possível devolver números da série '{chave}': {str(e)}")
+
+    @classmethod
+    def _registrar_devolucao(cls):
+        if cls._atexit_registrado:
+            return
+        cls._atexit_registrado = True
+        app = current_app._get_current_object()
+
+        def devolver():
+            try:
+                with app.app_context():
+                    cls.devolver_blocos()
+            except Exception:
+                pass
+
+        atexit.register(devolver)
+
+    # ==================== LACUNAS FISCAIS ====================
+
+    @classmethod
+    def lacunas_fiscais(cls, modelo, serie, idade_minima=None):
+        """
+        Faixas de números fiscais alocados que não viraram nota nem foram
+        inutilizados (candidatos a InutilizacaoNFe)
+
+        Args:
+            modelo: '55' ou '65'
+            serie: Série da numeração
+            idade_minima: Ignora blocos mais recentes (podem estar em uso);
+                          padrão NUMERACAO_IDADE_MINIMA_LACUNA minutos
+
+        Returns:
+            list: [{'inicio', 'fim', 'data_alocacao'}]
+        """
+        from app.models.numeracao import BlocoNumeracao
+        from app.models.fiscal import NotaFiscal, InutilizacaoNFe
+
+        if idade_minima is None:
+            idade_minima = timedelta(
+                minutes=current_app.config.get('NUMERACAO_IDADE_MINIMA_LACUNA', 60)
+            )
+
+        blocos = BlocoNumeracao.query.filter(
+            BlocoNumeracao.chave == cls.chave_fiscal(modelo, serie),
+            BlocoNumeracao.data_alocacao <= datetime.utcnow() - idade_minima
+        ).order_by(BlocoNumeracao.inicio).all()
+
+        if not blocos:
+            return []
+
+        menor = blocos[0].inicio
+        maior = max(bloco.fim for bloco in blocos)
+
+        usados = set(db.session.execute(
+            select(NotaFiscal.numero).where(
+                NotaFiscal.modelo == str(modelo),
+                NotaFiscal.serie == serie,
+                NotaFiscal.numero.between(menor, maior)
+            )
+        ).scalars())
+
+        inutilizadas = db.session.execute(
+            select(InutilizacaoNFe.numero_inicial, InutilizacaoNFe.numero_final).where(
+                InutilizacaoNFe.modelo == str(modelo),
+                InutilizacaoNFe.serie == serie,
+                InutilizacaoNFe.status == 'homologado',
+                and_(InutilizacaoNFe.numero_final >= menor, InutilizacaoNFe.numero_inicial <= maior)
+            )
+        ).all()
+        for inicial, final in inutilizadas:
+            usados.update(range(inicial, final + 1))
+
+        lacunas = []
+        for bloco in blocos:
+            atual = None
+            for numero in range(bloco.inicio, bloco.fim + 1):
+                if numero in usados:
+                    atual = None
+                    continue
+                if atual and atual['fim'] == numero - 1:
+                    atual['fim'] = numero
+                else:
+                    atual = {'inicio': numero, 'fim': numero, 'data_alocacao': bloco.data_alocacao}
+                    lacunas.append(atual)
+
+        return lacunas
+
+    # ==================== AUXILIARES ====================
+
+    @classmethod
+    def _numero_anual(cls, prefixo, coluna):
+        """Número no formato PREFIXO-ANO-00001, reiniciado a cada ano"""
+        ano = datetime.now().year
+        chave = f'{prefixo}-{ano}'
+        numero = cls.proximo(chave, semente=lambda: cls._semente_anual(chave, coluna))
+        return f'{chave}-{numero:05d}'
+
+    @staticmethod
+    def _semente_anual(chave, coluna):
+        """Maior número já usado na série (números de tamanhos diferentes ordenados pelo comprimento)"""
+        ultimo = db.session.execute(
+            select(coluna)
+            .where(coluna.like(f'{chave}-%'))
+            .order_by(func.length(coluna).desc(), coluna.desc())
+            .limit(1)
+        ).scalar()
+
+        if not ultimo:
+            return 0
+        try:
+            return int(ultimo.rsplit('-', 1)[-1])
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _semente_fiscal(modelo, serie):
+        from app.models.fiscal import NotaFiscal
+
+        return db.session.execute(
+            select(func.max(NotaFiscal.numero)).where(
+                NotaFiscal.modelo == str(modelo),
+                NotaFiscal.serie == serie
+            )
+        ).scalar() or 0
+
+    @staticmethod
+    def _processo():
+        return f'{socket.gethostname()}:{os.getpid()}'[:100]
@@ -230,6 +230,8 @@ class PDFService:
     def _criar_natureza_protocolo(self, nota_fiscal):
         """Natureza da operação e protocolo de autorização"""
         protocolo = nota_fiscal.protocolo_autorizacao or 'Aguardando autorização'
+        if not nota_fiscal.protocolo_autorizacao and (nota_fiscal.tipo_emissao or 1) != 1:
+            protocolo = 'EMITIDA EM CONTINGÊNCIA - Pendente de autorização'
         data_auth = nota_fiscal.data_autorizacao.strftime('%d/%m/%Y %H:%M:%S') if nota_fiscal.data_autorizacao else ''
 
         dados = [
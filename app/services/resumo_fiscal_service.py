@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Resumo Fiscal
+Totais de notas fiscais agregados no banco e resumo mensal materializado
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import event, select, insert, delete, func, literal
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class ResumoFiscalService:
+    """
+    Serviço do resumo mensal de notas fiscais
+
+    A tabela resumo_fiscal_mensal guarda, por mês de emissão, quantidade e
+    valores agrupados por modelo, status e cancelamento. Escritas via ORM
+    em NotaFiscal que mudam algum desses campos (ou a data de emissão)
+    recalculam, no mesmo flush, os meses afetados. Alterações fora do ORM
+    exigem ``reconstruir``.
+
+    A tabela não tem chave única por grupo: no PostgreSQL o recálculo de
+    cada mês é serializado por um advisory lock da transação, senão duas
+    transações concorrentes no mesmo mês inseririam cada uma os seus
+    agregados (contagem em dobro). Os meses são travados em ordem.
+    """
+
+    CHAVE_SESSAO = 'resumo_fiscal_meses'
+    # Primeira parte da chave dos advisory locks (a segunda é AAAAMM)
+    TRAVA_MES = 7316
+    ATRIBUTOS = ('data_emissao', 'modelo', 'status', 'cancelada', 'valor_total', 'valor_icms')
+
+    # ==================== EVENTOS ====================
+
+    @classmethod
+    def registrar_eventos(cls):
+        """Registra os listeners de sessão (idempotente)"""
+        from app.models.fiscal import NotaFiscal
+
+        if not event.contains(Session, 'after_flush', cls._coletar_meses):
+            event.listen(Session, 'after_flush', cls._coletar_meses)
+            event.listen(Session, 'after_flush_postexec', cls._atualizar_resumo)
+            # Carregar a data anterior ao alterá-la, para recalcular o mês de origem
+            event.listen(NotaFiscal.data_emissao, 'set', cls._manter_historico, active_history=True)
+
+    @staticmethod
+    def _manter_historico(target, value, oldvalue, initiator):
+        """Listener vazio; existe apenas para ativar o histórico completo da data"""
+
+    @staticmethod
+    def mes_de(valor):
+        """Primeiro dia do mês de uma data/datetime"""
+        return date(valor.year, valor.month, 1)
+
+    @classmethod
+    def _coletar_meses(cls, session, flush_context):
+        """Coleta os meses afetados por notas inseridas, alteradas ou excluídas"""
+        from app.models.fiscal import NotaFiscal
+
+        meses = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, NotaFiscal):
+                continue
+            if obj in session.dirty and not any(get_history(obj, nome).has_changes() for nome in cls.ATRIBUTOS):
+                continue
+
+            historico = get_history(obj, 'data_emissao')
+            datas = set(historico.added or ()) | set(historico.unchanged or ()) | set(historico.deleted or ())
+            if not datas:
+                datas = {obj.data_emissao}
+            meses.update(cls.mes_de(data) for data in datas if data)
+
+        if meses:
+            session.info.setdefault(cls.CHAVE_SESSAO, set()).update(meses)
+
+    @classmethod
+    def _atualizar_resumo(cls, session, flush_context):
+        """Recalcula os meses afetados (mesma transação)"""
+        meses = session.info.pop(cls.CHAVE_SESSAO, None)
+        if meses:
+            cls.recalcular_meses(meses, session.connection())
+
+    # ==================== CÁLCULO ====================
+
+    @staticmethod
+    def _proximo_mes(mes):
+        return (mes + timedelta(days=32)).replace(day=1)
+
+    @classmethod
+    def _agrupamento(cls, de, ate):
+        """SELECT agrupado por modelo, status e cancelamento em [de, ate)"""
+        from app.models.fiscal import NotaFiscal
+
+        cancelada = func.coalesce(NotaFiscal.cancelada, False)
+        return (
+            select(
+                NotaFiscal.modelo,
+                NotaFiscal.status,
+                cancelada.label('cancelada'),
+                func.count(NotaFiscal.id).label('quantidade'),
+                func.coalesce(func.sum(NotaFiscal.valor_total), 0).label('valor_total'),
+                func.coalesce(func.sum(NotaFiscal.valor_icms), 0).label('valor_icms')
+            )
+            .where(NotaFiscal.data_emissao >= de, NotaFiscal.data_emissao < ate)
+            .group_by(NotaFiscal.modelo, NotaFiscal.status, cancelada)
+        )
+
+    @classmethod
+    def _travar_mes(cls, conexao, mes):
+        """Espera as outras transações que recalculam o mês (até o fim da transação atual)"""
+        if conexao.dialect.name == 'postgresql':
+            conexao.execute(select(func.pg_advisory_xact_lock(cls.TRAVA_MES, mes.year * 100 + mes.month)))
+
+    @classmethod
+    def recalcular_meses(cls, meses, conexao=None):
+        """
+        Recalcula o resumo dos meses informados (DELETE + INSERT ... SELECT, sem commit)
+
+        Args:
+            meses: Iterável de datas (qualquer dia do mês)
+            conexao: Conexão da transação atual (padrão: a da sessão)
+        """
+        from app.models.fiscal import ResumoFiscalMensal
+
+        conexao = conexao or db.session.connection()
+        for mes in sorted({cls.mes_de(mes) for mes in meses}):
+            de = datetime.combine(mes, time.min)
+            ate = datetime.combine(cls._proximo_mes(mes), time.min)
+            agrupado = cls._agrupamento(de, ate).subquery()
+
+            cls._travar_mes(conexao, mes)
+            conexao.execute(delete(ResumoFiscalMensal).where(ResumoFiscalMensal.mes == mes))
+            conexao.execute(
+                insert(ResumoFiscalMensal).from_select(
+                    ['mes', 'modelo', 'status', 'cancelada', 'quantidade', 'valor_total', 'valor_icms'],
+                    select(literal(mes, db.Date), *agrupado.c)
+                )
+            )
+
+    @classmethod
+    def reconstruir(cls):
+        """
+        Recalcula o resumo de todos os meses com notas
+
+        Returns:
+            int: Quantidade de meses recalculados
+        """
+        from app.models.fiscal import NotaFiscal, ResumoFiscalMensal
+
+        datas = db.session.execute(
+            select(func.min(NotaFiscal.data_emissao), func.max(NotaFiscal.data_emissao))
+        ).one()
+        db.session.execute(delete(ResumoFiscalMensal))
+
+        meses = []
+        if datas[0] is not None:
+            mes, ultimo = cls.mes_de(datas[0]), cls.mes_de(datas[1])
+            while mes <= ultimo:
+                meses.append(mes)
+                mes = cls._proximo_mes(mes)
+            cls.recalcular_meses(meses)
+        db.session.commit()
+
+        logger.info(f"Resumo fiscal reconstruído: {len(meses)} mês(es)")
+        return len(meses)
+
+    # ==================== CONSULTAS ====================
+
+    @classmethod
+    def agrupar_periodo(cls, inicio, fim):
+        """
+        Totais por modelo, status e cancelamento entre duas datas (inclusive)
+
+        Os meses inteiros do período vêm do resumo mensal; apenas as pontas
+        (meses parciais) são agregadas direto em nota_fiscal.
+
+        Returns:
+            list: [{'modelo', 'status', 'cancelada', 'quantidade', 'valor_total', 'valor_icms'}]
+        """
+        from app.models.fiscal import ResumoFiscalMensal
+
+        fim_exclusivo = fim + timedelta(days=1)
+        primeiro_mes = inicio if inicio.day == 1 else cls._proximo_mes(inicio)
+        ultimo_mes = cls.mes_de(fim_exclusivo)
+
+        consultas = []
+        if primeiro_mes < ultimo_mes:
+            consultas.append(
+                select(
+                    ResumoFiscalMensal.modelo,
+                    ResumoFiscalMensal.status,
+                    ResumoFiscalMensal.cancelada,
+                    ResumoFiscalMensal.quantidade,
+                    ResumoFiscalMensal.valor_total,
+                    ResumoFiscalMensal.valor_icms
+                ).where(ResumoFiscalMensal.mes >= primeiro_mes, ResumoFiscalMensal.mes < ultimo_mes)
+            )
+            pontas = [(inicio, primeiro_mes), (ultimo_mes, fim_exclusivo)]
+        else:
+            pontas = [(inicio, fim_exclusivo)]
+
+        for de, ate in pontas:
+            if de < ate:
+                consultas.append(cls._agrupamento(datetime.combine(de, time.min), datetime.combine(ate, time.min)))
+
+        grupos = {}
+        for consulta in consultas:
+            for modelo, status, cancelada, quantidade, valor_total, valor_icms in db.session.execute(consulta):
+                grupo = grupos.setdefault((modelo, status, bool(cancelada)), {
+                    'modelo': modelo, 'status': status, 'cancelada': bool(cancelada),
+                    'quantidade': 0, 'valor_total': 0.0, 'valor_icms': 0.0
+                })
+                grupo['quantidade'] += int(quantidade or 0)
+                grupo['valor_total'] += float(valor_total or 0)
+                grupo['valor_icms'] += float(valor_icms or 0)
+
+        return sorted(grupos.values(), key=lambda g: (g['modelo'] or '', g['status'] or '', g['cancelada']))
+
+    @staticmethod
+    def totalizar(grupos):
+        """
+        Totais do período a partir de ``agrupar_periodo``
+
+        Returns:
+            dict: total_notas, total_autorizadas e total_canceladas (quantidades),
+            valor_total e total_icms das autorizadas não canceladas
+        """
+        validas = [g for g in grupos if g['status'] == 'autorizada' and not g['cancelada']]
+        return {
+            'total_notas': sum(g['quantidade'] for g in grupos),
+            'total_autorizadas': sum(g['quantidade'] for g in validas),
+            'total_canceladas': sum(g['quantidade'] for g in grupos if g['cancelada']),
+            'valor_total': sum(g['valor_total'] for g in validas),
+            'total_icms': sum(g['valor_icms'] for g in validas),
+        }
+
+    @classmethod
+    def resumo_mes(cls, mes=None):
+        """
+        Indicadores do mês para o dashboard fiscal (lidos do resumo mensal)
+
+        Returns:
+            dict: total_notas, notas_autorizadas, notas_canceladas, valor_total_mes
+        """
+        from app.models.fiscal import ResumoFiscalMensal
+
+        mes = cls.mes_de(mes or date.today())
+        linhas = db.session.execute(
+            select(
+                ResumoFiscalMensal.status,
+                ResumoFiscalMensal.cancelada,
+                ResumoFiscalMensal.quantidade,
+                ResumoFiscalMensal.valor_total
+            ).where(ResumoFiscalMensal.mes == mes)
+        ).all()
+
+        return {
+            'total_notas': sum(quantidade for _, _, quantidade, _ in linhas),
+            'notas_autorizadas': sum(quantidade for status, _, quantidade, _ in linhas if status == 'autorizada'),
+            'notas_canceladas': sum(quantidade for _, cancelada, quantidade, _ in linhas if cancelada),
+            'valor_total_mes': sum(float(valor or 0) for status, _, _, valor in linhas if status == 'autorizada'),
+        }
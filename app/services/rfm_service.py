@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de RFM
+Cálculo em lote do score RFM (Recência, Frequência, Valor) dos clientes
+"""
+
+import time
+import logging
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select, insert, update, func, and_, or_, Table, Column, Integer, Float, DateTime, MetaData
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class RFMService:
+    """
+    Score RFM de todos os clientes em três passos
+
+    1. Uma consulta agregada traz, por cliente, a última compra, a
+       quantidade de pedidos e o valor total (pedidos cancelados e
+       devolvidos não contam).
+    2. Com NumPy, cada dimensão recebe nota de 1 a 5 pelo quintil em que o
+       cliente está entre os que já compraram (recência: quanto mais
+       recente, maior a nota). O score é a média inteira das três notas,
+       como em Cliente.calcular_rfm; quem nunca comprou fica com 0.
+    3. Os resultados vão para uma tabela temporária e um único
+       UPDATE ... FROM grava apenas os clientes cujo score ou métricas
+       mudaram.
+    """
+
+    STATUS_EXCLUIDOS = ('cancelado', 'devolvido')
+    QUANTIS = (0.2, 0.4, 0.6, 0.8)
+
+    # ==================== CÁLCULO ====================
+
+    @classmethod
+    def _metricas(cls):
+        """
+        Returns:
+            tuple: arrays (ids, ultima_compra, pedidos, valor); ultima_compra
+            é datetime64 (NaT para quem nunca comprou)
+        """
+        from app.models.crm import Cliente
+        from app.models.pedido import Pedido
+
+        linhas = db.session.execute(
+            select(
+                Cliente.id,
+                func.max(Pedido.data_criacao),
+                func.count(Pedido.id),
+                func.coalesce(func.sum(Pedido.total), 0)
+            )
+            .select_from(Cliente)
+            .outerjoin(Pedido, and_(
+                Pedido.usuario_id == Cliente.usuario_id,
+                Pedido.status.notin_(cls.STATUS_EXCLUIDOS)
+            ))
+            .group_by(Cliente.id)
+            .order_by(Cliente.id)
+        ).all()
+
+        total = len(linhas)
+        ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=total)
+        ultima = np.array([linha[1] for linha in linhas], dtype='datetime64[s]')
+        pedidos = np.fromiter((linha[2] for linha in linhas), dtype=np.int64, count=total)
+        valor = np.fromiter((linha[3] or 0 for linha in linhas), dtype=np.float64, count=total)
+        return ids, ultima, pedidos, valor
+
+    @classmethod
+    def _notas(cls, valores, maior_melhor=True):
+        """Nota de 1 a 5 pelo quintil (cortes calculados sobre ``valores``)"""
+        if valores.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        cortes = np.quantile(valores, cls.QUANTIS)
+        if maior_melhor:
+            return 1 + np.searchsorted(cortes, valores, side='right')
+        return 5 - np.searchsorted(cortes, valores, side='left')
+
+    @classmethod
+    def pontuar(cls, ultima, pedidos, valor, agora=None):
+        """
+        Calcula os scores RFM (vetorizado)
+
+        Args:
+            ultima: datetime64 da última compra (NaT = nunca comprou)
+            pedidos: Quantidade de pedidos
+            valor: Valor total comprado
+            agora: Referência da recência (padrão: agora, UTC)
+
+        Returns:
+            np.ndarray: Scores de 0 a 5
+        """
+        agora = np.datetime64(agora or datetime.utcnow(), 's')
+        compraram = pedidos > 0
+        scores = np.zeros(pedidos.shape, dtype=np.int64)
+        if not compraram.any():
+            return scores
+
+        dias = (agora - ultima[compraram]).astype('timedelta64[s]').astype(np.float64) / 86400
+        recencia = cls._notas(dias, maior_melhor=False)
+        frequencia = cls._notas(pedidos[compraram].astype(np.float64))
+        monetario = cls._notas(valor[compraram])
+        scores[compraram] = (recencia + frequencia + monetario) // 3
+        return scores
+
+    # ==================== GRAVAÇÃO ====================
+
+    @staticmethod
+    def _tabela_temporaria():
+        return Table(
+            'tmp_rfm_clientes', MetaData(),
+            Column('id', Integer, primary_key=True),
+            Column('score_rfm', Integer),
+            Column('total_compras', Float),
+            Column('quantidade_pedidos', Integer),
+            Column('ticket_medio', Float),
+            Column('ultima_compra', DateTime),
+            prefixes=['TEMPORARY']
+        )
+
+    @classmethod
+    def _gravar(cls, linhas, lote=10000):
+        """
+        Grava os resultados com um único UPDATE ... FROM
+
+        Returns:
+            int: Clientes atualizados
+        """
+        from app.models.crm import Cliente
+
+        temporaria = cls._tabela_temporaria()
+        conexao = db.session.connection()
+        temporaria.drop(conexao, checkfirst=True)
+        temporaria.create(conexao)
+        try:
+            for inicio in range(0, len(linhas), lote):
+                db.session.execute(insert(temporaria), linhas[inicio:inicio + lote])
+
+            clientes = Cliente.__table__
+            colunas = ['score_rfm', 'total_compras', 'quantidade_pedidos', 'ticket_medio', 'ultima_compra']
+            resultado = db.session.execute(
+                update(clientes)
+                .where(clientes.c.id == temporaria.c.id)
+                .where(or_(*[clientes.c[coluna].is_distinct_from(temporaria.c[coluna]) for coluna in colunas]))
+                .values(
+                    **{coluna: temporaria.c[coluna] for coluna in colunas},
+                    data_atualizacao=clientes.c.data_atualizacao
+                )
+            )
+            return resultado.rowcount
+        finally:
+            temporaria.drop(conexao)
+
+    # ==================== EXECUÇÃO ====================
+
+    @classmethod
+    def recalcular(cls, agora=None):
+        """
+        Recalcula e grava o RFM de todos os clientes (worker)
+
+        Returns:
+            dict: clientes, atualizados e tempos de cada etapa (segundos)
+        """
+        inicio = time.perf_counter()
+        ids, ultima, pedidos, valor = cls._metricas()
+        fim_consulta = time.perf_counter()
+
+        scores = cls.pontuar(ultima, pedidos, valor, agora)
+        ticket = np.divide(valor, pedidos, out=np.zeros_like(valor), where=pedidos > 0)
+        ultima_compra = ultima.astype(object)
+        linhas = [
+            {
+                'id': int(cliente_id),
+                'score_rfm': int(score),
+                'total_compras': float(total),
+                'quantidade_pedidos': int(quantidade),
+                'ticket_medio': round(float(medio), 2),
+                'ultima_compra': data,
+            }
+            for cliente_id, score, total, quantidade, medio, data
+            in zip(ids, scores, valor, pedidos, ticket, ultima_compra)
+        ]
+        fim_calculo = time.perf_counter()
+
+        atualizados = cls._gravar(linhas) if linhas else 0
+        db.session.commit()
+        fim = time.perf_counter()
+
+        metricas = {
+            'clientes': len(linhas),
+            'atualizados': atualizados,
+            'tempo_consulta': round(fim_consulta - inicio, 3),
+            'tempo_calculo': round(fim_calculo - fim_consulta, 3),
+            'tempo_gravacao': round(fim - fim_calculo, 3),
+            'tempo_total': round(fim - inicio, 3),
+        }
+        logger.info(f"RFM recalculado: {metricas}")
+        return metricas
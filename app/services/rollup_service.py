@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Rollup de Vendas
+Atualização incremental dos agregados diários e consultas do dashboard
+"""
+
+import logging
+from datetime import datetime, date, time, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, delete, func, true
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class RollupVendasService:
+    """
+    Serviço dos rollups diários de vendas
+
+    O worker lê a marca d'água (última execução) e procura pedidos com
+    data_atualizacao posterior a ela; cada dia de criação afetado é
+    recalculado por inteiro (DELETE + INSERT ... SELECT), o que torna a
+    atualização idempotente. A janela é recuada em ROLLUP_ATRASO_SEGUNDOS
+    para cobrir transações que gravaram antes da marca e comitaram depois.
+    Pedidos não são excluídos pelo sistema; exclusões feitas direto no
+    banco exigem a reconstrução completa.
+    """
+
+    NOME = 'vendas'
+
+    # ==================== ATUALIZAÇÃO ====================
+
+    @staticmethod
+    def _dia_criacao():
+        from app.models.pedido import Pedido
+        return func.date(Pedido.data_criacao, type_=db.Date)
+
+    @staticmethod
+    def _faixas_continuas(dias):
+        """Agrupa dias em faixas contínuas [(inicio, fim)]"""
+        faixas = []
+        for dia in sorted(set(dias)):
+            if faixas and dia - faixas[-1][1] <= timedelta(days=1):
+                faixas[-1][1] = dia
+            else:
+                faixas.append([dia, dia])
+        return [tuple(faixa) for faixa in faixas]
+
+    @classmethod
+    def recalcular_dias(cls, dias):
+        """
+        Recalcula os rollups dos dias informados (sem commit)
+
+        Args:
+            dias: Iterável de datas (data de criação dos pedidos)
+
+        Returns:
+            int: Quantidade de dias recalculados
+        """
+        from app.models.pedido import Pedido, ItemPedido
+        from app.models.produto import Produto
+        from app.models.rollup import VendaDiaria, PedidoDiario
+
+        dias = [dia if isinstance(dia, date) else date.fromisoformat(str(dia)) for dia in dias if dia]
+        dia_criacao = cls._dia_criacao()
+
+        for inicio, fim in cls._faixas_continuas(dias):
+            de = datetime.combine(inicio, time.min)
+            ate = datetime.combine(fim + timedelta(days=1), time.min)
+            periodo = (Pedido.data_criacao >= de, Pedido.data_criacao < ate)
+
+            db.session.execute(delete(VendaDiaria).where(VendaDiaria.dia.between(inicio, fim)))
+            db.session.execute(delete(PedidoDiario).where(PedidoDiario.dia.between(inicio, fim)))
+
+            db.session.execute(
+                insert(VendaDiaria).from_select(
+                    ['dia', 'produto_id', 'categoria_id', 'status', 'itens', 'quantidade', 'valor'],
+                    select(
+                        dia_criacao,
+                        ItemPedido.produto_id,
+                        Produto.categoria_id,
+                        Pedido.status,
+                        func.count(ItemPedido.id),
+                        func.coalesce(func.sum(ItemPedido.quantidade), 0),
+                        func.coalesce(func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario), 0)
+                    )
+                    .select_from(ItemPedido)
+                    .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+                    .outerjoin(Produto, Produto.id == ItemPedido.produto_id)
+                    .where(*periodo)
+                    .group_by(dia_criacao, ItemPedido.produto_id, Produto.categoria_id, Pedido.status)
+                )
+            )
+            db.session.execute(
+                insert(PedidoDiario).from_select(
+                    ['dia', 'status', 'pedidos', 'total'],
+                    select(
+                        dia_criacao,
+                        Pedido.status,
+                        func.count(Pedido.id),
+                        func.coalesce(func.sum(Pedido.total), 0)
+                    )
+                    .where(*periodo)
+                    .group_by(dia_criacao, Pedido.status)
+                )
+            )
+
+        return len(set(dias))
+
+    @classmethod
+    def _estado(cls):
+        from app.models.rollup import EstadoRollup
+
+        estado = EstadoRollup.query.filter_by(nome=cls.NOME).first()
+        if estado is None:
+            estado = EstadoRollup(nome=cls.NOME)
+            db.session.add(estado)
+        return estado
+
+    @classmethod
+    def atualizar(cls):
+        """
+        Atualização incremental a partir da marca d'água (worker)
+
+        Returns:
+            int: Quantidade de dias recalculados
+        """
+        from app.models.pedido import Pedido
+
+        estado = cls._estado()
+        if estado.marca is None:
+            return cls.reconstruir()
+
+        inicio_execucao = datetime.utcnow()
+        desde = estado.marca - timedelta(seconds=current_app.config.get('ROLLUP_ATRASO_SEGUNDOS', 120))
+
+        dias = db.session.execute(
+            select(cls._dia_criacao()).where(Pedido.data_atualizacao > desde).distinct()
+        ).scalars().all()
+
+        recalculados = cls.recalcular_dias(dias) if dias else 0
+        estado.marca = inicio_execucao
+        estado.data_execucao = inicio_execucao
+        estado.dias_recalculados = recalculados
+        db.session.commit()
+        return recalculados
+
+    @classmethod
+    def reconstruir(cls, inicio=None, fim=None, dias_por_lote=31):
+        """
+        Reconstrução completa (ou de um período), em lotes com commit
+
+        Args:
+            inicio / fim: Datas limite (padrão: todo o histórico)
+            dias_por_lote: Dias recalculados por transação
+
+        Returns:
+            int: Quantidade de dias recalculados
+        """
+        from app.models.pedido import Pedido
+        from app.models.rollup import VendaDiaria, PedidoDiario
+
+        completo = inicio is None and fim is None
+        inicio_execucao = datetime.utcnow()
+        primeiro, ultimo = db.session.execute(
+            select(func.min(Pedido.data_criacao), func.max(Pedido.data_criacao))
+        ).one()
+
+        if completo:
+            # Dias fora do histórico atual (pedidos removidos direto no banco)
+            for modelo in (VendaDiaria, PedidoDiario):
+                condicao = true() if primeiro is None else (
+                    (modelo.dia < primeiro.date()) | (modelo.dia > ultimo.date())
+                )
+                db.session.execute(delete(modelo).where(condicao))
+
+        total = 0
+        if primeiro is not None:
+            inicio = inicio or primeiro.date()
+            fim = fim or ultimo.date()
+            dia = inicio
+            while dia <= fim:
+                lote_fim = min(dia + timedelta(days=dias_por_lote - 1), fim)
+                total += cls.recalcular_dias(
+                    [dia + timedelta(days=i) for i in range((lote_fim - dia).days + 1)]
+                )
+                db.session.commit()
+                dia = lote_fim + timedelta(days=1)
+
+        estado = cls._estado()
+        if completo or estado.marca is None:
+            estado.marca = inicio_execucao
+        estado.data_execucao = inicio_execucao
+        estado.dias_recalculados = total
+        db.session.commit()
+
+        logger.info(f"Rollup de vendas reconstruído: {total} dia(s)")
+        return total
+
+    # ==================== CONSULTAS ====================
+
+    @staticmethod
+    def _filtros(modelo, inicio=None, fim=None, status=None):
+        filtros = []
+        if inicio:
+            filtros.append(modelo.dia >= inicio)
+        if fim:
+            filtros.append(modelo.dia <= fim)
+        if status:
+            filtros.append(modelo.status.in_(status))
+        return filtros
+
+    @classmethod
+    def pedidos_por_dia(cls, inicio=None, fim=None, status=None):
+        """
+        Returns:
+            list: [(dia, pedidos, total)] em ordem cronológica
+        """
+        from app.models.rollup import PedidoDiario
+
+        linhas = db.session.execute(
+            select(PedidoDiario.dia, func.sum(PedidoDiario.pedidos), func.sum(PedidoDiario.total))
+            .where(*cls._filtros(PedidoDiario, inicio, fim, status))
+            .group_by(PedidoDiario.dia)
+            .order_by(PedidoDiario.dia)
+        ).all()
+        return [(dia, int(pedidos or 0), float(total or 0)) for dia, pedidos, total in linhas]
+
+    @classmethod
+    def pedidos_por_status(cls, inicio=None, fim=None):
+        """
+        Returns:
+            list: [(status, pedidos, total)]
+        """
+        from app.models.rollup import PedidoDiario
+
+        linhas = db.session.execute(
+            select(PedidoDiario.status, func.sum(PedidoDiario.pedidos), func.sum(PedidoDiario.total))
+            .where(*cls._filtros(PedidoDiario, inicio, fim))
+            .group_by(PedidoDiario.status)
+        ).all()
+        return [(status, int(pedidos or 0), float(total or 0)) for status, pedidos, total in linhas]
+
+    @classmethod
+    def produtos_mais_vendidos(cls, inicio=None, fim=None, status=None, limite=10):
+        """
+        Returns:
+            list: [(nome, quantidade, valor)] ordenado pela quantidade
+        """
+        from app.models.rollup import VendaDiaria
+        from app.models.produto import Produto
+
+        quantidade = func.sum(VendaDiaria.quantidade)
+        ranking = (
+            select(VendaDiaria.produto_id, quantidade.label('quantidade'), func.sum(VendaDiaria.valor).label('valor'))
+            .where(*cls._filtros(VendaDiaria, inicio, fim, status))
+            .group_by(VendaDiaria.produto_id)
+            .order_by(quantidade.desc())
+            .limit(limite)
+            .subquery()
+        )
+        linhas = db.session.execute(
+            select(Produto.nome, ranking.c.quantidade, ranking.c.valor)
+            .join(Produto, Produto.id == ranking.c.produto_id)
+            .order_by(ranking.c.quantidade.desc())
+        ).all()
+        return [(nome, int(qtd or 0), float(valor or 0)) for nome, qtd, valor in linhas]
+
+    @classmethod
+    def vendas_por_categoria(cls, inicio=None, fim=None, status=None):
+        """
+        Returns:
+            list: [(nome, itens, valor)] ordenado pelo valor
+        """
+        from app.models.rollup import VendaDiaria
+        from app.models.categoria import Categoria
+
+        valor = func.sum(VendaDiaria.valor)
+        linhas = db.session.execute(
+            select(Categoria.nome, func.sum(VendaDiaria.itens), valor)
+            .join(Categoria, Categoria.id == VendaDiaria.categoria_id)
+            .where(*cls._filtros(VendaDiaria, inicio, fim, status))
+            .group_by(Categoria.id, Categoria.nome)
+            .order_by(valor.desc())
+        ).all()
+        return [(nome, int(itens or 0), float(total or 0)) for nome, itens, total in linhas]
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Monitoramento da SEFAZ
+Consulta periódica do status do serviço e histórico de disponibilidade
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class SefazMonitorService:
+    """
+    Disponibilidade da SEFAZ por UF e ambiente
+
+    O worker consulta o status do serviço (consStatServ) de cada UF/ambiente
+    configurado e grava online, cStat, mensagem e latência em status_sefaz.
+    Telas e emissão leem apenas o último registro, sem acessar a SEFAZ.
+    Registros mais antigos que SEFAZ_MONITOR_VALIDADE são tratados como
+    status desconhecido: a emissão segue e a própria transmissão decide.
+    """
+
+    # ==================== CONSULTA ====================
+
+    @staticmethod
+    def alvos():
+        """
+        UFs/ambientes a monitorar (um por empresa configurada)
+
+        Returns:
+            list: [ConfiguracaoEmpresa] com pares (uf, ambiente_nfe) distintos
+        """
+        from app.models.fiscal import ConfiguracaoEmpresa
+
+        empresas = {}
+        for empresa in ConfiguracaoEmpresa.query.order_by(ConfiguracaoEmpresa.id).all():
+            empresas.setdefault((empresa.uf, empresa.ambiente_nfe or 2), empresa)
+        return list(empresas.values())
+
+    @classmethod
+    def registrar(cls, uf, ambiente, resultado, latencia_ms=None):
+        """
+        Grava o resultado de uma consulta de status (sem commit)
+
+        Args:
+            resultado: Retorno de NFeService.consultar_status_servico
+            latencia_ms: Tempo de resposta da SEFAZ
+
+        Returns:
+            StatusSefaz: Registro criado
+        """
+        from app.models.fiscal import StatusSefaz
+
+        status = StatusSefaz(
+            uf=uf,
+            ambiente=ambiente,
+            online=bool(resultado.get('online')),
+            codigo=(resultado.get('codigo') or '')[:3] or None,
+            mensagem=(resultado.get('mensagem') or '')[:500] or None,
+            latencia_ms=latencia_ms,
+            data_consulta=datetime.utcnow()
+        )
+        db.session.add(status)
+        return status
+
+    @classmethod
+    def verificar(cls, empresa, cert_service):
+        """
+        Consulta o status da SEFAZ da empresa e grava no histórico (sem commit)
+
+        Returns:
+            StatusSefaz: Registro criado
+        """
+        from app.services.nfe_service import NFeService
+
+        nfe_service = NFeService(empresa, cert_service)
+        inicio = time.perf_counter()
+        resultado = nfe_service.consultar_status_servico()
+        latencia_ms = int((time.perf_counter() - inicio) * 1000)
+
+        return cls.registrar(nfe_service.uf, nfe_service.ambiente, resultado, latencia_ms)
+
+    @classmethod
+    def verificar_todos(cls):
+        """
+        Consulta todas as UFs/ambientes configurados e remove o histórico antigo (worker)
+
+        Returns:
+            list: StatusSefaz registrados
+        """
+        from app.services.certificado_service import CertificadoService
+
+        registros = []
+        for empresa in cls.alvos():
+            cert_service = CertificadoService.carregar_padrao(empresa)
+            if not cert_service:
+                logger.warning(f"Monitor SEFAZ {empresa.uf}: nenhum certificado A1 válido configurado")
+                continue
+            registros.append(cls.verificar(empresa, cert_service))
+
+        cls.limpar_historico()
+        db.session.commit()
+
+        for status in registros:
+            logger.info(
+                f"SEFAZ {status.uf}/{status.ambiente}: {'online' if status.online else 'offline'} "
+                f"({status.codigo}) em {status.latencia_ms}ms"
+            )
+        return registros
+
+    @staticmethod
+    def limpar_historico():
+        """Remove registros mais antigos que SEFAZ_MONITOR_HISTORICO_DIAS (sem commit)"""
+        from app.models.fiscal import StatusSefaz
+
+        dias = current_app.config.get('SEFAZ_MONITOR_HISTORICO_DIAS', 30)
+        limite = datetime.utcnow() - timedelta(days=dias)
+        return db.session.execute(
+            delete(StatusSefaz).where(StatusSefaz.data_consulta < limite)
+        ).rowcount
+
+    # ==================== LEITURA ====================
+
+    @staticmethod
+    def ultimo_status(uf, ambiente):
+        """
+        Último status registrado da UF/ambiente
+
+        Returns:
+            dict: online, codigo, mensagem, latencia_ms, data_consulta e
+            desatualizado (mais antigo que SEFAZ_MONITOR_VALIDADE); None se
+            nunca consultado
+        """
+        from app.models.fiscal import StatusSefaz
+
+        status = db.session.execute(
+            select(StatusSefaz)
+            .where(StatusSefaz.uf == uf, StatusSefaz.ambiente == ambiente)
+            .order_by(StatusSefaz.data_consulta.desc())
+            .limit(1)
+        ).scalar()
+        if status is None:
+            return None
+
+        validade = current_app.config.get('SEFAZ_MONITOR_VALIDADE', 300)
+        return {
+            'online': status.online,
+            'codigo': status.codigo,
+            'mensagem': status.mensagem,
+            'latencia_ms': status.latencia_ms,
+            'data_consulta': status.data_consulta,
+            'desatualizado': status.data_consulta < datetime.utcnow() - timedelta(seconds=validade),
+        }
+
+    @classmethod
+    def disponivel(cls, uf, ambiente):
+        """
+        Verifica, sem acessar a SEFAZ, se vale tentar uma transmissão
+
+        Returns:
+            tuple: (disponivel, status) — indisponível apenas quando o último
+            status recente registrado é offline
+        """
+        status = cls.ultimo_status(uf, ambiente)
+        if status is None or status['desatualizado']:
+            return True, status
+        return status['online'], status
+
+    @staticmethod
+    def historico(uf, ambiente, horas=24):
+        """
+        Histórico de consultas da UF/ambiente nas últimas horas
+
+        Returns:
+            list: StatusSefaz em ordem cronológica
+        """
+        from app.models.fiscal import StatusSefaz
+
+        return db.session.execute(
+            select(StatusSefaz)
+            .where(
+                StatusSefaz.uf == uf,
+                StatusSefaz.ambiente == ambiente,
+                StatusSefaz.data_consulta >= datetime.utcnow() - timedelta(hours=horas)
+            )
+            .order_by(StatusSefaz.data_consulta)
+        ).scalars().all()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Transporte SEFAZ
+Sessões HTTPS com certificado cliente reaproveitadas entre chamadas
+"""
+
+import os
+import ssl
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+import certifi
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError, NameResolutionError
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+
+class _AdaptadorTLS(HTTPAdapter):
+    """HTTPAdapter que usa um SSLContext próprio (com o certificado cliente já carregado)"""
+
+    def __init__(self, contexto, **kwargs):
+        self._contexto = contexto
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._contexto
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._contexto
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+class SefazTransporteService:
+    """
+    Envio de envelopes SOAP aos web services da SEFAZ
+
+    Mantém, por processo, uma requests.Session por certificado e host, com
+    keep-alive: o handshake TCP+TLS acontece uma vez e as chamadas seguintes
+    reaproveitam a conexão. A chave privada é carregada no SSLContext a
+    partir da memória (memfd no Linux; nos demais sistemas, um arquivo
+    temporário removido logo após a leitura).
+
+    Falhas transitórias são repetidas com backoff exponencial. Serviços que
+    alteram estado na SEFAZ (autorização, eventos, inutilização) só são
+    repetidos quando a conexão nem chegou a ser aberta; consultas também
+    em timeout de leitura e HTTP 5xx.
+    """
+
+    SERVICOS_IDEMPOTENTES = {'status', 'consulta', 'retorno'}
+    CODIGOS_TRANSITORIOS = {500, 502, 503, 504}
+
+    _sessoes = {}
+    _trava = threading.Lock()
+
+    def __init__(self, certificado_service):
+        """
+        Args:
+            certificado_service: CertificadoService com certificado A1 carregado
+        """
+        self.cert_pem = certificado_service.obter_certificado_pem()
+        self.key_pem = certificado_service.obter_chave_pem()
+        if not self.cert_pem or not self.key_pem:
+            raise Exception("Certificado não carregado")
+        self.impressao = hashlib.sha256(self.cert_pem + self.key_pem).hexdigest()
+
+    # ==================== CONFIGURAÇÃO ====================
+
+    @staticmethod
+    def _config(nome, padrao):
+        if has_app_context():
+            return current_app.config.get(nome, padrao)
+        return padrao
+
+    @classmethod
+    def resolver_url(cls, url):
+        """
+        Aplica SEFAZ_WS_URL_BASE (ex: stub local) mantendo o caminho do serviço
+
+        Returns:
+            str: URL a ser chamada
+        """
+        base = cls._config('SEFAZ_WS_URL_BASE', None)
+        if not base:
+            return url
+        destino, original = urlsplit(base), urlsplit(url)
+        return urlunsplit((destino.scheme, destino.netloc, original.path, original.query, ''))
+
+    @classmethod
+    def _verificar_servidor(cls):
+        """Caminho do bundle de CAs ou False (SEFAZ_VERIFICAR_SSL=False, apenas testes)"""
+        if not cls._config('SEFAZ_VERIFICAR_SSL', True):
+            return False
+        return cls._config('SEFAZ_CA_BUNDLE', None) or certifi.where()
+
+    # ==================== SESSÕES ====================
+
+    def _carregar_chave(self, contexto):
+        """Carrega certificado e chave no contexto sem deixá-los em disco"""
+        conteudo = self.cert_pem + b'\n' + self.key_pem
+        if hasattr(os, 'memfd_create'):
+            descritor = os.memfd_create('sefaz-cert', getattr(os, 'MFD_CLOEXEC', 0))
+            try:
+                os.write(descritor, conteudo)
+                contexto.load_cert_chain(f'/proc/self/fd/{descritor}')
+                return
+            except (OSError, ssl.SSLError):
+                pass
+            finally:
+                os.close(descritor)
+
+        descritor, caminho = tempfile.mkstemp(suffix='.pem')
+        try:
+            os.write(descritor, conteudo)
+            os.close(descritor)
+            contexto.load_cert_chain(caminho)
+        finally:
+            os.unlink(caminho)
+
+    def _criar_sessao(self):
+        verificar = self._verificar_servidor()
+        contexto = ssl.create_default_context(cafile=verificar or None)
+        if not verificar:
+            contexto.check_hostname = False
+            contexto.verify_mode = ssl.CERT_NONE
+        self._carregar_chave(contexto)
+
+        sessao = requests.Session()
+        sessao.verify = bool(verificar)
+        sessao.mount('https://', _AdaptadorTLS(
+            contexto,
+            pool_maxsize=self._config('SEFAZ_POOL_CONEXOES', 4),
+            max_retries=0
+        ))
+        return sessao
+
+    def sessao(self, url):
+        """requests.Session do certificado para o host da URL (criada na primeira chamada)"""
+        chave = (self.impressao, urlsplit(url).netloc)
+        with self._trava:
+            sessao = self._sessoes.get(chave)
+            if sessao is None:
+                sessao = self._sessoes[chave] = self._criar_sessao()
+        return sessao
+
+    @classmethod
+    def fechar_sessoes(cls):
+        """Fecha todas as sessões (ex: troca de certificado ou fim do worker)"""
+        with cls._trava:
+            sessoes = list(cls._sessoes.values())
+            cls._sessoes.clear()
+        for sessao in sessoes:
+            sessao.close()
+
+    # ==================== ENVIO ====================
+
+    @staticmethod
+    def _falha_de_conexao(erro):
+        """True quando a requisição certamente não chegou à SEFAZ"""
+        if isinstance(erro, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(erro, requests.exceptions.ConnectionError):
+            motivo = getattr(erro.args[0], 'reason', None) if erro.args else None
+            return isinstance(motivo, (NewConnectionError, ConnectTimeoutError, NameResolutionError))
+        return False
+
+    def enviar(self, servico, url, envelope, soap_action, timeout=30):
+        """
+        POST de um envelope SOAP 1.2
+
+        Args:
+            servico: Chave do serviço em NFeService.WS_URLS (define a política de repetição)
+            url: URL do web service
+            envelope: Envelope SOAP (str)
+            soap_action: Ação SOAP
+            timeout: Timeout de leitura (segundos)
+
+        Returns:
+            requests.Response: com ``tentativas`` e ``tempo_ms`` (total, incluindo esperas)
+        """
+        url = self.resolver_url(url)
+        dados = envelope.encode('utf-8')
+        headers = {
+            'Content-Type': 'application/soap+xml; charset=utf-8',
+            'SOAPAction': soap_action
+        }
+        tentativas = max(1, self._config('SEFAZ_TENTATIVAS', 3))
+        backoff = self._config('SEFAZ_BACKOFF_SEGUNDOS', 0.5)
+        conexao_timeout = self._config('SEFAZ_TIMEOUT_CONEXAO', 10)
+        idempotente = servico in self.SERVICOS_IDEMPOTENTES
+
+        inicio = time.perf_counter()
+        for tentativa in range(1, tentativas + 1):
+            chamada = time.perf_counter()
+            try:
+                response = self.sessao(url).post(
+                    url, data=dados, headers=headers, timeout=(conexao_timeout, timeout)
+                )
+            except requests.exceptions.RequestException as e:
+                repetir = self._falha_de_conexao(e) or (
+                    idempotente and isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+                )
+                logger.warning(
+                    f"SEFAZ {servico}: falha na tentativa {tentativa}/{tentativas} "
+                    f"após {(time.perf_counter() - chamada) * 1000:.0f}ms: {e}"
+                )
+                if not repetir or tentativa == tentativas:
+                    raise
+            else:
+                if idempotente and response.status_code in self.CODIGOS_TRANSITORIOS and tentativa < tentativas:
+                    logger.warning(f"SEFAZ {servico}: HTTP {response.status_code} na tentativa {tentativa}/{tentativas}")
+                else:
+                    response.tentativas = tentativa
+                    response.tempo_ms = int((time.perf_counter() - inicio) * 1000)
+                    logger.info(
+                        f"SEFAZ {servico} {urlsplit(url).netloc}: HTTP {response.status_code} "
+                        f"em {response.tempo_ms}ms ({tentativa} tentativa(s))"
+                    )
+                    return response
+            time.sleep(backoff * (2 ** (tentativa - 1)))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Sitemap
+Geração em streaming do sitemap index e dos arquivos de produtos
+"""
+
+import hashlib
+from datetime import datetime
+from xml.sax.saxutils import escape
+from flask import current_app
+from sqlalchemy import select, func
+
+from app import db
+from app.services.cache_service import CacheService
+
+
+class SitemapService:
+    """
+    Serviço de sitemap dividido em arquivos (protocolo sitemaps.org)
+
+    Os produtos são distribuídos em arquivos por faixa de ID
+    (``id - 1 // URLS_POR_ARQUIVO``), de modo que cada arquivo tem no
+    máximo o limite do protocolo e só muda quando um produto da sua faixa
+    muda. Um único GROUP BY fornece quantidade e última alteração de cada
+    arquivo, usados no índice e no ETag/Last-Modified.
+    """
+
+    XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+    XMLNS_IMAGE = 'http://www.google.com/schemas/sitemap-image/1.1'
+    LOTE = 1000
+
+    PAGINAS_ESTATICAS = [
+        {'loc': '/', 'priority': '1.0', 'changefreq': 'daily'},
+        {'loc': '/loja', 'priority': '0.9', 'changefreq': 'daily'},
+        {'loc': '/sobre', 'priority': '0.7', 'changefreq': 'monthly'},
+        {'loc': '/contato', 'priority': '0.8', 'changefreq': 'monthly'},
+    ]
+
+    @staticmethod
+    def urls_por_arquivo():
+        return max(1, min(current_app.config.get('SITEMAP_URLS_POR_ARQUIVO', 50000), 50000))
+
+    # ==================== METADADOS ====================
+
+    @classmethod
+    def arquivos_produtos(cls):
+        """
+        Arquivos de produtos existentes (cacheado até a próxima alteração)
+
+        Returns:
+            dict: {numero (1..n): {'total': int, 'ultima_alteracao': datetime|None}}
+        """
+        tamanho = cls.urls_por_arquivo()
+
+        def consultar():
+            from app.models.produto import Produto
+
+            arquivo = ((Produto.id - 1) // tamanho).label('arquivo')
+            linhas = db.session.execute(
+                select(arquivo, func.count(Produto.id), func.max(Produto.data_atualizacao))
+                .where(Produto.ativo == True)
+                .group_by(arquivo)
+            ).all()
+            return {
+                int(indice) + 1: {'total': total, 'ultima_alteracao': ultima}
+                for indice, total, ultima in linhas
+            }
+
+        return CacheService.obter_dados(f'sitemap_arquivos:{tamanho}', ['produtos'], consultar)
+
+    @staticmethod
+    def etag(*partes):
+        """ETag forte a partir das partes que determinam o conteúdo"""
+        return hashlib.sha1('|'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+    # ==================== GERAÇÃO ====================
+
+    @classmethod
+    def gerar_indice(cls, base_url, arquivos):
+        """Gera o sitemap index (paginas + um arquivo por faixa de produtos)"""
+        yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{cls.XMLNS}">\n'
+        yield f'  <sitemap>\n    <loc>{escape(base_url)}/sitemap-paginas.xml</loc>\n  </sitemap>\n'
+        for numero in sorted(arquivos):
+            ultima = arquivos[numero]['ultima_alteracao']
+            lastmod = f'\n    <lastmod>{ultima.strftime("%Y-%m-%d")}</lastmod>' if ultima else ''
+            yield (
+                f'  <sitemap>\n    <loc>{escape(base_url)}/sitemap-produtos-{numero}.xml</loc>{lastmod}\n'
+                f'  </sitemap>\n'
+            )
+        yield '</sitemapindex>\n'
+
+    @classmethod
+    def gerar_paginas(cls, base_url):
+        """Gera o arquivo de páginas institucionais e categorias"""
+        from app.models.categoria import Categoria
+
+        yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{cls.XMLNS}">\n'
+        for pagina in cls.PAGINAS_ESTATICAS:
+            yield (
+                f'  <url>\n    <loc>{escape(base_url + pagina["loc"])}</loc>\n'
+                f'    <changefreq>{pagina["changefreq"]}</changefreq>\n'
+                f'    <priority>{pagina["priority"]}</priority>\n  </url>\n'
+            )
+
+        categorias = db.session.execute(select(Categoria.id).order_by(Categoria.id)).scalars()
+        for categoria_id in categorias:
+            yield (
+                f'  <url>\n    <loc>{escape(base_url)}/loja?categoria={categoria_id}</loc>\n'
+                f'    <changefreq>weekly</changefreq>\n    <priority>0.8</priority>\n  </url>\n'
+            )
+        yield '</urlset>\n'
+
+    @classmethod
+    def gerar_produtos(cls, base_url, numero):
+        """
+        Gera o arquivo de produtos ``numero`` lendo o banco em lotes
+        (yield_per) e apenas com as colunas usadas, sem carregar os
+        produtos na memória
+        """
+        from app.models.produto import Produto
+
+        tamanho = cls.urls_por_arquivo()
+        inicio = (numero - 1) * tamanho + 1
+        fim = numero * tamanho
+
+        linhas = db.session.execute(
+            select(
+                Produto.id, Produto.nome, Produto.descricao_curta,
+                Produto.imagem_url, Produto.data_atualizacao
+            )
+            .where(Produto.ativo == True, Produto.id.between(inicio, fim))
+            .order_by(Produto.id)
+            .execution_options(yield_per=cls.LOTE)
+        )
+
+        yield (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<urlset xmlns="{cls.XMLNS}" xmlns:image="{cls.XMLNS_IMAGE}">\n'
+        )
+        hoje = datetime.utcnow().strftime('%Y-%m-%d')
+        for produto in linhas:
+            lastmod = produto.data_atualizacao.strftime('%Y-%m-%d') if produto.data_atualizacao else hoje
+            partes = [
+                f'  <url>\n    <loc>{escape(base_url)}/loja/produto/{produto.id}</loc>\n'
+                f'    <lastmod>{lastmod}</lastmod>\n'
+                f'    <changefreq>weekly</changefreq>\n    <priority>0.8</priority>\n'
+            ]
+            if produto.imagem_url:
+                imagem = produto.imagem_url
+                if imagem.startswith('/'):
+                    imagem = base_url + imagem
+                partes.append(
+                    f'    <image:image>\n      <image:loc>{escape(imagem)}</image:loc>\n'
+                    f'      <image:title>{escape(produto.nome)}</image:title>\n'
+                    f'      <image:caption>{escape(produto.descricao_curta or produto.nome)}</image:caption>\n'
+                    f'    </image:image>\n'
+                )
+            partes.append('  </url>\n')
+            yield ''.join(partes)
+        yield '</urlset>\n'
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de Validação XSD
+Validação local das mensagens da NF-e contra os schemas oficiais antes do envio à SEFAZ
+"""
+
+import os
+import logging
+import threading
+from flask import current_app, has_app_context
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+
+class ValidadorXSDService:
+    """
+    Validação das mensagens contra os XSDs do leiaute 4.00
+
+    Os schemas vêm dos pacotes de liberação do Portal da NF-e (PL_009_V4,
+    Evento de Cancelamento e Carta de Correção), extraídos em NFE_XSD_DIR;
+    cada arquivo é localizado em qualquer subdiretório, de modo que os
+    pacotes podem ser extraídos como vêm. Cada XMLSchema é compilado uma
+    única vez por processo. Sem os XSDs no diretório, a validação é
+    ignorada (com um aviso no log) e a SEFAZ continua sendo a referência.
+
+    Uma mensagem inválida recebe o mesmo código da SEFAZ para falha de
+    schema (225), com os erros do libxml2 em ``erros``, sem consumir a
+    ida e volta ao web service.
+    """
+
+    CODIGO_FALHA_SCHEMA = '225'
+    CODIGO_XML_MAL_FORMADO = '243'
+    MAXIMO_ERROS = 20
+    NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+    # Schema pelo elemento raiz da mensagem
+    SCHEMAS = {
+        'NFe': 'nfe_v4.00.xsd',
+        'enviNFe': 'enviNFe_v4.00.xsd',
+        'inutNFe': 'inutNFe_v4.00.xsd',
+        'envEvento': 'envEvento_v1.00.xsd',
+    }
+    # envEvento: schema específico pelo tpEvento
+    SCHEMAS_EVENTO = {
+        '110111': 'envEventoCancNFe_v1.00.xsd',
+        '110110': 'envCCe_v1.00.xsd',
+    }
+
+    _arquivos = {}
+    _schemas = {}
+    _trava = threading.Lock()
+
+    # ==================== SCHEMAS ====================
+
+    @staticmethod
+    def _config(nome, padrao):
+        if has_app_context():
+            return current_app.config.get(nome, padrao)
+        return padrao
+
+    @classmethod
+    def _diretorio(cls):
+        padrao = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'schemas', 'nfe')
+        return cls._config('NFE_XSD_DIR', None) or os.getenv('NFE_XSD_DIR') or padrao
+
+    @classmethod
+    def _localizar(cls, diretorio, nome):
+        """Caminho do XSD ``nome`` no diretório (indexado uma vez por processo)"""
+        if diretorio not in cls._arquivos:
+            arquivos = {}
+            for raiz, pastas, nomes in os.walk(diretorio):
+                pastas.sort()
+                for arquivo in sorted(nomes):
+                    if arquivo.endswith('.xsd'):
+                        arquivos.setdefault(arquivo, os.path.join(raiz, arquivo))
+            if not arquivos:
+                logger.warning(f"XSDs da NF-e não encontrados em {diretorio}; validação local desativada "
+                               "(extraia os pacotes de schemas e defina NFE_XSD_DIR)")
+            cls._arquivos[diretorio] = arquivos
+        return cls._arquivos[diretorio].get(nome)
+
+    @classmethod
+    def schema(cls, nome):
+        """
+        XMLSchema compilado (cache do processo)
+
+        Returns:
+            etree.XMLSchema: Schema ou None se o XSD não estiver disponível
+        """
+        diretorio = cls._diretorio()
+        chave = (diretorio, nome)
+        if chave in cls._schemas:
+            return cls._schemas[chave]
+
+        with cls._trava:
+            if chave not in cls._schemas:
+                caminho = cls._localizar(diretorio, nome)
+                schema = None
+                if caminho:
+                    try:
+                        schema = etree.XMLSchema(etree.parse(caminho))
+                    except (etree.XMLSchemaParseError, etree.XMLSyntaxError) as e:
+                        logger.error(f"Erro ao compilar o XSD {caminho}: {e}")
+                elif cls._arquivos.get(diretorio):
+                    logger.warning(f"XSD {nome} não encontrado em {diretorio}")
+                cls._schemas[chave] = schema
+        return cls._schemas[chave]
+
+    @classmethod
+    def verificar_instalacao(cls):
+        """
+        Confere na inicialização se os XSDs estão no diretório, avisando no
+        log quando a validação local ficará desligada (sem compilar os schemas)
+
+        Returns:
+            bool: True se todos os XSDs usados foram encontrados (ou a validação está desligada)
+        """
+        if not cls._config('NFE_VALIDAR_XSD', True):
+            return True
+        diretorio = cls._diretorio()
+        nomes = sorted(set(cls.SCHEMAS.values()) | set(cls.SCHEMAS_EVENTO.values()))
+        faltando = [nome for nome in nomes if not cls._localizar(diretorio, nome)]
+        if faltando and cls._arquivos.get(diretorio):
+            logger.warning(f"XSDs ausentes em {diretorio}: {', '.join(faltando)}; "
+                           "essas mensagens seguem para a SEFAZ sem validação local")
+        return not faltando
+
+    @classmethod
+    def limpar_cache(cls):
+        """Esquece os schemas compilados (ex: após atualizar os XSDs)"""
+        with cls._trava:
+            cls._arquivos.clear()
+            cls._schemas.clear()
+
+    @classmethod
+    def nome_schema(cls, root):
+        """XSD que valida a mensagem, pelo elemento raiz (e tpEvento)"""
+        tag = etree.QName(root).localname
+        if tag == 'envEvento':
+            tipo = root.findtext(f'.//{{{cls.NS_NFE}}}tpEvento')
+            return cls.SCHEMAS_EVENTO.get(tipo, cls.SCHEMAS['envEvento'])
+        return cls.SCHEMAS.get(tag)
+
+    # ==================== VALIDAÇÃO ====================
+
+    @classmethod
+    def validar(cls, xml):
+        """
+        Valida uma mensagem (NFe, enviNFe, envEvento ou inutNFe)
+
+        Args:
+            xml: String, bytes ou elemento lxml
+
+        Returns:
+            dict: valido, verificado (False se não havia XSD), schema,
+            codigo ('225' fora do schema, '243' mal formado), mensagem e erros
+            [{'linha', 'coluna', 'caminho', 'mensagem'}]
+        """
+        resultado = {'valido': True, 'verificado': False, 'schema': None,
+                     'codigo': None, 'mensagem': None, 'erros': []}
+        if not cls._config('NFE_VALIDAR_XSD', True):
+            return resultado
+
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        try:
+            root = etree.fromstring(xml) if isinstance(xml, bytes) else xml
+        except etree.XMLSyntaxError as e:
+            resultado.update(valido=False, verificado=True, codigo=cls.CODIGO_XML_MAL_FORMADO,
+                             mensagem=f'Rejeição: XML mal formado (validação local): {e}',
+                             erros=[{'linha': e.lineno, 'coluna': e.offset, 'caminho': None, 'mensagem': str(e)}])
+            return resultado
+
+        nome = cls.nome_schema(root)
+        schema = cls.schema(nome) if nome else None
+        if schema is None:
+            return resultado
+
+        # O error_log fica no XMLSchema: validação e leitura dos erros juntas
+        with cls._trava:
+            valido = schema.validate(root)
+            erros = [] if valido else [
+                {'linha': erro.line, 'coluna': erro.column, 'caminho': erro.path, 'mensagem': erro.message}
+                for erro in list(schema.error_log)[:cls.MAXIMO_ERROS]
+            ]
+
+        resultado.update(valido=valido, verificado=True, schema=nome, erros=erros)
+        if not valido:
+            resultado['codigo'] = cls.CODIGO_FALHA_SCHEMA
+            resultado['mensagem'] = f"Rejeição: Falha no Schema XML (validação local): {erros[0]['mensagem']}"
+        return resultado
+
+    @classmethod
+    def rejeicao(cls, xml):
+        """
+        Valida a mensagem e, se inválida, devolve a rejeição no formato das respostas da SEFAZ
+
+        Returns:
+            dict: {'sucesso': False, 'codigo', 'mensagem', 'erros', 'validacao_local': True}
+            ou None se a mensagem for válida (ou não houver XSD)
+        """
+        resultado = cls.validar(xml)
+        if resultado['valido']:
+            return None
+        logger.warning(f"{resultado['schema'] or 'XML'} recusado na validação local: {resultado['mensagem']}")
+        return {
+            'sucesso': False,
+            'codigo': resultado['codigo'],
+            'mensagem': resultado['mensagem'],
+            'erros': resultado['erros'],
+            'validacao_local': True
+        }
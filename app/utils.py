@@ -5,8 +5,14 @@ Funções auxiliares para validação, sanitização, upload de arquivos, etc.
 import os
 import re
 import secrets
+from datetime import datetime, date
+from decimal import Decimal
 from PIL import Image
-from flask import current_app, flash
+from flask import current_app, flash, request, has_request_context
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_, false, inspect as sa_inspect
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
 from werkzeug.utils import secure_filename
 
 
@@ -324,28 +330,54 @@ def format_phone(phone):
     return phone
 
 
-def paginate_query(query, page, per_page=20):
+def paginate_query(query, page, per_page=20, modo='offset', cursor=None, estimar_total=False):
     """
     Pagina uma query do SQLAlchemy
 
+    Suporta dois modos:
+    - 'offset': COUNT + OFFSET, com números de página (padrão)
+    - 'cursor': paginação por chave (keyset), usando as colunas do ORDER BY
+      da query e a chave primária como desempate. O custo de cada página
+      independe da profundidade e não exige COUNT.
+
+    O modo cursor só é usado quando a rota pede (``modo='cursor'``); o token
+    vem então de ``cursor`` ou do parâmetro ``cursor`` da requisição. Nas
+    rotas em modo offset o parâmetro é ignorado (os templates dependem dos
+    números de página).
+
     Args:
         query: Query do SQLAlchemy
-        page: Número da página (começa em 1)
+        page: Número da página (começa em 1, usado apenas no modo offset)
         per_page: Itens por página
+        modo: 'offset' ou 'cursor'
+        cursor: Token opaco gerado por uma página anterior
+        estimar_total: Usa a estimativa do planejador em vez de COUNT exato
+            (queries sem filtro sobre uma tabela sempre usam ContagemService.total)
 
     Returns:
         dict: {
             'items': lista de itens,
-            'total': total de itens,
+            'total': total de itens (None se desconhecido),
+            'total_estimado': se o total é uma estimativa,
             'pages': total de páginas,
             'current_page': página atual,
             'has_prev': tem página anterior,
             'has_next': tem próxima página,
             'prev_page': número da página anterior,
-            'next_page': número da próxima página
+            'next_page': número da próxima página,
+            'prev_cursor': token da página anterior (modo cursor),
+            'next_cursor': token da próxima página (modo cursor),
+            'modo': 'offset' ou 'cursor'
         }
     """
-    total = query.count()
+    if modo == 'cursor':
+        if cursor is None and has_request_context():
+            cursor = request.args.get('cursor')
+        return _paginar_por_cursor(query, per_page, cursor or None, estimar_total)
+
+    from app.services.contagem_service import ContagemService
+
+    total, total_estimado = ContagemService.contar_query(query, estimar=estimar_total)
     pages = (total + per_page - 1) // per_page  # Ceiling division
 
     items = query.offset((page - 1) * per_page).limit(per_page).all()
@@ -353,11 +385,174 @@ def paginate_query(query, page, per_page=20):
     return {
         'items': items,
         'total': total,
+        'total_estimado': total_estimado,
         'pages': pages,
         'current_page': page,
         'has_prev': page > 1,
         'has_next': page < pages,
         'prev_page': page - 1 if page > 1 else None,
         'next_page': page + 1 if page < pages else None,
-        'per_page': per_page
+        'prev_cursor': None,
+        'next_cursor': None,
+        'per_page': per_page,
+        'modo': 'offset'
+    }
+
+
+def _paginar_por_cursor(query, per_page, cursor, estimar_total):
+    """Paginação por chave (seek) a partir das colunas de ordenação da query"""
+    colunas = _colunas_ordenacao(query)
+
+    dados = _decodificar_cursor(cursor, len(colunas)) if cursor else None
+    voltando = dados is not None and dados['d'] == 'p'
+    valores = dados['v'] if dados else None
+
+    # Na volta, percorre a ordenação invertida a partir do primeiro item
+    ordem = [(expr, desc != voltando) for expr, desc in colunas]
+
+    q = query.order_by(None).order_by(
+        *[expr.desc() if desc else expr.asc() for expr, desc in ordem]
+    )
+    q = q.add_columns(
+        *[expr.label(f'_cursor_{i}') for i, (expr, _) in enumerate(colunas)]
+    )
+
+    if valores is not None:
+        q = q.filter(_predicado_seek(ordem, valores))
+
+    linhas = q.limit(per_page + 1).all()
+    ha_mais = len(linhas) > per_page
+    linhas = linhas[:per_page]
+
+    if voltando:
+        linhas.reverse()
+        has_prev, has_next = ha_mais, True
+    else:
+        has_prev, has_next = valores is not None, ha_mais
+
+    items = [linha[0] for linha in linhas]
+    chaves = [tuple(linha[1:]) for linha in linhas]
+
+    total = estimar_total_query(query) if estimar_total else None
+    pages = (total + per_page - 1) // per_page if total is not None else None
+
+    return {
+        'items': items,
+        'total': total,
+        'total_estimado': total is not None,
+        'pages': pages,
+        'current_page': None,
+        'has_prev': has_prev and bool(chaves),
+        'has_next': has_next and bool(chaves),
+        'prev_page': None,
+        'next_page': None,
+        'prev_cursor': _codificar_cursor('p', chaves[0]) if has_prev and chaves else None,
+        'next_cursor': _codificar_cursor('n', chaves[-1]) if has_next and chaves else None,
+        'per_page': per_page,
+        'modo': 'cursor'
     }
+
+
+def _colunas_ordenacao(query):
+    """
+    Extrai as expressões do ORDER BY da query como lista de (expressão, desc)
+    e acrescenta a chave primária da entidade como desempate
+    """
+    colunas = []
+    for clausula in query._order_by_clauses:
+        expr, desc = clausula, False
+        while isinstance(expr, UnaryExpression) and expr.modifier in (
+            operators.desc_op, operators.asc_op,
+            operators.nulls_first_op, operators.nulls_last_op
+        ):
+            if expr.modifier is operators.desc_op:
+                desc = True
+            expr = expr.element
+        colunas.append((expr, desc))
+
+    entidade = query.column_descriptions[0]['entity']
+    for pk in sa_inspect(entidade).primary_key:
+        colunas.append((pk, False))
+
+    return colunas
+
+
+def _predicado_seek(ordem, valores):
+    """
+    Monta (k0 após v0) OR (k0 = v0 AND k1 após v1) OR ...
+
+    Respeita a posição padrão dos NULLs de cada banco (maiores que qualquer
+    valor no PostgreSQL, menores no SQLite/MySQL).
+    """
+    from app import db
+    nulls_maiores = db.engine.dialect.name == 'postgresql'
+
+    def igual(expr, valor):
+        return expr.is_(None) if valor is None else expr == valor
+
+    def apos(expr, valor, desc):
+        nulls_no_fim = nulls_maiores != desc
+        if valor is None:
+            return false() if nulls_no_fim else expr.isnot(None)
+        comparacao = expr < valor if desc else expr > valor
+        return or_(comparacao, expr.is_(None)) if nulls_no_fim else comparacao
+
+    condicoes = []
+    for i, (expr, desc) in enumerate(ordem):
+        anteriores = [igual(e, v) for (e, _), v in zip(ordem[:i], valores[:i])]
+        condicoes.append(and_(*anteriores, apos(expr, valores[i], desc)))
+
+    return or_(*condicoes)
+
+
+def _serializador_cursor():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='paginacao-cursor')
+
+
+def _codificar_cursor(direcao, valores):
+    """Gera token opaco e assinado com a direção e as chaves de ordenação"""
+    serializados = []
+    for valor in valores:
+        if isinstance(valor, datetime):
+            serializados.append(['dt', valor.isoformat()])
+        elif isinstance(valor, date):
+            serializados.append(['d', valor.isoformat()])
+        elif isinstance(valor, Decimal):
+            serializados.append(['dec', str(valor)])
+        else:
+            serializados.append(['', valor])
+    return _serializador_cursor().dumps({'d': direcao, 'v': serializados})
+
+
+def _decodificar_cursor(token, quantidade):
+    """Valida e decodifica um token de cursor (None se inválido)"""
+    try:
+        dados = _serializador_cursor().loads(token)
+    except BadSignature:
+        return None
+
+    if dados.get('d') not in ('n', 'p') or len(dados.get('v', [])) != quantidade:
+        return None
+
+    valores = []
+    for tipo, valor in dados['v']:
+        if tipo == 'dt':
+            valor = datetime.fromisoformat(valor)
+        elif tipo == 'd':
+            valor = date.fromisoformat(valor)
+        elif tipo == 'dec':
+            valor = Decimal(valor)
+        valores.append(valor)
+
+    return {'d': dados['d'], 'v': valores}
+
+
+def estimar_total_query(query):
+    """
+    Estima o número de linhas de uma query pelo planejador do banco
+    (ver ContagemService.estimar_query). Retorna None quando o banco não
+    oferece estimativa.
+    """
+    from app.services.contagem_service import ContagemService
+
+    return ContagemService.estimar_query(query)
@@ -37,6 +37,18 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+    # Imagens - rendições geradas em background (nome:lado_máximo em px)
+    IMAGEM_RENDICOES = os.getenv('IMAGEM_RENDICOES', 'thumb:300,card:600,zoom:1600')
+    IMAGEM_WORKERS = int(os.getenv('IMAGEM_WORKERS', 2))
+    IMAGEM_QUALIDADE_WEBP = int(os.getenv('IMAGEM_QUALIDADE_WEBP', 80))
+    IMAGEM_QUALIDADE_JPEG = int(os.getenv('IMAGEM_QUALIDADE_JPEG', 82))
+    # Imagens sob demanda (/img/<arquivo>?w=&h=&fmt=): dimensões aceitas,
+    # cache em disco (padrão: instance/img_cache) e validade no navegador/CDN
+    IMAGEM_DIMENSOES_PERMITIDAS = os.getenv('IMAGEM_DIMENSOES_PERMITIDAS', '150,300,450,600,900,1200,1600')
+    IMAGEM_CACHE_DIR = os.getenv('IMAGEM_CACHE_DIR')
+    IMAGEM_CACHE_MAX_MB = int(os.getenv('IMAGEM_CACHE_MAX_MB', 512))
+    IMAGEM_CACHE_MAX_AGE = int(os.getenv('IMAGEM_CACHE_MAX_AGE', 31536000))  # 1 ano
+
     # URL base para imagens (Cloudinary, S3, etc)
     IMAGES_BASE_URL = os.getenv('IMAGES_BASE_URL', '/static/produtos/')
 
@@ -59,6 +71,107 @@ class Config:
     CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
     CACHE_REDIS_URL = os.getenv('REDIS_URL')
+    # Páginas da vitrine para visitantes anônimos (invalidadas a cada commit
+    # em produtos/categorias/estoque/reviews; o timeout só limita a memória).
+    # Exige cache compartilhado (CACHE_TYPE=RedisCache): com SimpleCache as
+    # páginas não são cacheadas
+    CACHE_CATALOGO_ATIVO = os.getenv('CACHE_CATALOGO_ATIVO', 'True') == 'True'
+    CACHE_CATALOGO_TIMEOUT = int(os.getenv('CACHE_CATALOGO_TIMEOUT', 600))
+
+    # Sitemap - URLs por arquivo (máximo do protocolo: 50000), validade do
+    # corpo gerado no cache (0 = não guardar) e max-age para os crawlers
+    SITEMAP_URLS_POR_ARQUIVO = int(os.getenv('SITEMAP_URLS_POR_ARQUIVO', 50000))
+    SITEMAP_CACHE_TIMEOUT = int(os.getenv('SITEMAP_CACHE_TIMEOUT', 3600))
+    SITEMAP_MAX_AGE = int(os.getenv('SITEMAP_MAX_AGE', 3600))
+
+    # Loja - limites das faixas de preço do filtro lateral (R$, separados por vírgula)
+    LOJA_FAIXAS_PRECO = os.getenv('LOJA_FAIXAS_PRECO', '50,100,250,500,1000')
+
+    # Numeração de documentos
+    # Números reservados por processo a cada ida ao banco. A numeração fiscal
+    # usa blocos de 1 por padrão: cada número não usado vira uma inutilização.
+    NUMERACAO_TAMANHO_BLOCO = int(os.getenv('NUMERACAO_TAMANHO_BLOCO', 20))
+    NUMERACAO_TAMANHO_BLOCO_FISCAL = int(os.getenv('NUMERACAO_TAMANHO_BLOCO_FISCAL', 1))
+    NUMERACAO_IDADE_MINIMA_LACUNA = int(os.getenv('NUMERACAO_IDADE_MINIMA_LACUNA', 60))  # minutos
+
+    # KPIs dos dashboards - validade do snapshot (segundos, 0 = sem cache);
+    # alterações nas tabelas envolvidas invalidam antes do prazo
+    KPI_CACHE_TIMEOUT = int(os.getenv('KPI_CACHE_TIMEOUT', 60))
+
+    # Contagens das telas administrativas - acima deste número de linhas o
+    # PostgreSQL usa a estimativa do planejador (pg_class.reltuples); os
+    # COUNT(*) exatos ficam em cache até a próxima escrita na tabela
+    CONTAGEM_LIMITE_EXATO = int(os.getenv('CONTAGEM_LIMITE_EXATO', 100000))
+    CONTAGEM_CACHE_TIMEOUT = int(os.getenv('CONTAGEM_CACHE_TIMEOUT', 300))
+
+    # Rollups de vendas - recuo da marca d'água para transações longas (segundos)
+    ROLLUP_ATRASO_SEGUNDOS = int(os.getenv('ROLLUP_ATRASO_SEGUNDOS', 120))
+
+    # Monitor SEFAZ - status mais antigo que a validade é tratado como
+    # desconhecido (segundos); histórico mantido por N dias
+    SEFAZ_MONITOR_VALIDADE = int(os.getenv('SEFAZ_MONITOR_VALIDADE', 300))
+    SEFAZ_MONITOR_HISTORICO_DIAS = int(os.getenv('SEFAZ_MONITOR_HISTORICO_DIAS', 30))
+
+    # SEFAZ - transporte dos web services (sessões HTTPS por certificado/host).
+    # SEFAZ_WS_URL_BASE troca o host de todos os serviços (ex: scripts/sefaz_stub.py);
+    # SEFAZ_CA_BUNDLE substitui o bundle de CAs do certifi
+    SEFAZ_WS_URL_BASE = os.getenv('SEFAZ_WS_URL_BASE')
+    SEFAZ_CA_BUNDLE = os.getenv('SEFAZ_CA_BUNDLE')
+    SEFAZ_VERIFICAR_SSL = os.getenv('SEFAZ_VERIFICAR_SSL', 'True') == 'True'
+    SEFAZ_TENTATIVAS = int(os.getenv('SEFAZ_TENTATIVAS', 3))
+    SEFAZ_BACKOFF_SEGUNDOS = float(os.getenv('SEFAZ_BACKOFF_SEGUNDOS', 0.5))
+    SEFAZ_TIMEOUT_CONEXAO = int(os.getenv('SEFAZ_TIMEOUT_CONEXAO', 10))
+    SEFAZ_POOL_CONEXOES = int(os.getenv('SEFAZ_POOL_CONEXOES', 4))
+
+    # Emissão de NF-e em lote - notas por enviNFe (máximo 50), espera entre
+    # consultas do recibo (segundos, dobra a cada consulta até o máximo) e
+    # consultas sem resultado antes de conferir as notas pela chave
+    LOTE_NFE_TAMANHO = min(int(os.getenv('LOTE_NFE_TAMANHO', 50)), 50)
+    LOTE_NFE_CONSULTA_INICIAL = int(os.getenv('LOTE_NFE_CONSULTA_INICIAL', 3))
+    LOTE_NFE_CONSULTA_MAXIMA = int(os.getenv('LOTE_NFE_CONSULTA_MAXIMA', 300))
+    LOTE_NFE_CONSULTA_TENTATIVAS = int(os.getenv('LOTE_NFE_CONSULTA_TENTATIVAS', 20))
+
+    # Assinatura de XML em lote - processos do pool (0 = número de CPUs) e
+    # tamanho mínimo do lote para usar o pool (abaixo disso, em série)
+    ASSINATURA_PROCESSOS = int(os.getenv('ASSINATURA_PROCESSOS', 0))
+    ASSINATURA_LOTE_MINIMO = int(os.getenv('ASSINATURA_LOTE_MINIMO', 100))
+
+    # Validação local das mensagens contra os XSDs oficiais (pacotes do Portal
+    # da NF-e extraídos em NFE_XSD_DIR; sem os arquivos, a validação é ignorada)
+    NFE_VALIDAR_XSD = os.getenv('NFE_VALIDAR_XSD', 'True') == 'True'
+    NFE_XSD_DIR = os.getenv('NFE_XSD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'schemas', 'nfe'))
+
+    # Contingência automática: com a SEFAZ fora do ar (ou latência do monitor
+    # acima do limite, em ms) o PDV emite NFC-e off-line e NF-e pelo SVC;
+    # a transmissão das NFC-e off-line é feita em blocos de até N notas
+    CONTINGENCIA_AUTOMATICA = os.getenv('CONTINGENCIA_AUTOMATICA', 'True') == 'True'
+    CONTINGENCIA_LATENCIA_MAXIMA_MS = int(os.getenv('CONTINGENCIA_LATENCIA_MAXIMA_MS', 5000))
+    CONTINGENCIA_JUSTIFICATIVA = os.getenv(
+        'CONTINGENCIA_JUSTIFICATIVA', 'SEFAZ indisponivel ou com tempo de resposta elevado'
+    )
+    CONTINGENCIA_LIMITE_TRANSMISSAO = int(os.getenv('CONTINGENCIA_LIMITE_TRANSMISSAO', 200))
+    # Prazo de transmissão das NFC-e off-line (horas); as que passarem dele
+    # são alertadas no log pelo worker
+    CONTINGENCIA_PRAZO_HORAS = int(os.getenv('CONTINGENCIA_PRAZO_HORAS', 24))
+
+    # Fila de emissão do PDV - tentativas por nota, espera inicial entre elas
+    # (segundos, dobra a cada tentativa) e validade da reserva de um worker
+    FILA_NFE_TENTATIVAS = int(os.getenv('FILA_NFE_TENTATIVAS', 8))
+    FILA_NFE_BACKOFF_SEGUNDOS = int(os.getenv('FILA_NFE_BACKOFF_SEGUNDOS', 5))
+    FILA_NFE_RESERVA_SEGUNDOS = int(os.getenv('FILA_NFE_RESERVA_SEGUNDOS', 300))
+
+    # Worker - intervalos das tarefas em background (segundos); a cada
+    # WORKER_TICK_SEGUNDOS o worker verifica quais tarefas estão vencidas
+    WORKER_TICK_SEGUNDOS = int(os.getenv('WORKER_TICK_SEGUNDOS', 1))
+    WORKER_INTERVALO_RECONCILIAR_AGREGADOS = int(os.getenv('WORKER_INTERVALO_RECONCILIAR_AGREGADOS', 3600))
+    WORKER_INTERVALO_PROCESSAR_IMAGENS = int(os.getenv('WORKER_INTERVALO_PROCESSAR_IMAGENS', 300))
+    WORKER_INTERVALO_ROLLUP_VENDAS = int(os.getenv('WORKER_INTERVALO_ROLLUP_VENDAS', 60))
+    WORKER_INTERVALO_RFM_CLIENTES = int(os.getenv('WORKER_INTERVALO_RFM_CLIENTES', 86400))
+    WORKER_INTERVALO_MONITOR_SEFAZ = int(os.getenv('WORKER_INTERVALO_MONITOR_SEFAZ', 60))
+    WORKER_INTERVALO_LOTES_NFE = int(os.getenv('WORKER_INTERVALO_LOTES_NFE', 60))
+    WORKER_INTERVALO_FILA_NFE = int(os.getenv('WORKER_INTERVALO_FILA_NFE', 1))
+    WORKER_INTERVALO_CONTINGENCIA = int(os.getenv('WORKER_INTERVALO_CONTINGENCIA', 10))
+    WORKER_INTERVALO_PRAZO_CONTINGENCIA = int(os.getenv('WORKER_INTERVALO_PRAZO_CONTINGENCIA', 900))
 
     # Logging - Em produção/Vercel, sempre use stdout
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
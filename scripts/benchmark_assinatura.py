@@ -0,0 +1,173 @@
+"""
+Benchmark e verificação da assinatura de XML em lote - Terman OS
+
+Gera um certificado A1 sintético (RSA 2048) e um lote de NF-e sintéticas
+(infNFe com N itens) e compara três formas de assinar:
+
+- atual: caminho anterior de CertificadoService.assinar_xml, com um
+  XMLSigner novo e a chave/certificado em PEM relidos a cada documento;
+- reaproveitado: AssinaturaService.assinar em série (assinador e chave
+  carregados uma vez);
+- processos: AssinaturaService.assinar_lote com o pool de processos.
+
+Verificação: as três saídas precisam ser idênticas (RSA PKCS#1 v1.5 é
+determinística), na ordem do lote, e um documento inválido no meio do lote
+precisa voltar com erro sem afetar os demais. Sai com código 1 se algo
+divergir; sem o signxml disponível, informa e sai com 0.
+
+Uso:
+    python scripts/benchmark_assinatura.py
+    python scripts/benchmark_assinatura.py --documentos 400 --itens 20 --processos 1,2,4
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Benchmark da assinatura de XML em lote')
+parser.add_argument('--documentos', type=int, default=200, help='Documentos no lote')
+parser.add_argument('--itens', type=int, default=10, help='Itens (det) por NF-e')
+parser.add_argument('--processos', default='', help='Tamanhos de pool, separados por vírgula (padrão: 2 e CPUs)')
+args = parser.parse_args()
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from lxml import etree
+
+
+def gerar_certificado():
+    """Chave e certificado autoassinado em PEM"""
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'EMPRESA BENCHMARK:99999999000191')])
+    agora = datetime.utcnow()
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome)
+        .issuer_name(nome)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - timedelta(days=1))
+        .not_valid_after(agora + timedelta(days=365))
+        .sign(chave, hashes.SHA256())
+    )
+    key_pem = chave.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption())
+    return key_pem, certificado.public_bytes(serialization.Encoding.PEM)
+
+
+def nfe_sintetica(numero, itens):
+    """NF-e mínima com ``itens`` det; retorna (xml, reference_uri)"""
+    id_nfe = f"NFe4326019999999900019155001{numero:09d}1{numero:08d}0"
+    dets = ''.join(
+        f'<det nItem="{item}"><prod><cProd>SKU-{item}</cProd><xProd>Produto {item} &amp; Cia</xProd>'
+        f'<NCM>22030000</NCM><CFOP>5102</CFOP><uCom>UN</uCom><qCom>1.0000</qCom>'
+        f'<vUnCom>10.0000000000</vUnCom><vProd>10.00</vProd></prod></det>'
+        for item in range(1, itens + 1)
+    )
+    xml = (
+        '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+        f'<infNFe Id="{id_nfe}" versao="4.00">'
+        f'<ide><cUF>43</cUF><mod>55</mod><serie>1</serie><nNF>{numero}</nNF></ide>{dets}'
+        '</infNFe></NFe>'
+    )
+    return xml, f'#{id_nfe}'
+
+
+def assinar_atual(xml_string, reference_uri, key_pem, cert_pem):
+    """
+    Caminho anterior de CertificadoService.assinar_xml (referência): assinador
+    novo e chave/certificado em PEM relidos a cada documento
+    """
+    from app.services.assinatura_service import criar_signer
+
+    root = etree.fromstring(xml_string.encode('utf-8'))
+    signed_root = criar_signer().sign(root, key=key_pem, cert=cert_pem, reference_uri=reference_uri)
+    return etree.tostring(signed_root, encoding='unicode', pretty_print=False)
+
+
+def medir(rotulo, assinar_todos, referencia):
+    """
+    Returns:
+        tuple: (documentos por segundo, divergências)
+    """
+    inicio = time.perf_counter()
+    saidas = assinar_todos()
+    duracao = time.perf_counter() - inicio
+    divergencias = sum(1 for a, b in zip(referencia, saidas) if a != b) + abs(len(referencia) - len(saidas))
+    taxa = len(saidas) / max(duracao, 1e-9)
+    print(f"{rotulo:<24} {duracao * 1000:9.1f}ms  {taxa:8.1f} doc/s  {divergencias} divergência(s)")
+    return taxa, divergencias
+
+
+def verificar_erros(assinador, documentos):
+    """Documento inválido no meio do lote: erro só nele, ordem preservada"""
+    lote = list(documentos[:20])
+    lote.insert(7, ('<NFe><infNFe Id="NFe1">sem fechamento', '#NFe1'))
+    lote.insert(12, (documentos[0][0], '#IdInexistente'))
+    falhas = 0
+    for processos in (1, 4):
+        resultados = assinador.assinar_lote(lote, processos=processos)
+        com_erro = [r['indice'] for r in resultados if not r['sucesso']]
+        ordem_ok = all(r['indice'] == i for i, r in enumerate(resultados))
+        uris_ok = all(
+            r['xml'] and doc[1][1:] in r['xml'] for r, doc in zip(resultados, lote) if r['sucesso']
+        )
+        ok = com_erro == [7, 12] and ordem_ok and uris_ok
+        falhas += 0 if ok else 1
+        print(f"Erros por documento ({processos} processo(s)): índices com erro {com_erro}, "
+              f"ordem {'preservada' if ordem_ok else 'ALTERADA'} -> {'ok' if ok else 'FALHOU'}")
+    return falhas
+
+
+def main():
+    try:
+        import signxml  # noqa: F401
+    except Exception as e:
+        print(f"signxml indisponível ({type(e).__name__}: {e}); nada a medir")
+        return 0
+
+    from app.services.assinatura_service import AssinaturaService
+
+    key_pem, cert_pem = gerar_certificado()
+    documentos = [nfe_sintetica(numero, args.itens) for numero in range(1, args.documentos + 1)]
+    assinador = AssinaturaService(key_pem, cert_pem)
+    assinar_atual(*documentos[0], key_pem, cert_pem)  # aquecimento (imports)
+
+    print(f"{args.documentos} NF-e com {args.itens} item(ns), {os.cpu_count()} CPU(s)")
+    inicio = time.perf_counter()
+    referencia = [assinar_atual(xml, uri, key_pem, cert_pem) for xml, uri in documentos]
+    duracao = time.perf_counter() - inicio
+    taxa_atual = len(referencia) / duracao
+    print(f"{'atual (em série)':<24} {duracao * 1000:9.1f}ms  {taxa_atual:8.1f} doc/s")
+
+    divergencias = 0
+    taxa, falhas = medir('reaproveitado (série)',
+                         lambda: [assinador.assinar(xml, uri) for xml, uri in documentos], referencia)
+    divergencias += falhas
+    print(f"{'':<24} {taxa / taxa_atual:9.2f}x o atual")
+
+    if args.processos:
+        tamanhos = [int(p) for p in args.processos.split(',') if p.strip()]
+    else:
+        tamanhos = sorted({2, os.cpu_count() or 1})
+    for processos in tamanhos:
+        taxa, falhas = medir(
+            f'processos ({processos})',
+            lambda: [r['xml'] for r in assinador.assinar_lote(documentos, processos=processos)],
+            referencia
+        )
+        divergencias += falhas
+        print(f"{'':<24} {taxa / taxa_atual:9.2f}x o atual")
+
+    divergencias += verificar_erros(assinador, documentos)
+    print(f"Verificação: {'ok' if not divergencias else f'{divergencias} divergência(s)'}")
+    return 1 if divergencias else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
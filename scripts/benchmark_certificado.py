@@ -0,0 +1,166 @@
+"""
+Benchmark do cache de certificados A1 - Terman OS
+
+Cadastra um certificado A1 sintético (RSA 2048, PKCS#12 com senha) e mede
+a preparação de uma emissão como feita em pdv_emitir_nfe: busca do
+certificado padrão, CertificadoService.carregar_certificado_a1, NFeService
+e assinatura de um infNFe mínimo (quando o signxml está disponível). Cada
+rodada é medida com o cache esvaziado antes de toda emissão e com o cache
+aquecido.
+
+Uso:
+    python scripts/benchmark_certificado.py                   # SQLite temporário, 200 emissões
+    python scripts/benchmark_certificado.py --emissoes 1000 --sem-assinatura
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Benchmark do cache de certificados A1')
+parser.add_argument('--emissoes', type=int, default=200, help='Emissões medidas em cada modo')
+parser.add_argument('--sem-assinatura', action='store_true', help='Mede apenas o carregamento do certificado')
+args = parser.parse_args()
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from app import create_app, db
+from app.models.fiscal import ConfiguracaoEmpresa, CertificadoDigital
+from app.services.certificado_service import CertificadoService
+from app.services.nfe_service import NFeService
+
+app = create_app()
+CNPJ = '99.999.999/0001-91'
+SENHA = 'benchmark'
+XML_NFE = (
+    '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+    '<infNFe Id="NFe43000000000000000000550010000000011000000010" versao="4.00">'
+    '<ide><cUF>43</cUF><mod>55</mod><serie>1</serie><nNF>1</nNF></ide>'
+    '</infNFe></NFe>'
+)
+
+
+def gerar_pfx():
+    """PKCS#12 autoassinado no formato de CN usado pela ICP-Brasil (NOME:CNPJ)"""
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'EMPRESA BENCHMARK:99999999000191')])
+    agora = datetime.utcnow()
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome)
+        .issuer_name(nome)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - timedelta(days=1))
+        .not_valid_after(agora + timedelta(days=365))
+        .sign(chave, hashes.SHA256())
+    )
+    return pkcs12.serialize_key_and_certificates(
+        b'benchmark', chave, certificado, None,
+        serialization.BestAvailableEncryption(SENHA.encode())
+    )
+
+
+def preparar_dados():
+    """Cria (ou recria) a empresa e o certificado padrão sintéticos"""
+    with app.app_context():
+        db.create_all()
+        empresa = ConfiguracaoEmpresa.query.filter_by(cnpj=CNPJ).first()
+        if not empresa:
+            empresa = ConfiguracaoEmpresa(
+                razao_social='EMPRESA BENCHMARK', cnpj=CNPJ, logradouro='Rua', numero='1',
+                bairro='Centro', cidade='Porto Alegre', codigo_municipio='4314902',
+                uf='RS', cep='90000-000', ambiente_nfe=2
+            )
+            db.session.add(empresa)
+            db.session.flush()
+
+        CertificadoDigital.query.filter_by(empresa_id=empresa.id).delete()
+        db.session.add(CertificadoDigital(
+            empresa_id=empresa.id, tipo='A1', nome='EMPRESA BENCHMARK',
+            arquivo_pfx=gerar_pfx(), senha_pfx=SENHA,
+            data_validade=(datetime.utcnow() + timedelta(days=365)).date(),
+            ativo=True, padrao=True
+        ))
+        db.session.commit()
+
+
+def assinatura_disponivel():
+    try:
+        import signxml  # noqa: F401
+        return True
+    except Exception as e:
+        print(f"signxml indisponível ({type(e).__name__}: {e}); medindo apenas o certificado")
+        return False
+
+
+def emitir(assinar):
+    """Caminho de preparação da emissão (sem transmissão)"""
+    empresa = ConfiguracaoEmpresa.query.filter_by(cnpj=CNPJ).first()
+    certificado = CertificadoDigital.query.filter_by(empresa_id=empresa.id, ativo=True, padrao=True).first()
+
+    cert_service = CertificadoService(certificado)
+    cert_service.carregar_certificado_a1(certificado.arquivo_pfx, certificado.senha_pfx)
+    nfe_service = NFeService(empresa, cert_service)
+    if assinar:
+        nfe_service.assinar_nfe(XML_NFE)
+    else:
+        cert_service.obter_certificado_pem()
+        cert_service.obter_chave_pem()
+
+
+def medir(com_cache, assinar):
+    """
+    Returns:
+        list: Duração de cada emissão (ms)
+    """
+    tempos = []
+    with app.app_context():
+        CertificadoService.invalidar_cache()
+        emitir(assinar)  # aquecimento (imports, consultas preparadas)
+        for _ in range(args.emissoes):
+            if not com_cache:
+                CertificadoService.invalidar_cache()
+            inicio = time.perf_counter()
+            emitir(assinar)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            db.session.rollback()
+    return tempos
+
+
+def resumo(tempos):
+    ordenados = sorted(tempos)
+    p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+    return statistics.mean(tempos), statistics.median(tempos), p95
+
+
+def main():
+    preparar_dados()
+    assinar = not args.sem_assinatura and assinatura_disponivel()
+
+    resultados = {}
+    for rotulo, com_cache in (('Sem cache', False), ('Com cache', True)):
+        resultados[rotulo] = resumo(medir(com_cache, assinar))
+        media, mediana, p95 = resultados[rotulo]
+        print(f"{rotulo}: {args.emissoes} emissões, média {media:.2f}ms, "
+              f"mediana {mediana:.2f}ms, p95 {p95:.2f}ms")
+
+    ganho = resultados['Sem cache'][0] / max(resultados['Com cache'][0], 1e-9)
+    print(f"Etapas medidas: certificado{' + assinatura' if assinar else ''}; "
+          f"ganho médio com cache: {ganho:.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Benchmark de checkout concorrente - Terman OS
+
+Simula N checkouts simultâneos disputando o mesmo estoque e verifica que a
+reserva atômica do CarrinhoService nunca vende além do disponível.
+
+Uso:
+    python scripts/benchmark_checkout.py                      # SQLite temporário
+    DATABASE_URL=postgresql://... python scripts/benchmark_checkout.py --concorrencia 50
+    python scripts/benchmark_checkout.py --modo legado         # leitura + decremento em Python
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Benchmark de checkout concorrente')
+parser.add_argument('--concorrencia', type=int, default=50, help='Checkouts simultâneos')
+parser.add_argument('--rodadas', type=int, default=5, help='Rodadas de checkouts simultâneos')
+parser.add_argument('--produtos', type=int, default=20, help='Produtos disputados')
+parser.add_argument('--estoque', type=int, default=40, help='Estoque inicial de cada produto')
+parser.add_argument('--linhas', type=int, default=3, help='Linhas por carrinho')
+parser.add_argument('--modo', choices=['atomico', 'legado'], default='atomico')
+args = parser.parse_args()
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+from app import create_app, db
+from app.models.produto import Produto
+from app.services.carrinho_service import CarrinhoService
+
+app = create_app()
+PREFIXO_SLUG = 'benchmark-checkout-'
+
+
+def preparar_produtos():
+    """Cria (ou reinicia) os produtos disputados"""
+    with app.app_context():
+        Produto.query.filter(Produto.slug.like(f'{PREFIXO_SLUG}%')).delete(synchronize_session=False)
+        produtos = [
+            Produto(nome=f'Produto benchmark {i}', preco=10.0 + i, estoque=args.estoque,
+                    slug=f'{PREFIXO_SLUG}{i}', ativo=True)
+            for i in range(args.produtos)
+        ]
+        db.session.add_all(produtos)
+        db.session.commit()
+        return [p.id for p in produtos]
+
+
+def checkout_atomico(carrinho):
+    cotacao = CarrinhoService.precificar(carrinho)
+    reserva = CarrinhoService.reservar_estoque(cotacao['itens'])
+    if not reserva['sucesso']:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+def checkout_legado(carrinho):
+    """Reproduz o fluxo anterior: um SELECT por linha e decremento em Python"""
+    for pid, item in carrinho.items():
+        produto = Produto.query.get(int(pid))
+        if produto.estoque < item['quantidade']:
+            db.session.rollback()
+            return False
+        produto.estoque -= item['quantidade']
+    db.session.commit()
+    return True
+
+
+def executar(produto_ids):
+    checkout = checkout_atomico if args.modo == 'atomico' else checkout_legado
+    latencias, vendidos, erros = [], {}, []
+    trava = threading.Lock()
+    barreira = threading.Barrier(args.concorrencia)
+
+    def cliente(semente):
+        rnd = random.Random(semente)
+        carrinho = {
+            str(pid): {'quantidade': rnd.randint(1, 3)}
+            for pid in rnd.sample(produto_ids, min(args.linhas, len(produto_ids)))
+        }
+        with app.app_context():
+            barreira.wait()
+            inicio = time.perf_counter()
+            try:
+                ok = checkout(carrinho)
+            except Exception as e:
+                db.session.rollback()
+                ok = False
+                with trava:
+                    erros.append(str(e).splitlines()[0])
+            duracao = time.perf_counter() - inicio
+            db.session.remove()
+
+        with trava:
+            latencias.append(duracao)
+            if ok:
+                for pid, item in carrinho.items():
+                    vendidos[int(pid)] = vendidos.get(int(pid), 0) + item['quantidade']
+
+    inicio_total = time.perf_counter()
+    for rodada in range(args.rodadas):
+        threads = [
+            threading.Thread(target=cliente, args=(rodada * args.concorrencia + i,))
+            for i in range(args.concorrencia)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    tempo_total = time.perf_counter() - inicio_total
+
+    return latencias, vendidos, erros, tempo_total
+
+
+def main():
+    produto_ids = preparar_produtos()
+    latencias, vendidos, erros, tempo_total = executar(produto_ids)
+
+    with app.app_context():
+        estoques = dict(db.session.query(Produto.id, Produto.estoque).filter(Produto.id.in_(produto_ids)).all())
+        banco = db.engine.url.get_backend_name()
+
+    inconsistentes = [
+        pid for pid in produto_ids
+        if estoques[pid] < 0 or args.estoque - estoques[pid] != vendidos.get(pid, 0)
+    ]
+    latencias.sort()
+
+    print(f"Banco: {banco}")
+    print(f"Modo: {args.modo} | {args.rodadas} rodada(s) x {args.concorrencia} checkouts simultâneos")
+    print(f"Checkouts: {len(latencias)} em {tempo_total:.2f}s ({len(latencias) / tempo_total:.1f}/s)")
+    print(f"Latência p50: {statistics.median(latencias) * 1000:.1f} ms | "
+          f"p95: {latencias[int(len(latencias) * 0.95) - 1] * 1000:.1f} ms | "
+          f"máx: {latencias[-1] * 1000:.1f} ms")
+    print(f"Unidades vendidas: {sum(vendidos.values())} de {args.estoque * len(produto_ids)}")
+    print(f"Erros de banco: {len(erros)}" + (f" (ex.: {erros[0]})" if erros else ''))
+    print(f"Produtos com estoque negativo: {sum(1 for v in estoques.values() if v < 0)}")
+    print(f"Produtos inconsistentes (vendido != baixado): {len(inconsistentes)}")
+
+    return 1 if inconsistentes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
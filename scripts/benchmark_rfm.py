@@ -0,0 +1,153 @@
+"""
+Benchmark do cálculo de RFM em lote - Terman OS
+
+Gera clientes e pedidos sintéticos e mede o RFMService.recalcular
+(consulta agregada + NumPy + UPDATE em lote). Com --legado-amostra, mede
+também o caminho antigo (um objeto e um flush por cliente) em uma amostra
+e projeta o tempo para todos os clientes.
+
+Uso:
+    python scripts/benchmark_rfm.py                           # SQLite temporário, 100k clientes
+    DATABASE_URL=postgresql://... python scripts/benchmark_rfm.py --clientes 100000
+    python scripts/benchmark_rfm.py --legado-amostra 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Benchmark do RFM em lote')
+parser.add_argument('--clientes', type=int, default=100000, help='Clientes sintéticos')
+parser.add_argument('--pedidos-por-cliente', type=float, default=3.0, help='Média de pedidos por cliente')
+parser.add_argument('--sem-compra', type=float, default=0.2, help='Fração de clientes sem pedidos')
+parser.add_argument('--legado-amostra', type=int, default=0, help='Clientes medidos no cálculo antigo (0 = não medir)')
+parser.add_argument('--semente', type=int, default=42)
+args = parser.parse_args()
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+from sqlalchemy import insert, select, func
+from app import create_app, db
+from app.models.user import User
+from app.models.crm import Cliente
+from app.models.pedido import Pedido
+from app.services.rfm_service import RFMService
+
+app = create_app()
+PREFIXO_EMAIL = 'benchmark-rfm-'
+LOTE = 10000
+
+
+def preparar_dados():
+    """Cria (ou recria) usuários, clientes e pedidos sintéticos"""
+    rnd = random.Random(args.semente)
+    agora = datetime.utcnow()
+
+    with app.app_context():
+        db.create_all()
+        usuarios_antigos = select(User.id).where(User.email.like(f'{PREFIXO_EMAIL}%'))
+        Pedido.query.filter(Pedido.usuario_id.in_(usuarios_antigos)).delete(synchronize_session=False)
+        Cliente.query.filter(Cliente.usuario_id.in_(usuarios_antigos)).delete(synchronize_session=False)
+        User.query.filter(User.email.like(f'{PREFIXO_EMAIL}%')).delete(synchronize_session=False)
+        db.session.commit()
+
+        inicio = time.perf_counter()
+        for base in range(0, args.clientes, LOTE):
+            db.session.execute(insert(User), [
+                {'nome': f'Cliente {i}', 'email': f'{PREFIXO_EMAIL}{i}@exemplo.com',
+                 'senha_hash': 'x', 'tipo_usuario': 'cliente'}
+                for i in range(base, min(base + LOTE, args.clientes))
+            ])
+        usuario_ids = db.session.execute(
+            select(User.id).where(User.email.like(f'{PREFIXO_EMAIL}%')).order_by(User.id)
+        ).scalars().all()
+
+        for base in range(0, len(usuario_ids), LOTE):
+            db.session.execute(insert(Cliente), [
+                {'usuario_id': usuario_id, 'ativo': True}
+                for usuario_id in usuario_ids[base:base + LOTE]
+            ])
+
+        pedidos, numero = [], 0
+        for usuario_id in usuario_ids:
+            if rnd.random() < args.sem_compra:
+                continue
+            for _ in range(max(1, int(rnd.expovariate(1 / args.pedidos_por_cliente)))):
+                numero += 1
+                pedidos.append({
+                    'numero_pedido': f'BENCH-RFM-{numero}',
+                    'usuario_id': usuario_id,
+                    'status': rnd.choice(['entregue', 'entregue', 'enviado', 'pendente', 'cancelado']),
+                    'total': round(rnd.lognormvariate(5, 1), 2),
+                    'data_criacao': agora - timedelta(days=rnd.randint(0, 720), seconds=rnd.randint(0, 86399)),
+                })
+                if len(pedidos) >= LOTE:
+                    db.session.execute(insert(Pedido), pedidos)
+                    pedidos = []
+        if pedidos:
+            db.session.execute(insert(Pedido), pedidos)
+        db.session.commit()
+
+        print(f"Dados: {len(usuario_ids)} clientes, {numero} pedidos "
+              f"(gerados em {time.perf_counter() - inicio:.1f}s)")
+
+
+def medir_legado(amostra):
+    """Caminho antigo: agrega e grava um cliente por vez via ORM"""
+    with app.app_context():
+        clientes = Cliente.query.join(User, User.id == Cliente.usuario_id).filter(
+            User.email.like(f'{PREFIXO_EMAIL}%')
+        ).limit(amostra).all()
+
+        inicio = time.perf_counter()
+        for cliente in clientes:
+            ultima, quantidade, total = db.session.execute(
+                select(func.max(Pedido.data_criacao), func.count(Pedido.id), func.coalesce(func.sum(Pedido.total), 0))
+                .where(Pedido.usuario_id == cliente.usuario_id, Pedido.status.notin_(RFMService.STATUS_EXCLUIDOS))
+            ).one()
+            cliente.ultima_compra = ultima
+            cliente.quantidade_pedidos = quantidade
+            cliente.total_compras = total
+            cliente.calcular_rfm()
+            db.session.flush()
+        db.session.commit()
+        return time.perf_counter() - inicio, len(clientes)
+
+
+def main():
+    preparar_dados()
+
+    with app.app_context():
+        banco = db.engine.url.get_backend_name()
+        primeira = RFMService.recalcular()
+        segunda = RFMService.recalcular()
+        distribuicao = db.session.execute(
+            select(Cliente.score_rfm, func.count(Cliente.id)).group_by(Cliente.score_rfm).order_by(Cliente.score_rfm)
+        ).all()
+
+    print(f"Banco: {banco}")
+    for rotulo, metricas in (('1ª execução', primeira), ('2ª execução (sem mudanças)', segunda)):
+        print(f"{rotulo}: {metricas['clientes']} clientes, {metricas['atualizados']} atualizados em "
+              f"{metricas['tempo_total']:.2f}s (consulta {metricas['tempo_consulta']:.2f}s, "
+              f"cálculo {metricas['tempo_calculo']:.2f}s, gravação {metricas['tempo_gravacao']:.2f}s)")
+    print("Distribuição dos scores: " + ', '.join(f'{score}: {total}' for score, total in distribuicao))
+
+    if args.legado_amostra:
+        duracao, medidos = medir_legado(args.legado_amostra)
+        if medidos:
+            projecao = duracao / medidos * primeira['clientes']
+            print(f"Legado: {medidos} clientes em {duracao:.2f}s "
+                  f"(projeção para {primeira['clientes']}: {projecao:.1f}s, "
+                  f"{projecao / max(primeira['tempo_total'], 1e-9):.0f}x o lote)")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
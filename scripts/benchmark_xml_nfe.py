@@ -0,0 +1,202 @@
+"""
+Benchmark e verificação do gerador de XML da NFe - Terman OS
+
+Monta notas sintéticas (objetos em memória, sem banco) com 1, 50, 500 e 990
+itens, variando regime tributário, CST/CSOSN, IPI, descontos, forma de
+emissão (normal e contingência), campos vazios e textos com caracteres que
+exigem escape, e compara
+NFeService.gerar_xml_nfe (NFeXMLService) com a implementação de
+referência em lxml (gerar_xml_nfe_referencia):
+
+- verificação: as duas saídas precisam ser idênticas byte a byte, e textos
+  com caracteres de controle precisam ser recusados pelas duas;
+- benchmark: tempo médio por nota em cada tamanho.
+
+Sai com código 1 se alguma saída divergir (para uso em CI: make benchmark-xml).
+
+Uso:
+    python scripts/benchmark_xml_nfe.py
+    python scripts/benchmark_xml_nfe.py --itens 1,50,500,990 --repeticoes 20
+    python scripts/benchmark_xml_nfe.py --apenas-verificar --variacoes 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Benchmark e verificação do gerador de XML da NFe')
+parser.add_argument('--itens', default='1,50,500,990', help='Tamanhos de nota (itens), separados por vírgula')
+parser.add_argument('--repeticoes', type=int, default=0, help='Gerações medidas por tamanho (0 = automático)')
+parser.add_argument('--variacoes', type=int, default=50, help='Notas aleatórias comparadas por tamanho')
+parser.add_argument('--apenas-verificar', action='store_true', help='Não mede tempos')
+parser.add_argument('--semente', type=int, default=42)
+args = parser.parse_args()
+
+from app.services.nfe_service import NFeService
+from app.services.nfe_xml_service import NFeXMLService
+
+TEXTOS = ['Produto comum', 'Açúcar & Café <500g>', 'Aspas "duplas" e \'simples\'', 'Linha\r\nquebrada\tcom tab',
+          'Ação › ünicode € 😀', '', 'x' * 200]
+
+
+def empresa_sintetica(rnd, regime):
+    return SimpleNamespace(
+        id=regime, cnpj='12.345.678/0001-95', razao_social=rnd.choice(TEXTOS[:5]) + ' LTDA',
+        nome_fantasia=rnd.choice([None, 'Loja & Cia']), logradouro='Rua das Flores', numero='100',
+        complemento=rnd.choice([None, 'Sala <2>']), bairro='Centro', codigo_municipio='4314902',
+        cidade='Porto Alegre', uf='RS', cep='90000-000', codigo_pais=None, pais=None,
+        telefone=rnd.choice([None, '(51) 3333-4444']), inscricao_estadual='123.456.789-0',
+        regime_tributario=regime, resp_tecnico_cnpj=rnd.choice([None, '98.765.432/0001-10']),
+        resp_tecnico_contato='Suporte', resp_tecnico_email='suporte@exemplo.com',
+        resp_tecnico_telefone=rnd.choice([None, '(51) 9999-0000']), ambiente_nfe=2
+    )
+
+
+def valor(rnd, casas=2, vazio=True):
+    if vazio and rnd.random() < 0.15:
+        return None
+    return Decimal(str(round(rnd.uniform(0, 5000), casas)))
+
+
+def item_sintetico(rnd, numero):
+    return SimpleNamespace(
+        numero_item=numero, codigo=f'SKU-{numero}', ean=rnd.choice([None, '7891234567895']),
+        descricao=rnd.choice(TEXTOS[:5] + [TEXTOS[6]]), ncm=rnd.choice(['22030000', None]),
+        cest=rnd.choice([None, '0302100']), cfop='5102', unidade=rnd.choice(['UN', 'KGRAMAS']),
+        quantidade=valor(rnd, 4, False), valor_unitario=valor(rnd, 10, False), valor_total=valor(rnd),
+        ean_tributavel=None, unidade_tributavel=rnd.choice([None, 'CX']), quantidade_tributavel=valor(rnd, 4),
+        valor_unitario_tributavel=valor(rnd, 10), valor_desconto=rnd.choice([None, Decimal('0'), valor(rnd)]),
+        valor_aproximado_tributos=valor(rnd), origem=rnd.choice([None, '0', '2']),
+        cst_icms=rnd.choice([None, '00', '40', '41', '60', '20', '101', '102', '500', '900']),
+        modalidade_bc_icms=rnd.choice([None, 0, 3]), valor_bc_icms=valor(rnd), aliquota_icms=valor(rnd),
+        valor_icms=valor(rnd), cst_ipi=rnd.choice([None, '', '50', '99', '53']), valor_ipi=valor(rnd),
+        valor_bc_ipi=valor(rnd), aliquota_ipi=valor(rnd), cst_pis=rnd.choice([None, '01', '07', '49']),
+        valor_bc_pis=valor(rnd), aliquota_pis=valor(rnd), valor_pis=valor(rnd),
+        cst_cofins=rnd.choice([None, '01', '02', '07']), valor_bc_cofins=valor(rnd),
+        aliquota_cofins=valor(rnd), valor_cofins=valor(rnd),
+        informacoes_adicionais=rnd.choice([None, 'Lote 12 & validade <2026>'])
+    )
+
+
+def nota_sintetica(rnd, numero):
+    return SimpleNamespace(
+        modelo=rnd.choice(['55', '65']), serie=1, numero=numero, natureza_operacao='Venda de Mercadoria',
+        data_emissao=datetime(2026, 1, 15, 10, 30), data_saida_entrada=rnd.choice([None, datetime(2026, 1, 15, 11)]),
+        tipo_operacao=1, finalidade=1, indicador_consumidor_final=1, indicador_presenca=1,
+        destinatario_cpf_cnpj=rnd.choice([None, '', '123.456.789-09', '12.345.678/0001-95']),
+        destinatario_razao_social=rnd.choice([None, 'Cliente <VIP> & Filhos']), indicador_ie_destinatario=rnd.choice([1, 9]),
+        destinatario_ie=rnd.choice([None, '987.654.321-0']), destinatario_email=rnd.choice([None, 'a@b.com']),
+        valor_bc_icms=valor(rnd), valor_icms=valor(rnd), valor_fcp=valor(rnd), valor_bc_icms_st=valor(rnd),
+        valor_icms_st=valor(rnd), valor_produtos=valor(rnd), valor_frete=valor(rnd), valor_seguro=valor(rnd),
+        valor_desconto=valor(rnd), valor_ii=valor(rnd), valor_ipi=valor(rnd), valor_pis=valor(rnd),
+        valor_cofins=valor(rnd), valor_outras_despesas=valor(rnd), valor_total=valor(rnd, vazio=False),
+        valor_aproximado_tributos=valor(rnd), modalidade_frete=rnd.choice([0, 9]),
+        transportadora_cnpj=rnd.choice([None, '12.345.678/0001-95', '123.456.789-09']),
+        transportadora_razao_social=rnd.choice([None, 'Transportes & Cia']),
+        veiculo_placa=rnd.choice([None, 'ABC1D23']), veiculo_uf=rnd.choice([None, 'SC']),
+        quantidade_volumes=rnd.choice([None, 0, 3]), especie_volumes=rnd.choice([None, 'CAIXA']),
+        peso_liquido=valor(rnd, 3), peso_bruto=valor(rnd, 3),
+        forma_pagamento=rnd.choice(['pix', 'dinheiro', '01', None]), valor_pagamento=valor(rnd),
+        informacoes_complementares=rnd.choice([None, 'Pedido 123 <urgente>']),
+        informacoes_fisco=rnd.choice([None, 'Fisco & cia']), chave_acesso=None,
+        tipo_emissao=rnd.choice([None, 1, 6, 9]), data_contingencia=datetime(2026, 1, 15, 10, 5),
+        justificativa_contingencia=rnd.choice(['SEFAZ indisponivel & sem resposta', 'x' * 300])
+    )
+
+
+def gerar_par(nfe_service, nota, itens):
+    referencia = nfe_service.gerar_xml_nfe_referencia(nota, '12345678', itens)
+    otimizado = nfe_service.gerar_xml_nfe(nota, '12345678', itens)
+    return referencia, otimizado
+
+
+def verificar(rnd, tamanhos):
+    """
+    Returns:
+        int: Divergências encontradas
+    """
+    divergencias = 0
+    comparadas = 0
+    for tamanho in tamanhos:
+        for variacao in range(args.variacoes if tamanho <= 50 else max(2, args.variacoes // 10)):
+            empresa = empresa_sintetica(rnd, rnd.choice([1, 3]))
+            nfe_service = NFeService(empresa)
+            nota = nota_sintetica(rnd, variacao + 1)
+            itens = [item_sintetico(rnd, numero) for numero in range(1, tamanho + 1)]
+            referencia, otimizado = gerar_par(nfe_service, nota, itens)
+            comparadas += 1
+            if referencia != otimizado:
+                divergencias += 1
+                posicao = next(i for i, (a, b) in enumerate(zip(referencia, otimizado)) if a != b) \
+                    if any(a != b for a, b in zip(referencia, otimizado)) else min(len(referencia), len(otimizado))
+                print(f"DIVERGÊNCIA ({tamanho} itens, variação {variacao}) na posição {posicao}:")
+                print(f"  referência: ...{referencia[max(0, posicao - 60):posicao + 60]!r}")
+                print(f"  otimizado:  ...{otimizado[max(0, posicao - 60):posicao + 60]!r}")
+
+    # Caracteres de controle: as duas implementações precisam recusar
+    empresa = empresa_sintetica(rnd, 3)
+    nfe_service = NFeService(empresa)
+    for invalido in ('\x00', '\x01', '\x0b', '\ufffe'):
+        nota = nota_sintetica(rnd, 1)
+        itens = [item_sintetico(rnd, 1)]
+        itens[0].descricao = f'Produto{invalido}'
+        erros = []
+        for gerar in (nfe_service.gerar_xml_nfe_referencia, nfe_service.gerar_xml_nfe):
+            try:
+                gerar(nota, '12345678', itens)
+                erros.append(None)
+            except ValueError as e:
+                erros.append(str(e))
+        comparadas += 1
+        if erros[0] is None or erros[0] != erros[1]:
+            divergencias += 1
+            print(f"DIVERGÊNCIA no caractere {invalido!r}: {erros}")
+
+    print(f"Verificação: {comparadas} nota(s) comparadas, {divergencias} divergência(s)")
+    return divergencias
+
+
+def benchmark(rnd, tamanhos):
+    empresa = empresa_sintetica(rnd, 3)
+    for tamanho in tamanhos:
+        repeticoes = args.repeticoes or max(5, 2000 // tamanho)
+        nota = nota_sintetica(rnd, 1)
+        itens = [item_sintetico(rnd, numero) for numero in range(1, tamanho + 1)]
+        nfe_service = NFeService(empresa)
+        NFeXMLService.limpar_cache()
+        gerar_par(nfe_service, nota, itens)  # aquecimento
+
+        tempos = {}
+        for rotulo, gerar in (('lxml (referência)', nfe_service.gerar_xml_nfe_referencia),
+                              ('NFeXMLService', nfe_service.gerar_xml_nfe)):
+            medidas = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                gerar(nota, '12345678', itens)
+                medidas.append((time.perf_counter() - inicio) * 1000)
+            tempos[rotulo] = statistics.median(medidas)
+
+        referencia, otimizado = tempos.values()
+        print(f"{tamanho:>4} item(ns): lxml {referencia:8.3f}ms | NFeXMLService {otimizado:8.3f}ms "
+              f"| {referencia / max(otimizado, 1e-9):4.1f}x ({repeticoes} gerações, mediana)")
+
+
+def main():
+    rnd = random.Random(args.semente)
+    tamanhos = [int(tamanho) for tamanho in args.itens.split(',') if tamanho.strip()]
+
+    divergencias = verificar(rnd, tamanhos)
+    if not args.apenas_verificar:
+        benchmark(rnd, tamanhos)
+    return 1 if divergencias else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
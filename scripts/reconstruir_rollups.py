@@ -0,0 +1,42 @@
+"""
+Reconstrução dos rollups de vendas do dashboard - Terman OS
+
+Recalcula as tabelas rollup_vendas_diarias e rollup_pedidos_diarios a partir
+de pedidos/itens_pedido. Sem período, reconstrói todo o histórico e
+reinicia a marca d'água usada pela atualização incremental do worker.
+
+Uso:
+    python scripts/reconstruir_rollups.py
+    python scripts/reconstruir_rollups.py --inicio 2025-01-01 --fim 2025-03-31
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Reconstrói os rollups de vendas')
+parser.add_argument('--inicio', type=date.fromisoformat, help='Primeiro dia (AAAA-MM-DD)')
+parser.add_argument('--fim', type=date.fromisoformat, help='Último dia (AAAA-MM-DD)')
+parser.add_argument('--dias-por-lote', type=int, default=31, help='Dias recalculados por transação')
+args = parser.parse_args()
+
+from app import create_app, db
+from app.services.rollup_service import RollupVendasService
+
+app = create_app()
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        inicio = time.perf_counter()
+        dias = RollupVendasService.reconstruir(args.inicio, args.fim, dias_por_lote=args.dias_por_lote)
+        print(f"Rollups reconstruídos: {dias} dia(s) em {time.perf_counter() - inicio:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
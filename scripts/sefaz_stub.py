@@ -0,0 +1,687 @@
+"""
+Stub HTTPS dos web services da SEFAZ - Terman OS
+
+Servidor local (certificado emitido por uma CA gerada na hora) que responde aos envelopes
+SOAP de status, autorização (síncrona ou em lote com recibo), consulta de
+recibo, consulta por chave, evento e inutilização. Serve para
+exercitar o SefazTransporteService (keep-alive, repetições, tempos) e o
+LoteNFeService sem acessar a SEFAZ. O modo --contingencia simula a SEFAZ fora
+do ar (HTTP 503): as NFC-e são emitidas off-line e transmitidas em bloco pelo
+worker quando o serviço volta (requer o signxml para assinar).
+
+Uso:
+    python scripts/sefaz_stub.py --porta 8443
+        SEFAZ_WS_URL_BASE=https://localhost:8443 SEFAZ_CA_BUNDLE=<certificado impresso> flask run
+
+    python scripts/sefaz_stub.py --benchmark 200              # compara sessão reaproveitada x requests.post por chamada
+    python scripts/sefaz_stub.py --benchmark 50 --falhar-primeiras 2 --latencia 20
+    python scripts/sefaz_stub.py --lote 120 --processamento-consultas 2 --rejeitar-cada 7
+    python scripts/sefaz_stub.py --lote 120 --perder-respostas 1      # lote recebido sem resposta: conferência pela chave
+    python scripts/sefaz_stub.py --fila 40 --perder-respostas 5 --rejeitar-cada 9
+    python scripts/sefaz_stub.py --contingencia 100 --latencia 300
+"""
+import os
+import re
+import sys
+import ssl
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipaddress import ip_address
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Stub HTTPS dos web services da SEFAZ')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--porta', type=int, default=8443)
+parser.add_argument('--latencia', type=int, default=0, help='Atraso de cada resposta (ms)')
+parser.add_argument('--falhar-primeiras', type=int, default=0, help='Responde HTTP 503 às N primeiras requisições')
+parser.add_argument('--benchmark', type=int, default=0, help='Sobe o stub e mede N consultas de status em cada modo')
+parser.add_argument('--lote', type=int, default=0, help='Sobe o stub e emite N NF-e sintéticas em lotes assíncronos')
+parser.add_argument('--processamento-consultas', type=int, default=1,
+                    help='Consultas de recibo respondidas com 105 (em processamento) antes do resultado')
+parser.add_argument('--rejeitar-cada', type=int, default=0, help='Rejeita (cStat 539) uma a cada N notas do lote')
+parser.add_argument('--fila', type=int, default=0, help='Sobe o stub e emite N NFC-e sintéticas pela fila do PDV')
+parser.add_argument('--perder-respostas', type=int, default=0,
+                    help='Processa as N primeiras autorizações (nota ou lote) e fecha a conexão sem responder')
+parser.add_argument('--trabalhadores', type=int, default=2, help='Workers concorrentes no modo --fila')
+parser.add_argument('--contingencia', type=int, default=0,
+                    help='Sobe o stub fora do ar, emite N NFC-e off-line e as transmite quando ele volta')
+args = parser.parse_args()
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+NS = 'http://www.portalfiscal.inf.br/nfe'
+RETORNOS = {
+    'nfeStatusServicoNF': (
+        f'<retConsStatServ xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>107</cStat>'
+        '<xMotivo>Servico em Operacao</xMotivo><cUF>43</cUF></retConsStatServ>'
+    ),
+    'nfeRecepcaoEvento': (
+        f'<retEnvEvento xmlns="{NS}" versao="1.00"><cStat>128</cStat><xMotivo>Lote de evento processado</xMotivo>'
+        '<retEvento versao="1.00"><infEvento><cStat>135</cStat><xMotivo>Evento registrado</xMotivo>'
+        '<nProt>143000000000002</nProt></infEvento></retEvento></retEnvEvento>'
+    ),
+    'nfeInutilizacaoNF': (
+        f'<retInutNFe xmlns="{NS}" versao="4.00"><infInut><cStat>102</cStat>'
+        '<xMotivo>Inutilizacao de numero homologado</xMotivo><nProt>143000000000003</nProt></infInut></retInutNFe>'
+    ),
+}
+
+
+
+def prot_nfe(chave, indice):
+    """protNFe de uma nota (autorizada ou, com --rejeitar-cada, rejeitada)"""
+    if args.rejeitar_cada and indice % args.rejeitar_cada == args.rejeitar_cada - 1:
+        c_stat, motivo, protocolo = '539', 'Rejeicao: Duplicidade de NF-e com diferenca na Chave de Acesso', ''
+    else:
+        c_stat, motivo, protocolo = '100', 'Autorizado o uso da NF-e', f'<nProt>1430000{indice:08d}</nProt>'
+    return (
+        f'<protNFe versao="4.00"><infProt><tpAmb>2</tpAmb><chNFe>{chave}</chNFe>'
+        f'<dhRecbto>{datetime.now():%Y-%m-%dT%H:%M:%S}-03:00</dhRecbto>{protocolo}'
+        f'<cStat>{c_stat}</cStat><xMotivo>{motivo}</xMotivo></infProt></protNFe>'
+    )
+
+
+def autorizacao(corpo):
+    """
+    retEnviNFe: recibo para indSinc=0, protocolos imediatos caso contrário.
+    Uma chave já autorizada é recusada com 204 (duplicidade), como na SEFAZ.
+    """
+    chaves = re.findall(r'Id="NFe(\d{44})"', corpo) or ['43000000000000000000550010000000011000000010']
+    if '<indSinc>0</indSinc>' in corpo:
+        with StubSefaz.trava:
+            recibo = f'43{len(StubSefaz.lotes) + 1:013d}'
+            StubSefaz.lotes[recibo] = {'chaves': chaves, 'consultas': 0}
+        return (
+            f'<retEnviNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>103</cStat>'
+            f'<xMotivo>Lote recebido com sucesso</xMotivo><infRec><nRec>{recibo}</nRec><tMed>1</tMed></infRec></retEnviNFe>'
+        )
+    protocolos = []
+    with StubSefaz.trava:
+        for chave in chaves:
+            StubSefaz.envios[chave] = StubSefaz.envios.get(chave, 0) + 1
+            if chave in StubSefaz.autorizadas:
+                protocolos.append(
+                    f'<protNFe versao="4.00"><infProt><tpAmb>2</tpAmb><chNFe>{chave}</chNFe>'
+                    '<cStat>204</cStat><xMotivo>Rejeicao: Duplicidade de NF-e</xMotivo></infProt></protNFe>'
+                )
+                continue
+            protocolo = prot_nfe(chave, len(StubSefaz.envios) - 1)
+            if '<cStat>100</cStat>' in protocolo:
+                StubSefaz.autorizadas[chave] = protocolo
+            protocolos.append(protocolo)
+    return (
+        f'<retEnviNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>104</cStat>'
+        f'<xMotivo>Lote processado</xMotivo>{"".join(protocolos)}</retEnviNFe>'
+    )
+
+
+def consulta(corpo):
+    """retConsSitNFe: 100 com o protNFe das chaves autorizadas, 217 para as demais"""
+    chave = re.search(r'<chNFe>(\d{44})</chNFe>', corpo)
+    protocolo = StubSefaz.autorizadas.get(chave.group(1)) if chave else None
+    if protocolo is None:
+        return (
+            f'<retConsSitNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>217</cStat>'
+            '<xMotivo>Rejeicao: NF-e nao consta na base de dados da SEFAZ</xMotivo></retConsSitNFe>'
+        )
+    return (
+        f'<retConsSitNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>100</cStat>'
+        f'<xMotivo>Autorizado o uso da NF-e</xMotivo>{protocolo}</retConsSitNFe>'
+    )
+
+
+def retorno_autorizacao(corpo):
+    """retConsReciNFe: 105 nas primeiras consultas, depois um protNFe por nota"""
+    recibo = re.search(r'<nRec>(\d+)</nRec>', corpo)
+    lote = StubSefaz.lotes.get(recibo.group(1)) if recibo else None
+    if lote is None:
+        return (
+            f'<retConsReciNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><cStat>106</cStat>'
+            '<xMotivo>Lote nao localizado</xMotivo></retConsReciNFe>'
+        )
+    with StubSefaz.trava:
+        lote['consultas'] += 1
+        em_processamento = lote['consultas'] <= args.processamento_consultas
+    if em_processamento:
+        return (
+            f'<retConsReciNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><nRec>{recibo.group(1)}</nRec>'
+            '<cStat>105</cStat><xMotivo>Lote em processamento</xMotivo></retConsReciNFe>'
+        )
+    return (
+        f'<retConsReciNFe xmlns="{NS}" versao="4.00"><tpAmb>2</tpAmb><nRec>{recibo.group(1)}</nRec>'
+        f'<cStat>104</cStat><xMotivo>Lote processado</xMotivo>'
+        f'{"".join(processar_lote(lote["chaves"]))}</retConsReciNFe>'
+    )
+
+
+def processar_lote(chaves):
+    """
+    protNFe de cada nota do lote (204 para chave já autorizada); as
+    autorizadas passam a constar na consulta pela chave
+    """
+    protocolos = []
+    with StubSefaz.trava:
+        for indice, chave in enumerate(chaves):
+            if chave in StubSefaz.autorizadas:
+                protocolos.append(
+                    f'<protNFe versao="4.00"><infProt><tpAmb>2</tpAmb><chNFe>{chave}</chNFe>'
+                    '<cStat>204</cStat><xMotivo>Rejeicao: Duplicidade de NF-e</xMotivo></infProt></protNFe>'
+                )
+                continue
+            protocolo = prot_nfe(chave, indice)
+            if '<cStat>100</cStat>' in protocolo:
+                StubSefaz.autorizadas[chave] = protocolo
+            protocolos.append(protocolo)
+    return protocolos
+
+
+def gerar_certificado(nome, san=None, emissor=None):
+    """
+    Certificado e chave (objetos); autoassinado e com permissão de CA quando
+    não há emissor
+
+    Args:
+        emissor: (certificado, chave) da CA que assina
+    """
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    sujeito = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, nome)])
+    certificado_emissor, chave_emissor = emissor or (None, chave)
+    agora = datetime.utcnow()
+    construtor = (
+        x509.CertificateBuilder()
+        .subject_name(sujeito)
+        .issuer_name(certificado_emissor.subject if certificado_emissor else sujeito)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - timedelta(days=1))
+        .not_valid_after(agora + timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=emissor is None, path_length=None), critical=True)
+    )
+    if san:
+        construtor = construtor.add_extension(x509.SubjectAlternativeName(san), critical=False)
+    return construtor.sign(chave_emissor, hashes.SHA256()), chave
+
+
+def em_pem(certificado, chave):
+    return (
+        certificado.public_bytes(serialization.Encoding.PEM),
+        chave.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                            serialization.NoEncryption())
+    )
+
+
+class StubSefaz(BaseHTTPRequestHandler):
+    """Responde a qualquer POST pelo método da SOAPAction"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    contador = 0
+    conexoes = set()
+    lotes = {}
+    autorizadas = {}  # chave -> protNFe
+    envios = {}  # chave -> autorizações síncronas recebidas
+    respostas_perdidas = 0
+    fora_do_ar = False
+    trava = threading.Lock()
+
+    def do_POST(self):
+        with self.trava:
+            StubSefaz.contador += 1
+            numero = StubSefaz.contador
+            StubSefaz.conexoes.add(self.client_address)
+
+        corpo = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if args.latencia:
+            time.sleep(args.latencia / 1000)
+
+        if numero <= args.falhar_primeiras or StubSefaz.fora_do_ar:
+            self._responder(503, b'Servico indisponivel', 'text/plain')
+            return
+
+        metodo = self.headers.get('SOAPAction', '').rsplit('/', 1)[-1]
+        if metodo == 'nfeAutorizacaoLote':
+            retorno = autorizacao(corpo)
+            with self.trava:
+                perder = StubSefaz.respostas_perdidas < args.perder_respostas
+                StubSefaz.respostas_perdidas += perder
+            if perder:
+                if '<indSinc>0</indSinc>' in corpo:
+                    processar_lote(re.findall(r'Id="NFe(\d{44})"', corpo))
+                # Nota (ou lote) processada, resposta perdida: o cliente só vê a conexão cair
+                self.close_connection = True
+                return
+        elif metodo == 'nfeConsultaNF':
+            retorno = consulta(corpo)
+        elif metodo == 'nfeRetAutorizacaoLote':
+            retorno = retorno_autorizacao(corpo)
+        else:
+            retorno = RETORNOS.get(metodo)
+        if retorno is None:
+            self._responder(404, f'Metodo desconhecido: {metodo}'.encode(), 'text/plain')
+            return
+
+        corpo = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<soap12:Envelope xmlns:soap12="http://www.w3.org/2003/05/soap-envelope"><soap12:Body>'
+            f'<nfeResultMsg>{retorno}</nfeResultMsg></soap12:Body></soap12:Envelope>'
+        )
+        self._responder(200, corpo.encode('utf-8'), 'application/soap+xml; charset=utf-8')
+
+    def _responder(self, codigo, corpo, tipo):
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *valores):
+        if not (args.benchmark or args.lote or args.fila or args.contingencia):
+            super().log_message(formato, *valores)
+
+
+def iniciar_servidor(diretorio, ca):
+    """
+    Sobe o stub com certificado emitido pela CA do stub. Com --benchmark/--lote/--fila o
+    certificado cliente é exigido (e emitido pela mesma CA); sem ele, não é
+    solicitado, pois a cadeia ICP-Brasil do certificado real não é validável aqui.
+
+    Returns:
+        tuple: (servidor, caminho do certificado da CA)
+    """
+    cert_pem, key_pem = em_pem(*gerar_certificado('localhost', [
+        x509.DNSName('localhost'), x509.IPAddress(ip_address('127.0.0.1'))
+    ], emissor=ca))
+    caminho_ca = os.path.join(diretorio, 'stub-sefaz-ca.pem')
+    caminho_cert = os.path.join(diretorio, 'stub-sefaz.pem')
+    caminho_chave = os.path.join(diretorio, 'stub-sefaz.key')
+    for caminho, conteudo in ((caminho_ca, em_pem(*ca)[0]), (caminho_cert, cert_pem), (caminho_chave, key_pem)):
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(conteudo)
+
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.load_cert_chain(caminho_cert, caminho_chave)
+    if args.benchmark or args.lote or args.fila or args.contingencia:
+        contexto.verify_mode = ssl.CERT_REQUIRED
+        contexto.load_verify_locations(caminho_ca)
+
+    servidor = ThreadingHTTPServer((args.host, args.porta), StubSefaz)
+    servidor.socket = contexto.wrap_socket(servidor.socket, server_side=True)
+    return servidor, caminho_ca
+
+
+class CertificadoMemoria:
+    """Substitui o CertificadoService carregado (apenas os PEMs são usados no transporte)"""
+
+    def __init__(self, ca):
+        self.certificado, self.chave = gerar_certificado('EMPRESA STUB:99999999000191', emissor=ca)
+        self.cert_pem, self.key_pem = em_pem(self.certificado, self.chave)
+
+    def pfx(self, senha):
+        """PKCS#12 do mesmo certificado, para cadastrar como CertificadoDigital A1"""
+        from cryptography.hazmat.primitives.serialization import pkcs12
+
+        return pkcs12.serialize_key_and_certificates(
+            b'stub', self.chave, self.certificado, None,
+            serialization.BestAvailableEncryption(senha.encode())
+        )
+
+    def obter_certificado_pem(self):
+        return self.cert_pem
+
+    def obter_chave_pem(self):
+        return self.key_pem
+
+
+def criar_app(caminho_ca):
+    """App apontando todos os web services para o stub"""
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stub.db')}"
+
+    from app import create_app
+
+    app = create_app()
+    app.config.update(
+        SEFAZ_WS_URL_BASE=f'https://localhost:{args.porta}',
+        SEFAZ_CA_BUNDLE=caminho_ca,
+        SEFAZ_BACKOFF_SEGUNDOS=0.05,
+        LOTE_NFE_CONSULTA_INICIAL=1
+    )
+    return app
+
+
+def benchmark(caminho_ca, ca):
+    """Consultas de status pela sessão reaproveitada e pelo caminho antigo (arquivo PEM + requests.post)"""
+    import requests
+    from app.services.nfe_service import NFeService
+    from app.services.sefaz_transporte_service import SefazTransporteService
+
+    app = criar_app(caminho_ca)
+    certificado = CertificadoMemoria(ca)
+
+    with app.app_context():
+        nfe_service = NFeService(None, certificado)
+        url = SefazTransporteService.resolver_url(nfe_service._get_ws_url('status'))
+        envelope = nfe_service._criar_envelope_soap('NfeStatusServico', '<consStatServ/>')
+        acao = 'http://www.portalfiscal.inf.br/nfe/wsdl/NFeStatusServico4/nfeStatusServicoNF'
+
+        def legado():
+            arquivo = tempfile.NamedTemporaryFile(delete=False, suffix='.pem')
+            arquivo.write(certificado.cert_pem)
+            arquivo.write(certificado.key_pem)
+            arquivo.close()
+            try:
+                return requests.post(
+                    url, data=envelope.encode('utf-8'), cert=arquivo.name, verify=caminho_ca, timeout=30,
+                    headers={'Content-Type': 'application/soap+xml; charset=utf-8', 'SOAPAction': acao}
+                )
+            finally:
+                os.unlink(arquivo.name)
+
+        def medir(chamada):
+            StubSefaz.conexoes.clear()
+            tempos = []
+            for _ in range(args.benchmark):
+                inicio = time.perf_counter()
+                resposta = chamada()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+                assert resposta.status_code == 200, resposta.status_code
+            return tempos, len(StubSefaz.conexoes)
+
+        primeira = nfe_service.consultar_status_servico()
+        print(f"Status via NFeService: {primeira}")
+        StubSefaz.contador = max(StubSefaz.contador, args.falhar_primeiras)
+
+        modos = {
+            'requests.post por chamada': legado,
+            'Sessão reaproveitada': lambda: nfe_service._enviar_soap('status', acao, envelope),
+        }
+        for rotulo, chamada in modos.items():
+            tempos, conexoes = medir(chamada)
+            ordenados = sorted(tempos)
+            print(f"{rotulo}: {len(tempos)} chamadas, média {statistics.mean(tempos):.2f}ms, "
+                  f"mediana {statistics.median(tempos):.2f}ms, "
+                  f"p95 {ordenados[int(len(ordenados) * 0.95) - 1]:.2f}ms, {conexoes} conexão(ões) TCP")
+
+    SefazTransporteService.fechar_sessoes()
+
+
+def preparar_empresa():
+    """Empresa sintética do stub (criada na primeira execução)"""
+    from app import db
+    from app.models.fiscal import ConfiguracaoEmpresa
+
+    db.create_all()
+    empresa = ConfiguracaoEmpresa.query.filter_by(cnpj='99.999.999/0001-91').first()
+    if not empresa:
+        empresa = ConfiguracaoEmpresa(
+            razao_social='EMPRESA STUB', cnpj='99.999.999/0001-91', logradouro='Rua', numero='1',
+            bairro='Centro', cidade='Porto Alegre', codigo_municipio='4314902', uf='RS', cep='90000-000',
+            inscricao_estadual='0960000001', ambiente_nfe=2
+        )
+        db.session.add(empresa)
+        db.session.flush()
+    return empresa
+
+
+def cadastrar_certificado(empresa, certificado):
+    """Cadastra o certificado do stub como A1 padrão da empresa (sem commit)"""
+    from app import db
+    from app.models.fiscal import CertificadoDigital
+
+    CertificadoDigital.query.filter_by(empresa_id=empresa.id).delete()
+    db.session.add(CertificadoDigital(
+        empresa_id=empresa.id, tipo='A1', nome='EMPRESA STUB', arquivo_pfx=certificado.pfx('stub'),
+        senha_pfx='stub', data_validade=(datetime.utcnow() + timedelta(days=30)).date(),
+        ativo=True, padrao=True
+    ))
+
+
+def notas_sinteticas(empresa, nfe_service, modelo, quantidade):
+    """NotaFiscal já "assinadas" (XML mínimo com a chave), gravadas com commit"""
+    from app import db
+    from app.models.fiscal import NotaFiscal
+
+    serie = int(time.time()) % 900 + 100  # série nova a cada execução: chaves não se repetem
+    notas = []
+    for numero in range(1, quantidade + 1):
+        chave = nfe_service._gerar_chave_acesso('43', f'{datetime.now():%y%m}', '99999999000191',
+                                                modelo, serie, numero, '1', numero)
+        notas.append(NotaFiscal(
+            modelo=modelo, serie=serie, numero=numero, chave_acesso=chave, status='assinada',
+            emitente_cnpj=empresa.cnpj, emitente_razao_social=empresa.razao_social,
+            destinatario_razao_social='CONSUMIDOR', data_emissao=datetime.now(), valor_total=10,
+            xml_nfe=f'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe Id="NFe{chave}" versao="4.00"/></NFe>'
+        ))
+    db.session.add_all(notas)
+    db.session.commit()
+    return notas
+
+
+def testar_lote(caminho_ca, ca):
+    """Emite NF-e sintéticas (já "assinadas") em lotes e acompanha os recibos"""
+    from app.services.lote_nfe_service import LoteNFeService
+    from app.services.nfe_service import NFeService
+    from app.services.sefaz_transporte_service import SefazTransporteService
+
+    app = criar_app(caminho_ca)
+    with app.app_context():
+        empresa = preparar_empresa()
+        certificado = CertificadoMemoria(ca)
+        nfe_service = NFeService(empresa, certificado)
+        notas = notas_sinteticas(empresa, nfe_service, '55', args.lote)
+
+        inicio = time.perf_counter()
+        lotes, erros = LoteNFeService.emitir(notas, empresa, certificado)
+        envio = time.perf_counter() - inicio
+        print(f"{len(notas)} nota(s) em {len(lotes)} lote(s) enviados em {envio:.2f}s; erros: {erros}")
+
+        for lote in lotes:
+            LoteNFeService.aguardar(lote, nfe_service, timeout=60)
+            progresso = LoteNFeService.progresso(lote)
+            print(f"Lote {progresso['numero_lote']} ({progresso['recibo']}): {progresso['status']}, "
+                  f"{progresso['tentativas_consulta']} consulta(s), por status {progresso['por_status']}")
+        if args.perder_respostas:
+            print(f"Respostas de lote perdidas: {StubSefaz.respostas_perdidas}")
+        print(f"Total: {time.perf_counter() - inicio:.2f}s")
+
+    SefazTransporteService.fechar_sessoes()
+
+
+def testar_fila(caminho_ca, ca):
+    """
+    Enfileira NFC-e sintéticas como o PDV e as emite com workers concorrentes
+    (threads com sessões próprias), pelo mesmo caminho do worker.py
+    """
+    from app import db
+    from app.models.fiscal import FilaEmissaoNFe
+    from app.services.fila_emissao_service import FilaEmissaoService
+    from app.services.nfe_service import NFeService
+    from app.services.sefaz_transporte_service import SefazTransporteService
+
+    app = criar_app(caminho_ca)
+    app.config.update(FILA_NFE_BACKOFF_SEGUNDOS=0)
+    certificado = CertificadoMemoria(ca)
+    with app.app_context():
+        empresa = preparar_empresa()
+        cadastrar_certificado(empresa, certificado)
+        notas = notas_sinteticas(empresa, NFeService(empresa, certificado), '65', args.fila)
+        for nota in notas + notas[:5]:  # enfileirar de novo não duplica
+            FilaEmissaoService.enfileirar(nota)
+        db.session.commit()
+        ids = [nota.id for nota in notas]
+        print(f"{len(notas)} nota(s) enfileiradas, {FilaEmissaoNFe.query.count()} item(ns) na fila")
+
+    processadas = []
+
+    def trabalhador():
+        with app.app_context():
+            while True:
+                quantidade = FilaEmissaoService.processar_pendentes(limite=5)
+                processadas.append(quantidade)
+                pendentes = FilaEmissaoNFe.query.filter(
+                    FilaEmissaoNFe.nota_fiscal_id.in_(ids),
+                    FilaEmissaoNFe.status.in_(('pendente', 'processando'))
+                ).count()
+                db.session.remove()
+                if not pendentes:
+                    return
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador) for _ in range(args.trabalhadores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    with app.app_context():
+        situacoes = {}
+        for item in FilaEmissaoNFe.query.filter(FilaEmissaoNFe.nota_fiscal_id.in_(ids)):
+            chave = (item.status, item.nota.status)
+            situacoes[chave] = situacoes.get(chave, 0) + 1
+        tentativas = sum(item.tentativas for item in FilaEmissaoNFe.query.filter(FilaEmissaoNFe.nota_fiscal_id.in_(ids)))
+    reenviadas = sum(1 for envios in StubSefaz.envios.values() if envios > 1)
+    print(f"Emissão em {duracao:.2f}s com {args.trabalhadores} worker(s): {sum(processadas)} processamento(s), "
+          f"{tentativas} tentativa(s); fila/nota: {situacoes}")
+    print(f"Respostas perdidas: {StubSefaz.respostas_perdidas}; chaves enviadas mais de uma vez: {reenviadas}")
+
+    SefazTransporteService.fechar_sessoes()
+
+
+def venda_pdv(empresa, serie, numero):
+    """NFC-e em rascunho com um item, montada como no PDV (sem commit)"""
+    from app import db
+    from app.models.fiscal import NotaFiscal, ItemNotaFiscal
+
+    nota = NotaFiscal(
+        modelo='65', serie=serie, numero=numero, emitente_cnpj=empresa.cnpj,
+        emitente_razao_social=empresa.razao_social, emitente_ie=empresa.inscricao_estadual,
+        destinatario_tipo='F', destinatario_cpf_cnpj='123.456.789-09',
+        destinatario_razao_social='CONSUMIDOR STUB', indicador_ie_destinatario=9,
+        indicador_consumidor_final=1, indicador_presenca=1, data_emissao=datetime.now(),
+        modalidade_frete=9, forma_pagamento='01', tipo_pagamento=0, ambiente=empresa.ambiente_nfe,
+        status='rascunho'
+    )
+    db.session.add(nota)
+    db.session.flush()
+    item = ItemNotaFiscal(
+        nota_fiscal_id=nota.id, numero_item=1, codigo='SKU-1', descricao='Produto stub', ncm='22030000',
+        cfop='5102', unidade='UN', quantidade=Decimal('2'), valor_unitario=Decimal('10.00'),
+        valor_total=Decimal('20.00'), valor_desconto=Decimal('0'), origem='0'
+    )
+    item.calcular_impostos(regime_tributario=empresa.regime_tributario, uf_origem=empresa.uf, uf_destino=empresa.uf)
+    db.session.add(item)
+    nota.valor_produtos = nota.valor_total = nota.valor_pagamento = Decimal('20.00')
+    nota.calcular_totais()
+    return nota
+
+
+def testar_contingencia(caminho_ca, ca):
+    """
+    SEFAZ fora do ar: emite NFC-e off-line como o PDV (gerar, assinar, enfileirar)
+    e mede o tempo por venda; depois religa o stub e transmite a fila em bloco
+    pelo mesmo caminho do worker.py
+    """
+    from app import db
+    from app.models.fiscal import NotaFiscal
+    from app.services.contingencia_service import ContingenciaService
+    from app.services.fila_emissao_service import FilaEmissaoService
+    from app.services.sefaz_monitor_service import SefazMonitorService
+    from app.services.sefaz_transporte_service import SefazTransporteService
+
+    app = criar_app(caminho_ca)
+    certificado = CertificadoMemoria(ca)
+    with app.app_context():
+        empresa = preparar_empresa()
+        cadastrar_certificado(empresa, certificado)
+        db.session.commit()
+
+        StubSefaz.fora_do_ar = True
+        status = SefazMonitorService.verificar_todos()[0]
+        print(f"Monitor: SEFAZ {'online' if status.online else 'offline'} ({status.codigo}) em {status.latencia_ms}ms")
+
+        serie = int(time.time()) % 900 + 100
+        ids, tempos = [], []
+        for numero in range(1, args.contingencia + 1):
+            inicio = time.perf_counter()
+            nota = venda_pdv(empresa, serie, numero)
+            ContingenciaService.aplicar(nota, empresa.uf, empresa.ambiente_nfe)
+            if nota.tipo_emissao == ContingenciaService.OFFLINE_NFCE:
+                ContingenciaService.emitir_offline(nota, FilaEmissaoService.servico_nfe(empresa))
+            FilaEmissaoService.enfileirar(nota)
+            db.session.commit()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            ids.append(nota.id)
+
+        notas = NotaFiscal.query.filter(NotaFiscal.id.in_(ids))
+        offline = sum(1 for nota in notas if nota.status == 'contingencia' and nota.chave_acesso[34] == '9'
+                      and '<tpEmis>9</tpEmis>' in nota.xml_nfe and '<dhCont>' in nota.xml_nfe)
+        print(f"{len(ids)} venda(s) com a SEFAZ fora do ar: {offline} NFC-e off-line (tpEmis 9) prontas para "
+              f"impressão; média {statistics.mean(tempos):.1f}ms, p95 "
+              f"{sorted(tempos)[int(len(tempos) * 0.95) - 1]:.1f}ms por venda (latência do stub: {args.latencia}ms)")
+        print(f"Fila normal: {FilaEmissaoService.processar_pendentes()} processada(s); transmissão em bloco com a "
+              f"SEFAZ fora do ar: {ContingenciaService.transmitir_pendentes()} processada(s)")
+
+        StubSefaz.fora_do_ar = False
+        status = SefazMonitorService.verificar_todos()[0]
+        print(f"Monitor: SEFAZ {'online' if status.online else 'offline'} ({status.codigo}) em {status.latencia_ms}ms")
+
+        inicio = time.perf_counter()
+        blocos = 0
+        while ContingenciaService.pendentes():
+            if not ContingenciaService.transmitir_pendentes():
+                break
+            blocos += 1
+        duracao = time.perf_counter() - inicio
+
+        situacoes = {}
+        for nota in NotaFiscal.query.filter(NotaFiscal.id.in_(ids)):
+            situacoes[nota.status] = situacoes.get(nota.status, 0) + 1
+        print(f"Transmissão em {blocos} bloco(s) em {duracao:.2f}s; notas por status: {situacoes}; "
+              f"pendentes: {ContingenciaService.pendentes()}")
+
+    SefazTransporteService.fechar_sessoes()
+
+
+def main():
+    diretorio = tempfile.mkdtemp()
+    ca = gerar_certificado('Stub SEFAZ CA')
+    servidor, caminho_cert = iniciar_servidor(diretorio, ca)
+
+    if args.benchmark or args.lote or args.fila or args.contingencia:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            if args.benchmark:
+                benchmark(caminho_cert, ca)
+            elif args.lote:
+                testar_lote(caminho_cert, ca)
+            elif args.fila:
+                testar_fila(caminho_cert, ca)
+            else:
+                testar_contingencia(caminho_cert, ca)
+        finally:
+            servidor.shutdown()
+        return 0
+
+    print(f"Stub SEFAZ em https://{args.host}:{args.porta}")
+    print(f"    SEFAZ_WS_URL_BASE=https://localhost:{args.porta}")
+    print(f"    SEFAZ_CA_BUNDLE={caminho_cert}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
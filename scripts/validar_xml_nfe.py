@@ -0,0 +1,71 @@
+"""
+Validação local de XMLs da NF-e contra os XSDs - Terman OS
+
+Valida arquivos de NFe, enviNFe, envEvento (cancelamento e CC-e) ou
+inutNFe com o ValidadorXSDService (mesmo caminho usado antes do envio à
+SEFAZ) e mostra os erros de cada um, o tempo de compilação dos schemas
+(uma vez por processo) e o tempo médio de validação.
+
+Sai com código 1 se algum arquivo for inválido e 2 se não houver XSD para
+algum deles.
+
+Uso:
+    python scripts/validar_xml_nfe.py nota.xml
+    python scripts/validar_xml_nfe.py notas/*.xml --xsd-dir /opt/xsd/nfe --repeticoes 200
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+parser = argparse.ArgumentParser(description='Validação de XMLs da NF-e contra os XSDs')
+parser.add_argument('arquivos', nargs='+', help='Arquivos XML')
+parser.add_argument('--xsd-dir', default=os.getenv('NFE_XSD_DIR'), help='Diretório dos XSDs (padrão: NFE_XSD_DIR)')
+parser.add_argument('--repeticoes', type=int, default=50, help='Validações medidas por arquivo')
+args = parser.parse_args()
+
+if args.xsd_dir:
+    os.environ['NFE_XSD_DIR'] = args.xsd_dir
+
+from lxml import etree
+from app.services.validador_xsd_service import ValidadorXSDService
+
+
+def main():
+    codigo_saida = 0
+    for caminho in args.arquivos:
+        with open(caminho, 'rb') as arquivo:
+            xml = arquivo.read()
+
+        try:
+            nome = ValidadorXSDService.nome_schema(etree.fromstring(xml))
+        except etree.XMLSyntaxError:
+            nome = None
+        inicio = time.perf_counter()
+        if nome and ValidadorXSDService.schema(nome) is None:
+            print(f"{caminho}: XSD {nome} indisponível")
+            codigo_saida = max(codigo_saida, 2)
+            continue
+        compilacao = (time.perf_counter() - inicio) * 1000
+
+        resultado = ValidadorXSDService.validar(xml)
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes):
+            ValidadorXSDService.validar(xml)
+        media = (time.perf_counter() - inicio) * 1000 / max(args.repeticoes, 1)
+
+        situacao = 'válido' if resultado['valido'] else f"INVÁLIDO ({resultado['codigo']})"
+        print(f"{caminho}: {situacao} - {resultado['schema'] or 'sem schema'}, "
+              f"compilação {compilacao:.1f}ms, validação {media:.2f}ms")
+        for erro in resultado['erros']:
+            print(f"  linha {erro['linha']} {erro['caminho'] or ''}: {erro['mensagem']}")
+        if not resultado['valido']:
+            codigo_saida = max(codigo_saida, 1)
+
+    return codigo_saida
+
+
+if __name__ == '__main__':
+    sys.exit(main())
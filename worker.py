@@ -29,15 +29,147 @@ def signal_handler(signum, frame):
     running = False
 
 
+# Momento da última execução de cada tarefa periódica
+ultima_execucao = {}
+
+
+def deve_executar(tarefa, intervalo):
+    """Verifica se a tarefa periódica deve rodar nesta iteração"""
+    agora = time.monotonic()
+    if agora - ultima_execucao.get(tarefa, float('-inf')) >= intervalo:
+        ultima_execucao[tarefa] = agora
+        return True
+    return False
+
+
+def executar_tarefa(tarefa):
+    """Executa uma tarefa isolando falhas das demais"""
+    try:
+        tarefa()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[{datetime.now()}] Erro na tarefa {tarefa.__name__}: {e}")
+
+
+def reconciliar_agregados():
+    """Corrige divergências nos agregados materializados de produtos"""
+    from app.services.agregados_service import AgregadosService
+
+    corrigidos = AgregadosService.reconciliar()
+    print(f"[{datetime.now()}] Agregados de produtos reconciliados ({corrigidos} corrigido(s))")
+
+
+def processar_imagens():
+    """Gera rendições de imagens de produtos que ficaram pendentes"""
+    from app.services.imagem_service import ImagemService
+
+    processados = ImagemService.processar_pendentes()
+    if processados:
+        print(f"[{datetime.now()}] Rendições geradas para {processados} produto(s)")
+
+
+def atualizar_rollup_vendas():
+    """Atualiza os rollups diários de vendas a partir da marca d'água"""
+    from app.services.rollup_service import RollupVendasService
+
+    dias = RollupVendasService.atualizar()
+    if dias:
+        print(f"[{datetime.now()}] Rollup de vendas atualizado ({dias} dia(s) recalculado(s))")
+
+
+def recalcular_rfm_clientes():
+    """Recalcula o score RFM de todos os clientes em lote"""
+    from app.services.rfm_service import RFMService
+
+    metricas = RFMService.recalcular()
+    print(f"[{datetime.now()}] RFM recalculado: {metricas['atualizados']} de {metricas['clientes']} "
+          f"cliente(s) atualizado(s) em {metricas['tempo_total']:.2f}s "
+          f"(consulta {metricas['tempo_consulta']:.2f}s, cálculo {metricas['tempo_calculo']:.2f}s, "
+          f"gravação {metricas['tempo_gravacao']:.2f}s)")
+
+
+def monitorar_sefaz():
+    """Consulta o status da SEFAZ de cada UF/ambiente configurado"""
+    from app.services.sefaz_monitor_service import SefazMonitorService
+
+    for status in SefazMonitorService.verificar_todos():
+        print(f"[{datetime.now()}] SEFAZ {status.uf}/{status.ambiente}: "
+              f"{'online' if status.online else 'offline'} ({status.codigo}) em {status.latencia_ms}ms")
+
+
+def consultar_lotes_nfe():
+    """Consulta os recibos dos lotes de NF-e em processamento"""
+    from app.services.lote_nfe_service import LoteNFeService
+
+    consultados = LoteNFeService.processar_pendentes()
+    if consultados:
+        print(f"[{datetime.now()}] Recibos consultados para {consultados} lote(s) de NF-e")
+
+
+def emitir_fila_nfe():
+    """Emite as notas enfileiradas pelo PDV"""
+    from app.services.fila_emissao_service import FilaEmissaoService
+
+    emitidas = FilaEmissaoService.processar_pendentes()
+    if emitidas:
+        print(f"[{datetime.now()}] Fila de emissão: {emitidas} nota(s) processada(s)")
+
+
+def transmitir_contingencia():
+    """Transmite as NFC-e emitidas em contingência off-line quando a SEFAZ volta"""
+    from app.services.contingencia_service import ContingenciaService
+
+    transmitidas = ContingenciaService.transmitir_pendentes()
+    if transmitidas:
+        print(f"[{datetime.now()}] Contingência: {transmitidas} nota(s) transmitida(s), "
+              f"{ContingenciaService.pendentes()} pendente(s)")
+
+
+def verificar_prazo_contingencia():
+    """Alerta as NFC-e off-line que passaram do prazo de transmissão"""
+    from app.services.contingencia_service import ContingenciaService
+
+    atrasadas = ContingenciaService.verificar_prazo()
+    if atrasadas:
+        print(f"[{datetime.now()}] Contingência: {atrasadas} NFC-e fora do prazo de transmissão")
+
+
 def run_scheduled_tasks():
     """Executa tarefas agendadas"""
     with app.app_context():
-        print(f"[{datetime.now()}] Executando verificação de tarefas...")
+        if deve_executar('verificacao', 60):
+            print(f"[{datetime.now()}] Executando verificação de tarefas...")
+
+        if deve_executar('fila_nfe', app.config['WORKER_INTERVALO_FILA_NFE']):
+            executar_tarefa(emitir_fila_nfe)
+
+        if deve_executar('contingencia', app.config['WORKER_INTERVALO_CONTINGENCIA']):
+            executar_tarefa(transmitir_contingencia)
+
+        if deve_executar('prazo_contingencia', app.config['WORKER_INTERVALO_PRAZO_CONTINGENCIA']):
+            executar_tarefa(verificar_prazo_contingencia)
+
+        if deve_executar('reconciliar_agregados', app.config['WORKER_INTERVALO_RECONCILIAR_AGREGADOS']):
+            executar_tarefa(reconciliar_agregados)
+
+        if deve_executar('processar_imagens', app.config['WORKER_INTERVALO_PROCESSAR_IMAGENS']):
+            executar_tarefa(processar_imagens)
+
+        if deve_executar('rollup_vendas', app.config['WORKER_INTERVALO_ROLLUP_VENDAS']):
+            executar_tarefa(atualizar_rollup_vendas)
+
+        if deve_executar('rfm_clientes', app.config['WORKER_INTERVALO_RFM_CLIENTES']):
+            executar_tarefa(recalcular_rfm_clientes)
+
+        if deve_executar('monitor_sefaz', app.config['WORKER_INTERVALO_MONITOR_SEFAZ']):
+            executar_tarefa(monitorar_sefaz)
+
+        if deve_executar('lotes_nfe', app.config['WORKER_INTERVALO_LOTES_NFE']):
+            executar_tarefa(consultar_lotes_nfe)
+
         # Placeholder para tarefas futuras:
         # - Verificar pedidos pendentes
         # - Processar filas de email
-        # - Atualizar cache de produtos
-        # - Sincronizar estoque
 
 
 def main():
@@ -55,11 +187,8 @@ def main():
     while running:
         try:
             run_scheduled_tasks()
-            # Intervalo entre execuções (60 segundos)
-            for _ in range(60):
-                if not running:
-                    break
-                time.sleep(1)
+            # Cada tarefa tem seu intervalo; o tick curto mantém a fila de emissão responsiva
+            time.sleep(app.config['WORKER_TICK_SEGUNDOS'])
         except Exception as e:
             print(f"[{datetime.now()}] Erro no worker: {e}")
             time.sleep(5)